@@ -0,0 +1,73 @@
+"""Compare reading the symbols of a static archive with and without workers
+
+Usage: python benchmarks/bench_archive.py [MEMBERS] [SYMBOLS] [REPEAT]
+
+Builds an archive of MEMBERS objects defining SYMBOLS functions each (gcc and
+ar are needed), and measures the best of REPEAT runs of reading its symbols
+in a single process, with the default number of workers, and by parsing the
+output of nm.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from abimap import archive
+from abimap import symver
+from abimap.merge import get_default_jobs
+
+
+def build(directory, members, symbols):
+    source = os.path.join(directory, "member.c")
+    with open(source, "w") as f:
+        f.writelines("int bench_fn_{0}(void) {{ return {0}; }}\n".format(k)
+                     for k in range(symbols))
+    subprocess.check_call(["gcc", "-c", "-o", "member.o", "member.c"],
+                          cwd=directory)
+    names = []
+    for j in range(members):
+        name = "member_{0}.o".format(j)
+        shutil.copyfile(os.path.join(directory, "member.o"),
+                        os.path.join(directory, name))
+        names.append(name)
+    subprocess.check_call(["ar", "rcs", "libbench.a"] + names, cwd=directory)
+    return os.path.join(directory, "libbench.a")
+
+
+def read_nm(filename):
+    output = subprocess.check_output(["nm", filename])
+    return symver.get_symbols_from_lines(
+        output.decode("utf-8").splitlines(), "nm")
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    members, symbols, repeat = args + [5000, 20, 3][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = build(directory, members, symbols)
+        jobs = get_default_jobs()
+
+        print("{0} members, {1} symbols per member, {2} CPUs".format(
+            members, symbols, jobs))
+        print("{0:<40}{1:>12}".format("reader", "time (ms)"))
+        for reader, function in (
+                ("archive, 1 job",
+                 lambda: archive.read_archive_symbols(filename, jobs=1)),
+                ("archive, {0} jobs".format(jobs),
+                 lambda: archive.read_archive_symbols(filename, jobs=jobs)),
+                ("nm output", lambda: read_nm(filename))):
+            best = min(timeit.repeat(function, number=1, repeat=repeat))
+            print("{0:<40}{1:>12.3f}".format(reader, best * 1e3))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
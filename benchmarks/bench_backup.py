@@ -0,0 +1,109 @@
+"""Compare the strategies used to back up the files overwritten by abimap
+
+Usage: python benchmarks/bench_backup.py [SIZE] [REPEAT] [DIRECTORY ...]
+
+Writes a map of SIZE MB in each DIRECTORY (by default, a temporary directory
+in /dev/shm, usually a tmpfs, and one in the default temporary directory,
+e.g. on ext4) and measures the best of REPEAT runs of backing it up with
+``shutil.copy2()``, with each strategy alone, with the default order of the
+strategies, and rotating 5 backups. Each run starts without backups. The
+strategies not supported by the file system are reported as such.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from abimap import backup
+
+DIRECTORIES = ("/dev/shm", None)
+
+
+def get_fs_type(directory):
+    try:
+        output = subprocess.check_output(["stat", "-f", "-c", "%T",
+                                          directory])
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return output.decode("utf-8").strip()
+
+
+def build(directory, size):
+    filename = os.path.join(directory, "libbench.map")
+    release = "".join("        bench_symbol_{0};\n".format(k)
+                      for k in range(1000))
+    with open(filename, "w") as f:
+        i = 0
+        while f.tell() < size:
+            f.write("LIBBENCH_{0}_0\n{{\n    global:\n{1}}} ;\n\n".format(
+                i, release))
+            i += 1
+    return filename
+
+
+def remove_backups(filename):
+    directory = os.path.dirname(filename)
+    for name in os.listdir(directory):
+        if name.startswith(os.path.basename(filename) + ".old"):
+            os.unlink(os.path.join(directory, name))
+
+
+def measure(filename, function, repeat):
+    times = []
+    for _ in range(repeat):
+        remove_backups(filename)
+        start = timeit.default_timer()
+        try:
+            function()
+        except ValueError:
+            return None
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def main():
+    args = sys.argv[1:]
+    size = int(float(args[0]) * 1024 * 1024) if args else 64 * 1024 * 1024
+    repeat = int(args[1]) if len(args) > 1 else 5
+    directories = args[2:] or [d for d in DIRECTORIES if d is None or
+                               os.path.isdir(d)]
+
+    for parent in directories:
+        directory = tempfile.mkdtemp(dir=parent)
+        try:
+            filename = build(directory, size)
+            print("{0} ({1}): {2} MB".format(directory,
+                                              get_fs_type(directory),
+                                              size // (1024 * 1024)))
+            print("{0:<40}{1:>12}".format("backup", "time (ms)"))
+            operations = [("shutil.copy2",
+                           lambda: shutil.copy2(filename, filename + ".old"))]
+            for strategy in backup.STRATEGIES:
+                operations.append((strategy, lambda strategy=strategy:
+                                   backup.backup_file(
+                                       filename, replaced=True,
+                                       strategies=(strategy,))))
+            operations.append(("default order", lambda: backup.backup_file(
+                filename, replaced=True)))
+            operations.append(("default order, rotated",
+                               lambda: backup.backup_file(
+                                   filename, keep=5, replaced=True)))
+
+            for operation, function in operations:
+                best = measure(filename, function, repeat)
+                if best is None:
+                    print("{0:<40}{1:>12}".format(operation, "unsupported"))
+                else:
+                    print("{0:<40}{1:>12.3f}".format(operation, best * 1e3))
+            print()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare building maps with the builder methods and parsing generated text
+
+Usage: python benchmarks/bench_builder.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Builds a map containing RELEASES releases with SYMBOLS symbols each, with the
+builder methods of Map and by generating the text and parsing it, and measures
+the best of REPEAT runs of each. Removing half of the symbols one at a time is
+also measured.
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+from abimap import symver
+
+
+def build(releases, symbols):
+    m = symver.Map()
+    previous = ""
+    for j in range(releases):
+        r = m.add_release("LIBBENCH_{0}_0".format(j), previous)
+        m.bulk_add_symbols(r, ("bench_symbol_{0}_{1}".format(j, k) for k in
+                               range(symbols)))
+        if not previous:
+            m.bulk_add_symbols(r, ["*"], "local")
+        previous = r
+    return m
+
+
+def generate(releases, symbols):
+    content = []
+    previous = ""
+    for j in range(releases):
+        release = "LIBBENCH_{0}_0".format(j)
+        content.append(release + "\n{\n    global:\n")
+        content.extend("        bench_symbol_{0}_{1};\n".format(j, k) for k
+                       in range(symbols))
+        if not previous:
+            content.append("    local:\n        *;\n")
+        content.append("} " + previous + ";\n\n")
+        previous = release
+    m = symver.Map()
+    m.parse("".join(content).splitlines(True))
+    m.check()
+    return m
+
+
+def remove_half(releases, symbols):
+    m = build(releases, symbols)
+    for j in range(releases):
+        for k in range(0, symbols, 2):
+            m.remove_symbols(["bench_symbol_{0}_{1}".format(j, k)])
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [1000, 100, 3][len(args):]
+
+    print("{0} releases, {1} symbols per release".format(releases,
+                                                        symbols))
+    print("{0:<40}{1:>12}".format("operation", "time (ms)"))
+    for operation, function in (
+            ("generate text, parse and check", generate),
+            ("build", build),
+            ("build, remove half one by one", remove_half)):
+        best = min(timeit.repeat(lambda: function(releases, symbols),
+                                 number=1, repeat=repeat))
+        print("{0:<40}{1:>12.3f}".format(operation, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
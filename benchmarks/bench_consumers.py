@@ -0,0 +1,78 @@
+"""Measure the queries of the consumers of symbols in a cached index
+
+Usage: python benchmarks/bench_consumers.py [CONSUMERS] [IMPORTS] [REMOVED] [REPEAT]
+
+Fills an index with CONSUMERS files importing IMPORTS symbols each, out of
+the symbols of a library with ten versions, and measures the best of REPEAT
+runs of finding the consumers of REMOVED symbols, in the index kept in
+memory and reopened from the disk.
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+from abimap.scan import Dependencies
+from abimap.scan import Scan_Index
+
+SYMBOLS = 10000
+
+
+def fill(index, consumers, imports):
+    rng = random.Random(0)
+    with index.db:
+        for i in range(consumers):
+            path = "/sysroot/bin/consumer_{0}".format(i)
+            index.db.execute("INSERT INTO files VALUES (?, 0, ?, 0, 0, NULL,"
+                             " NULL)", (path, i))
+            index._add_dependencies(path, Dependencies(
+                ["libbench.so.1"],
+                [("bench_symbol_{0}".format(k),
+                  "LIBBENCH_{0}_0".format(k % 10), "libbench.so.1") for k in
+                 rng.sample(range(SYMBOLS), imports)]))
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:5]]
+    consumers, imports, removed, repeat = \
+        args + [2000, 200, 100, 5][len(args):]
+
+    symbols = [("bench_symbol_{0}".format(k), "LIBBENCH_{0}_0".format(k % 10))
+               for k in range(0, SYMBOLS, SYMBOLS // removed)]
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "index.db")
+        with Scan_Index(path) as index:
+            fill(index, consumers, imports)
+
+        print("{0} consumers, {1} imports each, {2} symbols removed".format(
+            consumers, imports, len(symbols)))
+        print("{0:<40}{1:>12}{2:>12}".format("query", "time (ms)",
+                                             "consumers"))
+        with Scan_Index(path) as index:
+            best = min(timeit.repeat(lambda: index.consumers(
+                symbols, "libbench.so.1"), number=1, repeat=repeat))
+            found = len(set(row[0] for row in index.consumers(
+                symbols, "libbench.so.1")))
+            print("{0:<40}{1:>12.3f}{2:>12}".format("open index", best * 1e3,
+                                                    found))
+
+        def reopen():
+            with Scan_Index(path) as index:
+                return index.consumers(symbols, "libbench.so.1")
+
+        best = min(timeit.repeat(reopen, number=1, repeat=repeat))
+        print("{0:<40}{1:>12.3f}{2:>12}".format("reopened index", best * 1e3,
+                                                found))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
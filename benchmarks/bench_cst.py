@@ -0,0 +1,73 @@
+"""Compare writing an updated map regenerated and with its layout preserved
+
+Usage: python benchmarks/bench_cst.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Reads a map containing RELEASES releases with SYMBOLS symbols each, adds a
+symbol to the newest release, and measures the best of REPEAT runs of
+regenerating the whole text and of rendering it with the layout preserved.
+The number of lines changed in the file by each is also printed.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import timeit
+
+from abimap import symver
+from abimap.cst import Document
+
+
+def generate(releases, symbols):
+    content = []
+    previous = ""
+    for j in range(releases):
+        release = "LIBBENCH_{0}_0".format(j)
+        # Unsorted symbols, which regenerating the text sorts
+        content.append(release + "\n{\n    global:\n")
+        content.extend("        bench_symbol_{0}_{1};\n".format(j, k) for k
+                       in reversed(range(symbols)))
+        if not previous:
+            content.append("    local:\n        *;\n")
+        content.append("} " + previous + ";\n\n")
+        previous = release
+    return "".join(content)
+
+
+def changed_lines(before, after):
+    before = before.splitlines()
+    after = after.splitlines()
+    return sum(1 for a, b in zip(before, after) if a != b) + \
+        abs(len(before) - len(after))
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [1000, 100, 3][len(args):]
+
+    content = generate(releases, symbols)
+    fd, filename = tempfile.mkstemp(suffix=".map")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        m = symver.Map(filename=filename, keep_lines=True)
+    finally:
+        os.unlink(filename)
+    document = Document(m)
+    m.bulk_add_symbols(m.releases[-1], ["bench_new_symbol"])
+
+    print("{0} releases, {1} symbols per release".format(releases,
+                                                        symbols))
+    print("{0:<40}{1:>12}{2:>16}".format("operation", "time (ms)",
+                                         "lines changed"))
+    for operation, function in (
+            ("regenerate", lambda: str(m)),
+            ("preserve layout", lambda: document.render(m))):
+        best = min(timeit.repeat(function, number=1, repeat=repeat))
+        print("{0:<40}{1:>12.3f}{2:>16}".format(
+            operation, best * 1e3, changed_lines(content, function())))
+
+
+if __name__ == "__main__":
+    main()
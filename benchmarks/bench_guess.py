@@ -0,0 +1,79 @@
+"""Measure guessing the name of a new release in maps with many releases
+
+Usage: python benchmarks/bench_guess.py [RELEASES] [REPEAT]
+
+Builds maps containing RELEASES releases depending on each other, listed from
+the oldest to the newest and from the newest to the oldest, and measures the
+best of REPEAT runs of guessing the name of the next release. The parsing of
+all the release names is measured with empty caches and again with the caches
+filled (only the last PARSE_CACHE_SIZE names are kept).
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+from abimap import symver
+
+
+def build(releases, newest_first):
+    m = symver.Map()
+    previous = ""
+    for i in range(releases):
+        r = symver.Release()
+        r.name = "LIBBENCH_1_{0}_0".format(i)
+        r.previous = previous
+        r.symbols["global"] = ["bench_symbol_{0}".format(i)]
+        m.releases.append(r)
+        previous = r.name
+    if newest_first:
+        m.releases.reverse()
+    m.init = True
+    return m
+
+
+def guess(m):
+    # A new map, so that the dependencies are not cached
+    fresh = symver.Map()
+    fresh.releases = m.releases
+    fresh.init = True
+    return fresh.guess_name(None, guess=True)
+
+
+def parse_names(m, clear):
+    if clear:
+        clear_caches()
+    for release in m.releases:
+        symver.get_info_from_release_string(release.name)
+
+
+def clear_caches():
+    for function in (symver._split_release, symver._split_version):
+        if hasattr(function, "cache_clear"):
+            function.cache_clear()
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:3]]
+    releases, repeat = args + [100000, 3][len(args):]
+
+    oldest_first = build(releases, False)
+    newest_first = build(releases, True)
+
+    print("{0} releases, cache size {1}".format(releases,
+                                                symver.PARSE_CACHE_SIZE))
+    print("{0:<40}{1:>12}".format("operation", "time (ms)"))
+    for operation, function in (
+            ("guess name, oldest first", lambda: guess(oldest_first)),
+            ("guess name, newest first", lambda: guess(newest_first)),
+            ("parse all names, empty cache",
+             lambda: parse_names(oldest_first, True)),
+            ("parse all names again", lambda: parse_names(oldest_first,
+                                                          False))):
+        best = min(timeit.repeat(function, number=1, repeat=repeat))
+        print("{0:<40}{1:>12.3f}".format(operation, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure ingesting revisions into the history database and querying it
+
+Usage: python benchmarks/bench_history.py [REVISIONS] [SYMBOLS]
+
+Generates REVISIONS revisions of a map which starts with SYMBOLS symbols and
+gains one symbol per revision, with a new release every 100 revisions and a
+major version bump every 1000 revisions.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from abimap.history import History
+
+
+def generate(revisions, symbols):
+    releases = []
+    for i in range(revisions):
+        major, minor = i // 1000 + 1, i // 100
+        name = "LIBBENCH_{0}_{1}_0".format(major, minor)
+        if not releases or releases[-1][0] != name:
+            releases.append((name, []))
+        if i == 0:
+            releases[0][1].extend("base_symbol_{0}".format(k) for k in
+                                  range(symbols))
+        releases[-1][1].append("symbol_{0}".format(i))
+
+        content = []
+        previous = ""
+        for name, names in releases:
+            content.append(name + "\n{\n    global:\n")
+            content.extend("        {0};\n".format(s) for s in names)
+            if not previous:
+                content.append("    local:\n        *;\n")
+            content.append("}} {0};\n\n".format(previous))
+            previous = name
+        yield "r{0:06d}".format(i), "".join(content)
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:3]]
+    revisions, symbols = args + [2000, 1000][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        h = History(os.path.join(directory, "history.db"))
+
+        start = time.time()
+        for name, content in generate(revisions, symbols):
+            h.ingest(name, content)
+        elapsed = time.time() - start
+        print("{0} revisions ingested in {1:.2f} s ({2:.2f} ms each)".format(
+            revisions, elapsed, elapsed * 1e3 / revisions))
+
+        for query, function in (
+                ("symbol", lambda: h.symbol_history("symbol_1234")),
+                ("glob", lambda: h.symbol_history("symbol_12*")),
+                ("releases", h.release_history),
+                ("bumps", h.bumps)):
+            start = time.time()
+            rows = function()
+            print("{0:<12}{1:>8.2f} ms  ({2} rows)".format(
+                query, (time.time() - start) * 1e3, len(rows)))
+        h.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare reading maps lazily with parsing all the symbols
+
+Usage: python benchmarks/bench_lazy.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Generates a map file containing RELEASES releases with SYMBOLS symbols each,
+and measures the best of REPEAT runs of reading it and guessing the latest
+release, with and without parsing the symbols. The memory still allocated
+after reading the map is also reported.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from abimap import symver
+
+
+def generate(name, releases, symbols):
+    with open(name, "w") as f:
+        previous = ""
+        for j in range(releases):
+            release = "LIBBENCH_{0}_0".format(j)
+            f.write(release + "\n{\n    global:\n")
+            for k in range(symbols):
+                f.write("        bench_symbol_{0}_{1};\n".format(j, k))
+            if not previous:
+                f.write("    local:\n        *;\n")
+            f.write("} " + previous + ";\n\n")
+            previous = release
+
+
+def latest(name):
+    m = symver.Map(filename=name)
+    m.guess_latest_release()
+    return m
+
+
+def latest_lazy(name):
+    m = symver.Map(filename=name, lazy=True)
+    m.guess_latest_release()
+    return m
+
+
+def load_all_lazy(name):
+    m = symver.Map(filename=name, lazy=True)
+    for release in m.releases:
+        release.symbols
+    return m
+
+
+def memory(function, name):
+    tracemalloc.start()
+    try:
+        # Keep the map alive while measuring
+        m = function(name)
+        size = tracemalloc.get_traced_memory()[0]
+        del m
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [100, 500, 5][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        map_name = os.path.join(directory, "lib.map")
+        generate(map_name, releases, symbols)
+
+        print("{0} releases, {1} symbols per release".format(releases,
+                                                            symbols))
+        print("{0:<32}{1:>12}{2:>14}".format("operation", "time (ms)",
+                                             "memory (KiB)"))
+        baseline = None
+        for operation, function in (
+                ("parse, guess latest", latest),
+                ("lazy, guess latest", latest_lazy),
+                ("lazy, load all symbols", load_all_lazy)):
+            best = min(timeit.repeat(lambda: function(map_name), number=1,
+                                     repeat=repeat))
+            if baseline is None:
+                baseline = best
+            size = memory(function, map_name)
+            print("{0:<32}{1:>12.3f}{2:>14}  ({3:.1%})".format(
+                operation, best * 1e3, size // 1024, best / baseline))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
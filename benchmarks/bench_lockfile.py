@@ -0,0 +1,85 @@
+"""Compare verifying a map against its lockfile with comparing parsed maps
+
+Usage: python benchmarks/bench_lockfile.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Writes a map of RELEASES released releases with SYMBOLS symbols each, and
+measures the best of REPEAT runs of comparing it structurally with a copy
+(parsing both), of computing its lock, and of verifying it against the lock
+when it did not change, when a release not released yet was modified, and
+when a released release was modified.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from abimap import lockfile
+from abimap.symver import Map
+
+
+def build(releases, symbols):
+    parts = []
+    for i in range(releases):
+        previous = "LIBBENCH_{0}_0".format(i - 1) if i else ""
+        released = "    # Released" if i < releases - 1 else ""
+        local = "" if i else "    local:\n        *;\n"
+        parts.append("LIBBENCH_{0}_0{1}\n{{\n    global:\n{2}{3}}} {4};\n"
+                     .format(i, released,
+                             "".join("        bench_{0}_{1};\n".format(i, k)
+                                     for k in range(symbols)),
+                             local, previous))
+    return "\n".join(parts)
+
+
+def compare(filename, other):
+    a = Map(filename=filename)
+    b = Map(filename=other)
+    return [(r.name, r.previous, r.released, r.symbols) for r in
+            a.releases] == [(r.name, r.previous, r.released, r.symbols)
+                            for r in b.releases]
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [200, 100, 5][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        content = build(releases, symbols)
+        filename = os.path.join(directory, "libbench.map")
+        copy = os.path.join(directory, "copy.map")
+        for name in (filename, copy):
+            with open(name, "w") as f:
+                f.write(content)
+        lock = lockfile.get_lock(filename)
+
+        last = "LIBBENCH_{0}_0".format(releases - 1)
+        unreleased = content.replace("bench_{0}_0;".format(releases - 1),
+                                     "bench_added;")
+        released = content.replace("bench_0_0;", "bench_changed;")
+
+        print("{0} releases, {1} symbols each".format(releases, symbols))
+        print("{0:<40}{1:>12}".format("operation", "time (ms)"))
+        for operation, function in (
+                ("structural comparison",
+                 lambda: compare(filename, copy)),
+                ("compute the lock",
+                 lambda: lockfile.get_lock(filename, content)),
+                ("verify, unchanged",
+                 lambda: lockfile.verify(filename, lock, content)),
+                ("verify, {0} modified".format(last),
+                 lambda: lockfile.verify(filename, lock, unreleased)),
+                ("verify, released release modified",
+                 lambda: lockfile.verify(filename, lock, released))):
+            best = min(timeit.repeat(function, number=1, repeat=repeat))
+            print("{0:<40}{1:>12.3f}".format(operation, best * 1e3))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare the memory used by parsed maps in the default and compact modes
+
+Usage: python benchmarks/bench_memory.py [MAPS] [RELEASES] [SYMBOLS]
+
+Generates MAPS map files, each containing RELEASES releases with SYMBOLS
+symbols each. Most symbols are shared between the maps, like the maps of
+different versions of the same library.
+"""
+
+from __future__ import print_function
+
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from abimap import symver
+
+
+def generate(directory, maps, releases, symbols):
+    names = []
+    for i in range(maps):
+        name = os.path.join(directory, "lib{0}.map".format(i))
+        with open(name, "w") as f:
+            previous = ""
+            for j in range(releases):
+                release = "LIBBENCH_{0}_{1}_0".format(i, j)
+                f.write(release + "\n{\n    global:\n")
+                for k in range(symbols):
+                    f.write("        bench_symbol_{0}_{1};\n".format(j, k))
+                if not previous:
+                    f.write("    local:\n        *;\n")
+                f.write("} " + previous + ";\n\n")
+                previous = release
+        names.append(name)
+    return names
+
+
+def measure(names, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    maps = [symver.Map(filename=name, **kwargs) for name in names]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del maps
+    return current, peak
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    maps, releases, symbols = args + [40, 50, 200][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        names = generate(directory, maps, releases, symbols)
+
+        print("{0} maps, {1} releases, {2} symbols per release".format(
+            maps, releases, symbols))
+        print("{0:<24}{1:>14}{2:>14}".format("mode", "retained (MB)",
+                                             "peak (MB)"))
+        baseline = None
+        for mode, kwargs in (("keep lines", {"keep_lines": True}),
+                             ("default", {}),
+                             ("compact", {"compact": True})):
+            current, peak = measure(names, **kwargs)
+            if baseline is None:
+                baseline = current
+            print("{0:<24}{1:>14.1f}{2:>14.1f}  ({3:.0%})".format(
+                mode, current / 1e6, peak / 1e6, current / float(baseline)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare parsing a large map serially and in parallel
+
+Usage: python benchmarks/bench_parallel.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Generates a map file containing RELEASES releases with SYMBOLS symbols each,
+and measures the best of REPEAT runs of parsing it with 1, 2, 4 and the number
+of CPUs processes. The speedup is only seen on machines with more than one CPU.
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from abimap import symver
+
+
+def generate(name, releases, symbols):
+    with open(name, "w") as f:
+        previous = ""
+        for j in range(releases):
+            release = "LIBBENCH_{0}_0".format(j)
+            f.write(release + "\n{\n    global:\n")
+            for k in range(symbols):
+                f.write("        bench_symbol_{0}_{1};\n".format(j, k))
+            if not previous:
+                f.write("    local:\n        *;\n")
+            f.write("} " + previous + ";\n\n")
+            previous = release
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [200, 500, 3][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        map_name = os.path.join(directory, "lib.map")
+        generate(map_name, releases, symbols)
+
+        cpus = multiprocessing.cpu_count()
+        print("{0} releases, {1} symbols per release, {2} CPUs".format(
+            releases, symbols, cpus))
+        print("{0:<32}{1:>12}".format("jobs", "time (ms)"))
+        baseline = None
+        for jobs in sorted(set((1, 2, 4, cpus))):
+            best = min(timeit.repeat(
+                lambda: symver.Map(filename=map_name, jobs=jobs), number=1,
+                repeat=repeat))
+            if baseline is None:
+                baseline = best
+            print("{0:<32}{1:>12.3f}  ({2:.1%})".format(
+                jobs, best * 1e3, best / baseline))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
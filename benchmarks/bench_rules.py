@@ -0,0 +1,56 @@
+"""Measure checking large maps with the rules of Map.check()
+
+Usage: python benchmarks/bench_rules.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Builds a map containing RELEASES releases with SYMBOLS symbols each and
+measures the best of REPEAT runs of checking it with the default rules, with
+all the rules and with each rule alone.
+"""
+
+from __future__ import print_function
+
+import logging
+import sys
+import timeit
+
+from abimap import rules
+from abimap import symver
+
+
+def build(releases, symbols):
+    m = symver.Map()
+    m.logger.setLevel(logging.ERROR)
+    previous = ""
+    for j in range(releases):
+        r = symver.Release()
+        r.name = "LIBBENCH_{0}_0".format(j)
+        r.previous = previous
+        r.symbols["global"] = ["bench_symbol_{0}_{1}".format(j, k) for k in
+                               range(symbols)]
+        if not previous:
+            r.symbols["local"] = ["*"]
+        m.releases.append(r)
+        previous = r.name
+    return m
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [1000, 100, 3][len(args):]
+
+    m = build(releases, symbols)
+
+    print("{0} releases, {1} symbols per release".format(releases,
+                                                        symbols))
+    print("{0:<40}{1:>12}".format("rules", "time (ms)"))
+    selections = [("default", None),
+                  ("all", [rule.name for rule in rules.RULES])]
+    selections.extend((rule.name, [rule.name]) for rule in rules.RULES)
+    for name, selected in selections:
+        m.rules = selected
+        best = min(timeit.repeat(m.check, number=1, repeat=repeat))
+        print("{0:<40}{1:>12.3f}".format(name, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare the first scan of a directory with a scan of an existing index
+
+Usage: python benchmarks/bench_scan.py [DIRECTORY] [JOBS]
+
+Scans the shared objects of DIRECTORY (by default, the largest of the usual
+library directories) with JOBS worker processes (defaults to the
+number of CPUs) into a new index, then scans it again with the index kept,
+when no file changed.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from abimap.merge import get_default_jobs
+from abimap.scan import Scan_Index
+
+DIRECTORIES = ("/usr/lib64", "/usr/lib/x86_64-linux-gnu", "/usr/lib")
+
+
+def main():
+    if len(sys.argv) > 1:
+        directory = sys.argv[1]
+    else:
+        directory = max((d for d in DIRECTORIES if os.path.isdir(d)),
+                        key=lambda d: len(os.listdir(d)))
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else get_default_jobs()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "index.db")
+        with Scan_Index(path) as index:
+            results = []
+            for scan in ("first scan", "rescan"):
+                start = timeit.default_timer()
+                stats = index.scan([directory], jobs=jobs)
+                results.append((scan, timeit.default_timer() - start, stats))
+
+        print("{0}: {1} files, {2} shared objects, {3} jobs".format(
+            directory, stats.files, stats.libraries, jobs))
+        print("{0:<40}{1:>12}{2:>12}".format("scan", "time (ms)",
+                                             "files read"))
+        for scan, seconds, stats in results:
+            print("{0:<40}{1:>12.3f}{2:>12}".format(scan, seconds * 1e3,
+                                                    stats.read))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
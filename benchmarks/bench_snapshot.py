@@ -0,0 +1,88 @@
+"""Compare loading maps from binary snapshots with parsing the text
+
+Usage: python benchmarks/bench_snapshot.py [RELEASES] [SYMBOLS] [REPEAT]
+
+Generates a map file containing RELEASES releases with SYMBOLS symbols each,
+saves its snapshot, and measures the best of REPEAT runs of each way of loading
+it.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from abimap import symver
+from abimap.snapshot import Snapshot
+
+
+def generate(name, releases, symbols):
+    with open(name, "w") as f:
+        previous = ""
+        for j in range(releases):
+            release = "LIBBENCH_{0}_0".format(j)
+            f.write(release + "\n{\n    global:\n")
+            for k in range(symbols):
+                f.write("        bench_symbol_{0}_{1};\n".format(j, k))
+            if not previous:
+                f.write("    local:\n        *;\n")
+            f.write("} " + previous + ";\n\n")
+            previous = release
+
+
+def parse(name):
+    symver.Map(filename=name)
+
+
+def load(name):
+    m = symver.Map()
+    m.load_snapshot(name)
+    return m
+
+
+def load_all(name):
+    for release in load(name).releases:
+        release.symbols
+
+
+def lookup(name):
+    Snapshot(name).find_symbol("bench_symbol_0_0")
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    releases, symbols, repeat = args + [50, 200, 5][len(args):]
+
+    directory = tempfile.mkdtemp()
+    try:
+        map_name = os.path.join(directory, "lib.map")
+        snapshot_name = map_name + ".snap"
+        generate(map_name, releases, symbols)
+        symver.Map(filename=map_name).save_snapshot(snapshot_name)
+
+        print("{0} releases, {1} symbols per release".format(releases,
+                                                            symbols))
+        print("map: {0} bytes, snapshot: {1} bytes".format(
+            os.path.getsize(map_name), os.path.getsize(snapshot_name)))
+        print("{0:<32}{1:>12}".format("operation", "time (ms)"))
+        baseline = None
+        for operation, function, name in (
+                ("parse text", parse, map_name),
+                ("load snapshot", load, snapshot_name),
+                ("load snapshot, all symbols", load_all, snapshot_name),
+                ("open snapshot, find symbol", lookup, snapshot_name)):
+            best = min(timeit.repeat(lambda: function(name), number=1,
+                                     repeat=repeat))
+            if baseline is None:
+                baseline = best
+            print("{0:<32}{1:>12.3f}  ({2:.1%})".format(
+                operation, best * 1e3, best / baseline))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the symbol set operations of update with and without NumPy
+
+Usage: python benchmarks/bench_symbol_changes.py [SYMBOLS] [CHANGED] [REPEAT]
+
+Compares a map of SYMBOLS global symbols with SYMBOLS given symbols, of which
+CHANGED are new (and CHANGED of the map are missing), and measures the best
+of REPEAT runs of computing the changes in each mode of update, with Python
+sets and with NumPy. The given symbols are split from a text before each run,
+as when they are read from the input.
+"""
+
+from __future__ import print_function
+
+import random
+import sys
+import timeit
+
+from abimap import symver
+from abimap import vector
+
+try:
+    from sys import intern
+except ImportError:
+    pass
+
+
+def measure(function, text, repeat):
+    times = []
+    for _ in range(repeat):
+        new_symbols = text.split()
+        start = timeit.default_timer()
+        function(new_symbols)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:4]]
+    symbols, changed, repeat = args + [2000000, 20000, 3][len(args):]
+
+    # The symbols of a parsed map are interned
+    cur_symbols = [intern("generated_symbol_{0}".format(k)) for k in
+                   range(symbols)]
+    new_symbols = cur_symbols[changed:] + ["added_symbol_{0}".format(k) for
+                                           k in range(changed)]
+    random.Random(0).shuffle(new_symbols)
+    text = " ".join(new_symbols)
+
+    if vector.numpy is None:
+        print("NumPy is not installed")
+    print("{0} symbols, {1} changed".format(symbols, changed))
+    print("{0:<40}{1:>12}".format("operation", "time (ms)"))
+    min_symbols = symver.VECTOR_MIN_SYMBOLS
+    for mode, add, remove in (("compare", False, False), ("add", True, False),
+                              ("remove", False, True)):
+        for backend in ("python", "numpy"):
+            if backend == "numpy" and vector.numpy is None:
+                continue
+            symver.VECTOR_MIN_SYMBOLS = (min_symbols if backend == "numpy"
+                                         else float("inf"))
+            best = measure(lambda new: symver.get_symbol_changes(
+                cur_symbols, new, add, remove), text, repeat)
+            print("{0:<40}{1:>12.3f}".format(
+                "{0}, {1}".format(mode, backend), best * 1e3))
+    symver.VECTOR_MIN_SYMBOLS = min_symbols
+
+
+if __name__ == "__main__":
+    main()
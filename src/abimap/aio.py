@@ -0,0 +1,201 @@
+"""Coroutines to read, check, update and write maps without blocking
+
+The file operations run in the default executor of the event loop. The parsing
+and checking, which are CPU bound, run in the executor given to each coroutine
+(the default executor if not given). Using a
+``concurrent.futures.ProcessPoolExecutor`` allows many maps to be parsed in
+parallel. The coroutines require Python 3.7 or later.
+
+The results are the same given by the synchronous functions in
+``abimap.symver``::
+
+    async def check_all(filenames):
+        with ProcessPoolExecutor() as executor:
+            return await gather_bounded((read_map(name, executor=executor)
+                                         for name in filenames), limit=8)
+"""
+
+import asyncio
+import io
+import sys
+
+from . import symver
+from .symver import Map
+
+
+###############################################################################
+# Functions executed in the executors
+###############################################################################
+
+def _read_lines(filename):
+    with open(filename, "r") as f:
+        return f.readlines()
+
+
+def _parse_map(filename, lines, check):
+    m = Map()
+    m.filename = filename
+    m.parse(lines)
+    if check:
+        m.check()
+    return m
+
+
+def _check_map(m):
+    m.check()
+    return m
+
+
+def _update_map(cur_map, new_symbols, release_info, kwargs):
+    out = io.StringIO()
+    new_map, release = symver.update_map(cur_map, new_symbols, release_info,
+                                         out=out, **kwargs)
+    return new_map, release, out.getvalue()
+
+
+def _render_map(m, action, program):
+    out = io.StringIO()
+    symver.write_map(m, action, program=program, out=out)
+    return out.getvalue()
+
+
+###############################################################################
+# Coroutines
+###############################################################################
+
+async def read_map(filename, executor=None, check=True):
+    """
+    Read and parse a map file
+
+    This is the equivalent of ``Map(filename=filename)``.
+
+    :param filename:    The path to the map file
+    :param executor:    The executor where the map is parsed
+    :param check:       If True, the map is checked after parsing
+    :returns:           The parsed Map
+    :raises ParserError:    Raised when a syntax error is found in the file
+    """
+
+    loop = asyncio.get_running_loop()
+    lines = await loop.run_in_executor(None, _read_lines, filename)
+    return await loop.run_in_executor(executor, _parse_map, filename, lines,
+                                      check)
+
+
+async def check_map(m, executor=None):
+    """
+    Check a map
+
+    Since the executor can run in another process, the checked map is
+    returned; use it instead of the given one.
+
+    :param m:           The map to be checked
+    :param executor:    The executor where the map is checked
+    :returns:           The checked Map
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _check_map, m)
+
+
+async def read_symbols(filename):
+    """
+    Read the list of symbols from a file
+
+    :param filename:    The path to the file containing the symbols
+    :returns:           A list of the obtained symbols
+    """
+
+    loop = asyncio.get_running_loop()
+    lines = await loop.run_in_executor(None, _read_lines, filename)
+    return symver.get_symbols_from_lines(lines)
+
+
+async def update_map(cur_map, new_symbols, release_info=None, executor=None,
+                     out=None, **kwargs):
+    """
+    Update a map with the given list of symbols
+
+    This is the equivalent of ``symver.update_map()``, which describes the
+    other keyword arguments. The given map is not modified.
+
+    :param cur_map:         The map to be updated (a checked Map)
+    :param new_symbols:     The list of symbols
+    :param release_info:    The new release information
+    :param executor:        The executor where the map is updated
+    :param out:             The stream where the changes are printed (defaults
+                            to stdout)
+    :returns:               A tuple (map, release); (None, None) if the map
+                            was not changed
+    """
+
+    loop = asyncio.get_running_loop()
+    new_map, release, text = await loop.run_in_executor(executor, _update_map,
+                                                        cur_map.copy(),
+                                                        new_symbols,
+                                                        release_info, kwargs)
+    if text:
+        (out if out is not None else sys.stdout).write(text)
+    return new_map, release
+
+
+async def create_map(release_info, new_symbols, final=False, executor=None):
+    """
+    Create a new map containing the given symbols in a single release
+
+    This is the equivalent of ``symver.create_map()``.
+
+    :param release_info:    The release information
+    :param new_symbols:     The list of symbols
+    :param final:           Mark the new release as released
+    :param executor:        The executor where the map is created
+    :returns:               The new map; None if no symbols were given
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, symver.create_map,
+                                      release_info, new_symbols, final)
+
+
+async def write_map(m, filename, action="updated", program=None,
+                    executor=None):
+    """
+    Write a map to a file atomically, preceded by a comment header
+
+    The content is the same written by ``symver.write_map()``.
+
+    :param m:           The map to be written
+    :param filename:    The path to the output file
+    :param action:      The action described in the header
+    :param program:     The name of the program written in the header
+    :param executor:    The executor where the map is rendered
+    """
+
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(executor, _render_map, m, action,
+                                         program)
+    await loop.run_in_executor(None, symver.atomic_write, filename, content)
+
+
+async def gather_bounded(coroutines, limit=None):
+    """
+    Run coroutines concurrently, but no more than ``limit`` at a time
+
+    :param coroutines:  An iterable of coroutines
+    :param limit:       The maximum number of coroutines running at the same
+                        time. If None, there is no limit.
+    :returns:           The list of results, in the order of the coroutines
+    :raises Exception:  The first exception raised by a coroutine
+    """
+
+    if limit is None:
+        return await asyncio.gather(*coroutines)
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(bounded(coroutine) for coroutine in
+                                  coroutines))
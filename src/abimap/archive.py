@@ -0,0 +1,383 @@
+"""Read the symbols of static archives
+
+The symbols which can be exported by a library can be read from its static
+archive (``.a``), in the GNU, BSD and thin variants of the ``ar`` format. The
+archive is memory-mapped, and its ELF members are scanned in parallel for
+their defined, global and weak symbols with a default or protected
+visibility:
+::
+
+    from abimap.archive import iter_archive_symbols
+
+    for member, symbol in iter_archive_symbols("libx.a"):
+        print(member, symbol)
+
+The members of thin archives are not stored in the archive; they are read
+from their paths, relative to the directory of the archive.
+"""
+
+import mmap
+import multiprocessing
+import os
+import struct
+from collections import namedtuple
+
+from .elf import ELF_Error
+from .elf import ELF_File
+from .elf import is_elf
+from .inputs import get_symbol_types
+from .merge import get_default_jobs
+from .symver import Single_Logger
+
+# The magic numbers at the start of the archives
+AR_MAGIC = b"!<arch>\n"
+THIN_MAGIC = b"!<thin>\n"
+
+# The header of a member: name, date, uid, gid, mode, size, and the magic
+# number of the header
+AR_HEADER = struct.Struct("16s12s6s6s8s10s2s")
+AR_HEADER_MAGIC = b"`\n"
+
+# The names of the symbol tables (GNU 32 and 64 bits, and BSD)
+SYMBOL_TABLES = ("/", "/SYM64/", "__.SYMDEF", "__.SYMDEF SORTED")
+
+# The minimum number of members scanned in worker processes; smaller archives
+# are scanned faster than the workers are started
+ARCHIVE_PARALLEL_MIN_MEMBERS = 64
+
+# A member of an archive: the name, the offset and size of the data in the
+# archive, and the path to the file of the members of thin archives (None for
+# the members stored in the archive)
+Member = namedtuple("Member", ("name", "offset", "size", "path"))
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Archive(object):
+    """
+    A memory-mapped static archive
+
+    It is a context manager, closing the file when leaving the context.
+
+    Attributes:
+        filename:   The path to the archive
+        thin:       True if the archive is a thin archive
+        data:       The memory-mapped content
+    """
+
+    def __init__(self, filename):
+        """
+        The constructor
+
+        :param filename:    The path to the archive
+        :raises Exception:  Raised when the file is not an archive
+        """
+
+        self.filename = filename
+        self.data = None
+        self._file = open(filename, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size < len(AR_MAGIC):
+                magic = self._file.read()
+            else:
+                self.data = mmap.mmap(self._file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+                magic = self.data[:len(AR_MAGIC)]
+            if magic not in (AR_MAGIC, THIN_MAGIC):
+                logger = Single_Logger.getLogger(__name__)
+                msg = "\'{0}\' is not an archive".format(filename)
+                logger.error(msg)
+                raise Exception(msg)
+        except Exception:
+            self.close()
+            raise
+        self.thin = magic == THIN_MAGIC
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmap and close the archive
+        """
+
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def members(self):
+        """
+        Get the members of the archive
+
+        The symbol tables and the table of the long names are not members.
+
+        :returns:   A list of ``Member`` instances, in the order of the
+                    archive
+        :raises Exception:  Raised when the archive is corrupted
+        """
+
+        data = self.data
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        members = []
+        names = b""
+        position = len(AR_MAGIC)
+        end = len(data)
+        while position + AR_HEADER.size <= end:
+            (name, _, _, _, _, size,
+             magic) = AR_HEADER.unpack_from(data, position)
+            if magic != AR_HEADER_MAGIC:
+                self._corrupted(position)
+            try:
+                size = int(size)
+            except ValueError:
+                self._corrupted(position)
+            position += AR_HEADER.size
+            offset = position
+            name = name.decode("utf-8", "replace").rstrip(" ")
+
+            if name == "//":
+                # The table of the long names, always stored in the archive
+                names = data[offset:offset + size]
+                position += size + (size & 1)
+                continue
+
+            if name.startswith("#1/"):
+                # BSD long name, stored before the data
+                length = int(name[3:])
+                name = data[offset:offset + length]
+                name = name.decode("utf-8", "replace").rstrip("\0")
+                offset += length
+                stored = size
+                size -= length
+            elif name.startswith("/") and name[1:].isdigit():
+                # GNU long name, at an offset of the table of the long names
+                start = int(name[1:])
+                stop = names.find(b"\n", start)
+                if stop < 0:
+                    stop = len(names)
+                name = names[start:stop].decode("utf-8", "replace")
+                name = name.rstrip("/")
+                stored = size
+            else:
+                if name not in SYMBOL_TABLES:
+                    name = name.rstrip("/")
+                stored = size
+
+            if name in SYMBOL_TABLES:
+                # The symbol tables are stored in thin archives too
+                position += stored + (stored & 1)
+                continue
+
+            if self.thin:
+                members.append(Member(name, 0, size,
+                                      os.path.join(directory, name)))
+            else:
+                if offset + size > end:
+                    self._corrupted(position - AR_HEADER.size)
+                members.append(Member(name, offset, size, None))
+                position += stored + (stored & 1)
+        return members
+
+    def _corrupted(self, position):
+        """
+        Report a corrupted archive
+
+        :param position:    The position of the invalid header
+        :raises Exception:  Always raised
+        """
+
+        logger = Single_Logger.getLogger(__name__)
+        msg = "\'{0}\' is corrupted: invalid member header at offset" \
+              " {1}".format(self.filename, position)
+        logger.error(msg)
+        raise Exception(msg)
+
+
+###############################################################################
+# Functions executed in the worker processes
+###############################################################################
+
+def _scan_member(data, member, types):
+    """
+    Get the exported symbols of a member
+
+    :param data:    The buffer containing the member
+    :param member:  The ``Member``
+    :param types:   The set of types of the symbols to be kept
+    :returns:       A tuple (names, error); the error message is None if the
+                    member is an ELF file
+    """
+
+    offset = member.offset
+    if not is_elf(data, offset):
+        return None, "not an ELF file"
+    try:
+        elf = ELF_File(data, offset, member.size)
+        return elf.exported_symbols(types, dynamic=False), None
+    except ELF_Error as e:
+        return None, str(e)
+
+
+def _scan_thin_member(member, types):
+    """
+    Get the exported symbols of a member of a thin archive
+
+    :param member:  The ``Member``
+    :param types:   The set of types of the symbols to be kept
+    :returns:       A tuple (names, error)
+    """
+
+    try:
+        with open(member.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < 4:
+                return None, "not an ELF file"
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError) as e:
+        return None, str(e)
+    try:
+        return _scan_member(data, member._replace(size=len(data)), types)
+    finally:
+        data.close()
+
+
+def _scan_members(task):
+    """
+    Get the exported symbols of a chunk of members
+
+    The archive is memory-mapped by each worker process, so that only the
+    descriptions of the members are sent to the workers.
+
+    :param task:    A tuple (archive path, members, types)
+    :returns:       A list of tuples (member name, names, error), in the order
+                    of the members
+    """
+
+    filename, members, types = task
+    results = []
+    if members and members[0].path is not None:
+        for member in members:
+            names, error = _scan_thin_member(member, types)
+            results.append((member.name, names, error))
+        return results
+
+    with Archive(filename) as archive:
+        for member in members:
+            names, error = _scan_member(archive.data, member, types)
+            results.append((member.name, names, error))
+    return results
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def is_archive(filename):
+    """
+    Check if a file is a static archive
+
+    :param filename:    The path to the file
+    :returns:           True if the file starts with the magic number of
+                        archives
+    """
+
+    with open(filename, "rb") as f:
+        return f.read(len(AR_MAGIC)) in (AR_MAGIC, THIN_MAGIC)
+
+
+def _iter_results(filename, members, types, jobs):
+    """
+    Scan the members, in parallel if more than one job is requested
+
+    :param filename:    The path to the archive
+    :param members:     The list of members
+    :param types:       The set of types of the symbols to be kept
+    :param jobs:        The number of worker processes
+    :returns:           A generator of tuples (member name, names, error), in
+                        the order of the members
+    """
+
+    if len(members) < ARCHIVE_PARALLEL_MIN_MEMBERS:
+        jobs = 1
+    jobs = min(jobs, len(members))
+
+    if jobs <= 1:
+        for result in _scan_members((filename, members, types)):
+            yield result
+        return
+
+    # Send the members in chunks to amortize the communication cost
+    chunksize = max(1, len(members) // (jobs * 4))
+    tasks = [(filename, members[i:i + chunksize], types) for i in
+             range(0, len(members), chunksize)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for results in pool.imap(_scan_members, tasks):
+            for result in results:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def iter_archive_symbols(filename, types=None, jobs=None):
+    """
+    Iterate over the symbols which can be exported from a static archive
+
+    The members which are not ELF files are skipped with a warning.
+
+    :param filename:    The path to the archive
+    :param types:       The names of the types of the symbols to be kept (see
+                        ``abimap.inputs``); if None, the default types
+    :param jobs:        The number of worker processes (defaults to the number
+                        of CPUs)
+    :returns:           A generator of tuples (member name, symbol name), in
+                        the order of the archive
+    :raises Exception:  Raised when the file is not an archive, or is
+                        corrupted
+    """
+
+    logger = Single_Logger.getLogger(__name__)
+    types = get_symbol_types(types)
+    if jobs is None:
+        jobs = get_default_jobs()
+
+    with Archive(filename) as archive:
+        members = archive.members()
+
+    for member, names, error in _iter_results(filename, members, types,
+                                              jobs):
+        if error is not None:
+            logger.warning("Skipping member \'%s\' of \'%s\': %s", member,
+                           filename, error)
+            continue
+        for name in names:
+            yield member, name
+
+
+def read_archive_symbols(filename, types=None, jobs=None):
+    """
+    Get the symbols which can be exported from a static archive
+
+    :param filename:    The path to the archive
+    :param types:       The names of the types of the symbols to be kept
+    :param jobs:        The number of worker processes (defaults to the number
+                        of CPUs)
+    :returns:           A list of the names of the symbols, without
+                        duplicates, in the order of the archive
+    """
+
+    seen = set()
+    symbols = []
+    for _, name in iter_archive_symbols(filename, types, jobs):
+        if name not in seen:
+            seen.add(name)
+            symbols.append(name)
+    return symbols
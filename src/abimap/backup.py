@@ -0,0 +1,194 @@
+"""Backups of the files overwritten by the subcommands
+
+When the output of a subcommand is one of its inputs, a backup of the input is
+made before it is overwritten (see ``symver.check_files()``). The backup is
+made with the cheapest of these strategies supported by the file system:
+
+    - ``reflink``: the backup shares the blocks of the file (``FICLONE``
+      ioctl, on Btrfs, XFS and other copy-on-write file systems)
+    - ``copy_file_range``: the data is copied by the kernel, without passing
+      through the process (and shared, when the file system supports it)
+    - ``hardlink``: the backup is a hard link to the file. This is only used
+      when the caller knows the file is going to be replaced by a new file,
+      since a modification in place would change the backup too. The
+      subcommands do not use it: the file is not replaced if the update
+      fails or changes nothing
+    - ``copy``: the data is read and written by the process
+
+The backups can be rotated: with more than one backup, the newest backup is
+``<file>.old.1`` and the oldest is ``<file>.old.N``.
+"""
+
+import binascii
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    # The ioctls are not available (e.g. on Windows)
+    fcntl = None
+
+# The strategies used to make a backup, in the order they are tried
+STRATEGIES = ("reflink", "copy_file_range", "hardlink", "copy")
+
+# The ioctl which makes a file share the blocks of another (linux/fs.h)
+FICLONE = 0x40049409
+
+# The errors meaning that a strategy is not supported for the given files
+UNSUPPORTED_ERRORS = frozenset(getattr(errno, name) for name in
+                               ("EOPNOTSUPP", "ENOTSUP", "ENOTTY", "ENOSYS",
+                                "EXDEV", "EINVAL", "EBADF", "EPERM", "EMLINK")
+                               if hasattr(errno, name))
+
+# The size of the chunks copied by copy_file_range
+COPY_CHUNK_SIZE = 1 << 30
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_backup_name(filename, keep=1, index=1):
+    """
+    Get the name of a backup of a file
+
+    :param filename:    The path to the file
+    :param keep:        The number of backups kept
+    :param index:       The index of the backup, from 1 (the newest) to
+                        ``keep`` (the oldest)
+    :returns:           The path to the backup: ``<file>.old`` if only one
+                        backup is kept, ``<file>.old.<index>`` otherwise
+    """
+
+    if keep == 1:
+        return filename + ".old"
+    return "{0}.old.{1}".format(filename, index)
+
+
+def rotate_backups(filename, keep):
+    """
+    Rename the backups of a file to make room for a new one
+
+    Each backup ``<file>.old.<i>`` is renamed to ``<file>.old.<i+1>``; the
+    oldest backup is replaced.
+
+    :param filename:    The path to the file
+    :param keep:        The number of backups kept
+    """
+
+    for index in range(keep - 1, 0, -1):
+        name = get_backup_name(filename, keep, index)
+        if os.path.lexists(name):
+            os.rename(name, get_backup_name(filename, keep, index + 1))
+
+
+def _is_unsupported(e):
+    return getattr(e, "errno", None) in UNSUPPORTED_ERRORS
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except (IOError, OSError) as e:
+        if _is_unsupported(e):
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(src, dst):
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+    try:
+        while copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK_SIZE):
+            pass
+    except OSError as e:
+        if not _is_unsupported(e):
+            raise
+        # Start again from the beginning with another strategy
+        src.seek(0)
+        dst.seek(0)
+        dst.truncate()
+        return False
+    return True
+
+
+def _hardlink(filename, backup):
+    # The link is made with a temporary name, which replaces the backup
+    while True:
+        tmp_name = "{0}.{1}.tmp".format(backup,
+                                        binascii.hexlify(os.urandom(4))
+                                        .decode("ascii"))
+        try:
+            os.link(filename, tmp_name)
+            break
+        except OSError as e:
+            if _is_unsupported(e):
+                return False
+            if e.errno != errno.EEXIST:
+                raise
+    try:
+        os.rename(tmp_name, backup)
+    except Exception:
+        os.unlink(tmp_name)
+        raise
+    return True
+
+
+def backup_file(filename, keep=1, replaced=False, strategies=STRATEGIES):
+    """
+    Make a backup of a file
+
+    The strategies are tried in the given order, skipping the ones not
+    supported by the file system. The mode and the times of the file are kept
+    in the backup, as ``shutil.copy2()`` does.
+
+    :param filename:    The path to the file
+    :param keep:        The number of backups kept (see ``rotate_backups()``)
+    :param replaced:    True if the file is going to be replaced by a new
+                        file, which allows the ``hardlink`` strategy
+    :param strategies:  The names of the strategies to be tried (see
+                        ``STRATEGIES``)
+    :returns:           A tuple (backup, strategy) with the path to the backup
+                        and the name of the strategy used
+    """
+
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown backup strategy \'{0}\'".format(
+                strategy))
+
+    if keep > 1:
+        rotate_backups(filename, keep)
+    backup = get_backup_name(filename, keep)
+
+    # A backup linked to the file (if the file was not replaced after the
+    # backup was made) would truncate the file when written
+    if os.path.isfile(backup) and os.path.samefile(backup, filename):
+        os.unlink(backup)
+
+    with open(filename, "rb") as src, open(backup, "wb") as dst:
+        for strategy in strategies:
+            if strategy == "reflink":
+                done = _reflink(src, dst)
+            elif strategy == "copy_file_range":
+                done = _copy_file_range(src, dst)
+            elif strategy == "hardlink":
+                done = replaced and _hardlink(filename, backup)
+            else:
+                shutil.copyfileobj(src, dst)
+                done = True
+            if done:
+                break
+        else:
+            raise ValueError("No backup strategy could be used for \'{0}\'"
+                             .format(filename))
+
+    if strategy != "hardlink":
+        shutil.copystat(filename, backup)
+    return backup, strategy
@@ -0,0 +1,371 @@
+"""Lossless concrete syntax tree of a map file
+
+A ``Document`` keeps the text of a parsed map: the lines of each release and
+the trivia between the releases (comments and blank lines), in the order of
+the file. After the map is modified, ``render()`` emits the unchanged releases
+and the trivia byte-for-byte, and splices in only the changes:
+::
+
+    m = Map(filename="lib.map", keep_lines=True)
+    document = Document(m)
+    m.bulk_add_symbols("LIBX_1_1_0", ["new_symbol"])
+    content = document.render(m)
+
+The changes spliced into the text are:
+
+- symbols appended to a scope, inserted after the last symbol of the scope
+  with the same indentation;
+- new scopes, inserted after the ``{`` of the release;
+- a release marked as released, or no longer released;
+- new releases, inserted next to their previous release (before it if the
+  newest releases come first in the file, after it otherwise), or at the end
+  of the file;
+- removed releases, whose lines are dropped.
+
+Any other change to a release (e.g. symbols removed or reordered, or a new
+name or previous release) replaces the lines of the release with its
+regenerated text.
+"""
+
+from .symver import ELEMENT_RE
+from .symver import IDENTIFIER_RE
+from .symver import RELEASED_RE
+from .symver import SPACE_RE
+
+# The marker written after the name of a released release
+RELEASED_MARKER = "    # Released"
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Document(object):
+    """
+    The text of a parsed map, split in releases and trivia
+
+    Attributes:
+        nodes:  The list of nodes (instances of ``_Node``) in the order of the
+                file
+    """
+
+    __slots__ = ("nodes", "logger")
+
+    def __init__(self, m):
+        """
+        The constructor
+
+        The releases of the map must be in the order of the file, as they are
+        after reading it. The symbols of lazy releases are loaded.
+
+        :param m:   The map, read with ``keep_lines=True``
+        """
+
+        self.logger = m.logger
+        self.nodes = []
+
+        if not m.lines:
+            msg = "The lines of the map were not kept, read it with" \
+                  " keep_lines=True"
+            self.logger.error(msg)
+            raise Exception(msg)
+
+        lines = m.lines
+        position = 0
+        for release in m.releases:
+            if release.span is None:
+                msg = "Release \'{0}\' was not parsed".format(release.name)
+                self.logger.error(msg)
+                raise Exception(msg)
+            first, last = release.span
+            if first < position:
+                msg = "Release \'{0}\' shares a line with another release," \
+                      " the layout cannot be preserved".format(release.name)
+                self.logger.error(msg)
+                raise Exception(msg)
+            if first > position:
+                self.nodes.append(_Node(None, lines[position:first]))
+            self.nodes.append(_Node(release, lines[first:last + 1]))
+            position = last + 1
+        if position < len(lines):
+            self.nodes.append(_Node(None, lines[position:]))
+
+    def render(self, m):
+        """
+        Get the text of the map, preserving the text of the document where
+        the map was not changed
+
+        :param m:   The map, which can have been modified after the document
+                    was created
+        :returns:   The text of the map
+        """
+
+        known = dict((id(node.release), node) for node in self.nodes if
+                     node.release is not None)
+        present = set(id(release) for release in m.releases if
+                      id(release) in known)
+        by_name = dict((known[key].release.name, known[key]) for key in
+                       present)
+        newest_first = self._newest_first()
+
+        # A new release is placed next to its previous release, following
+        # the order of the file. Otherwise, it is placed before the next known
+        # release in the map, or at the end.
+        before = {}
+        after = {}
+        pending = []
+        for release in m.releases:
+            if id(release) in present:
+                if pending:
+                    before.setdefault(id(release), []).extend(pending)
+                    pending = []
+                continue
+            anchor = by_name.get(release.previous)
+            if anchor is None:
+                pending.append(release)
+            elif newest_first:
+                before.setdefault(id(anchor.release), []).append(release)
+            else:
+                after.setdefault(id(anchor.release), []).append(release)
+
+        out = []
+        for node in self.nodes:
+            if node.release is None:
+                out.extend(node.lines)
+                continue
+            key = id(node.release)
+            for release in before.get(key, ()):
+                out.append(str(release) + "\n")
+            if key in present:
+                out.extend(node.render())
+            _append(out, after.get(key, ()))
+        _append(out, pending)
+
+        return "".join(out)
+
+    def _newest_first(self):
+        """
+        Check if the releases are listed from the newest to the oldest
+
+        :returns:   False if a release is listed after its previous release;
+                    True otherwise
+        """
+
+        positions = {}
+        for index, node in enumerate(self.nodes):
+            if node.release is not None:
+                positions[node.snapshot[0]] = index
+        for node in self.nodes:
+            if node.release is not None:
+                previous = positions.get(node.snapshot[1])
+                if previous is not None:
+                    return previous > positions[node.snapshot[0]]
+        return True
+
+
+class _Node(object):
+    """
+    A node of the document: a release and its lines, or trivia
+
+    Attributes:
+        release:    The release; None for trivia
+        lines:      The lines of the file
+        snapshot:   A tuple (name, previous, released, symbols) with the
+                    content of the release when the document was created; the
+                    symbols is a dictionary {scope: tuple of symbols}
+    """
+
+    __slots__ = ("release", "lines", "snapshot")
+
+    def __init__(self, release, lines):
+        self.release = release
+        self.lines = lines
+        self.snapshot = None
+        if release is not None:
+            self.snapshot = (release.name, release.previous, release.released,
+                             dict((scope, tuple(symbols)) for scope, symbols
+                                  in release.symbols.items()))
+
+    def render(self):
+        """
+        Get the lines of the release, splicing in the changes
+
+        :returns:   A list of strings
+        """
+
+        r = self.release
+        name, previous, released, old = self.snapshot
+        if r.name != name or r.previous != previous:
+            return [str(r)]
+
+        current = r.symbols
+        if any(scope not in current for scope in old):
+            return [str(r)]
+
+        # The symbols appended to each scope; None for new scopes
+        appended = []
+        for scope in sorted(current):
+            symbols = current[scope]
+            before = old.get(scope)
+            if before is None:
+                appended.append((scope, None, symbols))
+                continue
+            count = len(before)
+            if len(symbols) == count and tuple(symbols) == before:
+                continue
+            if len(symbols) > count and tuple(symbols[:count]) == before:
+                appended.append((scope, before, symbols[count:]))
+                continue
+            return [str(r)]
+
+        if not appended and r.released == released:
+            return self.lines
+
+        lines = list(self.lines)
+        # The text inserted after each line
+        inserts = {}
+
+        if r.released != released:
+            m = IDENTIFIER_RE.match(lines[0], _skip(lines[0], 0))
+            if m is None:
+                return [str(r)]
+            end = m.end()
+            if r.released:
+                if lines[0][end:].strip():
+                    return [str(r)]
+                lines[0] = lines[0][:end] + RELEASED_MARKER + lines[0][end:]
+            else:
+                marker = RELEASED_RE.match(lines[0], end)
+                if marker is None:
+                    return [str(r)]
+                lines[0] = lines[0][:end] + lines[0][marker.end():]
+
+        if appended:
+            scan = _scan(self.lines)
+            if scan is None:
+                return [str(r)]
+            opening, scopes = scan
+            for scope, before, symbols in appended:
+                if before is None:
+                    # A new scope, after the '{'
+                    if opening is None:
+                        return [str(r)]
+                    text = "".join([" " * 4, scope, ":\n"] +
+                                   [" " * 8 + symbol + ";\n" for symbol in
+                                    symbols])
+                    inserts.setdefault(opening, []).append(text)
+                    continue
+                found = scopes.get(scope)
+                if found is None or tuple(found[2]) != before:
+                    # The scanner and the parser disagree
+                    return [str(r)]
+                index, indent, _ = found
+                if index is None:
+                    return [str(r)]
+                text = "".join(indent + symbol + ";\n" for symbol in symbols)
+                inserts.setdefault(index, []).append(text)
+
+        out = []
+        for index, line in enumerate(lines):
+            out.append(line)
+            out.extend(inserts.get(index, ()))
+        return out
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def _append(out, releases):
+    """
+    Append the text of new releases, separated by blank lines
+
+    :param out:         The list of strings being rendered
+    :param releases:    The releases to be appended
+    """
+
+    for release in releases:
+        if out and not out[-1].endswith("\n"):
+            out.append("\n")
+        if out:
+            out.append("\n")
+        out.append(str(release))
+
+
+def _skip(line, column):
+    """
+    Skip the whitespaces and comments
+
+    :param line:    The line
+    :param column:  The column where to start
+    :returns:       The column of the next token, or the length of the line
+    """
+
+    while column < len(line):
+        m = SPACE_RE.match(line, column)
+        if m is None or m.end() == column:
+            break
+        column = m.end()
+    return column
+
+
+def _scan(lines):
+    """
+    Find where the text can be inserted in the lines of a release
+
+    The insertion points are lines which end (apart from whitespaces and
+    comments) after a token. The text is inserted after these lines.
+
+    :param lines:   The lines of the release
+    :returns:       A tuple (opening, scopes), where ``opening`` is the index
+                    of the line of the ``{`` (None if other tokens follow it in
+                    the line) and ``scopes`` is a dictionary {scope: (index,
+                    indent, symbols)} with the index of the line of the last
+                    token of the scope (None if other tokens follow it in the
+                    line), the indentation of the symbols and the list of the
+                    symbols found. Returns None if the lines cannot be scanned.
+    """
+
+    opening = None
+    scopes = {}
+    scope = None
+    is_open = False
+    identifier = None
+
+    for index, line in enumerate(lines):
+        column = _skip(line, 0)
+        while column < len(line):
+            if not is_open:
+                found = line.find("{", column)
+                if found < 0:
+                    break
+                is_open = True
+                column = _skip(line, found + 1)
+                opening = index if column == len(line) else None
+                continue
+            if identifier is None:
+                if line[column] == "}":
+                    return opening, scopes
+                m = ELEMENT_RE.match(line, column)
+                if m is None:
+                    return None
+                identifier = m.group(0)
+                indent = line[:len(line) - len(line.lstrip())]
+                column = _skip(line, m.end())
+                continue
+            if line[column] == ":":
+                scope = identifier
+                entry = scopes.setdefault(scope, [None, indent + " " * 4, []])
+            elif line[column] == ";":
+                if scope is None:
+                    scope = "global"
+                    entry = scopes.setdefault(scope, [None, indent, []])
+                entry[2].append(identifier)
+                entry[1] = indent
+            else:
+                return None
+            identifier = None
+            column = _skip(line, column + 1)
+            entry[0] = index if column == len(line) else None
+
+    return None
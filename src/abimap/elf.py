@@ -0,0 +1,675 @@
+"""Read the symbols of ELF files
+
+A minimal reader of the ELF format (32 and 64 bits, little and big endian),
+which reads the sections and the symbol tables directly from a buffer, such as
+a memory-mapped file. The ELF file can start at an offset of the buffer, as
+the members of an archive do:
+::
+
+    with open("lib.o", "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    elf = ELF_File(data)
+    for symbol in elf.symbols():
+        print(symbol.name)
+
+The types of the symbols are classified as in ``abimap.inputs``: ``func``,
+``object``, ``tls`` and ``other``.
+"""
+
+import binascii
+import struct
+from collections import namedtuple
+
+# The magic number at the start of ELF files
+ELF_MAGIC = b"\x7fELF"
+
+# The classes and data encodings (e_ident[EI_CLASS] and e_ident[EI_DATA])
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+# The types of ELF files
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+# The types of sections
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6ffffffd
+SHT_GNU_VERNEED = 0x6ffffffe
+SHT_GNU_VERSYM = 0x6fffffff
+
+# The tags of the dynamic section entries
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+DT_FLAGS_1 = 0x6ffffffb
+
+# The flag of position independent executables in DT_FLAGS_1
+DF_1_PIE = 0x08000000
+
+# The type of the GNU build-id note
+NT_GNU_BUILD_ID = 3
+
+# The flag of the version definition naming the file itself
+VER_FLG_BASE = 0x1
+
+# The version indexes of the local and the unversioned global symbols, and
+# the flag of the non-default versions (symbol@VERSION)
+VER_NDX_LOCAL = 0
+VER_NDX_GLOBAL = 1
+VERSYM_HIDDEN = 0x8000
+
+# The special section indexes
+SHN_UNDEF = 0
+SHN_ABS = 0xfff1
+
+# The bindings of the symbols
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STB_GNU_UNIQUE = 10
+
+# The types of the symbols
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+STT_COMMON = 5
+STT_TLS = 6
+STT_GNU_IFUNC = 10
+
+# The visibilities of the symbols
+STV_DEFAULT = 0
+STV_INTERNAL = 1
+STV_HIDDEN = 2
+STV_PROTECTED = 3
+
+# The bindings and visibilities of the symbols which can be exported
+EXPORTED_BINDINGS = (STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE)
+EXPORTED_VISIBILITIES = (STV_DEFAULT, STV_PROTECTED)
+
+# The abimap types of the ELF symbol types; the other types are not symbols
+# which can be versioned (sections, files)
+SYMBOL_TYPES = {STT_NOTYPE: "other",
+                STT_OBJECT: "object",
+                STT_FUNC: "func",
+                STT_COMMON: "object",
+                STT_TLS: "tls",
+                STT_GNU_IFUNC: "func"}
+
+# The layouts of the headers, after e_ident, of the section headers, of the
+# symbols, and of the dynamic entries, for each class
+_LAYOUTS = {ELFCLASS32: ("HHIIIIIHHHHHH", "IIIIIIIIII", "IIIBBH", "iI"),
+            ELFCLASS64: ("HHIQQQIHHHHHH", "IIQQQQIIQQ", "IBBHQQ", "qQ")}
+
+# The layouts of the version definitions (Verdef and Verdaux), of the version
+# requirements (Verneed and Vernaux), and of the notes
+_VERDEF = "HHHHIII"
+_VERDAUX = "II"
+_VERNEED = "HHIII"
+_VERNAUX = "IHHII"
+_NOTE = "III"
+
+# A section header
+Section = namedtuple("Section", ("name", "type", "flags", "addr", "offset",
+                                 "size", "link", "info", "addralign",
+                                 "entsize"))
+
+# A symbol: its name, binding, type, visibility, and section index
+Symbol = namedtuple("Symbol", ("name", "binding", "type", "visibility",
+                               "section"))
+
+# A version definition: its index (referred by the version symbols), flags,
+# name, and the names of its parents (the previous versions)
+Version_Definition = namedtuple("Version_Definition", ("index", "flags",
+                                                       "name", "parents"))
+
+# A version requirement: its index (referred by the version symbols), flags,
+# name, and the file (soname) required to define it
+Version_Requirement = namedtuple("Version_Requirement", ("index", "flags",
+                                                         "name", "file"))
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class ELF_Error(Exception):
+    """
+    Raised when the data is not a valid ELF file
+    """
+    pass
+
+
+class ELF_File(object):
+    """
+    An ELF file read from a buffer
+
+    Attributes:
+        data:       The buffer (bytes or mmap) containing the file
+        offset:     The offset of the file in the buffer
+        size:       The size of the file
+        elf_class:  ``ELFCLASS32`` or ``ELFCLASS64``
+        type:       The type of the file (e.g. ``ET_REL``, ``ET_DYN``)
+        sections:   The list of section headers (instances of ``Section``)
+    """
+
+    __slots__ = ("data", "offset", "size", "elf_class", "type", "sections",
+                 "_endian", "_symbol", "_dynamic")
+
+    def __init__(self, data, offset=0, size=None):
+        """
+        The constructor
+
+        :param data:    The buffer containing the file
+        :param offset:  The offset of the file in the buffer
+        :param size:    The size of the file (defaults to the rest of the
+                        buffer)
+        :raises ELF_Error:  Raised when the data is not a valid ELF file
+        """
+
+        if size is None:
+            size = len(data) - offset
+        self.data = data
+        self.offset = offset
+        self.size = size
+
+        if size < 16 or data[offset:offset + 4] != ELF_MAGIC:
+            raise ELF_Error("Not an ELF file")
+
+        ident = bytearray(data[offset + 4:offset + 6])
+        self.elf_class = ident[0]
+        if self.elf_class not in _LAYOUTS:
+            raise ELF_Error("Unknown ELF class {0}".format(ident[0]))
+        if ident[1] == ELFDATA2LSB:
+            self._endian = "<"
+        elif ident[1] == ELFDATA2MSB:
+            self._endian = ">"
+        else:
+            raise ELF_Error("Unknown ELF data encoding {0}".format(ident[1]))
+
+        header, section, symbol, dynamic = _LAYOUTS[self.elf_class]
+        header = self._unpack(header, 16)
+        (self.type, _, _, _, _, shoff, _, _, _, _, shentsize, shnum,
+         _) = header
+        self._symbol = struct.Struct(self._endian + symbol)
+        self._dynamic = struct.Struct(self._endian + dynamic)
+
+        self.sections = []
+        if not shoff:
+            return
+        layout = struct.Struct(self._endian + section)
+        if shnum == 0:
+            # The number of sections is in the size of the first section
+            shnum = Section(*self._unpack(layout, shoff)).size
+        if shentsize < layout.size or shoff + shnum * shentsize > size:
+            raise ELF_Error("Invalid section headers")
+        self.sections = [Section(*self._unpack(layout, shoff + i * shentsize))
+                         for i in range(shnum)]
+
+    def _unpack(self, layout, position):
+        """
+        Unpack a structure at a position of the file
+
+        :param layout:      The struct.Struct, or its format without the byte
+                            order
+        :param position:    The position, relative to the start of the file
+        :returns:           The tuple of values
+        """
+
+        if not isinstance(layout, struct.Struct):
+            layout = struct.Struct(self._endian + layout)
+        if position + layout.size > self.size:
+            raise ELF_Error("Truncated ELF file")
+        return layout.unpack_from(self.data, self.offset + position)
+
+    def section_data(self, section):
+        """
+        Get the content of a section
+
+        :param section: The section header
+        :returns:       The content, as bytes
+        """
+
+        if section.offset + section.size > self.size:
+            raise ELF_Error("Truncated ELF file")
+        start = self.offset + section.offset
+        return bytes(self.data[start:start + section.size])
+
+    def find_sections(self, section_type):
+        """
+        Get the sections of a type
+
+        :param section_type:    The type of the sections (e.g. SHT_DYNSYM)
+        :returns:               A list of section headers
+        """
+
+        return [section for section in self.sections if
+                section.type == section_type]
+
+    def symbol_table(self, dynamic=None):
+        """
+        Get the symbol table
+
+        :param dynamic: If True, the dynamic symbol table (.dynsym); if False,
+                        the static symbol table (.symtab); if None, the
+                        dynamic table of shared objects and executables, and
+                        the static table of relocatable objects
+        :returns:       The section header of the table, or None if missing
+        """
+
+        if dynamic is None:
+            dynamic = self.type != ET_REL
+        found = self.find_sections(SHT_DYNSYM if dynamic else SHT_SYMTAB)
+        if found:
+            return found[0]
+        return None
+
+    def iter_raw_symbols(self, table):
+        """
+        Iterate over the raw entries of a symbol table
+
+        :param table:   The section header of the symbol table
+        :returns:       A generator of tuples (name offset, info, other,
+                        section index), in the order of the table
+        """
+
+        data = self.section_data(table)
+        layout = self._symbol
+        entsize = table.entsize or layout.size
+        if entsize < layout.size:
+            raise ELF_Error("Invalid symbol table")
+        count = len(data) // entsize
+        if self.elf_class == ELFCLASS64:
+            for index in range(count):
+                name, info, other, shndx, _, _ = layout.unpack_from(
+                    data, index * entsize)
+                yield name, info, other, shndx
+        else:
+            for index in range(count):
+                name, _, _, info, other, shndx = layout.unpack_from(
+                    data, index * entsize)
+                yield name, info, other, shndx
+
+    def string_table(self, table):
+        """
+        Get the string table linked to a section
+
+        :param table:   The section header (e.g. of a symbol table)
+        :returns:       The content of the string table, as bytes
+        """
+
+        if table.link >= len(self.sections):
+            raise ELF_Error("Invalid string table index")
+        return self.section_data(self.sections[table.link])
+
+    def symbols(self, dynamic=None):
+        """
+        Iterate over the symbols
+
+        :param dynamic: Which symbol table is read (see ``symbol_table()``)
+        :returns:       A generator of ``Symbol`` instances
+        """
+
+        table = self.symbol_table(dynamic)
+        if table is None:
+            return
+        strings = self.string_table(table)
+        for name, info, other, shndx in self.iter_raw_symbols(table):
+            yield Symbol(get_string(strings, name), info >> 4, info & 0xf,
+                         other & 0x3, shndx)
+
+    def _iter_exported(self, table, types):
+        """
+        Iterate over the symbols of a table which can be exported
+
+        :param table:   The section header of the symbol table
+        :param types:   The set of the abimap types of the symbols to be kept
+        :returns:       A generator of tuples (index in the table, name offset)
+        """
+
+        for index, (name, info, other, shndx) in enumerate(
+                self.iter_raw_symbols(table)):
+            if (shndx == SHN_UNDEF or info >> 4 not in EXPORTED_BINDINGS or
+                    other & 0x3 not in EXPORTED_VISIBILITIES):
+                continue
+            if shndx == SHN_ABS:
+                kind = "other"
+            else:
+                kind = SYMBOL_TYPES.get(info & 0xf)
+            if kind in types and name:
+                yield index, name
+
+    def exported_symbols(self, types, dynamic=None):
+        """
+        Get the names of the symbols which can be exported
+
+        These are the defined symbols with a global, weak or unique binding,
+        a default or protected visibility, and one of the given types.
+
+        :param types:   The set of the abimap types of the symbols to be kept
+                        (see ``SYMBOL_TYPES``)
+        :param dynamic: Which symbol table is read (see ``symbol_table()``)
+        :returns:       A list of names, in the order of the symbol table
+        """
+
+        table = self.symbol_table(dynamic)
+        if table is None:
+            return []
+        strings = self.string_table(table)
+        return [get_string(strings, name) for _, name in
+                self._iter_exported(table, types)]
+
+    def versioned_symbols(self, types):
+        """
+        Get the exported dynamic symbols with their versions
+
+        The symbols named after their own version (which define the version
+        nodes) are skipped.
+
+        :param types:   The set of the abimap types of the symbols to be kept
+        :returns:       A list of tuples (name, version, hidden), in the order
+                        of the dynamic symbol table. The version is None for
+                        the unversioned symbols; hidden is True for the
+                        non-default versions (symbol@VERSION)
+        """
+
+        table = self.symbol_table(dynamic=True)
+        if table is None:
+            return []
+        strings = self.string_table(table)
+        versym = self.version_symbols()
+        # The base definition has the index of the unversioned symbols
+        names = dict((d.index, d.name) for d in self.version_definitions() if
+                     not d.flags & VER_FLG_BASE)
+
+        symbols = []
+        for index, name in self._iter_exported(table, types):
+            name = get_string(strings, name)
+            version = None
+            hidden = False
+            if versym is not None and index < len(versym):
+                version = names.get(versym[index] & ~VERSYM_HIDDEN)
+                hidden = bool(versym[index] & VERSYM_HIDDEN)
+            if name != version:
+                symbols.append((name, version, hidden))
+        return symbols
+
+    def version_definitions(self):
+        """
+        Get the version definitions (.gnu.version_d)
+
+        :returns:   A list of ``Version_Definition`` instances, in the order
+                    of the section. The definition with the ``VER_FLG_BASE``
+                    flag names the file itself.
+        """
+
+        found = self.find_sections(SHT_GNU_VERDEF)
+        if not found:
+            return []
+        section = found[0]
+        data = self.section_data(section)
+        strings = self.string_table(section)
+        verdef = struct.Struct(self._endian + _VERDEF)
+        verdaux = struct.Struct(self._endian + _VERDAUX)
+
+        definitions = []
+        position = 0
+        # The number of entries is in sh_info; the chain is also bounded by
+        # the size of the section
+        for _ in range(section.info or len(data) // verdef.size):
+            if position + verdef.size > len(data):
+                raise ELF_Error("Truncated version definitions")
+            (_, flags, index, count, _, aux,
+             following) = verdef.unpack_from(data, position)
+            names = []
+            auxiliary = position + aux
+            for _ in range(count):
+                if auxiliary + verdaux.size > len(data):
+                    raise ELF_Error("Truncated version definitions")
+                name, next_aux = verdaux.unpack_from(data, auxiliary)
+                names.append(get_string(strings, name))
+                if not next_aux:
+                    break
+                auxiliary += next_aux
+            if names:
+                definitions.append(Version_Definition(index, flags, names[0],
+                                                      tuple(names[1:])))
+            if not following:
+                break
+            position += following
+        return definitions
+
+    def version_requirements(self):
+        """
+        Get the version requirements (.gnu.version_r)
+
+        :returns:   A list of ``Version_Requirement`` instances, in the order
+                    of the section
+        """
+
+        found = self.find_sections(SHT_GNU_VERNEED)
+        if not found:
+            return []
+        section = found[0]
+        data = self.section_data(section)
+        strings = self.string_table(section)
+        verneed = struct.Struct(self._endian + _VERNEED)
+        vernaux = struct.Struct(self._endian + _VERNAUX)
+
+        requirements = []
+        position = 0
+        for _ in range(section.info or len(data) // verneed.size):
+            if position + verneed.size > len(data):
+                raise ELF_Error("Truncated version requirements")
+            (_, count, filename, aux,
+             following) = verneed.unpack_from(data, position)
+            filename = get_string(strings, filename)
+            auxiliary = position + aux
+            for _ in range(count):
+                if auxiliary + vernaux.size > len(data):
+                    raise ELF_Error("Truncated version requirements")
+                (_, flags, index, name,
+                 next_aux) = vernaux.unpack_from(data, auxiliary)
+                requirements.append(Version_Requirement(
+                    index, flags, get_string(strings, name), filename))
+                if not next_aux:
+                    break
+                auxiliary += next_aux
+            if not following:
+                break
+            position += following
+        return requirements
+
+    def imported_symbols(self):
+        """
+        Get the dynamic symbols imported, with their required versions
+
+        The imported symbols are the undefined symbols, and the symbols which
+        require a version of another file although they are defined (the
+        objects copied by copy relocations).
+
+        :returns:   A list of tuples (name, version, file), in the order of the
+                    dynamic symbol table. The version and the file required to
+                    define it are None for the unversioned symbols.
+        """
+
+        table = self.symbol_table(dynamic=True)
+        if table is None:
+            return []
+        strings = self.string_table(table)
+        versym = self.version_symbols()
+        required = dict((r.index, r) for r in self.version_requirements())
+
+        symbols = []
+        for index, (name, info, _, shndx) in enumerate(
+                self.iter_raw_symbols(table)):
+            if not name or info >> 4 not in EXPORTED_BINDINGS:
+                continue
+            requirement = None
+            if versym is not None and index < len(versym):
+                requirement = required.get(versym[index] & ~VERSYM_HIDDEN)
+            if shndx != SHN_UNDEF and requirement is None:
+                continue
+            if requirement is None:
+                symbols.append((get_string(strings, name), None, None))
+            else:
+                symbols.append((get_string(strings, name), requirement.name,
+                                requirement.file))
+        return symbols
+
+    def version_symbols(self):
+        """
+        Get the version indexes of the dynamic symbols (.gnu.version)
+
+        :returns:   A list of the indexes, one per dynamic symbol, including
+                    the ``VERSYM_HIDDEN`` flag; None if the file has no
+                    version symbols
+        """
+
+        found = self.find_sections(SHT_GNU_VERSYM)
+        if not found:
+            return None
+        data = self.section_data(found[0])
+        count = len(data) // 2
+        return list(struct.unpack(self._endian + "{0}H".format(count),
+                                  data[:count * 2]))
+
+    def dynamic_entries(self):
+        """
+        Get the entries of the dynamic section
+
+        :returns:   A list of tuples (tag, value), up to the ``DT_NULL`` entry
+        """
+
+        found = self.find_sections(SHT_DYNAMIC)
+        if not found:
+            return []
+        data = self.section_data(found[0])
+        layout = self._dynamic
+        entries = []
+        for position in range(0, len(data) - layout.size + 1, layout.size):
+            tag, value = layout.unpack_from(data, position)
+            if tag == DT_NULL:
+                break
+            entries.append((tag, value))
+        return entries
+
+    def soname(self):
+        """
+        Get the name of the shared object (DT_SONAME)
+
+        :returns:   The name, or None if not given
+        """
+
+        found = self.find_sections(SHT_DYNAMIC)
+        for tag, value in self.dynamic_entries():
+            if tag == DT_SONAME:
+                return get_string(self.string_table(found[0]), value)
+        return None
+
+    def needed(self):
+        """
+        Get the names of the shared objects needed (DT_NEEDED)
+
+        :returns:   A list of names, in the order of the dynamic section
+        """
+
+        found = self.find_sections(SHT_DYNAMIC)
+        entries = [value for tag, value in self.dynamic_entries() if
+                   tag == DT_NEEDED]
+        if not entries:
+            return []
+        strings = self.string_table(found[0])
+        return [get_string(strings, value) for value in entries]
+
+    def is_shared_object(self):
+        """
+        Check if the file is a shared object
+
+        Position independent executables have the same type as shared
+        objects; they are told apart by the ``DF_1_PIE`` flag.
+
+        :returns:   True if the file is a shared object with dynamic symbols
+        """
+
+        if self.type != ET_DYN or self.symbol_table(dynamic=True) is None:
+            return False
+        for tag, value in self.dynamic_entries():
+            if tag == DT_FLAGS_1 and value & DF_1_PIE:
+                return False
+        return True
+
+    def build_id(self):
+        """
+        Get the GNU build-id
+
+        :returns:   The build-id as an hexadecimal string, or None if the file
+                    has no build-id note
+        """
+
+        note = struct.Struct(self._endian + _NOTE)
+        for section in self.find_sections(SHT_NOTE):
+            data = self.section_data(section)
+            align = max(4, section.addralign)
+            position = 0
+            while position + note.size <= len(data):
+                namesz, descsz, note_type = note.unpack_from(data, position)
+                name = position + note.size
+                desc = name + _align(namesz, align)
+                if (note_type == NT_GNU_BUILD_ID and
+                        data[name:name + namesz] == b"GNU\0"):
+                    return binascii.hexlify(data[desc:desc + descsz]).decode(
+                        "ascii")
+                position = desc + _align(descsz, align)
+        return None
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_string(strings, offset):
+    """
+    Get a string from a string table
+
+    :param strings: The content of the string table
+    :param offset:  The offset of the string
+    :returns:       The string
+    """
+
+    end = strings.find(b"\0", offset)
+    if end < 0:
+        end = len(strings)
+    return strings[offset:end].decode("utf-8", "replace")
+
+
+def _align(size, align):
+    """
+    Round a size up to a multiple of the alignment
+
+    :param size:    The size
+    :param align:   The alignment, a power of 2
+    :returns:       The aligned size
+    """
+
+    return (size + align - 1) & ~(align - 1)
+
+
+def is_elf(data, offset=0):
+    """
+    Check if the data starts with the ELF magic number
+
+    :param data:    The buffer
+    :param offset:  The position where the ELF file would start
+    :returns:       True if the magic number is found
+    """
+
+    return data[offset:offset + 4] == ELF_MAGIC
@@ -0,0 +1,393 @@
+"""Database of the history of the symbols across revisions of a map
+
+A sequence of revisions of a map file (e.g. a directory of snapshots or the
+commits of a git repository which modified the map) is stored in a SQLite
+database. Instead of the content of each revision, the database stores for how
+long each fact was true: each row of the ``symbols`` table says that a symbol
+was listed in a scope of a release from the revision ``first_seen`` to the
+revision ``last_seen``, inclusive. The ``releases`` table does the same for
+each release and its predecessor.
+
+New revisions are appended incrementally: the intervals which are still true
+are extended and new intervals are started for the new facts. The questions
+about the history are answered by indexed queries, without parsing the
+revisions again.
+"""
+
+import hashlib
+import os
+import sqlite3
+import subprocess
+
+from .symver import Map
+from .symver import ParserError
+from .symver import Single_Logger
+from .symver import get_info_from_release_string
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS releases (
+    name TEXT NOT NULL,
+    previous TEXT NOT NULL,
+    released INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL REFERENCES revisions(id),
+    last_seen INTEGER NOT NULL REFERENCES revisions(id)
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL,
+    release TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    first_seen INTEGER NOT NULL REFERENCES revisions(id),
+    last_seen INTEGER NOT NULL REFERENCES revisions(id)
+);
+CREATE INDEX IF NOT EXISTS symbols_name
+    ON symbols (name, release, scope, last_seen);
+CREATE INDEX IF NOT EXISTS symbols_last_seen ON symbols (last_seen);
+CREATE INDEX IF NOT EXISTS releases_name
+    ON releases (name, previous, released, last_seen);
+CREATE INDEX IF NOT EXISTS releases_last_seen ON releases (last_seen);
+"""
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class History(object):
+    """
+    A database of the history of a map
+
+    Attributes:
+        path:   The path to the SQLite database
+        logger: The logger object
+    """
+
+    def __init__(self, path, logger=None):
+        """
+        The constructor
+
+        The database is created if it does not exist.
+
+        :param path:    The path to the SQLite database
+        :param logger:  The logger object
+        """
+
+        if logger is None:
+            logger = Single_Logger.getLogger(__name__)
+        self.logger = logger
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.db.executescript("""
+            CREATE TEMP TABLE current_symbols (
+                name TEXT, release TEXT, scope TEXT,
+                PRIMARY KEY (name, release, scope));
+            CREATE TEMP TABLE current_releases (
+                name TEXT, previous TEXT, released INTEGER,
+                PRIMARY KEY (name, previous, released));
+        """)
+
+    def close(self):
+        """
+        Close the database
+        """
+
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def has_revision(self, name):
+        """
+        Check if a revision was ingested
+
+        :param name:    The name of the revision
+        :returns:       True if the revision is in the database
+        """
+
+        return self.db.execute("SELECT 1 FROM revisions WHERE name = ?",
+                               (name,)).fetchone() is not None
+
+    def _last_revision(self):
+        row = self.db.execute("SELECT id, digest FROM revisions"
+                              " ORDER BY id DESC LIMIT 1").fetchone()
+        return row if row else (0, None)
+
+    def ingest(self, name, content):
+        """
+        Append a revision of the map to the history
+
+        Revisions already in the database are skipped.
+
+        :param name:        The name of the revision (e.g. the file name or the
+                            commit)
+        :param content:     The content of the map file in the revision
+        :returns:           True if the revision was added
+        :raises ParserError: Raised when the revision cannot be parsed
+        """
+
+        if self.has_revision(name):
+            self.logger.debug("Revision %s already in the history", name)
+            return False
+
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        previous, previous_digest = self._last_revision()
+
+        if digest == previous_digest:
+            # Nothing changed, all the open intervals are extended
+            with self.db:
+                cur = self.db.execute("INSERT INTO revisions (name, digest)"
+                                      " VALUES (?, ?)", (name, digest))
+                current = cur.lastrowid
+                for table in ("symbols", "releases"):
+                    self.db.execute("UPDATE {0} SET last_seen = ?"
+                                    " WHERE last_seen = ?".format(table),
+                                    (current, previous))
+            return True
+
+        m = Map(logger=self.logger)
+        m.filename = name
+        m.parse(content.splitlines(True))
+
+        with self.db:
+            cur = self.db.execute("INSERT INTO revisions (name, digest)"
+                                  " VALUES (?, ?)", (name, digest))
+            current = cur.lastrowid
+
+            self.db.execute("DELETE FROM current_symbols")
+            self.db.execute("DELETE FROM current_releases")
+            self.db.executemany("INSERT INTO current_releases"
+                                " VALUES (?, ?, ?)",
+                                set((r.name, r.previous, int(r.released))
+                                    for r in m.releases))
+            self.db.executemany("INSERT INTO current_symbols"
+                                " VALUES (?, ?, ?)",
+                                set((symbol, r.name, scope)
+                                    for r in m.releases
+                                    for scope, symbols in r.symbols.items()
+                                    for symbol in symbols))
+
+            self._update("symbols", ("name", "release", "scope"), current,
+                         previous)
+            self._update("releases", ("name", "previous", "released"),
+                         current, previous)
+        return True
+
+    def _update(self, table, columns, current, previous):
+        """
+        Extend the intervals of the facts which are still true and start new
+        intervals for the new facts
+
+        :param table:       The table of facts
+        :param columns:     The columns which identify a fact
+        :param current:     The id of the revision being ingested
+        :param previous:    The id of the previous revision
+        """
+
+        def match(other):
+            return " AND ".join("c.{0} = {1}.{0}".format(column, other)
+                                for column in columns)
+
+        self.db.execute("UPDATE {0} SET last_seen = ?"
+                        " WHERE last_seen = ? AND EXISTS"
+                        " (SELECT 1 FROM current_{0} AS c WHERE {1})"
+                        .format(table, match(table)), (current, previous))
+        self.db.execute("INSERT INTO {0} ({1}, first_seen, last_seen)"
+                        " SELECT {2}, ?, ? FROM current_{0} AS c"
+                        " WHERE NOT EXISTS"
+                        " (SELECT 1 FROM {0} AS t WHERE {3}"
+                        " AND t.last_seen = ?)"
+                        .format(table, ", ".join(columns),
+                                ", ".join("c." + column for column in columns),
+                                match("t")),
+                        (current, current, current))
+
+    def ingest_files(self, paths):
+        """
+        Append revisions read from files, in the given order
+
+        Directories are expanded to the files they contain, sorted by name. The
+        revisions are named after the paths of the files.
+
+        :param paths:   The paths to the files or directories
+        :returns:       The number of revisions added
+        """
+
+        added = 0
+        for path in paths:
+            if os.path.isdir(path):
+                names = sorted(os.path.join(path, name) for name in
+                               os.listdir(path))
+                files = [name for name in names if os.path.isfile(name)]
+            else:
+                files = [path]
+            for filename in files:
+                if self.has_revision(filename):
+                    continue
+                with open(filename, "r") as f:
+                    content = f.read()
+                added += self._ingest_or_skip(filename, content)
+        return added
+
+    def ingest_git(self, repository, path, revision="HEAD"):
+        """
+        Append the revisions of a file from the history of a git repository
+
+        The commits which modified the file are added from the oldest to the
+        newest. The revisions are named after the commits.
+
+        :param repository:  The path to the git repository
+        :param path:        The path of the map file in the repository
+        :param revision:    The revision (or range) whose history is added
+        :returns:           The number of revisions added
+        """
+
+        commits = subprocess.check_output(
+            ["git", "-C", repository, "rev-list", "--reverse", revision,
+             "--", path]).decode("utf-8").split()
+
+        added = 0
+        for commit in commits:
+            if self.has_revision(commit):
+                continue
+            try:
+                content = subprocess.check_output(
+                    ["git", "-C", repository, "show",
+                     "{0}:{1}".format(commit, path)],
+                    stderr=subprocess.STDOUT).decode("utf-8")
+            except subprocess.CalledProcessError:
+                # The file was removed in this commit
+                self.logger.warning("%s not found in %s, skipping", path,
+                                    commit)
+                continue
+            added += self._ingest_or_skip(commit, content)
+        return added
+
+    def _ingest_or_skip(self, name, content):
+        try:
+            return int(self.ingest(name, content))
+        except ParserError:
+            # Already logged by the parser
+            self.logger.warning("Skipping revision %s", name)
+            return 0
+
+    def revisions(self):
+        """
+        Get the revisions in the history
+
+        :returns:   A list of revision names, from the oldest to the newest
+        """
+
+        return [row[0] for row in
+                self.db.execute("SELECT name FROM revisions ORDER BY id")]
+
+    def symbol_history(self, pattern):
+        """
+        Get the history of the symbols matching a pattern
+
+        :param pattern: A symbol name or a glob pattern (e.g. ``foo_*``)
+        :returns:       A list of tuples (symbol, release, scope, first_seen,
+                        last_seen) with the names of the revisions. A symbol
+                        which was removed and added back has more than one
+                        tuple.
+        """
+
+        query = ("SELECT s.name, s.release, s.scope, f.name, l.name"
+                 " FROM symbols AS s"
+                 " JOIN revisions AS f ON f.id = s.first_seen"
+                 " JOIN revisions AS l ON l.id = s.last_seen"
+                 " WHERE s.name {0} ?"
+                 " ORDER BY s.name, s.first_seen, s.release, s.scope")
+        operator = "GLOB" if any(c in pattern for c in "*?[") else "="
+        return self.db.execute(query.format(operator), (pattern,)).fetchall()
+
+    def release_history(self):
+        """
+        Get the history of the releases
+
+        :returns:   A list of tuples (release, previous, released, first_seen,
+                    last_seen) with the names of the revisions, ordered by
+                    the first revision
+        """
+
+        return [(name, previous, bool(released), first, last)
+                for name, previous, released, first, last in
+                self.db.execute("SELECT r.name, r.previous, r.released,"
+                                " f.name, l.name FROM releases AS r"
+                                " JOIN revisions AS f ON f.id = r.first_seen"
+                                " JOIN revisions AS l ON l.id = r.last_seen"
+                                " ORDER BY r.first_seen, r.name")]
+
+    def bumps(self):
+        """
+        Get the releases which changed the major version of the library
+
+        The latest release of each revision is compared with the latest
+        release of the previous revision. A revision bumps the major version
+        (the SONAME) if the prefix or the current version number of its latest
+        release differ from those of the previous latest release. The release
+        created by an ABI break has no predecessor, since the older releases
+        are merged into it.
+
+        The latest release of a revision is guessed as in
+        ``Map.guess_latest_release()``: the release with the highest version
+        among the releases which are not the predecessor of another release.
+        The releases without a version (e.g. ``LIBX``) are ignored.
+
+        :returns:   A list of tuples (revision, previous, release) with the
+                    first revision where each bump was seen
+        """
+
+        def version(release):
+            # The releases without a version suffix (e.g. LIBX) are skipped
+            info = get_info_from_release_string(release)
+            if info is None or not info[2]:
+                return None
+            return info
+
+        def major(release):
+            info = version(release)
+            if info is None:
+                return None
+            return info[1], info[3][0]
+
+        def latest(releases):
+            predecessors = set(previous for _, previous in releases)
+            heads = []
+            for name, _ in releases:
+                if name in predecessors:
+                    continue
+                info = version(name)
+                if info is not None:
+                    heads.append((info[3], name))
+            return max(heads)[1] if heads else None
+
+        rows = self.db.execute("SELECT name, previous, first_seen, last_seen"
+                               " FROM releases").fetchall()
+        # The latest release can only change in the revisions where a release
+        # appears or disappears
+        changes = set(row[2] for row in rows)
+        changes.update(row[3] + 1 for row in rows)
+
+        bumps = []
+        last = None
+        for current, revision in self.db.execute("SELECT id, name FROM"
+                                                 " revisions ORDER BY id"):
+            if current not in changes:
+                continue
+            release = latest([(name, previous) for name, previous, first,
+                              end in rows if first <= current <= end])
+            if release is None:
+                continue
+            if (last is not None and release != last and
+                    major(release) != major(last)):
+                bumps.append((revision, last, release))
+            last = release
+        return bumps
@@ -0,0 +1,231 @@
+"""Read the symbols from the output of nm and readelf
+
+The symbols exported by a library can be given in the output of ``nm -D``
+(``nm``), ``nm -D -P`` (``nm-posix``), or ``readelf --dyn-syms -W``
+(``readelf``). The lines are parsed one at a time, keeping only the symbols
+which can be versioned: the symbols which are defined, are not local, and
+have one of the requested types.
+
+The types of the symbols are:
+
+- ``func``: functions, including indirect functions
+- ``object``: data objects, including common symbols
+- ``tls``: thread-local storage objects (only known from readelf)
+- ``other``: the symbols without a type, and absolute symbols (which include
+  the symbols defining the version nodes)
+
+The version appended to the names of the symbols (e.g. ``symbol@@LIBX_1_0``)
+is removed. The symbols named after their own version are skipped.
+"""
+
+import re
+
+from .symver import Single_Logger
+
+# The formats of the input
+INPUT_FORMATS = ("plain", "nm", "nm-posix", "readelf")
+
+# The types of the symbols
+SYMBOL_TYPES = ("func", "object", "tls", "other")
+
+# The types of the symbols read by default
+DEFAULT_SYMBOL_TYPES = ("func", "object", "tls")
+
+# The types of the nm symbol letters kept; the other letters are undefined
+# symbols (U, w, v), local symbols (lowercase) or debugging symbols
+NM_TYPES = {"T": "func",
+            "W": "func",
+            "i": "func",
+            "D": "object",
+            "B": "object",
+            "R": "object",
+            "G": "object",
+            "S": "object",
+            "V": "object",
+            "C": "object",
+            "u": "object",
+            "A": "other"}
+
+# The types of the readelf symbol types
+READELF_TYPES = {"FUNC": "func",
+                 "IFUNC": "func",
+                 "OBJECT": "object",
+                 "COMMON": "object",
+                 "TLS": "tls",
+                 "NOTYPE": "other"}
+
+# The bindings of the symbols which can be exported
+READELF_BINDINGS = ("GLOBAL", "WEAK", "UNIQUE", "GNU_UNIQUE")
+
+# The visibilities of the symbols which can be exported
+READELF_VISIBILITIES = ("DEFAULT", "PROTECTED")
+
+# A symbol of readelf: number, value, size, type, bind, visibility (which can
+# be followed by other flags in brackets), section index, and name
+READELF_SYMBOL_RE = re.compile(r'\s*\d+:\s+\S+\s+\S+\s+(\S+)\s+(\S+)\s+(\S+)'
+                               r'(?:\s+\[[^\]]*\])?\s+(\S+)\s+(\S+)')
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_symbol_types(names=None):
+    """
+    Get the set of symbol types to be read
+
+    :param names:   The names of the types; if None, the default types
+    :returns:       A set of type names
+    :raises Exception:  Raised when an unknown type is given
+    """
+
+    if names is None:
+        return set(DEFAULT_SYMBOL_TYPES)
+    for name in names:
+        if name not in SYMBOL_TYPES:
+            logger = Single_Logger.getLogger(__name__)
+            msg = "Unknown symbol type \'{0}\'. The types are: {1}".format(
+                name, ", ".join(SYMBOL_TYPES))
+            logger.error(msg)
+            raise Exception(msg)
+    return set(names)
+
+
+def _split_version(name):
+    """
+    Remove the version from the name of a symbol
+
+    :param name:    The name, possibly followed by @VERSION or @@VERSION
+    :returns:       A tuple (name, version); the version is None if not given
+    """
+
+    found = name.find("@")
+    if found < 0:
+        return name, None
+    return name[:found], name[found:].lstrip("@")
+
+
+def _keep(name):
+    """
+    Get the name of a symbol to be kept
+
+    :param name:    The name read, possibly followed by the version
+    :returns:       The name without the version; None if the symbol defines
+                    a version node
+    """
+
+    name, version = _split_version(name)
+    # The version nodes are defined as absolute symbols named as the version
+    if name == version:
+        return None
+    return name
+
+
+def iter_nm_symbols(lines, types):
+    """
+    Iterate over the symbols listed by nm in the BSD format
+
+    Each line contains the value (missing for undefined symbols), the type
+    letter, and the name. The lines naming the files read are skipped.
+
+    :param lines:   An iterable over the lines
+    :param types:   The set of types of the symbols to be kept
+    :returns:       A generator of the names of the symbols kept
+    """
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 3:
+            letter, name = fields[1], fields[2]
+        elif len(fields) == 2:
+            letter, name = fields
+        else:
+            continue
+        if NM_TYPES.get(letter) in types:
+            name = _keep(name)
+            if name:
+                yield name
+
+
+def iter_nm_posix_symbols(lines, types):
+    """
+    Iterate over the symbols listed by nm in the POSIX format
+
+    Each line contains the name, the type letter, and optionally the value
+    and the size. The lines naming the files read are skipped.
+
+    :param lines:   An iterable over the lines
+    :param types:   The set of types of the symbols to be kept
+    :returns:       A generator of the names of the symbols kept
+    """
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 2 or fields[0].endswith(":"):
+            continue
+        if NM_TYPES.get(fields[1]) in types:
+            name = _keep(fields[0])
+            if name:
+                yield name
+
+
+def iter_readelf_symbols(lines, types):
+    """
+    Iterate over the symbols listed by readelf
+
+    The symbol tables are read from the lines of their entries. The other
+    lines (headers, titles) are skipped.
+
+    :param lines:   An iterable over the lines
+    :param types:   The set of types of the symbols to be kept
+    :returns:       A generator of the names of the symbols kept
+    """
+
+    logger = Single_Logger.getLogger(__name__)
+    for line in lines:
+        m = READELF_SYMBOL_RE.match(line)
+        if m is None:
+            continue
+        symbol_type, bind, visibility, index, name = m.groups()
+        if index == "ABS":
+            kind = "other"
+        else:
+            kind = READELF_TYPES.get(symbol_type)
+        if (index == "UND" or bind not in READELF_BINDINGS or
+                visibility not in READELF_VISIBILITIES or kind not in types):
+            continue
+        if name.endswith("[...]"):
+            logger.warning("The name of the symbol \'%s\' was truncated by"
+                           " readelf, run it with -W", name)
+            continue
+        name = _keep(name)
+        if name:
+            yield name
+
+
+def iter_symbols(lines, fmt, types=None):
+    """
+    Iterate over the symbols given in one of the input formats
+
+    :param lines:   An iterable over the lines
+    :param fmt:     The input format, one of ``INPUT_FORMATS`` other than
+                    "plain"
+    :param types:   The names of the types of the symbols to be kept; if None,
+                    the default types
+    :returns:       A generator of the names of the symbols kept
+    :raises Exception:  Raised when the format is unknown
+    """
+
+    types = get_symbol_types(types)
+    if fmt == "nm":
+        return iter_nm_symbols(lines, types)
+    if fmt == "nm-posix":
+        return iter_nm_posix_symbols(lines, types)
+    if fmt == "readelf":
+        return iter_readelf_symbols(lines, types)
+
+    logger = Single_Logger.getLogger(__name__)
+    msg = "Unknown input format \'{0}\'. The formats are: {1}".format(
+        fmt, ", ".join(INPUT_FORMATS))
+    logger.error(msg)
+    raise Exception(msg)
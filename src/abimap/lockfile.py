@@ -0,0 +1,255 @@
+"""Lockfiles recording the digests of the releases of a map
+
+A lockfile is a JSON file kept next to a map (``<map>.lock``) which records:
+
+- the SHA-256 of the content of the map file;
+- for each release, the digest of its canonical form (its name, its previous
+  release, the released marker, and its sorted scopes and symbols), and the
+  SHA-256 of the lines it was parsed from.
+
+A map whose content did not change is confirmed by comparing a single hash,
+without parsing it. Otherwise, the map is parsed lazily: only the release
+names and their predecessors are parsed, and the symbols of a released release
+are parsed and its digest computed again only if the lines it was parsed from
+changed.
+"""
+
+import hashlib
+import json
+import os
+
+from .symver import Map
+from .symver import Single_Logger
+from .symver import atomic_write
+
+# The suffix added to the name of the map to get the name of its lockfile
+LOCK_SUFFIX = ".lock"
+
+# The version of the format of the lockfiles
+LOCK_VERSION = 1
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Lock_Error(Exception):
+    """
+    Raised when the released releases of a map do not match its lockfile
+
+    Attributes:
+        filename:   The path to the map
+        altered:    The names of the released releases that were modified
+        removed:    The names of the released releases that were removed
+    """
+
+    def __init__(self, filename, altered, removed):
+        self.filename = filename
+        self.altered = altered
+        self.removed = removed
+        parts = []
+        if altered:
+            parts.append("modified: " + ", ".join(altered))
+        if removed:
+            parts.append("removed: " + ", ".join(removed))
+        msg = "Released releases of \'{0}\' do not match the lockfile " \
+              "({1})".format(filename, "; ".join(parts))
+        super(Lock_Error, self).__init__(msg)
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_lock_filename(filename):
+    """
+    Get the path to the lockfile of a map
+
+    :param filename:    The path to the map
+    :returns:           The path to the lockfile
+    """
+
+    return filename + LOCK_SUFFIX
+
+
+def _sha256(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def release_digest(release):
+    """
+    Get the digest of the canonical form of a release
+
+    The digest does not depend on the layout of the release in the file, on
+    its comments, nor on the order of its scopes and symbols.
+
+    :param release: A ``Release``
+    :returns:       The SHA-256 of the release, as a hexadecimal string
+    """
+
+    h = hashlib.sha256()
+    h.update("\0".join((release.name, release.previous,
+                        "released" if release.released else "")
+                       ).encode("utf-8"))
+    for scope in sorted(release.symbols):
+        h.update(b"\n")
+        h.update("\0".join([scope] + sorted(release.symbols[scope])
+                           ).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _span_digest(lines, release):
+    first, last = release.span
+    return _sha256("".join(lines[first:last + 1]))
+
+
+def get_lock(filename, content=None):
+    """
+    Compute the lock of a map file
+
+    :param filename:    The path to the map
+    :param content:     The content of the map, if it was already read
+    :returns:           A dictionary, as stored in the lockfile
+    """
+
+    if content is None:
+        with open(filename, "r") as f:
+            content = f.read()
+
+    m = Map()
+    m.filename = filename
+    lines = content.splitlines(True)
+    m.parse(lines)
+    m.check()
+
+    releases = {}
+    for release in m.releases:
+        releases[release.name] = {"digest": release_digest(release),
+                                  "released": release.released,
+                                  "text": _span_digest(lines, release)}
+    return {"version": LOCK_VERSION,
+            "content": _sha256(content),
+            "releases": releases}
+
+
+def write_lock(filename, lock_filename=None):
+    """
+    Write the lockfile of a map
+
+    :param filename:        The path to the map
+    :param lock_filename:   The path to the lockfile; defaults to the name of
+                            the map followed by ``LOCK_SUFFIX``
+    :returns:               The lock written
+    """
+
+    if lock_filename is None:
+        lock_filename = get_lock_filename(filename)
+    lock = get_lock(filename)
+    atomic_write(lock_filename, json.dumps(lock, indent=2, sort_keys=True) +
+                 "\n")
+    return lock
+
+
+def read_lock(lock_filename):
+    """
+    Read a lockfile
+
+    :param lock_filename:   The path to the lockfile
+    :returns:               The lock, as a dictionary
+    """
+
+    logger = Single_Logger.getLogger(__name__)
+
+    try:
+        with open(lock_filename, "r") as f:
+            lock = json.load(f)
+    except ValueError as e:
+        msg = "Invalid lockfile \'{0}\': {1}".format(lock_filename, e)
+        logger.error(msg)
+        raise Exception(msg)
+
+    if not isinstance(lock, dict) or lock.get("version") != LOCK_VERSION:
+        msg = "Unsupported lockfile \'{0}\'".format(lock_filename)
+        logger.error(msg)
+        raise Exception(msg)
+    return lock
+
+
+def verify(filename, lock, content=None):
+    """
+    Check that the released releases of a map match its lock
+
+    If the content of the map did not change, nothing is parsed. Otherwise,
+    the map is parsed lazily: only the symbols of the released releases whose
+    lines changed are parsed, to compare their digests with the lock. A
+    release whose lines changed but whose digest did not (e.g. only its
+    comments or its layout changed) is not altered. The releases which were
+    not released when the lock was written may be changed freely.
+
+    :param filename:    The path to the map
+    :param lock:        The lock, as returned by ``read_lock()``
+    :param content:     The content of the map, if it was already read
+    :returns:           A tuple (altered, removed) with the sorted names of
+                        the released releases that were modified, and of the
+                        ones that were removed
+    """
+
+    if content is None:
+        with open(filename, "r") as f:
+            content = f.read()
+
+    if _sha256(content) == lock["content"]:
+        return [], []
+
+    m = Map(lazy=True)
+    m.filename = filename
+    lines = content.splitlines(True)
+    m.parse(lines)
+    m.dependencies()
+
+    current = {}
+    for release in m.releases:
+        current.setdefault(release.name, release)
+
+    altered = []
+    removed = []
+    for name, entry in lock["releases"].items():
+        if not entry["released"]:
+            continue
+        release = current.get(name)
+        if release is None:
+            removed.append(name)
+        elif (_span_digest(lines, release) != entry["text"] and
+              release_digest(release) != entry["digest"]):
+            # The symbols are parsed only if the lines changed
+            altered.append(name)
+    return sorted(altered), sorted(removed)
+
+
+def check_lock(filename, lock_filename=None, content=None):
+    """
+    Check a map against its lockfile, if it exists
+
+    :param filename:        The path to the map
+    :param lock_filename:   The path to the lockfile; defaults to the name of
+                            the map followed by ``LOCK_SUFFIX``
+    :param content:         The content of the map, if it was already read
+    :returns:               True if the lockfile exists, False otherwise
+    :raises Lock_Error:     Raised when a released release was modified or
+                            removed
+    """
+
+    if lock_filename is None:
+        lock_filename = get_lock_filename(filename)
+    if not os.path.isfile(lock_filename):
+        return False
+
+    logger = Single_Logger.getLogger(__name__)
+    altered, removed = verify(filename, read_lock(lock_filename), content)
+    if altered or removed:
+        e = Lock_Error(filename, altered, removed)
+        logger.error(str(e))
+        raise e
+    return True
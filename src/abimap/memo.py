@@ -0,0 +1,257 @@
+"""Memoization of the results of the update subcommand
+
+The result of ``update`` depends only on the content of the map, the set of
+symbols, and the options given. The results are kept in a content-addressed
+store: a directory of files named after the SHA-256 of the inputs. When the
+store grows larger than its maximum size, the least recently used results are
+removed.
+"""
+
+from __future__ import print_function
+
+import errno
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sys
+
+from .symver import Log_Collector
+from .symver import atomic_write
+from .symver import get_input_format
+from .symver import get_name_version
+from .symver import read_symbols
+from .symver import read_update_map
+from .symver import update_map
+from .symver import write_map
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# The default maximum size of the store, in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# The messages collected from the logger, e.g. "[WARNING] message"
+MESSAGE_RE = re.compile(r"\[(\w+)\] (.*)", re.DOTALL)
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Result_Store(object):
+    """
+    A content-addressed store of results
+
+    The results are JSON files in subdirectories named after the first two
+    characters of their keys. The modification time of a file is updated when
+    it is read, so that the least recently used results are removed first.
+
+    Attributes:
+        directory:  The directory of the store
+        max_size:   The maximum size of the store, in bytes
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        """
+        The constructor
+
+        :param directory:   The directory of the store, created if necessary
+        :param max_size:    The maximum size of the store, in bytes
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        _makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Get a stored result
+
+        :param key:     The key of the result
+        :returns:       The result, or None if not found
+        """
+
+        path = self._path(key)
+        try:
+            with io.open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """
+        Store a result, removing old results if the store gets too large
+
+        :param key:     The key of the result
+        :param result:  The result, a JSON serializable object
+        """
+
+        path = self._path(key)
+        _makedirs(os.path.dirname(path))
+        content = json.dumps(result, sort_keys=True).encode("utf-8")
+        atomic_write(path, content)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used results until the store fits in its
+        maximum size
+        """
+
+        entries = []
+        total = 0
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def get_update_key(map_content, symbols, release_info, args):
+    """
+    Get the key of the result of an update
+
+    :param map_content:     The content of the map file, as bytes
+    :param symbols:         The list of symbols
+    :param release_info:    The release information given in the arguments
+    :param args:            The arguments of the update subcommand
+    :returns:               The key, the hexadecimal SHA-256 of the inputs
+    """
+
+    inputs = {"program": get_name_version(args.program),
+              "map": hashlib.sha256(map_content).hexdigest(),
+              "symbols": sorted(set(symbols)),
+              "release": release_info,
+              "add": args.add,
+              "remove": args.remove,
+              "allow_abi_break": args.allow_abi_break,
+              "final": args.final,
+              "guess": args.guess,
+              "preserve_layout": getattr(args, "preserve_layout", False)}
+    content = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def _run_update(args, map_content, symbols, release_info, logger):
+    """
+    Update the map, collecting everything the update prints
+
+    The map is parsed from the given content, which is the content the key of
+    the result was computed from, even if the file was modified since.
+
+    :returns:   The result: a dictionary with the rendered map (None if the map
+                was not changed), the report of the symbols added and removed,
+                and the diagnostics logged
+    """
+
+    collector = Log_Collector(logger)
+    # Collect without removing the other handlers
+    logger.addHandler(collector)
+    try:
+        cur_map, document = read_update_map(args, logger, map_content)
+        report = StringIO()
+        new_map, _ = update_map(cur_map, symbols, release_info, add=args.add,
+                                remove=args.remove,
+                                allow_abi_break=args.allow_abi_break,
+                                final=args.final, guess=args.guess,
+                                out=report)
+    finally:
+        logger.removeHandler(collector)
+
+    output = None
+    if new_map is not None:
+        if new_map is not cur_map:
+            document = None
+        rendered = StringIO()
+        write_map(new_map, "updated", program=args.program, out=rendered,
+                  document=document)
+        output = rendered.getvalue()
+
+    return {"output": output,
+            "report": report.getvalue(),
+            "diagnostics": collector.messages}
+
+
+def cached_update(store, args, release_info, logger, symbols=None,
+                  out=None):
+    """
+    Update the map, reusing a stored result if the inputs did not change
+
+    The report of the symbols added and removed is printed, and the
+    diagnostics are logged, even if the result was stored.
+
+    :param store:           The Result_Store
+    :param args:            The arguments of the update subcommand
+    :param release_info:    The release information given in the arguments
+    :param logger:          The logger
+    :param symbols:         The symbols given to the update subcommand; if
+                            None, they are read from the input
+    :param out:             The stream where the report is printed (defaults
+                            to stdout)
+    :returns:               The rendered map, or None if the map was not
+                            changed
+    """
+
+    if out is None:
+        out = sys.stdout
+
+    with open(args.file, "rb") as f:
+        map_content = f.read()
+    if symbols is None:
+        symbols = read_symbols(args.input, *get_input_format(args))
+
+    key = get_update_key(map_content, symbols, release_info, args)
+    result = store.get(key)
+    if result is None:
+        logger.debug("Update result not found in the cache")
+        result = _run_update(args, map_content, symbols, release_info,
+                             logger)
+        store.put(key, result)
+    else:
+        logger.debug("Using cached update result %s", key)
+        for message in result["diagnostics"]:
+            match = MESSAGE_RE.match(message)
+            if match:
+                logger.log(logging.getLevelName(match.group(1)),
+                           match.group(2))
+
+    out.write(result["report"])
+    return result["output"]
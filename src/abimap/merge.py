@@ -0,0 +1,209 @@
+"""Merge map fragments into a single map
+
+Large libraries can keep one map fragment per component. The fragments are
+parsed in parallel and merged into a single map: the releases with the same
+name are merged by the union of their scopes.
+"""
+
+import multiprocessing
+
+from .symver import Map
+from .symver import ParserError
+from .symver import Release
+from .symver import Single_Logger
+
+
+###############################################################################
+# Functions executed in the worker processes
+###############################################################################
+
+def _parse_fragment(filename):
+    """
+    Read and parse a fragment
+
+    :param filename:    The path to the fragment
+    :returns:           A tuple (filename, releases, error); the error message
+                        is None if the fragment was parsed. The errors are
+                        logged.
+    """
+
+    m = Map()
+    m.filename = filename
+    try:
+        with open(filename, "r") as f:
+            lines = f.readlines()
+    except (IOError, OSError) as e:
+        m.logger.error(e)
+        return filename, None, str(e)
+    try:
+        m.parse(lines)
+    except ParserError as e:
+        # Already logged by the parser
+        return filename, None, str(e)
+    return filename, m.releases, None
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_default_jobs():
+    """
+    Get the default number of worker processes
+
+    :returns:   The number of CPUs, or 1 if unknown
+    """
+
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def parse_fragments(filenames, jobs=None):
+    """
+    Parse the fragments, in parallel if more than one job is requested
+
+    :param filenames:   The paths to the fragments
+    :param jobs:        The number of worker processes (defaults to the number
+                        of CPUs)
+    :returns:           A list of tuples (filename, releases, error), in the
+                        order of the given files
+    """
+
+    if jobs is None:
+        jobs = get_default_jobs()
+    jobs = min(jobs, len(filenames))
+
+    if jobs <= 1:
+        return [_parse_fragment(filename) for filename in filenames]
+
+    # Send the fragments in chunks to amortize the communication cost
+    chunksize = max(1, len(filenames) // (jobs * 4))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(_parse_fragment, filenames, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def merge_releases(fragments, logger=None):
+    """
+    Merge the releases of the parsed fragments
+
+    Releases with the same name are merged into a single release with the union
+    of the symbols of each scope. A release is marked as released if it is
+    released in any fragment. The symbols and the releases are sorted, so that
+    the result does not depend on the order of the fragments.
+
+    :param fragments:   A list of tuples (filename, releases)
+    :param logger:      The logger used to report the errors
+    :returns:           A tuple (map, duplicates). The duplicates are a list of
+                        tuples (symbol, [(filename, release, scope)]) for each
+                        symbol listed in more than one fragment.
+    :raises Exception:  Raised when a release has different predecessors in
+                        different fragments
+    """
+
+    if logger is None:
+        logger = Single_Logger.getLogger(__name__)
+
+    merged = {}
+    origins = {}
+    # Map each symbol to the places where it was listed
+    places = {}
+    for filename, releases in fragments:
+        for release in releases:
+            r = merged.get(release.name)
+            if r is None:
+                r = Release()
+                r.name = release.name
+                r.previous = release.previous
+                merged[r.name] = r
+                origins[r.name] = filename
+            elif r.previous != release.previous:
+                msg = ("Release \'{0}\' has different predecessors: \'{1}\'"
+                       " in {2} and \'{3}\' in {4}".format(
+                           r.name, r.previous, origins[r.name],
+                           release.previous, filename))
+                logger.error(msg)
+                raise Exception(msg)
+
+            r.released = r.released or release.released
+            for scope, symbols in release.symbols.items():
+                r.symbols.setdefault(scope, set()).update(symbols)
+                for symbol in symbols:
+                    # The local wildcard is expected in every fragment
+                    if symbol == "*":
+                        continue
+                    found = places.setdefault(symbol, [])
+                    place = (filename, release.name, scope)
+                    if place not in found:
+                        found.append(place)
+
+    duplicates = []
+    for symbol in sorted(places):
+        found = places[symbol]
+        if len(set(filename for filename, _, _ in found)) > 1:
+            duplicates.append((symbol, found))
+
+    m = Map(logger=logger)
+    for name in sorted(merged):
+        r = merged[name]
+        r.symbols = dict((scope, sorted(symbols)) for scope, symbols in
+                         r.symbols.items())
+        m.releases.append(r)
+
+    return m, duplicates
+
+
+def merge_maps(filenames, jobs=None, logger=None):
+    """
+    Parse and merge map fragments into a single checked map
+
+    The releases of the merged map are ordered from the newest to the oldest.
+
+    :param filenames:   The paths to the fragments
+    :param jobs:        The number of worker processes used to parse the
+                        fragments (defaults to the number of CPUs)
+    :param logger:      The logger used to report the errors and warnings
+    :returns:           A tuple (map, duplicates), as returned by
+                        ``merge_releases()``
+    :raises Exception:  Raised when a fragment cannot be parsed, the releases
+                        conflict, or the merged dependencies are invalid
+    """
+
+    if logger is None:
+        logger = Single_Logger.getLogger(__name__)
+
+    fragments = []
+    failed = 0
+    for filename, releases, error in parse_fragments(filenames, jobs):
+        if error is not None:
+            failed += 1
+        else:
+            fragments.append((filename, releases))
+
+    if failed:
+        msg = "Could not parse {0} of {1} fragments".format(failed,
+                                                            len(filenames))
+        logger.error(msg)
+        raise Exception(msg)
+
+    m, duplicates = merge_releases(fragments, logger)
+
+    # Checking the map validates the merged dependencies
+    m.check()
+
+    # Order the releases from the newest to the oldest
+    index = dict((r.name, r) for r in m.releases)
+    ordered = []
+    for dependency in m.dependencies():
+        for name in dependency:
+            release = index.pop(name, None)
+            if release is not None:
+                ordered.append(release)
+    m.releases = ordered
+
+    return m, duplicates
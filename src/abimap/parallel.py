@@ -0,0 +1,188 @@
+"""Parse large maps in parallel
+
+The lines of the map are split in chunks at the boundaries between releases,
+found by a quick scan which only follows the braces and semicolons outside
+comments. The chunks are parsed in a process pool and the releases are joined
+in order.
+
+The scan only suggests where to split: the result is used only if the parser
+finished each chunk (but the last) outside of a release, which means the
+chunks were parsed exactly as if the whole file was parsed at once. Otherwise,
+or if a syntax error is found, the file is parsed again in a single process,
+so that the errors are the same reported by ``Map.parse()``.
+"""
+
+import bisect
+import logging
+import multiprocessing
+import re
+
+from .symver import Log_Collector
+from .symver import Map
+from .symver import ParserError
+
+# The number of chunks for each process, to balance the load
+CHUNKS_PER_JOB = 4
+
+# The tokens followed by the scan: braces, semicolons and anything else
+TOKEN_RE = re.compile(r"[{};]|[^\s{};]+")
+
+# The lines given to the worker processes by the pool initializer
+_lines = None
+
+
+###############################################################################
+# Functions executed in the worker processes
+###############################################################################
+
+def _init_worker(lines):
+    global _lines
+    _lines = lines
+
+
+def _parse_chunk(task):
+    """
+    Parse a chunk of the lines given to the worker
+
+    :param task:    A tuple (filename, begin, end) with the name of the file
+                    and the range of lines of the chunk
+    :returns:       A tuple (releases, state, warnings), or None if a syntax
+                    error was found
+    """
+
+    filename, begin, end = task
+
+    m = Map()
+    m.filename = filename
+    collector = Log_Collector(m.logger)
+    collector.setFormatter(logging.Formatter("%(message)s"))
+    with collector:
+        try:
+            releases, state = m._parse(_lines[begin:end], begin)
+        except ParserError:
+            return None
+    return releases, state, collector.messages
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def scan_boundaries(lines):
+    """
+    Find the lines where a release can start
+
+    :param lines:   The lines of the map
+    :returns:       A list of the indexes of the lines which start outside of
+                    any release
+    """
+
+    boundaries = []
+    # 0: outside, 1: after the name, 2: inside the braces, 3: after the braces
+    state = 0
+    depth = 0
+    for index, line in enumerate(lines):
+        found = line.find("#")
+        if found >= 0:
+            line = line[:found]
+        # Most lines are symbols inside the braces
+        if state == 2 and "{" not in line and "}" not in line:
+            continue
+        for token in TOKEN_RE.findall(line):
+            if state == 0:
+                state = 1
+            elif state == 1:
+                if token == "{":
+                    state = 2
+                    depth = 1
+            elif state == 2:
+                if token == "{":
+                    depth += 1
+                elif token == "}":
+                    depth -= 1
+                    if not depth:
+                        state = 3
+            elif token == ";":
+                state = 0
+        if state == 0:
+            boundaries.append(index + 1)
+    return boundaries
+
+
+def split_lines(lines, chunks):
+    """
+    Split the lines in chunks of similar sizes at release boundaries
+
+    :param lines:   The lines of the map
+    :param chunks:  The number of chunks desired
+    :returns:       A list of tuples (begin, end) with the ranges of lines of
+                    the chunks
+    """
+
+    boundaries = scan_boundaries(lines)
+    n_lines = len(lines)
+
+    splits = [0]
+    for i in range(1, chunks):
+        target = n_lines * i // chunks
+        found = bisect.bisect_left(boundaries, max(target, splits[-1] + 1))
+        if found == len(boundaries) or boundaries[found] >= n_lines:
+            break
+        splits.append(boundaries[found])
+    splits.append(n_lines)
+
+    return list(zip(splits[:-1], splits[1:]))
+
+
+def parse_lines(m, lines, jobs):
+    """
+    Parse the lines of a map using a pool of processes
+
+    :param m:       The Map, which gives the file name and the logger
+    :param lines:   The lines of the map
+    :param jobs:    The number of processes
+    :returns:       A tuple (releases, state), as returned by ``Map._parse()``
+    :raises ParserError:    Raised when a syntax error is found
+    """
+
+    chunks = split_lines(lines, jobs * CHUNKS_PER_JOB)
+    if len(chunks) < 2:
+        return m._parse(lines)
+
+    pool = multiprocessing.Pool(min(jobs, len(chunks)), _init_worker,
+                                (lines,))
+    try:
+        results = pool.map(_parse_chunk, [(m.filename, begin, end) for
+                                          begin, end in chunks])
+    finally:
+        pool.close()
+        pool.join()
+
+    for result in results[:-1]:
+        if result is None or result[1] != 0:
+            m.logger.debug("Could not parse the chunks, parsing serially")
+            return m._parse(lines)
+    if results[-1] is None:
+        return m._parse(lines)
+
+    releases = []
+    names = set()
+    for chunk_releases, state, warnings in results:
+        for message in warnings:
+            m.logger.warning(message)
+        # Duplicates in the same chunk were reported by the worker
+        for release in chunk_releases:
+            if release.name in names:
+                index = release.span[0]
+                line = lines[index]
+                match = re.search(r"\b{0}\b".format(re.escape(release.name)),
+                                  line)
+                column = match.end() if match else 0
+                msg = "Duplicated Release identifier \'{}\'".format(
+                    release.name)
+                m.logger.warning(ParserError(m.filename, line, index, column,
+                                             msg))
+        names.update(release.name for release in chunk_releases)
+        releases.extend(chunk_releases)
+
+    return releases, state
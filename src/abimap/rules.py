@@ -0,0 +1,402 @@
+"""Rules checked by ``Map.check()``
+
+Each rule is a class which overrides the callbacks it needs. The releases and
+their scopes are traversed once, calling the callbacks of all the rules:
+::
+
+    start(m)                                once, before the traversal
+    release(release)                        for each release
+    scope(release, scope, symbols)          for each scope of each release
+    finish(m)                               once, after the traversal
+
+Only the callbacks overridden by the selected rules are called, so a rule
+which does not look at the scopes does not slow down the traversal. The rules
+are called in the order of ``RULES`` and log their messages with the logger of
+the map. A rule can raise an exception to stop the check.
+
+The rules with the ``first`` attribute set have their ``release`` and
+``scope`` callbacks called in a traversal of their own, before the other
+rules. This keeps the duplicated symbols reported before any other message,
+as they were before the checks were split in rules.
+
+New rules are added with the ``register_rule`` decorator:
+::
+
+    @register_rule
+    class Empty_Release_Rule(Rule):
+        name = "empty-release"
+        description = "Report releases without global symbols"
+        default = False
+
+        def release(self, release):
+            if not release.symbols.get("global"):
+                self.warning("%s has no global symbols", release.name)
+"""
+
+import logging
+
+from . import timings
+
+# The registered rule classes, in the order they are run
+RULES = []
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Rule(object):
+    """
+    The base class of the rules
+
+    Attributes:
+        name:           The name used to select the rule (class attribute)
+        description:    A short description of the rule (class attribute)
+        default:        Indicates if the rule is run when no rules are selected
+                        (class attribute)
+        first:          Indicates if the release and scope callbacks are
+                        called in a traversal before the other rules (class
+                        attribute)
+        logger:         The logger used to report the messages; set to the
+                        logger of the map being checked
+    """
+
+    name = None
+    description = ""
+    default = True
+    first = False
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def start(self, m):
+        """
+        Called before the traversal
+
+        :param m:   The map being checked
+        """
+        pass
+
+    def release(self, release):
+        """
+        Called for each release
+
+        :param release: The release
+        """
+        pass
+
+    def scope(self, release, scope, symbols):
+        """
+        Called for each scope of each release
+
+        :param release: The release
+        :param scope:   The name of the scope
+        :param symbols: The symbols of the scope
+        """
+        pass
+
+    def finish(self, m):
+        """
+        Called after the traversal
+
+        :param m:   The map being checked
+        """
+        pass
+
+    def info(self, msg, *args):
+        self.logger.info(msg, *args)
+
+    def warning(self, msg, *args):
+        self.logger.warning(msg, *args)
+
+
+def register_rule(cls):
+    """
+    Register a rule class, to be run after the rules already registered
+
+    :param cls: The Rule subclass
+    :returns:   The class
+    """
+
+    if any(rule.name == cls.name for rule in RULES):
+        raise ValueError("Rule \'{0}\' already registered".format(cls.name))
+    RULES.append(cls)
+    return cls
+
+
+@register_rule
+class Duplicates_Rule(Rule):
+    name = "duplicates"
+    description = "Report symbols repeated in a scope of a release"
+    first = True
+
+    def start(self, m):
+        self._last = None
+
+    def scope(self, release, scope, symbols):
+        if not symbols:
+            return
+        seen = set()
+        duplicates = set()
+        for symbol in symbols:
+            if symbol in seen:
+                duplicates.add(symbol)
+            else:
+                seen.add(symbol)
+        if duplicates:
+            if self._last is not release:
+                self.warning("Duplicates found in release \'%s\':",
+                             release.name)
+                self._last = release
+            self.warning("    %s:", scope)
+            self.warning("\n".join((" " * 8 + symbol for symbol in
+                                    duplicates)))
+
+
+@register_rule
+class Wildcard_Rule(Rule):
+    name = "wildcard"
+    description = "Check where the \'*\' wildcard is used"
+
+    def start(self, m):
+        self._found = []
+
+    def scope(self, release, scope, symbols):
+        if not symbols or "*" not in symbols:
+            return
+        if scope == "local":
+            self.info("%s contains the local \'*\' wildcard", release.name)
+            if release.previous:
+                # Predecessor version and local: *; are present
+                self.warning("%s should not contain the local wildcard"
+                             " because it is not the base version (it"
+                             " refers to version %s as its predecessor)",
+                             release.name, release.previous)
+            self._found.append((release.name, scope))
+        elif scope == "global":
+            # Release contains '*' wildcard in global scope
+            self.warning("%s contains the \'*\' wildcard in global scope."
+                         " It is probably exporting symbols it should not.",
+                         release.name)
+            self._found.append((release.name, scope))
+
+    def finish(self, m):
+        if not self._found:
+            self.warning("The \'*\' wildcard was not found")
+        elif len(self._found) > 1:
+            # The '*' wildcard was found in more than one place
+            self.warning("The \'*\' wildcard was found in more than one"
+                         " place:")
+            for name, scope in self._found:
+                self.warning("    %s: in \'%s\'", name, scope)
+
+
+@register_rule
+class Base_Rule(Rule):
+    name = "base"
+    description = "Find the base version: the release without a predecessor" \
+                  " which has the local \'*\' wildcard"
+
+    def start(self, m):
+        self._found = []
+
+    def scope(self, release, scope, symbols):
+        if scope == "local" and not release.previous and symbols and \
+                "*" in symbols:
+            self.info("%s seems to be the base version", release.name)
+            self._found.append(release.name)
+
+    def finish(self, m):
+        if not self._found:
+            self.warning("No base version release found")
+        elif len(self._found) > 1:
+            # There is more than one release without predecessor and
+            # containing '*' wildcard in local scope
+            self.warning("More than one release seem to be the base version"
+                         " (contain the local wildcard and do not have a"
+                         " predecessor version):")
+            for name in self._found:
+                self.warning("    %s", name)
+
+
+@register_rule
+class Scopes_Rule(Rule):
+    name = "scopes"
+    description = "Report scopes other than \'global\' and \'local\'"
+
+    def scope(self, release, scope, symbols):
+        if scope not in ("global", "local"):
+            self.warning("%s contains unknown scope named %s (different from"
+                         " \'global\' and \'local\')", release.name, scope)
+
+
+@register_rule
+class Dependencies_Rule(Rule):
+    name = "dependencies"
+    description = "Check that the previous releases exist, are unique and" \
+                  " do not form cycles"
+
+    def finish(self, m):
+        dependencies = m.dependencies()
+        self.info("Found dependencies:")
+        for release in dependencies:
+            self.info("".join([" " * 4] + [dep + "->" for dep in release]))
+
+
+@register_rule
+class Exported_Twice_Rule(Rule):
+    name = "exported-twice"
+    description = "Report symbols which are global in more than one release"
+    default = False
+
+    def start(self, m):
+        self._owners = {}
+
+    def scope(self, release, scope, symbols):
+        if scope != "global":
+            return
+        owners = self._owners
+        for symbol in symbols:
+            if symbol == "*":
+                continue
+            owner = owners.setdefault(symbol, release.name)
+            if owner != release.name:
+                self.warning("%s is global in %s and %s", symbol, owner,
+                             release.name)
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_rules(select=None, ignore=None):
+    """
+    Get new instances of the rules to be run
+
+    :param select:  The names of the rules to be run; if None, the rules run
+                    by default
+    :param ignore:  The names of the rules not to be run
+    :returns:       A list of Rule instances
+    :raises Exception:  Raised when an unknown rule name is given
+    """
+
+    names = set(rule.name for rule in RULES)
+    for name in _chain_names(select, ignore):
+        if name not in names:
+            raise Exception("Unknown rule \'{0}\'. The rules are: {1}".format(
+                name, ", ".join(rule.name for rule in RULES)))
+
+    rules = []
+    for rule in RULES:
+        if select is None:
+            if not rule.default:
+                continue
+        elif rule.name not in select:
+            continue
+        if ignore and rule.name in ignore:
+            continue
+        rules.append(rule())
+    return rules
+
+
+def _chain_names(*lists):
+    """
+    Iterate over the names in the given lists, skipping the lists not given
+    """
+
+    for names in lists:
+        if names:
+            for name in names:
+                yield name
+
+
+def _overrides(rule, callback):
+    """
+    Check if a rule overrides a callback of Rule
+
+    :param rule:        The Rule instance
+    :param callback:    The name of the callback
+    :returns:           True if the callback is overridden
+    """
+
+    for cls in type(rule).__mro__:
+        if cls is Rule:
+            return False
+        if callback in cls.__dict__:
+            return True
+    return False
+
+
+def _timed(callback, totals, name):
+    def wrapper(*args):
+        start = timings.clock()
+        try:
+            return callback(*args)
+        finally:
+            totals[name] += timings.clock() - start
+    return wrapper
+
+
+def _traverse(m, on_release, on_scope):
+    """
+    Call the given callbacks for each release and each scope of the map
+    """
+
+    for release in m.releases:
+        for callback in on_release:
+            callback(release)
+        if on_scope:
+            for scope, symbols in release.symbols.items():
+                for callback in on_scope:
+                    callback(release, scope, symbols)
+
+
+def run_rules(m, rules):
+    """
+    Check a map running the given rules in a single traversal
+
+    The rules with the ``first`` attribute set are run in a traversal before
+    the other rules, so their messages come first.
+
+    The rules log their messages with the logger of the map. If the
+    timings are being collected (see ``abimap.timings``), the time spent by
+    each rule is recorded.
+
+    :param m:       The map to be checked
+    :param rules:   The list of Rule instances, as returned by ``get_rules()``
+    """
+
+    for rule in rules:
+        rule.logger = m.logger
+
+    totals = None
+    if timings.collecting():
+        totals = dict((rule.name, 0.0) for rule in rules)
+
+    def callbacks(name, selected=rules):
+        found = []
+        for rule in selected:
+            if _overrides(rule, name):
+                callback = getattr(rule, name)
+                if totals is not None:
+                    callback = _timed(callback, totals, rule.name)
+                found.append(callback)
+        return found
+
+    try:
+        for callback in callbacks("start"):
+            callback(m)
+
+        for selected in ([rule for rule in rules if rule.first],
+                         [rule for rule in rules if not rule.first]):
+            on_release = callbacks("release", selected)
+            on_scope = callbacks("scope", selected)
+            if on_release or on_scope:
+                _traverse(m, on_release, on_scope)
+
+        for callback in callbacks("finish"):
+            callback(m)
+    finally:
+        if totals is not None:
+            for rule in rules:
+                timings.record("rule " + rule.name, totals[rule.name])
@@ -0,0 +1,637 @@
+"""Index of the versions and symbols of the shared objects of a sysroot
+
+The directories scanned are walked, and the ELF shared objects found (by the
+magic number of their files, whatever their names) are read in parallel: their
+version definitions (``.gnu.version_d``) and their exported dynamic symbols,
+with the version of each symbol. The symbols imported by every dynamically
+linked ELF file (shared objects and executables) are read too, with the
+versions they require (``.gnu.version_r``). The results are stored in a SQLite
+index:
+
+- ``files``: each regular file seen, with its device, inode, modification
+  time and size, its build-id, and the library read from it (NULL for the
+  files which are not shared objects)
+- ``libraries``: the content of each shared object, identified by its GNU
+  build-id, with its soname
+- ``versions``: the version definitions of each library, in the order of the
+  file, with their predecessor
+- ``symbols``: the exported symbols of each library, with their version (NULL
+  for the unversioned symbols) and whether it is not the default version
+  (``symbol@VERSION``)
+- ``needed``: the shared objects needed by each file (``DT_NEEDED``)
+- ``imports``: the undefined dynamic symbols of each file, with the version
+  required (NULL for the unversioned symbols) and the shared object required
+  to define it. Indexed by symbol, it gives the consumers of each symbol
+
+When the index is scanned again, the files whose device, inode, modification
+time and size did not change are not opened. The files which changed are read
+again, but when their build-id did not change (or is the build-id of a library
+already indexed, e.g. a copy of a library) the indexed library is kept. The
+symbolic links are not followed, so each library is indexed once.
+
+The map of each library can be reconstructed from the index, and the
+consumers which would break if symbols were removed from a library can be
+found.
+"""
+
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import stat
+from collections import namedtuple
+
+from .elf import ELF_Error
+from .elf import ELF_File
+from .elf import ELF_MAGIC
+from .elf import VER_FLG_BASE
+from .merge import get_default_jobs
+from .symver import Map
+from .symver import Release
+from .symver import Single_Logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS libraries (
+    id INTEGER PRIMARY KEY,
+    build_id TEXT UNIQUE,
+    soname TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    build_id TEXT,
+    library INTEGER REFERENCES libraries(id)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    library INTEGER NOT NULL REFERENCES libraries(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    previous TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    library INTEGER NOT NULL REFERENCES libraries(id),
+    name TEXT NOT NULL,
+    version TEXT,
+    hidden INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS needed (
+    path TEXT NOT NULL REFERENCES files(path),
+    soname TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT NOT NULL REFERENCES files(path),
+    symbol TEXT NOT NULL,
+    version TEXT,
+    soname TEXT
+);
+CREATE INDEX IF NOT EXISTS files_library ON files (library);
+CREATE INDEX IF NOT EXISTS versions_library ON versions (library, position);
+CREATE INDEX IF NOT EXISTS symbols_library ON symbols (library);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS needed_path ON needed (path, soname);
+CREATE INDEX IF NOT EXISTS imports_path ON imports (path);
+CREATE INDEX IF NOT EXISTS imports_symbol
+    ON imports (symbol, version, soname, path);
+"""
+
+# The types of the symbols indexed
+SCAN_SYMBOL_TYPES = frozenset(("func", "object", "tls", "other"))
+
+# The status of the files read by the workers: shared objects, other
+# dynamically linked ELF files, files which did not change, files which are
+# not dynamically linked ELF files, and files which could not be read
+READ = "read"
+CONSUMER = "consumer"
+UNCHANGED = "unchanged"
+OTHER = "other"
+FAILED = "failed"
+
+# The content of a shared object: its build-id (None if missing), soname
+# (None if missing), the list of the version definitions as tuples (name,
+# previous), and the list of the exported symbols as tuples (name, version,
+# hidden)
+Library = namedtuple("Library", ("build_id", "soname", "versions",
+                                 "symbols"))
+
+# The dependencies of a dynamically linked ELF file: the list of the shared
+# objects needed, and the list of the imported symbols as tuples (name,
+# version, soname)
+Dependencies = namedtuple("Dependencies", ("needed", "imports"))
+
+# The numbers of files found, of shared objects found, of files read, of
+# files skipped because they did not change, and of files removed from the
+# index
+Scan_Stats = namedtuple("Scan_Stats", ("files", "libraries", "read",
+                                       "unchanged", "removed"))
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Scan_Index(object):
+    """
+    An index of the shared objects found in directories
+
+    Attributes:
+        path:   The path to the SQLite database (":memory:" for an index which
+                is not kept)
+        logger: The logger object
+    """
+
+    def __init__(self, path=":memory:", logger=None):
+        """
+        The constructor
+
+        The database is created if it does not exist.
+
+        :param path:    The path to the SQLite database
+        :param logger:  The logger object
+        """
+
+        if logger is None:
+            logger = Single_Logger.getLogger(__name__)
+        self.logger = logger
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Close the database
+        """
+
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def scan(self, directories, jobs=None):
+        """
+        Scan directories and update the index
+
+        The files which are not found anymore in the directories are removed
+        from the index, with the libraries read only from them.
+
+        :param directories: The paths to the directories
+        :param jobs:        The number of worker processes reading the files
+                            (defaults to the number of CPUs)
+        :returns:           A ``Scan_Stats`` instance
+        """
+
+        directories = [os.path.abspath(directory) for directory in
+                       directories]
+        known = {}
+        for directory in directories:
+            prefix = os.path.join(directory, "")
+            for row in self.db.execute(
+                    "SELECT path, device, inode, mtime, size, library,"
+                    " build_id FROM files WHERE substr(path, 1, ?) = ?",
+                    (len(prefix), prefix)):
+                known[row[0]] = (row[1:5], row[5], row[6])
+
+        found = 0
+        libraries = 0
+        unchanged = 0
+        changed = []
+        seen = set()
+        for path, status in iter_files(directories):
+            found += 1
+            seen.add(path)
+            previous = known.get(path)
+            if previous is not None and previous[0] == status:
+                unchanged += 1
+                libraries += previous[1] is not None
+            else:
+                changed.append((path, status, previous))
+
+        removed = [path for path in known if path not in seen]
+        read = 0
+        with self.db:
+            tasks = [(path, previous[2] if previous else None) for
+                     path, _, previous in changed]
+            for (path, status, previous), result in zip(
+                    changed, _read_files(tasks, jobs)):
+                (result, build_id, library, dependencies,
+                 error) = result
+                if result == FAILED:
+                    self.logger.warning("Skipping \'%s\': %s", path, error)
+                    continue
+                if result == UNCHANGED:
+                    self.db.execute("UPDATE files SET device = ?, inode = ?,"
+                                    " mtime = ?, size = ? WHERE path = ?",
+                                    status + (path,))
+                    unchanged += 1
+                    libraries += previous[1] is not None
+                    continue
+                read += 1
+                library_id = None
+                if result == READ:
+                    library_id = self._add_library(library)
+                    libraries += 1
+                self.db.execute("INSERT OR REPLACE INTO files"
+                                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (path,) + status + (build_id, library_id))
+                self._remove_dependencies([path])
+                if dependencies is not None:
+                    self._add_dependencies(path, dependencies)
+
+            self.db.executemany("DELETE FROM files WHERE path = ?",
+                                ((path,) for path in removed))
+            self._remove_dependencies(removed)
+            self._remove_orphans()
+
+        return Scan_Stats(found, libraries, read, unchanged, len(removed))
+
+    def _add_library(self, library):
+        """
+        Add the content of a shared object, unless its build-id is known
+
+        :param library: The ``Library``
+        :returns:       The id of the library in the index
+        """
+
+        if library.build_id is not None:
+            row = self.db.execute("SELECT id FROM libraries"
+                                  " WHERE build_id = ?",
+                                  (library.build_id,)).fetchone()
+            if row is not None:
+                return row[0]
+
+        cur = self.db.execute("INSERT INTO libraries (build_id, soname)"
+                              " VALUES (?, ?)",
+                              (library.build_id, library.soname))
+        library_id = cur.lastrowid
+        self.db.executemany("INSERT INTO versions VALUES (?, ?, ?, ?)",
+                            ((library_id, position, name, previous) for
+                             position, (name, previous) in
+                             enumerate(library.versions)))
+        self.db.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?)",
+                            ((library_id, name, version, int(hidden)) for
+                             name, version, hidden in library.symbols))
+        return library_id
+
+    def _add_dependencies(self, path, dependencies):
+        """
+        Add the dependencies of a file
+
+        :param path:            The path to the file
+        :param dependencies:    The ``Dependencies``
+        """
+
+        self.db.executemany("INSERT INTO needed VALUES (?, ?)",
+                            ((path, soname) for soname in
+                             dependencies.needed))
+        self.db.executemany("INSERT INTO imports VALUES (?, ?, ?, ?)",
+                            ((path, name, version, soname) for
+                             name, version, soname in dependencies.imports))
+
+    def _remove_dependencies(self, paths):
+        """
+        Remove the dependencies of files
+
+        :param paths:   The paths to the files
+        """
+
+        for table in ("needed", "imports"):
+            self.db.executemany("DELETE FROM {0} WHERE path = ?".format(
+                table), ((path,) for path in paths))
+
+    def _remove_orphans(self):
+        """
+        Remove the libraries which are not read from any file
+        """
+
+        orphans = "(SELECT id FROM libraries WHERE id NOT IN" \
+                  " (SELECT library FROM files WHERE library IS NOT NULL))"
+        for table, column in (("symbols", "library"),
+                              ("versions", "library"),
+                              ("libraries", "id")):
+            self.db.execute("DELETE FROM {0} WHERE {1} IN {2}".format(
+                table, column, orphans))
+
+    def libraries(self):
+        """
+        Get the shared objects in the index
+
+        :returns:   A list of tuples (path, soname, build-id, versions,
+                    symbols), sorted by path
+        """
+
+        return self.db.execute(
+            "SELECT path, soname, l.build_id,"
+            " (SELECT count(*) FROM versions AS v WHERE v.library = l.id),"
+            " (SELECT count(*) FROM symbols AS s WHERE s.library = l.id)"
+            " FROM files JOIN libraries AS l ON files.library = l.id"
+            " ORDER BY path").fetchall()
+
+    def find(self, library):
+        """
+        Find a shared object by its path or its soname
+
+        :param library: The path to the file, or the soname
+        :returns:       The id of the library in the index, or None if not
+                        found
+        """
+
+        row = self.db.execute("SELECT library FROM files WHERE path = ? AND"
+                              " library IS NOT NULL",
+                              (os.path.abspath(library),)).fetchone()
+        if row is None:
+            row = self.db.execute("SELECT id FROM libraries WHERE soname = ?"
+                                  " ORDER BY id", (library,)).fetchone()
+        return row[0] if row else None
+
+    def get_library(self, library_id):
+        """
+        Get the content of a shared object from the index
+
+        :param library_id:  The id of the library (see ``find()``)
+        :returns:           A ``Library`` instance
+        """
+
+        build_id, soname = self.db.execute(
+            "SELECT build_id, soname FROM libraries WHERE id = ?",
+            (library_id,)).fetchone()
+        versions = self.db.execute(
+            "SELECT name, previous FROM versions WHERE library = ?"
+            " ORDER BY position", (library_id,)).fetchall()
+        symbols = [(name, version, bool(hidden)) for name, version, hidden in
+                   self.db.execute("SELECT name, version, hidden FROM symbols"
+                                   " WHERE library = ? ORDER BY rowid",
+                                   (library_id,))]
+        return Library(build_id, soname, versions, symbols)
+
+    def get_map(self, library):
+        """
+        Reconstruct the map of a shared object
+
+        :param library: The path to the file, or the soname
+        :returns:       The ``Map`` (see ``library_map()``)
+        :raises Exception:  Raised when the library is not in the index
+        """
+
+        library_id = self.find(library)
+        if library_id is None:
+            msg = "Library \'{0}\' not found in the index".format(library)
+            self.logger.error(msg)
+            raise Exception(msg)
+        return library_map(self.get_library(library_id), self.logger)
+
+    def consumers(self, symbols, soname=None, directories=None):
+        """
+        Find the files which import symbols
+
+        A file imports a symbol if it has an undefined dynamic symbol which
+        requires one of the given versions of the symbol (from the given
+        shared object, if any). When the shared object is given, the files
+        which need it and import the symbol without a version are consumers
+        too.
+
+        :param symbols:     An iterable of tuples (symbol, version)
+        :param soname:      The soname of the library defining the symbols
+        :param directories: If given, only the files in these directories are
+                            found
+        :returns:           A list of tuples (path, symbol, version), sorted;
+                            the version is None for the unversioned imports
+        """
+
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS wanted ("
+                            " symbol TEXT, version TEXT,"
+                            " PRIMARY KEY (symbol, version))")
+            self.db.execute("DELETE FROM wanted")
+            self.db.executemany("INSERT OR IGNORE INTO wanted VALUES (?, ?)",
+                                symbols)
+
+            # The wanted symbols are looked up in the index of the imports
+            # (CROSS JOIN keeps the order of the tables)
+            query = "SELECT i.path, i.symbol, i.version FROM wanted AS w" \
+                    " CROSS JOIN imports AS i ON i.symbol = w.symbol AND" \
+                    " i.version = w.version"
+            params = []
+            if soname:
+                query += " AND i.soname = ?" \
+                         " UNION SELECT i.path, i.symbol, NULL FROM" \
+                         " (SELECT DISTINCT symbol FROM wanted) AS w" \
+                         " CROSS JOIN imports AS i ON i.symbol = w.symbol AND" \
+                         " i.version IS NULL" \
+                         " JOIN needed AS n ON n.path = i.path AND" \
+                         " n.soname = ?"
+                params.extend((soname, soname))
+
+            query = "SELECT * FROM ({0})".format(query)
+            if directories:
+                prefixes = [os.path.join(os.path.abspath(directory), "") for
+                            directory in directories]
+                query += " WHERE " + " OR ".join(
+                    "substr(path, 1, ?) = ?" for _ in prefixes)
+                for prefix in prefixes:
+                    params.extend((len(prefix), prefix))
+            query += " ORDER BY path, symbol, version"
+            return self.db.execute(query, params).fetchall()
+
+
+###############################################################################
+# Functions executed in the worker processes
+###############################################################################
+
+def read_file(filename, known_build_id=None):
+    """
+    Read a dynamically linked ELF file
+
+    The versions and the exported symbols of the shared objects, and the
+    dependencies of all the dynamically linked files are read.
+
+    :param filename:        The path to the file
+    :param known_build_id:  The build-id of the file when it was last read; if
+                            the file still has this build-id, it is not read
+    :returns:               A tuple (status, build-id, library, dependencies,
+                            error): the status is ``READ`` for shared objects
+                            (with the ``Library``), ``CONSUMER`` for the other
+                            dynamically linked files, ``UNCHANGED``, ``OTHER``
+                            for the other files, or ``FAILED`` (with the error
+                            message). The ``Dependencies`` are given for
+                            ``READ`` and ``CONSUMER``.
+    """
+
+    try:
+        with open(filename, "rb") as f:
+            if f.read(len(ELF_MAGIC)) != ELF_MAGIC:
+                return OTHER, None, None, None, None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError) as e:
+        return FAILED, None, None, None, str(e)
+
+    try:
+        elf = ELF_File(data)
+        if elf.symbol_table(dynamic=True) is None:
+            return OTHER, None, None, None, None
+        build_id = elf.build_id()
+        if build_id is not None and build_id == known_build_id:
+            return UNCHANGED, build_id, None, None, None
+        dependencies = Dependencies(elf.needed(), elf.imported_symbols())
+        if not elf.is_shared_object():
+            return CONSUMER, build_id, None, dependencies, None
+        versions = [(d.name, d.parents[0] if d.parents else "") for d in
+                    elf.version_definitions() if not d.flags & VER_FLG_BASE]
+        library = Library(build_id, elf.soname(), versions,
+                          elf.versioned_symbols(SCAN_SYMBOL_TYPES))
+        return READ, build_id, library, dependencies, None
+    except ELF_Error as e:
+        return FAILED, None, None, None, str(e)
+    finally:
+        data.close()
+
+
+def _read_chunk(tasks):
+    """
+    Read a chunk of files
+
+    :param tasks:   A list of tuples (path, known build-id)
+    :returns:       A list of the results of ``read_file()``
+    """
+
+    return [read_file(path, build_id) for path, build_id in tasks]
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_status(st):
+    """
+    Get the status of a file compared when scanning again
+
+    :param st:  The result of ``os.stat()``
+    :returns:   A tuple (device, inode, modification time, size)
+    """
+
+    return (st.st_dev, st.st_ino, getattr(st, "st_mtime_ns", st.st_mtime),
+            st.st_size)
+
+
+def iter_files(directories):
+    """
+    Iterate over the regular files of directories
+
+    The symbolic links are not followed.
+
+    :param directories: The paths to the directories
+    :returns:           A generator of tuples (path, status), sorted by path
+                        in each directory (see ``get_status()``)
+    """
+
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    yield path, get_status(st)
+
+
+def _read_files(tasks, jobs=None):
+    """
+    Read files, in parallel if more than one job is requested
+
+    :param tasks:   A list of tuples (path, known build-id)
+    :param jobs:    The number of worker processes (defaults to the number of
+                    CPUs)
+    :returns:       A generator of the results of ``read_file()``, in the
+                    order of the tasks
+    """
+
+    if jobs is None:
+        jobs = get_default_jobs()
+    jobs = min(jobs, len(tasks))
+
+    if jobs <= 1:
+        for path, build_id in tasks:
+            yield read_file(path, build_id)
+        return
+
+    # Send the files in chunks to amortize the communication cost
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for results in pool.imap(_read_chunk, chunks):
+            for result in results:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_removed_versions(m, symbols=None):
+    """
+    Get the versions of the symbols removed from a map
+
+    :param m:       The ``Map``
+    :param symbols: The symbols removed; if None, all the global symbols
+    :returns:       A tuple (removed, missing): the list of tuples (symbol,
+                    release) for each release where a removed symbol is
+                    global, and the list of the symbols which are not global
+                    in any release
+    """
+
+    releases = {}
+    for r in m.releases:
+        for symbol in r.symbols.get("global", ()):
+            releases.setdefault(symbol, []).append(r.name)
+
+    if symbols is None:
+        symbols = sorted(releases)
+    removed = []
+    missing = []
+    for symbol in symbols:
+        if symbol in releases:
+            removed.extend((symbol, name) for name in releases[symbol])
+        else:
+            missing.append(symbol)
+    return removed, missing
+
+
+def library_map(library, logger=None):
+    """
+    Reconstruct the map of a shared object
+
+    Each version definition is a released release, with the default and the
+    non-default versions of the symbols as global symbols. The releases are
+    ordered from the newest to the oldest (the reverse order of the file),
+    and the base releases hide the other symbols (``local: *;``). The
+    unversioned symbols are not in any release.
+
+    :param library: The ``Library``
+    :param logger:  The logger of the map
+    :returns:       The ``Map``
+    """
+
+    symbols = {}
+    for name, version, _ in library.symbols:
+        if version is not None:
+            symbols.setdefault(version, set()).add(name)
+
+    m = Map(logger=logger)
+    names = set(name for name, _ in library.versions)
+    for name, previous in reversed(library.versions):
+        r = Release()
+        r.name = name
+        r.previous = previous if previous in names else ""
+        r.released = True
+        r.symbols["global"] = sorted(symbols.get(name, ()))
+        if not r.previous:
+            r.symbols["local"] = ["*"]
+        m.releases.append(r)
+    return m
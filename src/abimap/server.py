@@ -0,0 +1,799 @@
+"""A server which keeps parsed maps in memory and answers requests
+
+The server listens on a Unix domain socket. Each request is a JSON object in a
+single line; each response is a JSON object in a single line. Requests have an
+``op`` field, which can be:
+
+    - ``check``: Check a map file (``file``)
+    - ``update``: Update a map file, like the ``update`` subcommand
+    - ``new``: Create a map file, like the ``new`` subcommand
+    - ``query``: Get the releases of a map file and, optionally, the releases
+      where the given ``symbols`` are defined
+    - ``verify``: Verify that the global symbols of a map file are the given
+      symbols
+    - ``shutdown``: Stop the server
+
+The arguments of ``check``, ``update`` and ``new`` have the same names of the
+attributes set by the command line parser (e.g. ``allow_abi_break``). The
+symbols are read from the file given in ``input``, or from the list of lines
+given in ``stdin``.
+
+Responses contain the fields ``ok``, ``error``, ``stdout`` (what the command
+line application would print to stdout), ``diagnostics`` (the warnings and
+errors logged), and ``result`` (the result of ``query`` and ``verify``).
+
+The server requires Python 3.7 or later (see ``symver.SERVER_MIN_PYTHON``).
+"""
+
+from __future__ import print_function
+
+import argparse
+import asyncio
+import errno
+import io
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+
+from . import symver
+from .lockfile import check_lock
+from .symver import Log_Collector
+from .symver import Map
+from .symver import Single_Logger
+
+# Default values for the arguments of update and new requests
+REQUEST_DEFAULTS = {"file": None,
+                    "input": None,
+                    "stdin": None,
+                    "out": None,
+                    "dry": False,
+                    "backups": 1,
+                    "name": None,
+                    "version": None,
+                    "release": None,
+                    "guess": True,
+                    "add": False,
+                    "remove": False,
+                    "allow_abi_break": False,
+                    "final": False,
+                    "preserve_layout": False,
+                    "retry_merge": False,
+                    "cache_dir": None,
+                    "cache_size": 64,
+                    "lock": None,
+                    "update_lock": False,
+                    "depfile": None,
+                    "stamp": None,
+                    "input_format": "plain",
+                    "symbol_types": None,
+                    "jobs": None,
+                    "select": None,
+                    "ignore": None,
+                    "program": "abimap"}
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Map_Cache(object):
+    """
+    A cache of parsed maps, keyed by path
+
+    A cached map is used as long as the file status (inode, size, and
+    modification time) does not change. Modified files are parsed again
+    incrementally, in a copy of the cached map, so that the maps returned are
+    never modified by the cache. The cache can be used by concurrent threads.
+
+    The maps are lazy: the body of each release is only parsed when its
+    symbols are accessed (see ``Map.parse()``).
+
+    Attributes:
+        maps:   A dictionary {path: (status, map)}
+    """
+
+    def __init__(self, logger=None):
+        """
+        The constructor
+
+        :param logger:  The logger given to the maps
+        """
+
+        if logger is None:
+            logger = Single_Logger.getLogger(__name__)
+        self.logger = logger
+        self.maps = {}
+        # The locks of the paths being read, so that each file is parsed once
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _path_lock(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def get(self, filename):
+        """
+        Get the parsed map for the given file
+
+        The returned map is shared. Copy it before modifying.
+
+        :param filename:    The path to the map file
+        :returns:           The parsed, but not checked, Map
+        :raises ParserError:    Raised when a syntax error is found in the file
+        """
+
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        status = (st.st_ino, st.st_size,
+                  getattr(st, "st_mtime_ns", st.st_mtime))
+
+        with self._path_lock(path):
+            cached = self.maps.get(path)
+            if cached is not None and cached[0] == status:
+                return cached[1]
+
+            with open(path, "r") as f:
+                lines = f.readlines()
+
+            if cached is not None:
+                # The old map may be in use by other requests
+                m = cached[1].copy()
+                # Do not keep the old map if parsing fails
+                self.maps.pop(path, None)
+                m.reparse(lines)
+            else:
+                m = Map(logger=self.logger, lazy=True)
+                m.filename = filename
+                m.parse(lines)
+
+            self.maps[path] = (status, m)
+            return m
+
+    def check(self, filename):
+        """
+        Get the parsed map for the given file, and check it
+
+        Checking updates the cached dependencies of the map, so the shared map
+        is checked holding the lock of its path. The diagnostics are logged
+        on each call.
+
+        :param filename:    The path to the map file
+        :returns:           The parsed and checked Map
+        :raises ParserError:    Raised when a syntax error is found in the file
+        """
+
+        m = self.get(filename)
+        with self._path_lock(os.path.abspath(filename)):
+            m.check()
+        return m
+
+    def read(self, filename):
+        """
+        Get the parsed map for the given file, checking only the dependencies
+        between the releases
+
+        As when a lazy map is read, the bodies of the releases are not parsed.
+        The returned map is considered checked (see ``Map.read()``).
+
+        :param filename:    The path to the map file
+        :returns:           The parsed Map
+        :raises ParserError:    Raised when a syntax error is found in the file
+        """
+
+        m = self.get(filename)
+        with self._path_lock(os.path.abspath(filename)):
+            m.dependencies()
+            m.init = True
+        return m
+
+    def invalidate(self, filename):
+        """
+        Remove a file from the cache
+
+        :param filename:    The path to the map file
+        """
+
+        self.maps.pop(os.path.abspath(filename), None)
+
+
+class Server(object):
+    """
+    The server listening on a Unix domain socket
+
+    The requests are executed in a pool of threads, so that a slow request
+    does not delay the requests of other clients.
+
+    Attributes:
+        path:   The path to the socket
+        cache:  The cache of parsed maps
+    """
+
+    def __init__(self, path=None, logger=None):
+        """
+        The constructor
+
+        :param path:    The path to the socket (see ``get_socket_path()``)
+        :param logger:  The logger used by the requests
+        """
+
+        if logger is None:
+            logger = Single_Logger.getLogger(__name__)
+        self.logger = logger
+        self.path = get_socket_path(path)
+        self.cache = Map_Cache(logger)
+        self._server = None
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answer the requests received in a connection
+
+        :param reader:  The stream reader of the connection
+        :param writer:  The stream writer of the connection
+        """
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    request = None
+                    response = {"ok": False,
+                                "error": "Invalid request: {0}".format(e)}
+
+                if request is not None:
+                    if request.get("op") == "shutdown":
+                        response = {"ok": True}
+                        self._server.close()
+                    else:
+                        loop = asyncio.get_running_loop()
+                        response = await loop.run_in_executor(
+                            None, handle_request, request, self.cache,
+                            self.logger)
+
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """
+        Listen for connections until the server is stopped
+        """
+
+        remove_stale_socket(self.path)
+        self._server = await asyncio.start_unix_server(self.handle_connection,
+                                                       path=self.path)
+        self.logger.info("Listening on %s", self.path)
+        try:
+            # Wait until the server is closed by a shutdown request
+            await self._server.wait_closed()
+        finally:
+            self._server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def run(self):
+        """
+        Run the server until it is stopped
+        """
+
+        asyncio.run(self.serve())
+
+
+class Client(object):
+    """
+    A client which sends requests to the server
+
+    Attributes:
+        path:   The path to the server socket
+    """
+
+    def __init__(self, path=None, timeout=None):
+        """
+        The constructor
+
+        :param path:    The path to the socket (see ``get_socket_path()``)
+        :param timeout: The timeout for socket operations, in seconds
+        """
+
+        self.path = get_socket_path(path)
+        self.timeout = timeout
+
+    def connect(self):
+        """
+        Connect to the server
+
+        :returns:       The connected socket
+        :raises OSError:    Raised if the server cannot be reached
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, request, sock=None):
+        """
+        Send a request to the server and wait for the response
+
+        :param request: The request (a dictionary)
+        :param sock:    The socket returned by ``connect()``. If not provided,
+                        a new connection is made
+        :returns:       The response (a dictionary)
+        :raises OSError:    Raised if the server cannot be reached, or the
+                            connection fails
+        """
+
+        if sock is None:
+            sock = self.connect()
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+        finally:
+            sock.close()
+
+        data = b"".join(chunks)
+        if not data:
+            raise OSError("Connection closed by the server")
+        return json.loads(data.decode("utf-8"))
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_socket_path(path=None):
+    """
+    Get the path to the server socket
+
+    :param path:    The path given by the user. If not provided, the
+                    environment variable ABIMAP_SOCKET is used, or a socket in
+                    XDG_RUNTIME_DIR, or in a directory of the temporary
+                    directory private to the user (see
+                    ``get_private_directory()``)
+    :returns:       The path to the socket
+    """
+
+    if path:
+        return path
+    if os.environ.get("ABIMAP_SOCKET"):
+        return os.environ["ABIMAP_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"],
+                            "abimap-{0}.sock".format(os.getuid()))
+    return os.path.join(get_private_directory(), "abimap.sock")
+
+
+def get_private_directory():
+    """
+    Get a directory in the temporary directory which only the user can access
+
+    The directory is created if it does not exist. Since the name is
+    predictable, an existing directory is used only if it is owned by the
+    user and not accessible by others.
+
+    :returns:       The path to the directory
+    :raises Exception:  Raised if the directory exists but is not private
+    """
+
+    directory = os.path.join(tempfile.gettempdir(),
+                             "abimap-{0}".format(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    st = os.lstat(directory)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        logger = Single_Logger.getLogger(__name__)
+        msg = "The directory \'{0}\' is not private to the user".format(
+            directory)
+        logger.error(msg)
+        raise Exception(msg)
+    return directory
+
+
+def remove_stale_socket(path):
+    """
+    Remove a socket left by a server which is not running anymore
+
+    :param path:    The path to the socket
+    :raises Exception:  Raised if a server is listening on the socket
+    """
+
+    if not os.path.exists(path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        sock.close()
+
+    msg = "A server is already listening on \'{0}\'".format(path)
+    raise Exception(msg)
+
+
+def _get_args(request, func):
+    """
+    Get a namespace with the arguments of a request
+
+    :param request: The request
+    :param func:    The subcommand function (e.g. ``symver.update``)
+    :returns:       An argparse.Namespace
+    """
+
+    values = dict(REQUEST_DEFAULTS)
+    values.update((key, value) for key, value in request.items() if
+                  key in REQUEST_DEFAULTS)
+    args = argparse.Namespace(**values)
+    args.func = func
+    return args
+
+
+def _get_symbols(args):
+    """
+    Get the symbols of an update or new request
+
+    :param args:    The request arguments
+    :returns:       A list of symbols
+    """
+
+    fmt, types, jobs = symver.get_input_format(args)
+    if args.input:
+        return symver.read_symbols(args.input, fmt, types, jobs)
+    return symver.get_symbols_from_lines(args.stdin or [], fmt, types)
+
+
+def _update(request, cache, logger, out):
+    args = _get_args(request, symver.update)
+
+    if args.out:
+        if os.path.isfile(args.out):
+            logger.warning("Overwriting existing file \'%s\'", args.out)
+    if args.out and args.input:
+        symver.check_files('--out', args.out, '--in', args.input, args.dry,
+                           args.backups)
+
+    symver.get_build_target(args)
+
+    release_info = symver.get_info_from_args(args)
+
+    new_symbols = _get_symbols(args)
+
+    if args.dry or not symver.is_same_file(args.out, args.file):
+        if args.out and args.file:
+            symver.check_files('--out', args.out, 'file', args.file,
+                               args.dry, args.backups)
+        return _apply_update(args, release_info, new_symbols, cache, logger,
+                             out)
+
+    # The map is updated in place: hold the same lock as the update
+    # subcommand, so that the updates of other processes are not lost
+    if args.retry_merge:
+        return _update_merge(args, release_info, new_symbols, cache, logger,
+                             out)
+
+    with symver.lock_map_file(args.file):
+        symver.check_files('--out', args.out, 'file', args.file, args.dry,
+                           args.backups)
+        return _apply_update(args, release_info, new_symbols, cache, logger,
+                             out)
+
+
+def _compute_update(args, release_info, new_symbols, cache, logger, out):
+    if args.preserve_layout:
+        # The layout is preserved from the lines of the file, which are not
+        # kept by the cache
+        cur_map, document = symver.read_update_map(args, logger)
+    else:
+        cur_map, document = cache.get(args.file).copy(), None
+        cur_map.check()
+
+    new_map, _ = symver.update_map(cur_map, new_symbols, release_info,
+                                   add=args.add, remove=args.remove,
+                                   allow_abi_break=args.allow_abi_break,
+                                   final=args.final, guess=args.guess,
+                                   out=out)
+    if new_map is not cur_map:
+        # The releases were merged: there is no layout left to preserve
+        document = None
+    return new_map, document
+
+
+def _apply_update(args, release_info, new_symbols, cache, logger, out):
+    locked = check_lock(args.file)
+
+    if args.cache_dir:
+        from .memo import Result_Store
+        from .memo import cached_update
+
+        store = Result_Store(args.cache_dir,
+                             max_size=int(args.cache_size * 1024 * 1024))
+        output = cached_update(store, args, release_info, logger,
+                               symbols=new_symbols, out=out)
+        if output is not None:
+            if args.dry:
+                print("This is a dry run, the files were not modified.",
+                      file=out)
+                return None
+
+            if args.out:
+                symver.write_file(args.out, output)
+                cache.invalidate(args.out)
+            else:
+                out.write(output)
+            symver.update_lock(args, locked)
+
+        symver.write_build_files(args, [args.file, args.input])
+        return None
+
+    new_map, document = _compute_update(args, release_info, new_symbols,
+                                        cache, logger, out)
+    if new_map is not None:
+        if args.dry:
+            print("This is a dry run, the files were not modified.",
+                  file=out)
+            return None
+
+        symver.write_map(new_map, "updated", args.out, args.program,
+                         out=out, document=document)
+        if args.out:
+            cache.invalidate(args.out)
+        symver.update_lock(args, locked)
+
+    symver.write_build_files(args, [args.file, args.input])
+    return None
+
+
+def _update_merge(args, release_info, new_symbols, cache, logger, out):
+    # See symver._update_merge()
+    content = symver.read_content(args.file)
+    check_lock(args.file, content=content.decode("utf-8"))
+    report = io.StringIO()
+    new_map, document = _compute_update(args, release_info, new_symbols,
+                                        cache, logger, report)
+
+    with symver.lock_map_file(args.file):
+        if symver.read_content(args.file) != content:
+            logger.warning("\'%s\' was modified during the update. Applying"
+                           " the update again.", args.file)
+            report = io.StringIO()
+            new_map, document = _compute_update(args, release_info,
+                                                new_symbols, cache, logger,
+                                                report)
+
+        out.write(report.getvalue())
+        if new_map is not None:
+            # The released releases are checked again, holding the lock
+            locked = check_lock(args.file)
+            symver.check_files('--out', args.out, 'file', args.file,
+                               args.dry, args.backups)
+            symver.write_map(new_map, "updated", args.out, args.program,
+                             out=out, document=document)
+            cache.invalidate(args.out)
+            symver.update_lock(args, locked)
+
+    symver.write_build_files(args, [args.file, args.input])
+    return None
+
+
+def _new(request, cache, logger, out):
+    args = _get_args(request, symver.new)
+
+    if args.out:
+        if os.path.isfile(args.out):
+            logger.warning("Overwriting existing file \'%s\'.", args.out)
+    if args.out and args.input:
+        symver.check_files('--out', args.out, '--in', args.input, args.dry,
+                           args.backups)
+
+    release_info = symver.get_info_from_args(args)
+    if not release_info:
+        msg = "Please provide the release name."
+        logger.error(msg)
+        raise Exception(msg)
+
+    symver.get_build_target(args)
+
+    new_map = symver.create_map(release_info, _get_symbols(args),
+                                final=args.final)
+    if new_map is None:
+        logger.warning("No valid symbols provided. Nothing done.")
+        return None
+
+    if args.dry:
+        print("This is a dry run, the files were not modified.", file=out)
+        return None
+
+    symver.write_map(new_map, "created", args.out, args.program, out=out)
+    if args.out:
+        cache.invalidate(args.out)
+
+    symver.write_build_files(args, [args.input])
+    return None
+
+
+def _check(request, cache, logger, out):
+    args = _get_args(request, symver.check)
+    symver.get_build_target(args)
+
+    rules = symver.get_check_rules(args, logger)
+    if rules is None:
+        cache.check(args.file)
+    else:
+        # The cached map is shared: check the selected rules in a copy
+        m = cache.get(args.file).copy()
+        m.rules = rules
+        m.check()
+    symver.check_map_lock(args, logger)
+
+    symver.write_build_files(args, [args.file])
+    return None
+
+
+def _query(request, cache, logger, out):
+    symbols = request.get("symbols")
+    if symbols:
+        m = cache.check(request["file"])
+    else:
+        # The releases and their dependencies are enough
+        m = cache.read(request["file"])
+
+    result = {"releases": [{"name": release.name,
+                            "previous": release.previous,
+                            "released": release.released}
+                           for release in m.releases],
+              "latest": m.guess_latest_release()[0]}
+
+    if symbols:
+        found = dict((symbol, []) for symbol in symbols)
+        for release in m.releases:
+            for symbol in release.symbols.get("global", []):
+                if symbol in found:
+                    found[symbol].append(release.name)
+        result["symbols"] = found
+    return result
+
+
+def _verify(request, cache, logger, out):
+    m = cache.check(request["file"])
+
+    args = _get_args(request, None)
+    new_set = set(_get_symbols(args))
+    all_symbols = m.all_global_symbols()
+    all_symbols.discard("*")
+
+    added = sorted(new_set - all_symbols)
+    removed = sorted(all_symbols - new_set)
+
+    if added:
+        print("".join(["Added:\n"] + ["    " + symbol + "\n" for symbol in
+                                      added]), file=out)
+    if removed:
+        print("".join(["Removed:\n"] + ["    " + symbol + "\n" for symbol in
+                                        removed]), file=out)
+    if added or removed:
+        msg = "The map is not up to date"
+        logger.error(msg)
+        raise Exception(msg)
+
+    return {"added": added, "removed": removed}
+
+
+# The functions which handle each operation
+HANDLERS = {"check": _check,
+            "update": _update,
+            "new": _new,
+            "query": _query,
+            "verify": _verify}
+
+
+def handle_request(request, cache, logger=None):
+    """
+    Execute a request
+
+    :param request: The request (a dictionary)
+    :param cache:   The cache of parsed maps (a Map_Cache instance)
+    :param logger:  The logger where the diagnostics are collected from
+    :returns:       The response (a dictionary)
+    """
+
+    if logger is None:
+        logger = Single_Logger.getLogger(__name__)
+
+    out = io.StringIO()
+    result = None
+    error = None
+
+    with Log_Collector(logger) as collector:
+        try:
+            handler = HANDLERS.get(request.get("op"))
+            if handler is None:
+                raise Exception("Unknown operation \'{0}\'".format(
+                    request.get("op")))
+            result = handler(request, cache, logger, out)
+        except Exception as e:
+            error = str(e)
+
+    return {"ok": error is None,
+            "error": error,
+            "stdout": out.getvalue(),
+            "diagnostics": collector.messages,
+            "result": result}
+
+
+def send_request(request, path=None, fallback=True):
+    """
+    Send a request to the server, or execute it in this process
+
+    :param request:     The request (a dictionary)
+    :param path:        The path to the server socket
+    :param fallback:    If True, execute the request in this process when the
+                        server is not running. Once connected, the request is
+                        never executed again, even if the connection fails
+    :returns:           The response (a dictionary)
+    """
+
+    client = Client(path)
+    try:
+        sock = client.connect()
+    except OSError:
+        if not fallback:
+            raise
+        return handle_request(request, Map_Cache())
+    return client.request(request, sock)
+
+
+def get_request_from_args(args):
+    """
+    Get the request equivalent to the arguments of a subcommand
+
+    Relative paths are made absolute, since the server may run in another
+    directory. If the symbols are read from stdin, they are read here and
+    included in the request.
+
+    :param args:    The arguments parsed by the command line parser
+    :returns:       The request (a dictionary)
+    """
+
+    request = {"op": args.subcommand}
+
+    for key in REQUEST_DEFAULTS:
+        if hasattr(args, key):
+            request[key] = getattr(args, key)
+
+    for key in ("file", "input", "out", "depfile", "stamp", "cache_dir",
+                "lock"):
+        if request.get(key):
+            request[key] = os.path.abspath(request[key])
+
+    if args.subcommand in ("update", "new"):
+        if not request.get("input"):
+            request["stdin"] = sys.stdin.readlines()
+
+    return request
@@ -0,0 +1,359 @@
+"""Binary snapshots of parsed maps
+
+A snapshot stores a parsed map in a compact binary format which can be loaded
+without parsing. The file is memory-mapped when loaded, and the symbols of
+each release are only read from it when accessed.
+
+All the integers are unsigned, 32 bits, little endian. The file contains, in
+this order:
+
+- The header (see ``HEADER``)
+- The string table offsets: ``strings + 1`` offsets into the string data; the
+  string ``i`` is the UTF-8 data between the offsets ``i`` and ``i + 1``. The
+  string ``0`` is always the empty string
+- The release records (see ``RELEASE``): the name and the previous release
+  (indexes in the string table), the flags, the index of the first scope
+  record of the release, the number of scopes and the span (``NO_SPAN`` if
+  unknown)
+- The scope records (see ``SCOPE``): the name of the scope, the index of the
+  first symbol of the scope and the number of symbols
+- The symbols: the index in the string table of each symbol of each scope
+- The symbol hash index: an open addressing hash table of ``buckets`` entries
+  (see ``BUCKET``) with the CRC32 of the symbol and its position in the
+  symbols section (``EMPTY`` for a free bucket)
+- The string data
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+from .symver import Release
+from .symver import atomic_write
+
+MAGIC = b"ABIMAPSN"
+VERSION = 1
+
+# Header flags
+FLAG_CHECKED = 0x1
+
+# Release flags
+RELEASE_RELEASED = 0x1
+
+# Marks a free bucket in the hash index
+EMPTY = 0xffffffff
+# Marks a release without span
+NO_SPAN = 0xffffffff
+
+# magic, version, flags, strings, releases, scopes, symbols, buckets
+HEADER = struct.Struct("<8sIIIIIII")
+# name, previous, flags, first scope, scopes, span first, span last
+RELEASE = struct.Struct("<IIIIIII")
+# name, first symbol, symbols
+SCOPE = struct.Struct("<III")
+# hash, position of the symbol
+BUCKET = struct.Struct("<II")
+WORD = struct.Struct("<I")
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Snapshot(object):
+    """
+    A memory-mapped snapshot of a map
+
+    Attributes:
+        path:       The path of the snapshot file
+        checked:    Indicates if the map was checked when the snapshot was
+                    saved
+    """
+
+    def __init__(self, path):
+        """
+        The constructor
+
+        :param path:        The path of the snapshot file
+        :raises ValueError: Raised when the file is not a valid snapshot
+        """
+
+        self.path = path
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("{0} is not a snapshot".format(path))
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, flags, self.n_strings, self.n_releases,
+         self.n_scopes, self.n_symbols, self.n_buckets) = \
+            HEADER.unpack_from(self.mm, 0)
+
+        if magic != MAGIC:
+            raise ValueError("{0} is not a snapshot".format(path))
+        if version != VERSION:
+            raise ValueError("Unsupported snapshot version {0} in {1}".format(
+                version, path))
+
+        self.checked = bool(flags & FLAG_CHECKED)
+
+        # The offsets of the sections
+        self.strings_offset = HEADER.size
+        self.releases_offset = (self.strings_offset +
+                                (self.n_strings + 1) * WORD.size)
+        self.scopes_offset = (self.releases_offset +
+                              self.n_releases * RELEASE.size)
+        self.symbols_offset = (self.scopes_offset +
+                               self.n_scopes * SCOPE.size)
+        self.buckets_offset = (self.symbols_offset +
+                               self.n_symbols * WORD.size)
+        self.data_offset = (self.buckets_offset +
+                            self.n_buckets * BUCKET.size)
+
+        if self.data_offset + self._string_offset(self.n_strings) > size:
+            raise ValueError("Truncated snapshot {0}".format(path))
+
+        # The decoded strings, filled on demand
+        self.strings = [None] * self.n_strings
+
+    def _string_offset(self, index):
+        return WORD.unpack_from(self.mm, self.strings_offset +
+                                index * WORD.size)[0]
+
+    def string(self, index):
+        """
+        Get a string from the string table
+
+        :param index:   The index of the string
+        :returns:       The string
+        """
+
+        string = self.strings[index]
+        if string is None:
+            start, end = struct.unpack_from("<II", self.mm,
+                                            self.strings_offset +
+                                            index * WORD.size)
+            string = self.mm[self.data_offset + start:
+                             self.data_offset + end].decode("utf-8")
+            self.strings[index] = string
+        return string
+
+    def releases(self):
+        """
+        Get the releases stored in the snapshot
+
+        The names and flags of the releases are read immediately, but the
+        symbols of each release are read only when accessed.
+
+        :returns: A list of Release instances
+        """
+
+        releases = []
+        for i in range(self.n_releases):
+            (name, previous, flags, first, count, span_first, span_last) = \
+                RELEASE.unpack_from(self.mm, self.releases_offset +
+                                    i * RELEASE.size)
+            r = Release(loader=self._scope_loader(first, count))
+            r.name = self.string(name)
+            r.previous = self.string(previous)
+            r.released = bool(flags & RELEASE_RELEASED)
+            if span_first != NO_SPAN:
+                r.span = (span_first, span_last)
+            releases.append(r)
+        return releases
+
+    def _scope_loader(self, first, count):
+        def load(release):
+            return self.scopes(first, count)
+        return load
+
+    def scopes(self, first, count):
+        """
+        Read scope records and their symbols
+
+        :param first:   The index of the first scope record
+        :param count:   The number of scope records
+        :returns:       A dictionary mapping the scopes to lists of symbols
+        """
+
+        symbols = {}
+        for i in range(first, first + count):
+            name, start, n = SCOPE.unpack_from(self.mm, self.scopes_offset +
+                                               i * SCOPE.size)
+            indexes = struct.unpack_from("<{0}I".format(n), self.mm,
+                                         self.symbols_offset +
+                                         start * WORD.size)
+            symbols[self.string(name)] = [self.string(j) for j in indexes]
+        return symbols
+
+    def find_symbol(self, symbol):
+        """
+        Find where a symbol is listed using the hash index
+
+        :param symbol:  The symbol name
+        :returns:       A list of tuples (release, scope) with the names of the
+                        releases and scopes which list the symbol
+        """
+
+        found = []
+        if not self.n_buckets:
+            return found
+
+        h = get_hash(symbol)
+        mask = self.n_buckets - 1
+        bucket = h & mask
+        while True:
+            b_hash, position = BUCKET.unpack_from(
+                self.mm, self.buckets_offset + bucket * BUCKET.size)
+            if position == EMPTY:
+                break
+            if b_hash == h:
+                index = WORD.unpack_from(self.mm, self.symbols_offset +
+                                         position * WORD.size)[0]
+                if self.string(index) == symbol:
+                    found.append(self._locate(position))
+            bucket = (bucket + 1) & mask
+        return found
+
+    def _locate(self, position):
+        """
+        Find the release and the scope which contain the given position in the
+        symbols section
+
+        :param position:    The position in the symbols section
+        :returns:           A tuple (release, scope) with their names
+        """
+
+        scope = self._search(self.scopes_offset, self.n_scopes, SCOPE,
+                             position)
+        release = self._search(self.releases_offset, self.n_releases, RELEASE,
+                               scope, field=3)
+        name = SCOPE.unpack_from(self.mm, self.scopes_offset +
+                                 scope * SCOPE.size)[0]
+        release_name = RELEASE.unpack_from(self.mm, self.releases_offset +
+                                           release * RELEASE.size)[0]
+        return self.string(release_name), self.string(name)
+
+    def _search(self, offset, count, record, value, field=1):
+        """
+        Binary search the last record whose field is not greater than the value
+
+        The records (scopes or releases) are stored in order of their first
+        item (symbol or scope). Empty records share the first item with the
+        next record, so the last record found is never empty.
+
+        :param offset:  The offset of the records
+        :param count:   The number of records
+        :param record:  The structure of the records
+        :param value:   The value searched
+        :param field:   The index of the field with the first item
+        :returns:       The index of the record
+        """
+
+        low, high = 0, count
+        while high - low > 1:
+            middle = (low + high) // 2
+            if record.unpack_from(self.mm, offset +
+                                  middle * record.size)[field] > value:
+                high = middle
+            else:
+                low = middle
+        return low
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_hash(symbol):
+    """
+    Get the hash of a symbol used in the hash index
+
+    :param symbol:  The symbol name
+    :returns:       The CRC32 of the UTF-8 encoded name
+    """
+
+    return zlib.crc32(symbol.encode("utf-8")) & 0xffffffff
+
+
+def dump_snapshot(m):
+    """
+    Get the snapshot of a map
+
+    :param m:   The map
+    :returns:   The content of the snapshot file, as bytes
+    """
+
+    strings = {"": 0}
+    table = [""]
+
+    def add_string(string):
+        index = strings.get(string)
+        if index is None:
+            index = len(table)
+            strings[string] = index
+            table.append(string)
+        return index
+
+    releases = []
+    scopes = []
+    symbols = []
+    # Tuples (symbol, release, scope) for the hash index
+    for release in m.releases:
+        flags = RELEASE_RELEASED if release.released else 0
+        span_first, span_last = release.span or (NO_SPAN, NO_SPAN)
+        releases.append(RELEASE.pack(add_string(release.name),
+                                     add_string(release.previous), flags,
+                                     len(scopes), len(release.symbols),
+                                     span_first, span_last))
+        for scope in sorted(release.symbols):
+            names = release.symbols[scope]
+            scopes.append(SCOPE.pack(add_string(scope), len(symbols),
+                                     len(names)))
+            symbols.extend(add_string(symbol) for symbol in names)
+
+    # The number of buckets is a power of 2, at least twice the number of
+    # symbols, so that the probe sequences are short
+    n_buckets = 0
+    if symbols:
+        n_buckets = 1
+        while n_buckets < 2 * len(symbols):
+            n_buckets *= 2
+    buckets = [None] * n_buckets
+    mask = n_buckets - 1
+    for position, index in enumerate(symbols):
+        h = get_hash(table[index])
+        bucket = h & mask
+        while buckets[bucket] is not None:
+            bucket = (bucket + 1) & mask
+        buckets[bucket] = BUCKET.pack(h, position)
+    empty = BUCKET.pack(0, EMPTY)
+
+    data = [string.encode("utf-8") for string in table]
+    offsets = [0]
+    for string in data:
+        offsets.append(offsets[-1] + len(string))
+
+    flags = FLAG_CHECKED if m.init else 0
+    content = [HEADER.pack(MAGIC, VERSION, flags, len(table), len(releases),
+                           len(scopes), len(symbols), n_buckets),
+               struct.pack("<{0}I".format(len(offsets)), *offsets)]
+    content.extend(releases)
+    content.extend(scopes)
+    content.append(struct.pack("<{0}I".format(len(symbols)), *symbols))
+    content.extend(bucket or empty for bucket in buckets)
+    content.extend(data)
+    return b"".join(content)
+
+
+def save_snapshot(m, filename):
+    """
+    Write the snapshot of a map to a file atomically
+
+    :param m:           The map
+    :param filename:    The path to the snapshot file
+    """
+
+    atomic_write(filename, dump_snapshot(m))
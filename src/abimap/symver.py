@@ -6,9 +6,42 @@ import os
 import re
 import shutil
 import sys
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
 from itertools import chain
 
 from ._version import __version__
+from .rules import RULES
+from .rules import get_rules
+from .rules import run_rules
+from .timings import phase
+from .timings import timed
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 has intern() as a builtin
+    pass
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import fcntl
+except ImportError:
+    # The advisory locks are not available (e.g. on Windows)
+    fcntl = None
+
+try:
+    from functools import lru_cache
+except ImportError:
+    # Python 2 does not have lru_cache, so nothing is cached
+    def lru_cache(maxsize=128):
+        return lambda function: function
 
 VERBOSITY_MAP = {"debug": logging.DEBUG,
                  "info": logging.INFO,
@@ -16,6 +49,46 @@ VERBOSITY_MAP = {"debug": logging.DEBUG,
                  "error": logging.ERROR,
                  "quiet": logging.CRITICAL}
 
+# The minimum version of Python required by the server (see abimap.server)
+SERVER_MIN_PYTHON = (3, 7)
+
+# The minimum number of lines of a map to be parsed in parallel
+PARALLEL_MIN_LINES = 20000
+
+# The type of the array used to store the hashes of the lines
+try:
+    HASH_TYPECODE = array('q').typecode
+except ValueError:
+    # Python 2 does not support 'q'
+    HASH_TYPECODE = 'l'
+
+# The minimum number of symbols compared with NumPy, if installed
+VECTOR_MIN_SYMBOLS = 100000
+
+# The maximum number of strings whose parsed versions and release names are
+# cached
+PARSE_CACHE_SIZE = 4096
+
+# The regular expressions used in the module, compiled once
+# Whitespaces or a comment, skipped by the parser
+SPACE_RE = re.compile(r'\s+|\s*#.*$')
+# A release name or a scope name
+IDENTIFIER_RE = re.compile(r'\w+')
+# A symbol or a visibility scope name
+ELEMENT_RE = re.compile(r'\w+|\*')
+# The special comment which marks a release as released
+RELEASED_RE = re.compile(r'\s*#.\s*released.*$', re.IGNORECASE)
+# The start of the version part of a release name
+VERSION_RE = re.compile(r'_+[0-9]+')
+# The start of the version part of a prefix, or its trailing underscores
+PREFIX_VERSION_RE = re.compile(r'_+[0-9]+|_+$')
+# The numbers of a version
+DIGITS_RE = re.compile(r'[0-9]+')
+# The letters of a name
+LETTERS_RE = re.compile(r'[a-zA-Z]+')
+# The characters which separate the symbols in the input
+SEPARATOR_RE = re.compile(r'\W+')
+
 
 ###############################################################################
 # Classes
@@ -76,6 +149,74 @@ class Single_Logger(object):
         return Single_Logger.__instance
 
 
+class Log_Collector(logging.Handler):
+    """
+    A logging handler which collects the messages logged
+
+    It is used as a context manager to collect the messages logged by the
+    module logger while a block of code runs. The messages are not printed to
+    stderr while collecting, but are still written to the log files.
+    ::
+
+        with Log_Collector(logger) as collector:
+            abimap.check()
+        print(collector.messages)
+
+    Only the messages logged by the thread which created the collector are
+    collected, so that concurrent threads can collect their own messages from
+    the same logger. The console handlers are restored when the last
+    collector of the logger exits.
+
+    Attributes:
+        messages:   The list of formatted messages collected
+    """
+
+    # The handlers replaced in each logger, and the number of collectors
+    # using the logger: {logger: [handlers, count]}
+    _replaced = {}
+    _replaced_lock = threading.Lock()
+
+    def __init__(self, logger, level=logging.WARNING):
+        """
+        The constructor
+
+        :param logger:  The logger to collect messages from
+        :param level:   The minimum level of the messages collected
+        """
+        logging.Handler.__init__(self, level)
+        self.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        self.logger = logger
+        self.messages = []
+        self._thread = threading.current_thread()
+
+    def emit(self, record):
+        if threading.current_thread() is self._thread:
+            self.messages.append(self.format(record))
+
+    def __enter__(self):
+        # Replace the console handlers, but keep logging to files
+        with Log_Collector._replaced_lock:
+            replaced = Log_Collector._replaced.get(self.logger)
+            if replaced is None:
+                replaced = [self.logger.handlers, 0]
+                Log_Collector._replaced[self.logger] = replaced
+                self.logger.handlers = [handler for handler in replaced[0] if
+                                        isinstance(handler,
+                                                   logging.FileHandler)]
+            replaced[1] += 1
+            self.logger.addHandler(self)
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        with Log_Collector._replaced_lock:
+            self.logger.removeHandler(self)
+            replaced = Log_Collector._replaced[self.logger]
+            replaced[1] -= 1
+            if not replaced[1]:
+                self.logger.handlers = replaced[0]
+                del Log_Collector._replaced[self.logger]
+
+
 class ParserError(Exception):
     """
     Exception type raised by the map parser
@@ -129,9 +270,21 @@ class Map(object):
                     ``read()``
         logger:     The logger object; can be specified in the constructor
         filename:   Holds the name (path) of the file read
-        lines:      A list containing the lines of the file
+        lines:      A list containing the lines of the file, if requested in
+                    the constructor (empty otherwise)
+        keep_lines: Indicates if ``read()`` keeps the lines of the file
+        jobs:       The number of processes used to parse large files; if None
+                    or 1, the files are parsed in this process
+        lazy:       Indicates if the symbols of the releases are parsed only
+                    when accessed (see ``parse()``)
+        rules:      The names of the rules run by ``check()``; if None, the
+                    default rules are run (see ``abimap.rules``)
     """
 
+    __slots__ = ("init", "releases", "logger", "filename", "lines",
+                 "keep_lines", "jobs", "lazy", "rules", "_compact", "_hashes",
+                 "_deps_key", "_index", "_deps", "_builder")
+
     # To make printable
     def __str__(self):
         """
@@ -146,24 +299,47 @@ class Map(object):
         return content
 
     # Constructor
-    def __init__(self, filename=None, logger=None):
+    def __init__(self, filename=None, logger=None, keep_lines=False,
+                 compact=False, jobs=None, lazy=False, rules=None):
         """
         The constructor.
 
-        :param filename: The name of the file to be read. If provided the
-                         ``read()`` method is called using this name.
-        :param logger:   A logger object. If not provided, the module based
-                         logger will be used
+        :param filename:    The name of the file to be read. If provided the
+                            ``read()`` method is called using this name.
+        :param logger:      A logger object. If not provided, the module based
+                            logger will be used
+        :param keep_lines:  If True, ``read()`` keeps the lines of the file in
+                            ``lines`` after parsing
+        :param compact:     If True, the map is made compact after reading
+                            (see ``compact()``)
+        :param jobs:        The number of processes used to parse large files
+                            (see ``parse()``)
+        :param lazy:        If True, the symbols of each release are parsed
+                            only when accessed (see ``parse()``)
+        :param rules:       The names of the rules run by ``check()``
         """
 
         # The state
         self.init = False
         self.releases = []
+        self._compact = compact
         # Logging
         self.logger = Single_Logger.getLogger(__name__)
         # From the raw file
         self.filename = ''
         self.lines = []
+        self.keep_lines = keep_lines
+        self.jobs = jobs
+        self.lazy = lazy
+        self.rules = rules
+        # The hashes of the parsed lines, used by reparse()
+        self._hashes = None
+        # Cached release index and dependencies, see _release_index()
+        self._deps_key = None
+        self._index = None
+        self._deps = None
+        # Index used by the builder methods, see _builder_index()
+        self._builder = None
         if filename:
             self.read(filename)
 
@@ -187,222 +363,795 @@ class Map(object):
             4. previous: The parser is searching for previous release name
             5. previous_closer: The parser is searching for ``;``
 
+        If ``jobs`` is greater than 1 and there are at least
+        ``PARALLEL_MIN_LINES`` lines, the lines are split at the release
+        boundaries and parsed by a pool of processes (see ``abimap.parallel``).
+
+        If ``lazy`` is True, only the release names, the released markers and
+        the previous releases are parsed. The position of the body of each
+        release is recorded, and the body is parsed when the symbols of the
+        release are accessed for the first time. Syntax errors in a body are
+        raised then. The text of each body is kept by its release until the
+        symbols are loaded.
+
         :param lines: The lines of a version script file
         """
 
+        try:
+            if (self.jobs and self.jobs > 1 and not self.lazy and
+                    len(lines) >= PARALLEL_MIN_LINES):
+                from .parallel import parse_lines
+                releases, state = parse_lines(self, lines, self.jobs)
+            else:
+                releases, state = self._parse(lines)
+        except ParserError as e:
+            # Any exception raised is considered an error
+            self.logger.error(e)
+            raise e
+
+        if self._compact:
+            for release in releases:
+                release.compact()
+
+        # Store the parsed releases
+        self.releases = releases
+
+        # Keep the hashes of the lines to allow incremental parsing later. If
+        # the last release was not closed there is no safe place to restart
+        # the parser, so a later call to reparse() will parse everything.
+        if state == 0:
+            self._hashes = array(HASH_TYPECODE, (hash(line) for line in lines))
+        else:
+            self._hashes = None
+
+    def _parse(self, lines, offset=0, names=None, release=None, column=0):
+        """
+        Run the parser finite state machine over the given lines
+
+        The given lines can be a slice of the file, as long as the parser is
+        searching for a release name (state 0) at the beginning of the slice.
+        The line indexes reported in errors and stored in the releases spans are
+        relative to the whole file.
+
+        If a release is given, only its body is parsed: the parser starts
+        searching for elements (state 2) at the given column of the first line,
+        stores the symbols found in the release, and stops at the ``}``.
+
+        :param lines:   The lines to be parsed
+        :param offset:  The index of the first given line in the file
+        :param names:   A set of release names found before the given lines,
+                        used to detect duplicated release identifiers
+        :param release: The release whose body is parsed
+        :param column:  The column where the parser starts in the first line
+        :returns:       A tuple (releases, state), where state is the parser
+                        state after consuming all lines (0 if the last release
+                        was closed)
+        :raises ParserError:    Raised when a syntax error is found
+        """
+
         state = 0
 
         # The list of releases parsed
         releases = []
-        last = (0, 0)
-
-        for index, line in enumerate(lines):
-            column = 0
+        last = (offset, column)
+        start = offset
+        # The bodies are skipped when parsing lazily
+        lazy = self.lazy and release is None
+        body = None
+
+        if names is None:
+            names = set()
+
+        if release is not None:
+            r = release
+            v = None
+            state = 2
+
+        first_column = column
+        for index, line in enumerate(lines, offset):
+            column = first_column
+            first_column = 0
             while column < len(line):
-                try:
-                    # Remove whitespaces or comments
-                    m = re.match(r'\s+|\s*#.*$', line[column:])
-                    if m:
-                        column += m.end()
+                # Remove whitespaces or comments
+                m = SPACE_RE.match(line, column)
+                if m:
+                    column = m.end()
+                    last = (index, column)
+                    continue
+                # Searching for a release name
+                if state == 0:
+                    self.logger.debug(">>Name")
+                    m = IDENTIFIER_RE.match(line, column)
+                    if m is None:
+                        raise ParserError(self.filename,
+                                          lines[last[0] - offset], last[0],
+                                          last[1],
+                                          "Invalid Release identifier")
+                    else:
+                        # New release found
+                        name = intern(m.group(0))
+                        # Check if a release with this name is present
+                        has_duplicate = name in names
+                        names.add(name)
+                        column = m.end()
+                        r = Release()
+                        r.name = name
+                        start = index
+                        r.span = (start, index)
+                        releases.append(r)
                         last = (index, column)
-                        continue
-                    # Searching for a release name
-                    if state == 0:
-                        self.logger.debug(">>Name")
-                        m = re.match(r'\w+', line[column:])
-                        if m is None:
-                            raise ParserError(self.filename,
-                                              lines[last[0]], last[0],
-                                              last[1],
-                                              "Invalid Release identifier")
-                        else:
-                            # New release found
-                            name = m.group(0)
-                            # Check if a release with this name is present
-                            has_duplicate = [release for release in releases if
-                                             release.name == name]
-                            column += m.end()
-                            r = Release()
-                            r.name = m.group(0)
-                            releases.append(r)
-                            last = (index, column)
 
-                            if has_duplicate:
-                                msg = "Duplicated Release identifier \'{}\'"\
-                                      .format(name)
-                                # This is non-critical, only warning
-                                self.logger.warning(ParserError(self.filename,
-                                                                lines[index],
-                                                                index,
-                                                                column, msg))
-
-                            # Search for the special release marker comment
-                            m = re.match(r'\s*#.\s*released.*$',
-                                         line[column:],
-                                         re.IGNORECASE)
-                            if m:
-                                column += m.end()
-                                r.released = True
-                                last = (index, column)
-
-                            # Advance to the next state
-                            state += 1
-                            continue
-                    # Searching for the '{'
-                    elif state == 1:
-                        self.logger.debug(">>Opening")
-                        found = line.find('{', column)
-                        if found < 0:
-                            raise ParserError(self.filename,
-                                              lines[last[0]], last[0], last[1],
-                                              "Missing \'{\'")
-                        else:
-                            column += (found + 1)
-                            v = None
-                            last = (index, column)
-                            state += 1
-                            continue
-                    elif state == 2:
-                        self.logger.debug(">>Element")
-                        found = line.find('}', column)
-                        if found >= 0:
-                            self.logger.debug(">>Closer, jump to Previous")
-                            column += (found + 1)
+                        if has_duplicate:
+                            msg = "Duplicated Release identifier \'{}\'"\
+                                  .format(name)
+                            # This is non-critical, only warning
+                            self.logger.warning(ParserError(self.filename,
+                                                            line,
+                                                            index,
+                                                            column, msg))
+
+                        # Search for the special release marker comment
+                        m = RELEASED_RE.match(line, column)
+                        if m:
+                            column = m.end()
+                            r.released = True
                             last = (index, column)
-                            state = 4
-                            continue
-                        m = re.match(r'\w+|\*', line[column:])
-                        if m is None:
-                            raise ParserError(self.filename,
-                                              lines[last[0]], last[0], last[1],
-                                              "Invalid identifier")
-                        else:
-                            # In this case the position before the
-                            # identifier is stored
-                            last = (index, m.start())
-                            column += m.end()
-                            identifier = m.group(0)
-                            state += 1
-                            continue
-                    elif state == 3:
-                        self.logger.debug(">>Element closer")
-                        found = line.find(';', column)
-                        if found < 0:
-                            # It was not Symbol. Maybe a new visibility.
-                            found = line.find(':', column)
-                            if found != column:
-                                msg = "Missing \';\' or \':\' after"" \'{0}\'"\
-                                      .format(identifier)
-                                # In this case the current position is used
-                                raise ParserError(self.filename,
-                                                  lines[index], index,
-                                                  column, msg)
-                            else:
-                                # New visibility found
-                                if identifier in r.symbols:
-                                    v = r.symbols[identifier]
-                                else:
-                                    v = []
-                                    r.symbols[identifier] = v
-                                column += (found + 1)
-                                last = (index, column)
-                                state = 2
-                                continue
-                        elif found == column:
-                            if v is None:
-                                # There was no open visibility scope
-                                v = []
-                                r.symbols['global'] = v
-                                msg = "Missing visibility scope before"\
-                                      " \'{0}\'. Symbols considered in"\
-                                      " 'global:\'".format(identifier)
-                                # Non-critical, only warning
-                                self.logger.warning(ParserError(self.filename,
-                                                                lines[last[0]],
-                                                                last[0], last[1],
-                                                                msg))
-                            else:
-                                # Symbol found
-                                v.append(identifier)
-                                column += (found + 1)
-                                last = (index, column)
-                                # Move back the state to find elements
-                                state = 2
-                                continue
-                        else:
+
+                        # Advance to the next state
+                        state += 1
+                        continue
+                # Searching for the '{'
+                elif state == 1:
+                    self.logger.debug(">>Opening")
+                    found = line.find('{', column)
+                    if found < 0:
+                        raise ParserError(self.filename,
+                                          lines[last[0] - offset], last[0],
+                                          last[1], "Missing \'{\'")
+                    else:
+                        column += (found + 1)
+                        v = None
+                        last = (index, column)
+                        body = (index, column)
+                        state += 1
+                        continue
+                elif state == 2:
+                    self.logger.debug(">>Element")
+                    found = line.find('}', column)
+                    if found >= 0:
+                        self.logger.debug(">>Closer, jump to Previous")
+                        if release is not None:
+                            return releases, 4
+                        if lazy:
+                            r._symbols = None
+                            r._loader = self._body_loader(lines, offset, body,
+                                                          index)
+                        column += (found + 1)
+                        last = (index, column)
+                        state = 4
+                        continue
+                    if lazy:
+                        # The body is parsed when the symbols are accessed
+                        break
+                    m = ELEMENT_RE.match(line, column)
+                    if m is None:
+                        raise ParserError(self.filename,
+                                          lines[last[0] - offset], last[0],
+                                          last[1], "Invalid identifier")
+                    else:
+                        # In this case the position before the
+                        # identifier is stored
+                        last = (index, m.start())
+                        column = m.end()
+                        identifier = intern(m.group(0))
+                        state += 1
+                        continue
+                elif state == 3:
+                    self.logger.debug(">>Element closer")
+                    found = line.find(';', column)
+                    if found < 0:
+                        # It was not Symbol. Maybe a new visibility.
+                        found = line.find(':', column)
+                        if found != column:
                             msg = "Missing \';\' or \':\' after"" \'{0}\'"\
                                   .format(identifier)
                             # In this case the current position is used
                             raise ParserError(self.filename,
-                                              lines[index], index,
+                                              line, index,
                                               column, msg)
-                    elif state == 4:
-                        self.logger.debug(">>Previous")
-                        found = line.find(";", column)
-                        if found == column:
-                            self.logger.debug(">>Empty previous")
+                        else:
+                            # New visibility found
+                            if identifier in r.symbols:
+                                v = r.symbols[identifier]
+                            else:
+                                v = []
+                                r.symbols[identifier] = v
                             column += (found + 1)
                             last = (index, column)
-                            # Move back the state to find other releases
-                            state = 0
+                            state = 2
                             continue
-                        m = re.match(r'\w+', line[column:])
-                        if m is None:
-                            raise ParserError(self.filename,
-                                              lines[last[0]], last[0], last[1],
-                                              "Invalid identifier")
+                    elif found == column:
+                        if v is None:
+                            # There was no open visibility scope
+                            v = []
+                            r.symbols['global'] = v
+                            msg = "Missing visibility scope before"\
+                                  " \'{0}\'. Symbols considered in"\
+                                  " 'global:\'".format(identifier)
+                            # Non-critical, only warning
+                            self.logger.warning(
+                                ParserError(self.filename,
+                                            lines[last[0] - offset],
+                                            last[0], last[1], msg))
                         else:
-                            # Found previous release identifier
-                            column += m.end()
-                            identifier = m.group(0)
-                            last = (index, column)
-                            state += 1
-                            continue
-                    elif state == 5:
-                        self.logger.debug(">>Previous closer")
-                        found = line.find(";", column)
-                        if found < 0:
-                            raise ParserError(self.filename,
-                                              lines[last[0]], last[0], last[1],
-                                              "Missing \';\'")
-                        elif found == column:
-                            # Found previous closer
+                            # Symbol found
+                            v.append(identifier)
                             column += (found + 1)
-                            r.previous = identifier
                             last = (index, column)
-                            # Move back the state to find other releases
-                            state = 0
+                            # Move back the state to find elements
+                            state = 2
                             continue
-                        else:
-                            raise ParserError(self.filename,
-                                              lines[index], index,
-                                              column,
-                                              "Unexpected character")
+                    else:
+                        msg = "Missing \';\' or \':\' after"" \'{0}\'"\
+                              .format(identifier)
+                        # In this case the current position is used
+                        raise ParserError(self.filename,
+                                          line, index,
+                                          column, msg)
+                elif state == 4:
+                    self.logger.debug(">>Previous")
+                    found = line.find(";", column)
+                    if found == column:
+                        self.logger.debug(">>Empty previous")
+                        column += (found + 1)
+                        last = (index, column)
+                        r.span = (start, index)
+                        # Move back the state to find other releases
+                        state = 0
+                        continue
+                    m = IDENTIFIER_RE.match(line, column)
+                    if m is None:
+                        raise ParserError(self.filename,
+                                          lines[last[0] - offset], last[0],
+                                          last[1], "Invalid identifier")
+                    else:
+                        # Found previous release identifier
+                        column = m.end()
+                        identifier = intern(m.group(0))
+                        last = (index, column)
+                        state += 1
+                        continue
+                elif state == 5:
+                    self.logger.debug(">>Previous closer")
+                    found = line.find(";", column)
+                    if found < 0:
+                        raise ParserError(self.filename,
+                                          lines[last[0] - offset], last[0],
+                                          last[1], "Missing \';\'")
+                    elif found == column:
+                        # Found previous closer
+                        column += (found + 1)
+                        r.previous = identifier
+                        last = (index, column)
+                        r.span = (start, index)
+                        # Move back the state to find other releases
+                        state = 0
+                        continue
+                    else:
+                        raise ParserError(self.filename,
+                                          line, index,
+                                          column,
+                                          "Unexpected character")
 
-                except ParserError as e:
-                    # Any exception raised is considered an error
-                    self.logger.error(e)
-                    raise e
-        # Store the parsed releases
-        self.releases = releases
+        if release is not None:
+            return releases, state
+
+        # An unclosed release spans until the end of the given lines
+        if state != 0:
+            r.span = (start, offset + len(lines) - 1)
+            if lazy and state in (2, 3):
+                r._symbols = None
+                r._loader = self._body_loader(lines, offset, body,
+                                              offset + len(lines) - 1)
+
+        return releases, state
+
+    def _body_loader(self, lines, offset, body, end):
+        """
+        Get a function which parses the body of a release when called
+
+        :param lines:   The lines given to ``_parse()``
+        :param offset:  The index of the first given line in the file
+        :param body:    A tuple (line, column) with the position after the
+                        ``{`` of the release
+        :param end:     The index of the line containing the ``}``
+        :returns:       A loader for ``Release``
+        """
+
+        first, column = body
+        # A single string takes less memory than the list of lines
+        text = "".join(lines[first - offset:end - offset + 1])
+
+        def load(release):
+            r = Release()
+            try:
+                self._parse(text.splitlines(True), first, release=r,
+                            column=column)
+            except ParserError as e:
+                self.logger.error(e)
+                raise e
+            return r.symbols
+
+        return load
+
+    def reparse(self, lines):
+        """
+        Incrementally parse a modified version of the previously parsed lines
+
+        The hashes of the given lines are compared with the hashes of the lines
+        given to the last ``parse()`` to find the region that changed. Only the
+        releases whose spans overlap that region are parsed again; the other
+        releases are kept, with their spans shifted if lines were added or
+        removed before them. The cached release index and dependencies are
+        patched in place when the edit does not change the release names nor
+        the predecessors.
+
+        The resulting releases are the same as the ones obtained by calling
+        ``parse()`` with the given lines. If the changed region cannot be parsed
+        in isolation, the whole file is parsed again.
+
+        :param lines:   The lines of the modified version script
+        :returns:       The list of releases that were parsed again
+        :raises ParserError:    Raised when a syntax error is found
+        """
+
+        old = self._hashes
+        if old is None:
+            self.parse(lines)
+            return list(self.releases)
+
+        hashes = array(HASH_TYPECODE, (hash(line) for line in lines))
+
+        # Find the region that changed by removing the common head and tail
+        n_old = len(old)
+        n_new = len(hashes)
+        limit = min(n_old, n_new)
+        head = 0
+        while head < limit and old[head] == hashes[head]:
+            head += 1
+        if head == n_old == n_new:
+            return []
+        tail = 0
+        while (tail < limit - head and
+               old[n_old - tail - 1] == hashes[n_new - tail - 1]):
+            tail += 1
+
+        # The changed region in the old lines is [begin, stop)
+        begin = head
+        stop = n_old - tail
+        delta = n_new - n_old
+
+        # Find the releases overlapping the changed region; the releases in
+        # releases[first:last] are parsed again
+        releases = self.releases
+        first = 0
+        while first < len(releases) and releases[first].span[1] < begin:
+            first += 1
+        last = first
+        while last < len(releases) and releases[last].span[0] < stop:
+            last += 1
+        if first < last:
+            begin = min(begin, releases[first].span[0])
+            stop = max(stop, releases[last - 1].span[1] + 1)
+
+        # Include releases sharing lines with the region boundaries
+        while first > 0 and releases[first - 1].span[1] >= begin:
+            first -= 1
+            begin = min(begin, releases[first].span[0])
+        while last < len(releases) and releases[last].span[0] < stop:
+            last += 1
+            stop = max(stop, releases[last - 1].span[1] + 1)
+
+        names = set(release.name for release in releases[:first])
+        try:
+            parsed, state = self._parse(lines[begin:stop + delta], begin,
+                                        names)
+        except ParserError:
+            state = None
+
+        # The edit spilled over the region (or broke the file): parse it all
+        if state != 0:
+            self.parse(lines)
+            return list(self.releases)
+
+        if self._compact:
+            for release in parsed:
+                release.compact()
+
+        cache_valid = (self._deps_key is not None and
+                       self._deps_key == self._cache_key())
+
+        replaced = releases[first:last]
+        for release in releases[last:]:
+            release.span = (release.span[0] + delta, release.span[1] + delta)
+
+        self.releases = releases[:first] + parsed + releases[last:]
+        self._hashes = hashes
+
+        # Patch the cached index if the dependencies graph did not change
+        if cache_valid and ([(r.name, r.previous) for r in replaced] ==
+                            [(r.name, r.previous) for r in parsed]):
+            for old_release, new_release in zip(replaced, parsed):
+                entries = self._index[old_release.name]
+                entries[entries.index(old_release)] = new_release
+            self._deps_key = self._cache_key()
+        else:
+            self._deps_key = None
 
-    def read(self, filename):
+        return parsed
+
+    def read(self, filename, lines=None):
         """
         Read a linker map file (version script) and store the obtained releases
 
-        Obtain the lines of the file and calls ``parse()`` to parse the file
+        Obtain the lines of the file and calls ``parse()`` to parse the file.
+        If the map is lazy, only the dependencies between the releases are
+        checked; call ``check()`` to check the symbols.
 
         :param filename:        The path to the file to be read
+        :param lines:           The lines of the file, if already read
         :raises ParserError:    Raised when a syntax error is found in the file
         """
 
-        with open(filename, "r") as f:
-            self.lines = f.readlines()
+        if lines is None:
+            with open(filename, "r") as f:
+                lines = f.readlines()
 
         self.filename = filename
-        self.parse(self.lines)
+        with phase("parse"):
+            self.parse(lines)
+        # Only keep the lines if requested
+        if self.keep_lines:
+            self.lines = lines
+        else:
+            self.lines = []
         # Check the map read
-        self.check()
+        with phase("check"):
+            if self.lazy:
+                # Checking the symbols would load them all, so only the
+                # dependencies between the releases are checked
+                self.dependencies()
+                self.init = True
+            else:
+                self.check()
+
+    def save_snapshot(self, filename):
+        """
+        Save the parsed map in a binary snapshot file
+
+        The snapshot can be loaded with ``load_snapshot()`` without parsing the
+        map again (see ``abimap.snapshot``).
+
+        :param filename:    The path to the snapshot file
+        """
+
+        from .snapshot import save_snapshot
+
+        save_snapshot(self, filename)
+
+    def load_snapshot(self, filename):
+        """
+        Load the releases from a binary snapshot file
+
+        The file is memory-mapped and the symbols of each release are only read
+        when accessed. The map is considered checked if it was checked when the
+        snapshot was saved.
+
+        :param filename:    The path to the snapshot file
+        :raises Exception:  Raised when the file is not a valid snapshot
+        """
+
+        from .snapshot import Snapshot
+
+        try:
+            snapshot = Snapshot(filename)
+        except ValueError as e:
+            self.logger.error(str(e))
+            raise Exception(str(e))
+
+        self.releases = snapshot.releases()
+        self.init = snapshot.checked
+        self.lines = []
+        self._hashes = None
+        self._deps_key = None
+        if self._compact:
+            self.compact()
+
+    def copy(self):
+        """
+        Get a copy of the map
+
+        The releases and their lists of symbols are copied, so that the copy can
+        be modified without changing this map. The copy keeps the logger and
+        the options of this map (``jobs``, ``lazy``, ``rules`` and whether the
+        releases parsed later are made compact).
+
+        :returns: A new Map instance
+        """
+
+        m = Map(keep_lines=self.keep_lines, compact=self._compact,
+                jobs=self.jobs, lazy=self.lazy, rules=self.rules)
+        m.logger = self.logger
+        m.init = self.init
+        m.filename = self.filename
+        m.lines = list(self.lines)
+        m._hashes = self._hashes
+        m.releases = [release.copy() for release in self.releases]
+        return m
+
+    def compact(self):
+        """
+        Reduce the memory used by the map
+
+        The lists of symbols of the releases are replaced by sorted tuples of
+        interned strings (see ``Release.compact()``), and the lines of the file
+        are dropped. Releases parsed later (e.g. by ``reparse()``) are made
+        compact as well. Use ``copy()`` to get a map which can be modified.
+        """
+
+        for release in self.releases:
+            release.compact()
+        self.lines = []
+        self._compact = True
+        self._builder = None
+
+    def _builder_index(self):
+        """
+        Get the index used by the builder methods
+
+        The index is built when first needed, and kept up to date by the
+        builder methods. It is built again if the list of releases was replaced
+        or its length was changed by other means. The symbols of the releases
+        should not be modified directly while using the builder methods.
+
+        :returns: A _Builder_Index
+        """
+
+        key = (id(self.releases), len(self.releases))
+        index = self._builder
+        if index is None or index.key != key:
+            index = _Builder_Index(key)
+            for release in self.releases:
+                if release.name in index.releases:
+                    # Duplicated names cannot be used by the builder
+                    index.releases[release.name] = None
+                else:
+                    index.releases[release.name] = release
+                for symbol in release.symbols.get("global", ()):
+                    index.exported.setdefault(symbol, release.name)
+            self._builder = index
+        return index
+
+    def _builder_release(self, index, release):
+        """
+        Find a release given to a builder method
+
+        :param index:   The builder index
+        :param release: The release, or its name
+        :returns:       The release in this map
+        """
+
+        name = getattr(release, "name", release)
+        found = index.releases.get(name)
+        if found is None:
+            if name in index.releases:
+                msg = "defined more than 1 release \'{0}\'".format(name)
+            else:
+                msg = "Release \'{0}\' not found".format(name)
+            self.logger.error(msg)
+            raise Exception(msg)
+        return found
+
+    def _builder_positions(self, index, release, scope):
+        """
+        Get the positions of the symbols of a scope of a release
+
+        If the scope is not a list (e.g. the release is compact), it is
+        replaced by a list. Duplicated symbols are removed from the list.
+
+        :param index:   The builder index
+        :param release: The release
+        :param scope:   The name of the scope
+        :returns:       A dictionary {symbol: position in the list}
+        """
+
+        positions = index.positions.get((release.name, scope))
+        if positions is not None:
+            return positions
+
+        symbols = release.symbols.get(scope)
+        positions = {}
+        if symbols is None:
+            symbols = []
+        else:
+            unique = []
+            for symbol in symbols:
+                if symbol not in positions:
+                    positions[symbol] = len(unique)
+                    unique.append(symbol)
+            if len(unique) < len(symbols):
+                self.logger.warning("Duplicated symbols removed from %s: %s",
+                                    release.name, scope)
+            symbols = unique
+        release.symbols[scope] = symbols
+        index.positions[(release.name, scope)] = positions
+        return positions
+
+    def _builder_check_modifiable(self, release):
+        if release.released:
+            msg = "Released releases cannot be modified:"\
+                  " \'{0}\'".format(release.name)
+            self.logger.error(msg)
+            raise Exception(msg)
+
+    def add_release(self, name, previous="", released=False):
+        """
+        Add a new empty release to the map
+
+        The name and the previous release are checked, so that the dependencies
+        stay valid. The release is appended to ``releases``.
+
+        :param name:        The name of the new release
+        :param previous:    The previous release (or its name); empty for a
+                            base release
+        :param released:    Mark the new release as released
+        :returns:           The new release
+        """
+
+        index = self._builder_index()
+
+        m = IDENTIFIER_RE.match(name)
+        if m is None or m.end() != len(name):
+            msg = "Invalid Release identifier \'{0}\'".format(name)
+            self.logger.error(msg)
+            raise Exception(msg)
+        if name in index.releases:
+            msg = "Duplicated Release identifier \'{0}\'".format(name)
+            self.logger.error(msg)
+            raise Exception(msg)
+        if previous:
+            previous = self._builder_release(index, previous).name
+
+        r = Release()
+        r.name = intern(name)
+        r.previous = previous
+        r.released = released
+        self.releases.append(r)
+
+        index.releases[r.name] = r
+        index.key = (id(self.releases), len(self.releases))
+        return r
+
+    def bulk_add_symbols(self, release, symbols, scope="global"):
+        """
+        Add symbols to a scope of a release
+
+        The symbols are checked before the release is modified: the release
+        cannot be released, the symbols must be valid identifiers, cannot be
+        repeated in the scope, and global symbols cannot be global in another
+        release. The cost is amortized O(1) per symbol.
+
+        :param release: The release (or its name)
+        :param symbols: An iterable of symbols
+        :param scope:   The visibility scope (e.g. \'global\' or \'local\')
+        """
+
+        index = self._builder_index()
+        release = self._builder_release(index, release)
+        self._builder_check_modifiable(release)
+
+        m = IDENTIFIER_RE.match(scope)
+        if m is None or m.end() != len(scope):
+            msg = "Invalid visibility scope \'{0}\'".format(scope)
+            self.logger.error(msg)
+            raise Exception(msg)
+
+        positions = self._builder_positions(index, release, scope)
+        exported = index.exported if scope == "global" else None
+
+        added = []
+        seen = set()
+        for symbol in symbols:
+            m = ELEMENT_RE.match(symbol)
+            if m is None or m.end() != len(symbol):
+                msg = "Invalid symbol \'{0}\'".format(symbol)
+                self.logger.error(msg)
+                raise Exception(msg)
+            if symbol in positions or symbol in seen:
+                msg = "Duplicated symbol \'{0}\' in {1}: {2}".format(
+                    symbol, release.name, scope)
+                self.logger.error(msg)
+                raise Exception(msg)
+            if exported is not None and symbol in exported:
+                msg = "Symbol \'{0}\' is already global in {1}".format(
+                    symbol, exported[symbol])
+                self.logger.error(msg)
+                raise Exception(msg)
+            seen.add(symbol)
+            added.append(intern(symbol))
+
+        target = release.symbols[scope]
+        for symbol in added:
+            positions[symbol] = len(target)
+            target.append(symbol)
+            if exported is not None:
+                exported[symbol] = release.name
+
+    def remove_symbols(self, symbols, release=None, scope="global"):
+        """
+        Remove symbols from the map
+
+        If no release is given, each global symbol is removed from the release
+        which has it. The symbols are checked before the map is modified: they
+        must be found, and their releases cannot be released. The order of the
+        symbols in the scopes is not kept. The cost is amortized O(1) per
+        symbol.
+
+        :param symbols: An iterable of symbols
+        :param release: The release (or its name) which has the symbols
+        :param scope:   The visibility scope (e.g. \'global\' or \'local\')
+        """
+
+        index = self._builder_index()
+        if release is not None:
+            release = self._builder_release(index, release)
+            self._builder_check_modifiable(release)
+        elif scope != "global":
+            msg = "The release is needed to remove symbols from the"\
+                  " \'{0}\' scope".format(scope)
+            self.logger.error(msg)
+            raise Exception(msg)
+
+        removed = []
+        seen = set()
+        for symbol in symbols:
+            owner = release
+            if owner is None:
+                name = index.exported.get(symbol)
+                owner = index.releases.get(name) if name else None
+                if owner is not None:
+                    self._builder_check_modifiable(owner)
+            positions = None
+            if owner is not None:
+                positions = self._builder_positions(index, owner, scope)
+            if positions is None or symbol not in positions:
+                msg = "Symbol \'{0}\' not found".format(symbol)
+                self.logger.error(msg)
+                raise Exception(msg)
+            if symbol not in seen:
+                seen.add(symbol)
+                removed.append((owner, positions, symbol))
+
+        for owner, positions, symbol in removed:
+            # Move the last symbol to the position of the removed one
+            target = owner.symbols[scope]
+            position = positions.pop(symbol)
+            last = target.pop()
+            if position < len(target):
+                target[position] = last
+                positions[last] = position
+            if scope == "global" and index.exported.get(symbol) == owner.name:
+                del index.exported[symbol]
+
+    def mark_released(self, release):
+        """
+        Mark a release as released, so that it cannot be modified
+
+        :param release: The release (or its name)
+        """
+
+        index = self._builder_index()
+        self._builder_release(index, release).released = True
 
     def all_global_symbols(self):
         """
@@ -412,6 +1161,16 @@ class Map(object):
         :returns: A set containing all global symbols in all releases
         """
 
+        return set(self.global_symbols())
+
+    def global_symbols(self):
+        """
+        Returns the global symbols of all releases, without removing the
+        repeated ones
+
+        :returns: A list containing the global symbols of each release
+        """
+
         if not self.init:
             msg = "Map not checked, run check()"
             self.logger.error(msg)
@@ -421,7 +1180,7 @@ class Map(object):
         for release in self.releases:
             if 'global' in release.symbols:
                 symbols.extend(release.symbols['global'])
-        return set(symbols)
+        return symbols
 
     def duplicates(self):
         """
@@ -447,12 +1206,17 @@ class Map(object):
         names of the releases in a dependency path.
         The heads of the dependencies lists are the releases not refered as a
         previous release in any release.
+        The lists are cached until the releases names or predecessors change.
 
         :returns:   A list containing the dependencies lists
         """
 
-        def get_dependency(releases, head):
-            found = [release for release in releases if release.name == head]
+        index = self._release_index()
+        if self._deps is not None:
+            return [list(dep) for dep in self._deps]
+
+        def get_dependency(head):
+            found = index.get(head)
             if not found:
                 msg = "Release \'{0}\' not found".format(head)
                 self.logger.error(msg)
@@ -463,42 +1227,100 @@ class Map(object):
                 raise Exception(msg)
             return found[0].previous
 
-        solved = set()
-        deps = []
+        # The paths are built from the base to the head, so that a release
+        # can be put in front of a known path by appending it. Each solved
+        # release is mapped to (path, position), and the heads to their paths.
+        solved = {}
+        checked = set()
+        heads = {}
+        order = []
         for release in self.releases:
             # If the dependencies of the current release were resolved, skip
             if release.name in solved:
                 continue
-            else:
-                current = [release.name]
-                dep = release.previous
-                # Construct the current release dependency list
-                while dep:
-                    # If the found dependency was already in the list
-                    if dep in current:
-                        msg = ("Circular dependency detected!\n"
-                               "    {0}".format("->".join(chain(current,
-                                                                [dep]))))
-                        self.logger.error(msg)
-                        raise Exception(msg)
-                    # Append the dependency to the current list
-                    current.append(dep)
-
-                    # Remove the releases that are not heads from the list
-                    if dep in solved:
-                        deps = [i for i in deps if i[0] != dep]
+            current = [release.name]
+            visited = set(current)
+            path = []
+            dep = release.previous
+            # Construct the current release dependency list
+            while dep:
+                # If the found dependency was already in the list
+                if dep in visited:
+                    msg = ("Circular dependency detected!\n"
+                           "    {0}".format("->".join(chain(current,
+                                                            [dep]))))
+                    self.logger.error(msg)
+                    raise Exception(msg)
+
+                # The rest of the path is known: reuse it
+                if dep in solved:
+                    if dep not in checked:
+                        get_dependency(dep)
+                        checked.add(dep)
+                    known, position = solved[dep]
+                    if heads.get(dep) is known:
+                        # The dependency is not a head anymore
+                        del heads[dep]
+                        path = known
                     else:
-                        solved.add(dep)
-                    dep = get_dependency(self.releases, dep)
-                solved.add(release.name)
-                deps.append(current)
-        return deps
+                        path = known[:position + 1]
+                    break
+
+                # Append the dependency to the current list
+                current.append(dep)
+                visited.add(dep)
+                dep = get_dependency(current[-1])
+                checked.add(current[-1])
+
+            first = len(path)
+            path.extend(reversed(current))
+            for position in range(first, len(path)):
+                solved[path[position]] = (path, position)
+            heads[release.name] = path
+            order.append(release.name)
+
+        deps = [heads[head][::-1] for head in order if head in heads]
+        self._deps = deps
+        return [list(dep) for dep in deps]
+
+    def _cache_key(self):
+        """
+        Get the key which identifies the state of the cached release index
+
+        :returns: A list of tuples (name, previous, id) for each release
+        """
+
+        return [(release.name, release.previous, id(release))
+                for release in self.releases]
+
+    def _release_index(self):
+        """
+        Get an index mapping each release name to the releases with that name
+
+        The index is cached together with the dependencies lists. Both are
+        rebuilt when a release is added, removed, renamed, or has its
+        predecessor changed.
+
+        :returns: A dictionary {name: [releases]}
+        """
+
+        key = self._cache_key()
+        if key != self._deps_key:
+            index = {}
+            for release in self.releases:
+                index.setdefault(release.name, []).append(release)
+            self._index = index
+            self._deps = None
+            self._deps_key = key
+        return self._index
 
     def check(self):
         """
         Check the map structure.
 
         Reports errors found in the structure of the map in form of warnings.
+        The checks are the rules named in ``rules`` (see ``abimap.rules``),
+        run in a single traversal of the releases.
         """
 
         if not self.releases:
@@ -506,96 +1328,7 @@ class Map(object):
             self.logger.error(msg)
             raise Exception(msg)
 
-        have_wildcard = []
-        seems_base = []
-
-        # Find duplicated symbols
-        d = self.duplicates()
-        if d:
-            for release, duplicates in d:
-                self.logger.warning("Duplicates found in release \'%s\':",
-                                    release)
-                for scope, symbols in duplicates:
-                    self.logger.warning("    %s:", scope)
-                    self.logger.warning("\n".join(
-                                                  (" " * 8 +
-                                                   symbol for symbol in
-                                                   symbols)))
-
-        # Check '*' wildcard usage
-        for release in self.releases:
-            for scope, symbols in release.symbols.items():
-                if scope == 'local':
-                    if symbols:
-                        if "*" in symbols:
-                            self.logger.info("%s contains the local \'*\'"
-                                             " wildcard", release.name)
-                            if release.previous:
-                                # Predecessor version and local: *; are present
-                                self.logger.warning("%s should not contain the"
-                                                    " local wildcard because"
-                                                    " it is not the base"
-                                                    " version (it refers to"
-                                                    " version %s"
-                                                    " as its predecessor)",
-                                                    release.name,
-                                                    release.previous)
-                            else:
-                                # Release seems to be base: empty predecessor
-                                msg = "{} seems to be the base version"\
-                                      .format(release.name)
-                                self.logger.info(msg)
-                                seems_base.append(release.name)
-
-                            # Append to the list of releases which contain the
-                            # wildcard '*'
-                            have_wildcard.append((release.name, scope))
-                elif scope == 'global':
-                    if symbols:
-                        if "*" in symbols:
-                            # Release contains '*' wildcard in global scope
-                            self.logger.warning("%s contains the \'*\'"
-                                                " wildcard in"
-                                                " global scope. It is probably"
-                                                " exporting symbols"
-                                                " it should not.",
-                                                release.name)
-                            have_wildcard.append((release.name, scope))
-                else:
-                    # Release contains unknown visibility scopes (not global or
-                    # local)
-                    self.logger.warning("%s contains unknown scope named %s"
-                                        " (different from \'global\' and"
-                                        " \'local\')", release.name, scope)
-
-        if have_wildcard:
-            if len(have_wildcard) > 1:
-                # The '*' wildcard was found in more than one place
-                self.logger.warning("The \'*\' wildcard was found in more than"
-                                    " one place:")
-                for name, scope in have_wildcard:
-                    self.logger.warning("    %s: in \'%s\'", name, scope)
-        else:
-            self.logger.warning("The \'*\' wildcard was not found")
-
-        if seems_base:
-            if len(seems_base) > 1:
-                # There is more than one release without predecessor and
-                # containing '*' wildcard in local scope
-                self.logger.warning("More than one release seem to be the base"
-                                    " version (contain the local wildcard and"
-                                    " do not have a predecessor version):")
-                for name in seems_base:
-                    self.logger.warning("    %s", name)
-        else:
-            self.logger.warning("No base version release found")
-
-        dependencies = self.dependencies()
-        self.logger.info("Found dependencies:")
-        for release in dependencies:
-            content = "".join(chain(" " * 4,
-                                    (dep + "->" for dep in release)))
-            self.logger.info(content)
+        run_rules(self, get_rules(self.rules))
 
         # After calling a check, the map is considered initialized
         self.init = True
@@ -684,7 +1417,7 @@ class Map(object):
                     if new_prefix:
                         self.logger.debug("[guess]: Common prefix found")
                         # Search and remove any version info found as prefix
-                        m = re.search(r'_+[0-9]+|_+$', new_prefix)
+                        m = PREFIX_VERSION_RE.search(new_prefix)
                         if m:
                             new_prefix = new_prefix[:m.start()]
                     else:
@@ -775,13 +1508,63 @@ class Release(object):
         previous: The previous release to which this release is dependent
         symbols: The symbols contained in the release, grouped by the visibility
                  scope.
+        span: A tuple (first, last) with the indexes of the first and the last
+              lines of the release in the parsed file; None if not parsed
     """
 
-    def __init__(self):
+    __slots__ = ("name", "previous", "released", "span", "_symbols",
+                 "_loader")
+
+    def __init__(self, loader=None):
+        """
+        The constructor
+
+        :param loader:  A function which receives the release and returns its
+                        symbols. If given, the symbols are loaded by calling it
+                        when accessed for the first time.
+        """
         self.name = ''
         self.previous = ''
         self.released = False
-        self.symbols = dict()
+        self.span = None
+        if loader is None:
+            self._symbols = dict()
+        else:
+            self._symbols = None
+        self._loader = loader
+
+    @property
+    def symbols(self):
+        if self._symbols is None:
+            # Shared releases can be loaded by more than one thread at once
+            loader = self._loader
+            if loader is not None:
+                self._symbols = loader(self)
+                self._loader = None
+        return self._symbols
+
+    @symbols.setter
+    def symbols(self, value):
+        self._symbols = value
+        self._loader = None
+
+    # The loader cannot be pickled, so the symbols are loaded
+    def __getstate__(self):
+        return (self.name, self.previous, self.released, self.span,
+                self.symbols)
+
+    def __setstate__(self, state):
+        self.name, self.previous, self.released, self.span, symbols = state
+        self.symbols = symbols
+
+    def is_loaded(self):
+        """
+        Check if the symbols of the release were loaded
+
+        :returns: False if the symbols will be loaded when accessed
+        """
+
+        return self._symbols is not None
 
     def __str__(self):
         released = ""
@@ -799,6 +1582,48 @@ class Release(object):
                                 self.previous, ";\n"))
         return content
 
+    def copy(self):
+        """
+        Get a copy of the release, including copies of the lists of symbols
+
+        If the symbols were not loaded yet, the copy loads its own symbols when
+        accessed.
+
+        :returns: A new Release instance
+        """
+
+        loader = self._loader
+        if loader is not None:
+            r = Release(lambda release: dict(
+                (scope, list(symbols)) for scope, symbols in
+                loader(release).items()))
+        else:
+            r = Release()
+            r.symbols = dict((scope, list(symbols)) for scope, symbols in
+                             self.symbols.items())
+        r.name = self.name
+        r.previous = self.previous
+        r.released = self.released
+        r.span = self.span
+        return r
+
+    def compact(self):
+        """
+        Reduce the memory used by the release
+
+        The lists of symbols are replaced by sorted tuples of interned strings.
+        The symbols of a compact release cannot be modified in place. If the
+        symbols were not loaded yet, they are made compact when loaded.
+        """
+
+        self.name = intern(self.name)
+        self.previous = intern(self.previous)
+        if not self.is_loaded():
+            loader = self._loader
+            self._loader = lambda release: _compact_symbols(loader(release))
+            return
+        self.symbols = _compact_symbols(self.symbols)
+
     def duplicates(self):
         duplicates = []
         for scope, symbols in (self.symbols.items()):
@@ -815,14 +1640,88 @@ class Release(object):
         return duplicates
 
 
-###############################################################################
-# Utility functions
-###############################################################################
+class _Builder_Index(object):
+    """
+    The indexes kept by the builder methods of a Map
+
+    Attributes:
+        key:        Identifies the list of releases indexed
+        releases:   A dictionary {name: release}; the value is None for
+                    duplicated names
+        exported:   A dictionary {symbol: release name} of the global symbols
+        positions:  A dictionary {(release name, scope): {symbol: position}}
+                    of the scopes modified by the builder
+    """
+
+    __slots__ = ("key", "releases", "exported", "positions")
+
+    def __init__(self, key):
+        self.key = key
+        self.releases = {}
+        self.exported = {}
+        self.positions = {}
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def _compact_symbols(symbols):
+    """
+    Get the compact form of a dictionary of symbols (see ``Release.compact()``)
+
+    :param symbols: A dictionary mapping scopes to lists of symbols
+    :returns:       A dictionary mapping scopes to sorted tuples of symbols
+    """
+
+    return dict((intern(scope), tuple(sorted(intern(symbol) for symbol in
+                                             symbols)))
+                for scope, symbols in symbols.items())
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _split_version(version_string):
+    """
+    Get the numbers of a version string, cached
+
+    :param version_string:  The version string
+    :returns:               A tuple of the numbers in the string, as ints
+    """
+
+    return tuple(int(i) for i in DIGITS_RE.findall(version_string))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _split_release(release):
+    """
+    Split a release name in the prefix and the version part, cached
+
+    :param release: The release name, without leading whitespaces
+    :returns:       A tuple (prefix, tail), where tail is the version part or
+                    None if not found; None if the release name is not well
+                    formed
+    """
+
+    # Search for the first ocurrence of a version like sequence
+    m = VERSION_RE.search(release)
+    if m:
+        # If found, remove the version like sequence to get the prefix
+        return release[:m.start()], release[m.start():]
+
+    # Check if the prefix contain at least a letter
+    if LETTERS_RE.search(release):
+        return release, None
+
+    # If not, reject the prefix
+    return None
+
 
 def get_version_from_string(version_string):
     """
     Get the version numbers from a string
 
+    The numbers found in each string are cached (see ``PARSE_CACHE_SIZE``).
+
     :param version_string: A string composed by numbers separated by non \
                            alphanumeric characters (e.g. 0_1_2 or 0.1.2)
     :returns: A list of the numbers in the string
@@ -831,7 +1730,7 @@ def get_version_from_string(version_string):
     # Get logger
     logger = Single_Logger.getLogger(__name__)
 
-    m = re.findall(r'[0-9]+', version_string)
+    m = _split_version(version_string)
 
     if m:
         if len(m) < 2:
@@ -846,9 +1745,7 @@ def get_version_from_string(version_string):
         logger.error(msg)
         raise Exception(msg)
 
-    version = [int(i) for i in m]
-
-    return version
+    return list(m)
 
 
 def get_info_from_release_string(release):
@@ -857,7 +1754,9 @@ def get_info_from_release_string(release):
 
     The given string is split in a prefix (usually the name of the lib) and a
     suffix (the version part, e.g. '_1_4_7'). A list with the version info
-    converted to ints is also contained in the returned list.
+    converted to ints is also contained in the returned list. The split of
+    each string is cached (see ``PARSE_CACHE_SIZE``), and a new list is
+    returned on each call.
 
     :param release: A string in format 'LIBX_1_0_0' or similar
     :returns: A list in format [release, prefix, suffix, [CUR, AGE, REV]]
@@ -878,24 +1777,14 @@ def get_info_from_release_string(release):
     # Remove eventual white spaces
     release = release.lstrip()
 
-    # Search for the first ocurrence of a version like sequence
-    m = re.search(r'_+[0-9]+', release)
-    if m:
-        # If found, remove the version like sequence to get the prefix
-        prefix = release[:m.start()]
-        tail = release[m.start():]
-    else:
-        # Check if the prefix contain at least a letter
-        m = re.findall(r'[a-zA-Z]+', release)
-        if m:
-            prefix = release
-        else:
-            # If not, reject the prefix
-            logger.warning("Release provided is not well formed"
-                           " (a well formed release contain the library"
-                           " identifier and the version information)."
-                           " Suggested: something like LIBNAME_1_2_3")
-            return None
+    parts = _split_release(release)
+    if parts is None:
+        logger.warning("Release provided is not well formed"
+                       " (a well formed release contain the library"
+                       " identifier and the version information)."
+                       " Suggested: something like LIBNAME_1_2_3")
+        return None
+    prefix, tail = parts
 
     if tail:
         # Search and get the version information
@@ -955,7 +1844,7 @@ def clean_symbols(symbols):
     # Split the lines into potential symbols and remove invalid characters
     clean = []
     if symbols:
-        no_invalid = chain(*(re.split(r'\W+', i) for i in symbols))
+        no_invalid = chain(*(SEPARATOR_RE.split(i) for i in symbols))
         clean.extend((i for i in no_invalid if i))
 
     # Report duplicated symbols
@@ -977,14 +1866,21 @@ def clean_symbols(symbols):
     return clean
 
 
-def check_files(out_arg, out_name, in_arg, in_name, dry):
+def check_files(out_arg, out_name, in_arg, in_name, dry, backups=1):
     """
     Check if output and input are the same file. Create a backup if so.
 
+    The backup is made with the cheapest method supported by the file system
+    (see ``abimap.backup``).
+
     :param out_arg:  The name of the option used to receive output file name
     :param out_name: The received string as output file path
     :param in_arg:   The name of the option used to receive input file name
     :param in_name:  The received string as input file path
+    :param backups:  The number of backups kept: if 1, the backup is
+                     ``<in_name>.old``; if more, the backups are rotated from
+                     ``<in_name>.old.1`` (the newest) to
+                     ``<in_name>.old.<backups>``; if 0, no backup is made
     """
 
     # Get logger
@@ -999,19 +1895,26 @@ def check_files(out_arg, out_name, in_arg, in_name, dry):
                                str(out_arg), str(in_arg))
 
                 # Avoid changing the files if this is a dry run
-                if dry:
+                if dry or not backups:
                     return
 
-                logger.warning("Moving \'%s\' to \'%s.old\'.", str(in_name),
-                               str(in_name))
+                from .backup import backup_file
+                from .backup import get_backup_name
+
+                backup = get_backup_name(str(in_name), backups)
+                logger.warning("Moving \'%s\' to \'%s\'.", str(in_name),
+                               backup)
                 try:
                     # If it is the case, copy to another file to
-                    # preserve the content
-                    shutil.copy2(str(in_name), str(in_name) + ".old")
+                    # preserve the content. The file is not replaced if the
+                    # update fails or changes nothing, so the backup is a
+                    # copy, never a link to it.
+                    _, strategy = backup_file(str(in_name), backups)
                 except Exception as e:
-                    logger.error("Could not copy \'%s\' to \'%s.old\'."
-                                 " Aborting.", str(in_name), str(in_name))
+                    logger.error("Could not copy \'%s\' to \'%s\'."
+                                 " Aborting.", str(in_name), backup)
                     raise e
+                logger.debug("Backup made with %s", strategy)
 
 
 def get_info_from_args(args):
@@ -1033,7 +1936,7 @@ def get_info_from_args(args):
         release_info = get_info_from_release_string(args.release)
 
         if args.name:
-            m = re.search(r'\w+', args.name)
+            m = IDENTIFIER_RE.search(args.name)
             if m:
                 release_info[1] = m.group()
         if args.version:
@@ -1062,374 +1965,1065 @@ def get_info_from_args(args):
     return release_info
 
 
-###############################################################################
-# INTERFACE
-###############################################################################
-
-def update(args):
+def split_names(names):
     """
-    Given the new list of symbols, update the map
-
-    The new map will be generated by the following rules:
-        - If new symbols are added, a new release is created containing the new
-          symbols. This is a compatible update.
-        - If a previous existing symbol is removed, then all releases are
-          unified in a new release. This is an incompatible change, the SONAME
-          of the library should be bumped
+    Split a comma-separated list of names given in command line
 
-    The symbols provided are considered all the exported symbols in the
-    new version. Such set of symbols is compared to the previous existing
-    symbols. If symbols are added, but nothing removed, it is a compatible
-    change. Otherwise, it is an incompatible change and the SONAME of the
-    library should be bumped.
+    :param names:   The string containing the names, or None
+    :returns:       A list of names, or None if no string was given
+    """
 
-    If --add is provided, the symbols provided are considered new symbols to be
-    added. This is a compatible change.
+    if names is None:
+        return None
+    return [name.strip() for name in names.split(",") if name.strip()]
 
-    If --remove is provided, the symbols provided are considered the symbols to
-    be removed. This is an incompatible change and the SONAME of the library
-    should be bumped.
 
-    :param args: Arguments given in command line parsed by argparse
+def read_symbols(filename=None, fmt="plain", types=None, jobs=None):
+    """
+    Read the list of symbols from the given file, or from stdin
+
+    The lines are parsed as they are read. In the "archive" format, the
+    symbols are read from the ELF members of the static archive given in the
+    file (see ``abimap.archive``).
+
+    :param filename:    The path to the file containing the symbols. If not
+                        provided, the symbols are read from stdin.
+    :param fmt:         The format of the input (see
+                        ``get_symbols_from_lines()``)
+    :param types:       The names of the types of the symbols to be read
+    :param jobs:        The number of processes scanning the members of an
+                        archive (defaults to the number of CPUs)
+    :returns:           A list of the obtained symbols
+    :raises Exception:  Raised when an archive is not given in a file
     """
 
-    # Get logger
-    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+    if fmt == "archive":
+        if not filename:
+            logger = Single_Logger.getLogger(__name__)
+            msg = "The archive must be given in a file, with -i"
+            logger.error(msg)
+            raise Exception(msg)
 
-    logger.info("Command: update")
-    logger.debug("Arguments provided: ")
-    logger.debug(str(args))
+        from .archive import read_archive_symbols
 
-    # Set the verbosity if provided
-    if args.verbosity:
-        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+        with phase("clean_symbols"):
+            return clean_symbols(read_archive_symbols(filename, types, jobs))
 
-    # If output would be overwritten, print a warning
-    if args.out:
-        if os.path.isfile(args.out):
-            logger.warning("Overwriting existing file \'%s\'", args.out)
+    if filename:
+        with open(filename, "r") as symbols_fp:
+            return get_symbols_from_lines(symbols_fp, fmt, types)
 
-    # If both output and input files were given, check if are the same
-    if args.out and args.input:
-        check_files('--out', args.out, '--in', args.input, args.dry)
+    # Read from stdin
+    return get_symbols_from_lines(sys.stdin, fmt, types)
 
-    # If output is given, check with the file to be updated
-    if args.out and args.file:
-        check_files('--out', args.out, 'file', args.file, args.dry)
 
-    # Get the release information provided in the arguments
-    release_info = get_info_from_args(args)
+def get_symbols_from_lines(lines, fmt="plain", types=None):
+    """
+    Get the list of symbols from the lines of an input
 
-    # Read the current map file
-    cur_map = Map(filename=args.file, logger=logger)
+    In the "plain" format, the symbols are separated by whitespaces. The
+    output of nm and readelf can be given in the "nm", "nm-posix" and
+    "readelf" formats; only the defined, non-local symbols of the given types
+    are read (see ``abimap.inputs``).
 
-    # Get all global symbols (it is a set)
-    all_symbols = cur_map.all_global_symbols()
+    :param lines:   An iterable over the lines containing the symbols
+    :param fmt:     The format of the input
+    :param types:   The names of the types of the symbols to be read, when
+                    not in the "plain" format; if None, all but "other"
+    :returns:       A list of the obtained symbols
+    """
 
-    # Generate the list of the new symbols
     new_symbols = []
-    lines = None
-    if args.input:
-        with open(args.input, "r") as symbols_fp:
-            lines = symbols_fp.readlines()
+    if fmt == "plain":
+        for line in lines:
+            new_symbols.extend(line.split())
     else:
-        # Read from stdin
-        lines = sys.stdin.readlines()
+        from .inputs import iter_symbols
 
-    for line in lines:
-        new_symbols.extend(line.split())
+        new_symbols.extend(iter_symbols(lines, fmt, types))
 
     # Clean the input removing invalid symbols
-    new_symbols = clean_symbols(new_symbols)
+    with phase("clean_symbols"):
+        return clean_symbols(new_symbols)
 
-    # All symbols read
-    new_set = set(new_symbols)
 
-    added_set = set()
-    removed_set = set()
+def check_server_python(subcommand, logger):
+    """
+    Check if the server can be used with the running version of Python
 
-    # If the list of symbols are being added
-    if args.add:
-        # Check the symbols and print a warning if already present
-        for symbol in new_set:
-            if symbol in all_symbols:
-                logger.warning("The symbol \'%s\' is already"
-                               " present in a previous version. Keep the"
-                               " previous implementation to not break ABI.",
-                               symbol)
+    :param subcommand:  The name of the subcommand which uses the server
+    :param logger:      The logger used to report the error
+    :raises Exception:  Raised when the version of Python is too old
+    """
 
-        added_set.update(new_set)
-    # If the list of symbols are being removed
-    elif args.remove:
-        # Remove the symbols to be removed
-        for symbol in new_set:
-            if symbol in all_symbols:
-                removed_set.add(symbol)
-            else:
-                logger.warning("Requested to remove \'%s\', but not found.",
-                               symbol)
-    # If the list of all symbols are being compared (the default option)
-    else:
-        for symbol in new_set:
-            if symbol not in all_symbols:
-                added_set.add(symbol)
+    if sys.version_info < SERVER_MIN_PYTHON:
+        msg = "The \'{0}\' subcommand requires Python {1} or later"\
+              .format(subcommand, ".".join(str(n) for n in
+                                           SERVER_MIN_PYTHON))
+        logger.error(msg)
+        raise Exception(msg)
 
-        for symbol in all_symbols:
-            if symbol not in new_set:
-                removed_set.add(symbol)
 
-    # Make lists from the sets
-    added = list(added_set)
-    removed = list(removed_set)
+def get_check_rules(args, logger):
+    """
+    Get the names of the rules selected in the arguments of check
 
-    # Print the modifications
-    if added:
-        added.sort()
-        msg = "".join(chain("Added:\n",
-                            ("    " + symbol + "\n" for symbol in added)))
-        print(msg)
+    :param args:    The arguments of the check subcommand
+    :param logger:  The logger
+    :returns:       The list of the names of the rules, or None if the
+                    default rules are checked
+    """
 
-    if removed:
-        removed.sort()
-        msg = "".join(chain("Removed:\n",
-                            ("    " + symbol + "\n" for symbol in removed)))
-        print(msg)
+    select = getattr(args, "select", None)
+    ignore = getattr(args, "ignore", None)
+    if not (select or ignore):
+        return None
 
-    # Guess the latest release
-    latest = cur_map.guess_latest_release()
+    try:
+        return [rule.name for rule in
+                get_rules(split_names(select), split_names(ignore))]
+    except Exception as e:
+        logger.error(str(e))
+        raise
 
-    if not added and not removed:
-        print("No symbols added or removed. Nothing done.")
-        return
 
-    r = None
+def get_input_format(args):
+    """
+    Get the format of the symbols given to a subcommand
 
-    if added:
-        if release_info:
-            for to_up in cur_map.releases:
-                if to_up and to_up.name == release_info[0]:
-                    # If the release to be modified is released
-                    if to_up.released:
-                        msg = "Released releases cannot be modified. Abort."
-                        logger.error(msg)
-                        raise Exception(msg)
+    :param args:    The arguments of the subcommand
+    :returns:       A tuple (format, types, jobs) to be given to
+                    ``read_symbols()``
+    """
 
-                    r = to_up
+    return (getattr(args, "input_format", None) or "plain",
+            split_names(getattr(args, "symbol_types", None)),
+            getattr(args, "jobs", None))
 
-        if not r:
-            r = Release()
-            # Guess the name for the new release
-            r.name = cur_map.guess_name(release_info, guess=args.guess)
-            r.name.upper()
-            r.symbols['global'] = []
 
-            if not removed:
-                # Add the name for the previous release
-                r.previous = latest[0]
+def get_name_version(program=None):
+    """
+    Get the program name and version used in the output
 
-                # Put the release on the map
-                cur_map.releases.append(r)
+    :param program: The name of the program. Defaults to \'abimap\'
+    :returns:       A string in the format \'program-version\'
+    """
 
-        # If this is the final change to the release, mark as released
-        if args.final:
-            r.released = True
+    if program:
+        return "{0}-{1}".format(program, __version__)
+    return "abimap-{0}".format(__version__)
 
-        # Add the symbols added to global scope
-        r.symbols['global'].extend(added)
-    if removed:
-        if not args.allow_abi_break:
-            msg = "ABI break detected: symbols would be removed"
-            logger.error(msg)
-            raise Exception(msg)
 
-        logger.warning("ABI break detected: symbols were removed.")
-        print("Merging all symbols in a single new release")
-        new_map = Map()
-        r = Release()
+def write_map(m, action, out_name=None, program=None, out=None,
+              document=None):
+    """
+    Write the map to a file, or to stdout, preceded by a comment header
+
+    :param m:           The map to be written
+    :param action:      The action described in the header (e.g. \'updated\')
+    :param out_name:    The path to the output file. If not provided, the map
+                        is written to ``out``.
+    :param program:     The name of the program written in the header
+    :param out:         The stream used if no output file is given (defaults
+                        to stdout)
+    :param document:    The document read (see ``abimap.cst``). If given, the
+                        map is written keeping the text of the document where
+                        the map was not changed, without adding the header.
+    """
 
-        # Guess the name of the new release
-        r.name = cur_map.guess_name(release_info, abi_break=True,
-                                    guess=args.guess)
-        r.name.upper()
+    if document is not None:
+        content = document.render(m)
+    else:
+        # Set the name of the application in the output
+        name_version = get_name_version(program)
 
-        # Add the symbols added to global scope
-        all_symbols.update(added_set)
+        content = "# This map file was {0} with {1}\n\n{2}".format(
+            action, name_version, str(m))
 
-        # Remove the '*' wildcard, if present
-        if '*' in all_symbols:
-            logger.warning("Wildcard \'*\' found in global. Removed to avoid"
-                           " exporting unexpected symbols.")
-            all_symbols.remove('*')
+    if out_name:
+        write_file(out_name, content)
+    elif out is not None:
+        out.write(content)
+    else:
+        sys.stdout.write(content)
 
-        # Remove the symbols to be removed and convert to a list
-        all_symbols_list = [symbol for symbol in all_symbols if
-                            symbol not in removed_set]
 
-        # Update the global symbols
-        r.symbols.update({'global': all_symbols_list})
+def write_file(filename, content):
+    """
+    Replace the content of a file atomically
 
-        # Add the wildcard to the local symbols
-        r.symbols.update({'local': ['*']})
+    If the file is a symbolic link, the file it points to is replaced.
 
-        # If this is the final change to the release, mark as released
-        if args.final:
-            r.released = True
+    :param filename:    The path to the file
+    :param content:     The string to be written
+    """
 
-        # Put the release on the map
-        new_map.releases.append(r)
+    atomic_write(os.path.realpath(filename), content)
 
-        # Substitute the map
-        cur_map = new_map
 
-    # Do a structural check
-    cur_map.check()
+def atomic_write(filename, content):
+    """
+    Write the content to a file atomically
 
-    # Sort the releases putting the new release and dependencies first
-    cur_map.sort_releases_nice(r.name)
+    The content is written to a temporary file in the same directory, which
+    then replaces the given file. Readers see either the old or the new
+    content, never a partially written file.
 
-    if args.dry:
-        print("This is a dry run, the files were not modified.")
-        return
+    :param filename:    The path to the file
+    :param content:     The string (or bytes) to be written
+    """
 
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(prefix="." + os.path.basename(filename),
+                                    suffix=".tmp", dir=directory)
+    mode = "wb" if isinstance(content, bytes) else "w"
     try:
-        if args.out:
-            f = open(args.out, "w")
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # Keep the permissions of the replaced file
+        if os.path.isfile(filename):
+            shutil.copymode(filename, tmp_name)
         else:
-            f = sys.stdout
+            os.chmod(tmp_name, 0o666 & ~get_umask())
+        os.rename(tmp_name, filename)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
 
-        # Set the name of the application in the output
-        name_version = None
-        if args.program:
-            name_version = "{0}-{1}".format(args.program, __version__)
-        else:
-            name_version = "abimap-{0}".format(__version__)
-
-        f.write("# This map file was updated with"
-                " {0}\n\n".format(name_version))
-        f.write(str(cur_map))
-    finally:
-        if args.out:
-            f.close()
 
+def is_same_file(first, second):
+    """
+    Check if two paths are the same existing file
 
-def new(args):
+    :param first:   A path, or None
+    :param second:  Another path, or None
+    :returns:       True if both paths exist and are the same file
     """
-    \'new\' subcommand
 
-    Create a new version script file containing the provided symbols.
+    return bool(first and second and os.path.isfile(first) and
+                os.path.isfile(second) and os.path.samefile(first, second))
 
-    :param args: Arguments given in command line parsed by argparse
+
+@contextmanager
+def lock_map_file(filename):
     """
+    Hold an exclusive advisory lock on a map file
 
-    # Get logger
-    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+    The lock is taken with ``fcntl.flock()`` on the file itself, waiting until
+    other processes release it. The updated maps replace the locked file with
+    a new file, so the lock is taken again if the file was replaced while
+    waiting. Only the processes which take the lock are excluded.
 
-    logger.info("Command: new")
-    logger.debug("Arguments provided: ")
-    logger.debug(str(args))
+    :param filename:    The path to the map file
+    """
 
-    # Set the verbosity if provided
-    if args.verbosity:
-        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+    if fcntl is None:
+        logger = Single_Logger.getLogger(__name__)
+        logger.debug("Advisory locks are not supported: \'%s\' not locked",
+                     filename)
+        yield
+        return
 
-    # If output would be overwritten, print a warning
-    if args.out:
-        if os.path.isfile(args.out):
-            logger.warning("Overwriting existing file \'%s\'.", args.out)
+    while True:
+        f = open(filename, "r")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            locked = os.fstat(f.fileno())
+            try:
+                current = os.stat(filename)
+            except OSError:
+                current = None
+        except Exception:
+            f.close()
+            raise
+        if (current is not None and (locked.st_dev, locked.st_ino) ==
+                (current.st_dev, current.st_ino)):
+            break
+        # The file was replaced while waiting: lock the new one
+        f.close()
 
-    # If both output and input files were given, check if are the same
-    if args.out and args.input:
-        check_files('--out', args.out, '--in', args.input, args.dry)
+    try:
+        yield
+    finally:
+        # Closing the file releases the lock
+        f.close()
 
-    # Get the release information provided in the arguments
-    release_info = get_info_from_args(args)
 
-    # In the new command, there is no way to guess the name, since there are
-    # not previous information. So the exception have to be raised early to
-    # avoid collecting the new symbols and then find out we do not have a name
-    if not release_info:
-        msg = "Please provide the release name."
-        logger.error(msg)
-        raise Exception(msg)
+def read_content(filename):
+    """
+    Read the content of a file
 
-    logger.debug("Release info in args:")
-    logger.debug(str(release_info))
+    :param filename:    The path to the file
+    :returns:           The content of the file, as bytes
+    """
 
-    # Generate the list of the new symbols
-    new_symbols = []
-    lines = None
-    if args.input:
-        with open(args.input, "r") as symbols_fp:
-            lines = symbols_fp.readlines()
-    else:
-        # Read from stdin
-        lines = sys.stdin.readlines()
+    with open(filename, "rb") as f:
+        return f.read()
 
-    for line in lines:
-        new_symbols.extend(line.split())
 
-    # Clean the input removing invalid symbols
-    new_symbols = clean_symbols(new_symbols)
+def get_umask():
+    """
+    Get the current umask of the process
+
+    :returns: The umask
+    """
+
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def get_build_target(args):
+    """
+    Get the target of the depfile requested in the arguments
+
+    The target is the stamp file, if given, or the output file.
+
+    :param args:        Arguments given in command line parsed by argparse
+    :returns:           The target, or None if no depfile was requested
+    :raises Exception:  Raised if a depfile was requested without a target
+    """
+
+    if not getattr(args, "depfile", None):
+        return None
+
+    target = getattr(args, "stamp", None) or getattr(args, "out", None)
+    if not target:
+        msg = "Please provide '--stamp' or '--out' to write a depfile"
+        logger = Single_Logger.getLogger(__name__)
+        logger.error(msg)
+        raise Exception(msg)
+    return target
+
+
+def escape_make_path(path):
+    """
+    Escape a path to be used in a Makefile rule
+
+    :param path:    The path
+    :returns:       The escaped path
+    """
+
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def write_depfile(filename, target, dependencies):
+    """
+    Write a Makefile style depfile, as understood by make and ninja
+
+    :param filename:        The path to the depfile
+    :param target:          The target which depends on the files
+    :param dependencies:    The paths of the files the target depends on
+    """
+
+    content = [escape_make_path(target), ":"]
+    for dependency in dependencies:
+        content.extend([" \\\n  ", escape_make_path(dependency)])
+    content.append("\n")
+    atomic_write(filename, "".join(content))
+
+
+def touch(filename):
+    """
+    Update the modification time of a file, creating it if necessary
+
+    :param filename:    The path to the file
+    """
+
+    with open(filename, "a"):
+        os.utime(filename, None)
+
+
+def write_build_files(args, dependencies):
+    """
+    Write the depfile and touch the stamp requested in the arguments
+
+    Should be called only after the subcommand succeeded, so that the build
+    system runs the subcommand again after a failure. Nothing is written in a
+    dry run.
+
+    :param args:            Arguments given in command line parsed by argparse
+    :param dependencies:    The paths of the input files of the subcommand;
+                            None entries (e.g. stdin) are ignored
+    """
+
+    if getattr(args, "dry", False):
+        return
+
+    target = get_build_target(args)
+    if target:
+        # The target cannot depend on itself
+        found = []
+        for dependency in dependencies:
+            if dependency and dependency != target and \
+                    dependency not in found:
+                found.append(dependency)
+        write_depfile(args.depfile, target, found)
+
+    if getattr(args, "stamp", None):
+        touch(args.stamp)
+
+
+def update_lock(args, locked):
+    """
+    Write the lockfile of the map written by the update subcommand
+
+    The lockfile is written only if the updated map had one, and the updated
+    map was written to a file.
+
+    :param args:    The arguments of the update subcommand
+    :param locked:  True if the updated map had a lockfile
+    """
+
+    if not locked:
+        return
+
+    if not args.out:
+        logger = Single_Logger.getLogger(__name__)
+        logger.warning("The map was written to stdout: its lockfile was not"
+                       " updated.")
+        return
+
+    from .lockfile import write_lock
+
+    with phase("write_lock"):
+        write_lock(args.out)
+
+
+def check_map_lock(args, logger):
+    """
+    Check the map given to the check subcommand against its lockfile
+
+    If requested, the lockfile is written instead.
+
+    :param args:    The arguments of the check subcommand
+    :param logger:  The logger
+    :raises Lock_Error: Raised if a released release was modified or removed
+    """
+
+    from .lockfile import check_lock
+    from .lockfile import write_lock
+
+    lock = getattr(args, "lock", None)
+    if getattr(args, "update_lock", False):
+        with phase("write_lock"):
+            write_lock(args.file, lock)
+    elif lock and not os.path.isfile(lock):
+        msg = "Lockfile \'{0}\' not found".format(lock)
+        logger.error(msg)
+        raise Exception(msg)
+    else:
+        check_lock(args.file, lock)
+
+
+def apply_update(args, release_info, logger, new_symbols=None, out=None):
+    """
+    Read the map given to the update subcommand and update it
+
+    :param args:            The arguments of the update subcommand
+    :param release_info:    The release information given in the arguments
+    :param logger:          The logger
+    :param new_symbols:     The symbols given to the update subcommand; if
+                            None, they are read from the input
+    :param out:             The stream where the changes are printed (defaults
+                            to stdout)
+    :returns:               A tuple (new_map, document), where new_map is None
+                            if the map did not change, and the document is
+                            used to preserve the layout of the map (see
+                            ``read_update_map()``)
+    """
+
+    # Read the current map file
+    with phase("read"):
+        cur_map, document = read_update_map(args, logger)
+
+    # Generate the list of the new symbols
+    if new_symbols is None:
+        with phase("read_symbols"):
+            new_symbols = read_symbols(args.input, *get_input_format(args))
+
+    with phase("update_map"):
+        new_map, _ = update_map(cur_map, new_symbols, release_info,
+                                add=args.add, remove=args.remove,
+                                allow_abi_break=args.allow_abi_break,
+                                final=args.final, guess=args.guess, out=out)
+
+    if new_map is not cur_map:
+        # The releases were merged in a new map: there is no layout left to
+        # preserve
+        document = None
+
+    return new_map, document
+
+
+def read_update_map(args, logger, content=None):
+    """
+    Read the map given to the update subcommand
+
+    :param args:    The arguments of the update subcommand
+    :param logger:  The logger
+    :param content: The content of the map file, as bytes. If not provided,
+                    the file is read
+    :returns:       A tuple (map, document), where the document is used to
+                    preserve the layout of the map when requested (see
+                    ``abimap.cst``); otherwise it is None
+    """
+
+    preserve_layout = getattr(args, "preserve_layout", False)
+
+    lines = None
+    if content is not None:
+        if not isinstance(content, str):
+            # Python 3 reads the map as text
+            content = content.decode("utf-8")
+        lines = content.splitlines(True)
+
+    cur_map = Map(logger=logger, keep_lines=preserve_layout)
+    cur_map.read(args.file, lines)
+    if not preserve_layout:
+        return cur_map, None
+
+    from .cst import Document
+
+    return cur_map, Document(cur_map)
+
+
+def get_symbol_changes(cur_symbols, new_symbols, add=False, remove=False):
+    """
+    Compare the global symbols of a map with the given symbols
+
+    If NumPy is installed and there are at least ``VECTOR_MIN_SYMBOLS``
+    symbols, the symbols are compared in bulk (see ``abimap.vector``).
+    Otherwise, or if two different symbols have the same hash, Python sets are
+    used.
+
+    :param cur_symbols: The list of the global symbols of the map
+    :param new_symbols: The list of the given symbols
+    :param add:         If True, the given symbols are being added
+    :param remove:      If True, the given symbols are being removed
+    :returns:           A tuple of lists (added, removed, present,
+                        missing), without repeated symbols: the symbols to be
+                        added to the map, the symbols to be removed from the
+                        map, the symbols being added which are already
+                        present, and the symbols being removed which are not
+                        present
+    """
+
+    if len(cur_symbols) + len(new_symbols) >= VECTOR_MIN_SYMBOLS:
+        from . import vector
+
+        if vector.numpy is not None:
+            changes = vector.symbol_changes(cur_symbols, new_symbols, add,
+                                            remove)
+            if changes is not None:
+                return changes
+            logger = Single_Logger.getLogger(__name__)
+            logger.debug("Hash collision found, comparing the symbols again")
+
+    all_symbols = set(cur_symbols)
+
+    # All symbols read
+    new_set = set(new_symbols)
+
+    added_set = set()
+    removed_set = set()
+    present = set()
+    missing = set()
+
+    # If the list of symbols are being added
+    if add:
+        # Check the symbols already present
+        for symbol in new_set:
+            if symbol in all_symbols:
+                present.add(symbol)
+
+        added_set.update(new_set)
+    # If the list of symbols are being removed
+    elif remove:
+        # Remove the symbols to be removed
+        for symbol in new_set:
+            if symbol in all_symbols:
+                removed_set.add(symbol)
+            else:
+                missing.add(symbol)
+    # If the list of all symbols are being compared (the default option)
+    else:
+        for symbol in new_set:
+            if symbol not in all_symbols:
+                added_set.add(symbol)
+
+        for symbol in all_symbols:
+            if symbol not in new_set:
+                removed_set.add(symbol)
+
+    return list(added_set), list(removed_set), list(present), list(missing)
+
+
+def update_map(cur_map, new_symbols, release_info=None, add=False,
+               remove=False, allow_abi_break=False, final=False, guess=True,
+               out=None):
+    """
+    Update a map with the given list of symbols
+
+    The map is updated following the rules described in ``update()``. The
+    changes in the set of symbols are printed to ``out``.
+
+    :param cur_map:         The map to be updated (a checked Map instance). It
+                            can be modified.
+    :param new_symbols:     The list of symbols (see ``clean_symbols()``)
+    :param release_info:    The new release information, as returned by
+                            ``get_info_from_args()``
+    :param add:             If True, the symbols are added to the map
+    :param remove:          If True, the symbols are removed from the map
+    :param allow_abi_break: Allow removing symbols, and to break ABI
+    :param final:           Mark the modified release as released
+    :param guess:           Try to guess the new release name if needed
+    :param out:             The stream where the changes are printed (defaults
+                            to stdout)
+    :returns:               A tuple (map, release) containing the updated map
+                            and the modified release; (None, None) if the map
+                            was not changed
+    """
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__)
+
+    # Get all global symbols
+    cur_symbols = cur_map.global_symbols()
+
+    added, removed, present, missing = get_symbol_changes(
+        cur_symbols, new_symbols, add=add, remove=remove)
+
+    # If the list of symbols are being added, print a warning for the symbols
+    # already present
+    for symbol in sorted(present):
+        logger.warning("The symbol \'%s\' is already"
+                       " present in a previous version. Keep the"
+                       " previous implementation to not break ABI.",
+                       symbol)
+
+    # If the list of symbols are being removed, print a warning for the
+    # symbols not found
+    for symbol in sorted(missing):
+        logger.warning("Requested to remove \'%s\', but not found.",
+                       symbol)
+
+    # Print the modifications
+    if added:
+        added.sort()
+        msg = "".join(chain("Added:\n",
+                            ("    " + symbol + "\n" for symbol in added)))
+        print(msg, file=out)
+
+    if removed:
+        removed.sort()
+        msg = "".join(chain("Removed:\n",
+                            ("    " + symbol + "\n" for symbol in removed)))
+        print(msg, file=out)
+
+    # Guess the latest release
+    with phase("guess_latest_release"):
+        latest = cur_map.guess_latest_release()
+
+    if not added and not removed:
+        print("No symbols added or removed. Nothing done.", file=out)
+        return None, None
+
+    r = None
+
+    if added:
+        if release_info:
+            for to_up in cur_map.releases:
+                if to_up and to_up.name == release_info[0]:
+                    # If the release to be modified is released
+                    if to_up.released:
+                        msg = "Released releases cannot be modified. Abort."
+                        logger.error(msg)
+                        raise Exception(msg)
+
+                    r = to_up
+
+        if not r:
+            r = Release()
+            # Guess the name for the new release
+            r.name = cur_map.guess_name(release_info, guess=guess)
+            r.name.upper()
+            r.symbols['global'] = []
+
+            if not removed:
+                # Add the name for the previous release
+                r.previous = latest[0]
+
+                # Put the release on the map
+                cur_map.releases.append(r)
+
+        # If this is the final change to the release, mark as released
+        if final:
+            r.released = True
+
+        # Add the symbols added to global scope. The list is copied, as the
+        # release can be compact (see Release.compact())
+        r.symbols['global'] = list(r.symbols.get('global', [])) + added
+    if removed:
+        if not allow_abi_break:
+            msg = "ABI break detected: symbols would be removed"
+            logger.error(msg)
+            raise Exception(msg)
+
+        logger.warning("ABI break detected: symbols were removed.")
+        print("Merging all symbols in a single new release", file=out)
+        new_map = Map()
+        r = Release()
+
+        # Guess the name of the new release
+        r.name = cur_map.guess_name(release_info, abi_break=True,
+                                    guess=guess)
+        r.name.upper()
+
+        # Add the symbols added to global scope
+        all_symbols = set(cur_symbols)
+        all_symbols.update(added)
+
+        # Remove the '*' wildcard, if present
+        if '*' in all_symbols:
+            logger.warning("Wildcard \'*\' found in global. Removed to avoid"
+                           " exporting unexpected symbols.")
+            all_symbols.remove('*')
+
+        # Remove the symbols to be removed and convert to a list
+        removed_set = set(removed)
+        all_symbols_list = [symbol for symbol in all_symbols if
+                            symbol not in removed_set]
+
+        # Update the global symbols
+        r.symbols.update({'global': all_symbols_list})
+
+        # Add the wildcard to the local symbols
+        r.symbols.update({'local': ['*']})
+
+        # If this is the final change to the release, mark as released
+        if final:
+            r.released = True
+
+        # Put the release on the map
+        new_map.releases.append(r)
+
+        # Substitute the map
+        cur_map = new_map
+
+    # Do a structural check
+    with phase("check"):
+        cur_map.check()
+
+    # Sort the releases putting the new release and dependencies first
+    with phase("sort_releases_nice"):
+        cur_map.sort_releases_nice(r.name)
+
+    return cur_map, r
+
+
+def create_map(release_info, new_symbols, final=False):
+    """
+    Create a new map containing the given symbols in a single release
+
+    :param release_info:    The release information, as returned by
+                            ``get_info_from_args()``
+    :param new_symbols:     The list of symbols (see ``clean_symbols()``)
+    :param final:           Mark the new release as released
+    :returns:               The new map; None if no symbols were given
+    """
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__)
+
+    if not new_symbols:
+        return None
+
+    new_map = Map()
+    r = Release()
+
+    name = new_map.guess_name(release_info)
+
+    debug_msg = "Generated name: \'{}\'".format(name)
+    logger.debug(debug_msg)
+
+    # Set the name of the new release
+    r.name = name.upper()
+
+    # Add the symbols to global scope
+    r.symbols['global'] = list(set(new_symbols))
+
+    # Add the wildcard to the local symbols
+    r.symbols['local'] = ['*']
+
+    if final:
+        r.released = True
+
+    # Put the release on the map
+    new_map.releases.append(r)
+
+    # Do a structural check
+    new_map.check()
+
+    # Sort the releases putting the new release and dependencies first
+    new_map.sort_releases_nice(r.name)
+
+    return new_map
+
+
+###############################################################################
+# INTERFACE
+###############################################################################
+
+@timed
+def update(args):
+    """
+    Given the new list of symbols, update the map
+
+    The new map will be generated by the following rules:
+        - If new symbols are added, a new release is created containing the new
+          symbols. This is a compatible update.
+        - If a previous existing symbol is removed, then all releases are
+          unified in a new release. This is an incompatible change, the SONAME
+          of the library should be bumped
+
+    The symbols provided are considered all the exported symbols in the
+    new version. Such set of symbols is compared to the previous existing
+    symbols. If symbols are added, but nothing removed, it is a compatible
+    change. Otherwise, it is an incompatible change and the SONAME of the
+    library should be bumped.
+
+    If --add is provided, the symbols provided are considered new symbols to be
+    added. This is a compatible change.
+
+    If --remove is provided, the symbols provided are considered the symbols to
+    be removed. This is an incompatible change and the SONAME of the library
+    should be bumped.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: update")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    # If output would be overwritten, print a warning
+    if args.out:
+        if os.path.isfile(args.out):
+            logger.warning("Overwriting existing file \'%s\'", args.out)
+
+    # If both output and input files were given, check if are the same
+    if args.out and args.input:
+        check_files('--out', args.out, '--in', args.input, args.dry,
+                    getattr(args, "backups", 1))
+
+    # Fail early if a depfile cannot be written
+    get_build_target(args)
+
+    # Get the release information provided in the arguments
+    release_info = get_info_from_args(args)
+
+    if args.dry or not is_same_file(args.out, args.file):
+        # If output is given, check with the file to be updated
+        if args.out and args.file:
+            check_files('--out', args.out, 'file', args.file, args.dry,
+                        getattr(args, "backups", 1))
+
+        _update(args, release_info, logger)
+        return
+
+    # The map is updated in place: concurrent updates of the same map are
+    # applied one after the other, holding a lock on the map
+    if getattr(args, "retry_merge", False):
+        _update_merge(args, release_info, logger)
+        return
+
+    with lock_map_file(args.file):
+        check_files('--out', args.out, 'file', args.file, args.dry,
+                    getattr(args, "backups", 1))
+        _update(args, release_info, logger)
+
+
+def _update(args, release_info, logger):
+    """
+    Update the map given to the update subcommand and write the result
+
+    :param args:            The arguments of the update subcommand
+    :param release_info:    The release information given in the arguments
+    :param logger:          The logger
+    """
+
+    # Refuse to update a map whose released releases were modified
+    from .lockfile import check_lock
+
+    locked = check_lock(args.file)
+
+    cache_dir = getattr(args, "cache_dir", None)
+    if cache_dir:
+        from .memo import Result_Store
+        from .memo import cached_update
+
+        store = Result_Store(cache_dir,
+                             max_size=int(args.cache_size * 1024 * 1024))
+        with phase("cached_update"):
+            output = cached_update(store, args, release_info, logger)
+        if output is not None:
+            if args.dry:
+                print("This is a dry run, the files were not modified.")
+                return
+
+            with phase("write_map"):
+                if args.out:
+                    write_file(args.out, output)
+                else:
+                    sys.stdout.write(output)
+            update_lock(args, locked)
+
+        write_build_files(args, [args.file, args.input])
+        return
+
+    new_map, document = apply_update(args, release_info, logger)
+
+    if new_map is not None:
+        if args.dry:
+            print("This is a dry run, the files were not modified.")
+            return
+
+        with phase("write_map"):
+            write_map(new_map, "updated", args.out, args.program,
+                      document=document)
+        update_lock(args, locked)
+
+    write_build_files(args, [args.file, args.input])
+
+
+def _update_merge(args, release_info, logger):
+    """
+    Update a map in place, applying the update again if the map changed
+
+    The symbols are read and the update is computed without holding the lock
+    on the map. Then the lock is taken and, if the map was modified in the
+    meantime (e.g. by a concurrent update), the update is applied again to
+    the new content before writing it. The results are not cached.
+
+    :param args:            The arguments of the update subcommand
+    :param release_info:    The release information given in the arguments
+    :param logger:          The logger
+    """
+
+    from .lockfile import check_lock
+
+    with phase("read_symbols"):
+        new_symbols = read_symbols(args.input, *get_input_format(args))
+
+    content = read_content(args.file)
+    check_lock(args.file, content=content.decode("utf-8"))
+    report = StringIO()
+    new_map, document = apply_update(args, release_info, logger, new_symbols,
+                                     out=report)
+
+    with lock_map_file(args.file):
+        if read_content(args.file) != content:
+            logger.warning("\'%s\' was modified during the update. Applying"
+                           " the update again.", args.file)
+            report = StringIO()
+            new_map, document = apply_update(args, release_info, logger,
+                                             new_symbols, out=report)
 
-    new_symbols_set = set(new_symbols)
+        sys.stdout.write(report.getvalue())
+        if new_map is not None:
+            # The released releases are checked again, holding the lock
+            locked = check_lock(args.file)
+            check_files('--out', args.out, 'file', args.file, args.dry,
+                        getattr(args, "backups", 1))
+            with phase("write_map"):
+                write_map(new_map, "updated", args.out, args.program,
+                          document=document)
+            update_lock(args, locked)
 
-    if new_symbols:
-        new_map = Map()
-        r = Release()
+    write_build_files(args, [args.file, args.input])
 
-        name = new_map.guess_name(release_info)
 
-        debug_msg = "Generated name: \'{}\'".format(name)
-        logger.debug(debug_msg)
+@timed
+def new(args):
+    """
+    \'new\' subcommand
 
-        # Set the name of the new release
-        r.name = name.upper()
+    Create a new version script file containing the provided symbols.
 
-        # Add the symbols to global scope
-        r.symbols['global'] = list(new_symbols_set)
+    :param args: Arguments given in command line parsed by argparse
+    """
 
-        # Add the wildcard to the local symbols
-        r.symbols['local'] = ['*']
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
 
-        if args.final:
-            r.released = True
+    logger.info("Command: new")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
 
-        # Put the release on the map
-        new_map.releases.append(r)
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
 
-        # Do a structural check
-        new_map.check()
+    # If output would be overwritten, print a warning
+    if args.out:
+        if os.path.isfile(args.out):
+            logger.warning("Overwriting existing file \'%s\'.", args.out)
 
-        # Sort the releases putting the new release and dependencies first
-        new_map.sort_releases_nice(r.name)
+    # If both output and input files were given, check if are the same
+    if args.out and args.input:
+        check_files('--out', args.out, '--in', args.input, args.dry,
+                    getattr(args, "backups", 1))
 
-        if args.dry:
-            print("This is a dry run, the files were not modified.")
-            return
+    # Get the release information provided in the arguments
+    release_info = get_info_from_args(args)
 
-        try:
-            if args.out:
-                f = open(args.out, "w")
-            else:
-                f = sys.stdout
+    # In the new command, there is no way to guess the name, since there are
+    # not previous information. So the exception have to be raised early to
+    # avoid collecting the new symbols and then find out we do not have a name
+    if not release_info:
+        msg = "Please provide the release name."
+        logger.error(msg)
+        raise Exception(msg)
 
-            # Set the name of the application in the output
-            name_version = None
-            if args.program:
-                name_version = "{0}-{1}".format(args.program, __version__)
-            else:
-                name_version = "abimap-{0}".format(__version__)
-
-            f.write("# This map file was created with"
-                    " {0}\n\n".format(name_version))
-            f.write(str(new_map))
-        finally:
-            if args.out:
-                f.close()
-    else:
+    logger.debug("Release info in args:")
+    logger.debug(str(release_info))
+
+    # Fail early if a depfile cannot be written
+    get_build_target(args)
+
+    # Generate the list of the new symbols
+    with phase("read_symbols"):
+        new_symbols = read_symbols(args.input, *get_input_format(args))
+
+    with phase("create_map"):
+        new_map = create_map(release_info, new_symbols, final=args.final)
+
+    if new_map is None:
         logger.warning("No valid symbols provided. Nothing done.")
+        return
+
+    if args.dry:
+        print("This is a dry run, the files were not modified.")
+        return
+
+    with phase("write_map"):
+        write_map(new_map, "created", args.out, args.program)
+
+    write_build_files(args, [args.input])
 
 
+@timed
 def check(args):
     """
     \'check\' subcommand
@@ -1450,11 +3044,395 @@ def check(args):
     if args.verbosity:
         logger.setLevel(VERBOSITY_MAP[args.verbosity])
 
-    # Read the map file
-    abimap = Map(filename=args.file, logger=logger)
+    # Fail early if a depfile cannot be written
+    get_build_target(args)
+
+    # Get the rules to be checked
+    rules = get_check_rules(args, logger)
+
+    # Read the map file. Unless it is parsed in parallel, the bodies of the
+    # releases are only parsed when checked, and only if the rules need them
+    jobs = getattr(args, "jobs", None)
+    with phase("read"):
+        abimap = Map(filename=args.file, logger=logger, jobs=jobs,
+                     lazy=not (jobs and jobs > 1), rules=rules)
 
     # Check the map file
-    abimap.check()
+    with phase("check"):
+        abimap.check()
+
+    # Check the released releases against the lockfile, or write it
+    check_map_lock(args, logger)
+
+    write_build_files(args, [args.file])
+
+
+def merge(args):
+    """
+    \'merge\' subcommand
+
+    Merge map fragments into a single map. Releases with the same name are
+    merged, and symbols listed in more than one fragment are reported.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    from .merge import merge_maps
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: merge")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    if args.jobs is not None and args.jobs < 1:
+        msg = "The number of jobs must be at least 1"
+        logger.error(msg)
+        raise Exception(msg)
+
+    merged, duplicates = merge_maps(args.fragments, jobs=args.jobs,
+                                    logger=logger)
+
+    for symbol, places in duplicates:
+        logger.warning("Symbol \'%s\' found in more than one fragment:",
+                       symbol)
+        for filename, release, scope in places:
+            logger.warning("    %s: %s (%s)", filename, release, scope)
+
+    if duplicates and args.strict:
+        msg = "{0} symbols found in more than one fragment"\
+              .format(len(duplicates))
+        logger.error(msg)
+        raise Exception(msg)
+
+    if args.dry:
+        print("This is a dry run, the files were not modified.")
+        return
+
+    write_map(merged, "merged", args.out, args.program)
+
+
+def history(args):
+    """
+    \'history\' subcommand
+
+    Add revisions of a map to a history database and query the history of the
+    symbols and releases.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    from .history import History
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: history")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    if args.git and not args.path:
+        msg = "Please provide the path of the map file in the repository"
+        logger.error(msg)
+        raise Exception(msg)
+
+    with History(args.database, logger=logger) as h:
+        added = 0
+        if args.revisions:
+            added += h.ingest_files(args.revisions)
+        if args.git:
+            added += h.ingest_git(args.git, args.path, args.rev)
+        if args.revisions or args.git:
+            logger.info("Added %d revisions to the history", added)
+
+        if args.list_revisions:
+            for name in h.revisions():
+                print(name)
+
+        if args.symbol:
+            for row in h.symbol_history(args.symbol):
+                print("{0} {1} {2} first: {3} last: {4}".format(*row))
+
+        if args.releases:
+            for name, previous, released, first, last in h.release_history():
+                print("{0} ({1}){2} first: {3} last: {4}".format(
+                      name, previous or "base",
+                      " released" if released else "", first, last))
+
+        if args.bumps:
+            for revision, previous, name in h.bumps():
+                print("{0}: {1} -> {2}".format(revision, previous, name))
+
+
+def scan(args):
+    """
+    'scan' subcommand
+
+    Index the version definitions and the exported symbols of the shared
+    objects found in directories, and print the libraries or the map of a
+    library.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    from .scan import Scan_Index
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: scan")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    if args.jobs is not None and args.jobs < 1:
+        msg = "The number of jobs must be at least 1"
+        logger.error(msg)
+        raise Exception(msg)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            msg = "'{0}' is not a directory".format(directory)
+            logger.error(msg)
+            raise Exception(msg)
+
+    with Scan_Index(args.index or ":memory:", logger=logger) as index:
+        stats = index.scan(args.directories, jobs=args.jobs)
+        logger.info("Scanned %d files: %d shared objects, %d files read, %d"
+                    " unchanged, %d removed", stats.files, stats.libraries,
+                    stats.read, stats.unchanged, stats.removed)
+
+        if args.map:
+            m = index.get_map(args.map)
+            write_map(m, "reconstructed from {0}".format(args.map), args.out,
+                      args.program)
+            return
+
+        lines = []
+        for path, soname, _, versions, symbols in index.libraries():
+            lines.append("{0}: {1} ({2} versions, {3} symbols)\n".format(
+                path, soname or "no soname", versions, symbols))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.writelines(lines)
+    else:
+        sys.stdout.writelines(lines)
+
+
+def consumers(args):
+    """
+    'consumers' subcommand
+
+    Find the files which would break if symbols were removed from a library:
+    the files which import them with the versions given in the map of the
+    library.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    from .scan import Scan_Index
+    from .scan import get_removed_versions
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: consumers")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    if args.jobs is not None and args.jobs < 1:
+        msg = "The number of jobs must be at least 1"
+        logger.error(msg)
+        raise Exception(msg)
+
+    if not args.directories and not args.index:
+        msg = "Please provide the directories to be scanned, or an index"
+        logger.error(msg)
+        raise Exception(msg)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            msg = "'{0}' is not a directory".format(directory)
+            logger.error(msg)
+            raise Exception(msg)
+
+    # Read the map file
+    m = Map(filename=args.file, logger=logger)
+    m.check()
+
+    # Get the symbols to be removed
+    symbols = None
+    if args.symbols:
+        symbols = split_names(args.symbols)
+    elif args.input:
+        symbols = read_symbols(args.input)
+
+    removed, missing = get_removed_versions(m, symbols)
+    for symbol in missing:
+        logger.warning("Symbol '%s' is not global in the map", symbol)
+
+    with Scan_Index(args.index or ":memory:", logger=logger) as index:
+        if args.directories:
+            stats = index.scan(args.directories, jobs=args.jobs)
+            logger.info("Scanned %d files: %d files read, %d unchanged, %d"
+                        " removed", stats.files, stats.read, stats.unchanged,
+                        stats.removed)
+        found = index.consumers(removed, args.soname,
+                                args.directories or None)
+
+    broken = {}
+    for path, symbol, version in found:
+        name = "{0}@{1}".format(symbol, version) if version else symbol
+        broken.setdefault(path, []).append(name)
+
+    lines = ["{0}: {1}\n".format(path, ", ".join(broken[path])) for path in
+             sorted(broken)]
+    if args.out:
+        with open(args.out, "w") as f:
+            f.writelines(lines)
+    else:
+        sys.stdout.writelines(lines)
+
+    if broken and args.strict:
+        msg = "{0} consumers would break".format(len(broken))
+        logger.error(msg)
+        raise Exception(msg)
+
+
+def watch(args):
+    """
+    \'watch\' subcommand
+
+    Check the given map files and check them again whenever they are
+    modified, printing only the new and the resolved diagnostics.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    from .watch import Map_Watcher
+    from .watch import get_watcher
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: watch")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    watcher = get_watcher(args.files, debounce=args.debounce,
+                          interval=args.interval, poll=args.poll)
+    map_watcher = Map_Watcher(args.files, logger=logger, out=sys.stdout)
+
+    try:
+        map_watcher.run(watcher)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def serve(args):
+    """
+    \'serve\' subcommand
+
+    Run a server which keeps parsed maps in memory and answers requests
+    received in a Unix domain socket.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__, filename=args.logfile)
+
+    logger.info("Command: serve")
+    logger.debug("Arguments provided: ")
+    logger.debug(str(args))
+
+    # Set the verbosity if provided
+    if args.verbosity:
+        logger.setLevel(VERBOSITY_MAP[args.verbosity])
+
+    check_server_python("serve", logger)
+
+    from .server import Server
+
+    server = Server(args.socket, logger=logger)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def client(args):
+    """
+    \'client\' subcommand
+
+    Send a subcommand to the server started with \'serve\'. If the server is
+    not running, the subcommand is executed in this process.
+
+    :param args: Arguments given in command line parsed by argparse
+    """
+
+    # Get logger
+    logger = Single_Logger.getLogger(__name__)
+
+    check_server_python("client", logger)
+
+    from .server import get_request_from_args
+    from .server import send_request
+
+    if not args.command:
+        msg = "Please provide the subcommand to be sent"
+        logger.error(msg)
+        raise Exception(msg)
+
+    sub_args = get_arg_parser().parse_args(args.command)
+    if sub_args.subcommand not in ("check", "update", "new"):
+        msg = "The subcommand \'{0}\' cannot be sent to the server"\
+              .format(sub_args.subcommand)
+        logger.error(msg)
+        raise Exception(msg)
+
+    # The server measures the phases of all requests together
+    if getattr(sub_args, "timings", None):
+        msg = "The timings of a subcommand sent to the server cannot be" \
+              " measured"
+        logger.error(msg)
+        raise Exception(msg)
+
+    sub_args.program = args.program
+    request = get_request_from_args(sub_args)
+
+    response = send_request(request, args.socket,
+                            fallback=not args.no_fallback)
+
+    sys.stdout.write(response["stdout"])
+    for message in response["diagnostics"]:
+        print(message, file=sys.stderr)
+
+    if not response["ok"]:
+        raise Exception(response["error"])
 
 
 def version(args):
@@ -1467,10 +3445,7 @@ def version(args):
     :returns: A string containing the program name and version
     """
 
-    if args.program:
-        name_version = "{0}-{1}".format(args.program, __version__)
-    else:
-        name_version = "abimap-{0}".format(__version__)
+    name_version = get_name_version(args.program)
 
     print(name_version)
 
@@ -1496,6 +3471,28 @@ def get_arg_parser():
     file_args.add_argument('-d', '--dry',
                            help='Do everything, but do not modify the files',
                            action='store_true')
+    file_args.add_argument("--backups",
+                           help="The number of backups kept when the output"
+                           " overwrites an input: FILE.old if 1, FILE.old.1"
+                           " (newest) to FILE.old.N if more, none if 0"
+                           " (default: 1)", type=int, default=1)
+    file_args.add_argument("--input-format",
+                           help="The format of the input: a list of symbols"
+                           " (plain), or the output of 'nm -D' (nm), 'nm -D"
+                           " -P' (nm-posix) or 'readelf --dyn-syms -W'"
+                           " (readelf), or a static archive given with -i"
+                           " (archive) (default: plain)",
+                           choices=("plain", "nm", "nm-posix", "readelf",
+                                    "archive"),
+                           default="plain")
+    file_args.add_argument("--symbol-types",
+                           help="Comma-separated types of the symbols read"
+                           " from nm, readelf or an archive: func, object,"
+                           " tls, other (default: func,object,tls)")
+    file_args.add_argument("-j", "--jobs",
+                           help="The number of processes scanning the members"
+                           " of an archive (defaults to the number of CPUs)",
+                           type=int)
 
     # Common verbosity arguments
     verb_args = argparse.ArgumentParser(add_help=False)
@@ -1512,6 +3509,26 @@ def get_arg_parser():
     verb_args.add_argument('-l', '--logfile',
                            help='Log to this file')
 
+    # Common build system arguments
+    build_args = argparse.ArgumentParser(add_help=False)
+    build_args.add_argument("--depfile",
+                            help="Write a Makefile style depfile listing the"
+                            " input files, with the stamp (or the output"
+                            " file) as the target")
+    build_args.add_argument("--stamp",
+                            help="Touch this file when the subcommand"
+                            " succeeds")
+
+    # Common profiling arguments
+    timings_args = argparse.ArgumentParser(add_help=False)
+    group_timings = timings_args.add_mutually_exclusive_group()
+    group_timings.add_argument("--timings", help="Print the time and the"
+                               " peak memory used by each phase to stderr",
+                               action="store_const", const="table")
+    group_timings.add_argument("--timings-json", help="Print the timings as"
+                               " JSON", dest="timings", action="store_const",
+                               const="json")
+
     # Common release name arguments
     name_args = argparse.ArgumentParser(add_help=False)
     name_args.add_argument("-n", "--name",
@@ -1540,7 +3557,8 @@ def get_arg_parser():
     # Update subcommand parser
     parser_up = subparsers.add_parser("update", help="Update the map file",
                                       parents=[file_args, verb_args,
-                                               name_args],
+                                               name_args, build_args,
+                                               timings_args],
                                       epilog="A list of symbols is expected as"
                                       " the input.\nIf a file is provided with"
                                       " \'-i\', the symbols are read"
@@ -1558,6 +3576,26 @@ def get_arg_parser():
                        action='store_true')
     group.add_argument("--remove", help="Remove the symbols from the map"
                        " file. This breaks the ABI.", action="store_true")
+    parser_up.add_argument("--cache-dir",
+                           help="Reuse the results of previous updates with"
+                           " the same inputs, stored in this directory"
+                           " (defaults to $ABIMAP_CACHE_DIR, if set)",
+                           default=os.environ.get("ABIMAP_CACHE_DIR"))
+    parser_up.add_argument("--cache-size",
+                           help="The maximum size of the cache in MB"
+                           " (default: 64)", type=float, default=64)
+    parser_up.add_argument("--no-cache", help="Do not use the cache",
+                           action="store_const", const=None,
+                           dest="cache_dir")
+    parser_up.add_argument("--preserve-layout",
+                           help="Keep the comments and the layout of the map,"
+                           " changing only the modified lines",
+                           action='store_true')
+    parser_up.add_argument("--retry-merge",
+                           help="When updating the map in place, compute the"
+                           " update without holding the lock on the map, and"
+                           " apply it again if the map was modified meanwhile",
+                           action='store_true')
     parser_up.add_argument('file', help='The map file being updated')
     parser_up.set_defaults(func=update)
 
@@ -1565,7 +3603,8 @@ def get_arg_parser():
     parser_new = subparsers.add_parser("new",
                                        help="Create a new map file",
                                        parents=[file_args, verb_args,
-                                                name_args],
+                                                name_args, build_args,
+                                                timings_args],
                                        epilog="A list of symbols is expected"
                                        " as the input.\nIf a file is provided"
                                        " with \'-i\', the symbols are read"
@@ -1579,10 +3618,219 @@ def get_arg_parser():
 
     # Check subcommand parser
     parser_check = subparsers.add_parser("check", help="Check the map file",
-                                         parents=[verb_args])
+                                         parents=[verb_args, build_args,
+                                                  timings_args])
+    parser_check.add_argument("-j", "--jobs",
+                              help="The number of processes used to parse"
+                              " large files (default: 1)", type=int)
+    parser_check.add_argument("--select",
+                              help="Comma-separated names of the rules to be"
+                              " checked (default: all but exported-twice)."
+                              " The rules are: " +
+                              ", ".join(rule.name for rule in RULES))
+    parser_check.add_argument("--ignore",
+                              help="Comma-separated names of the rules not to"
+                              " be checked")
+    parser_check.add_argument("--lock",
+                              help="The lockfile recording the digests of"
+                              " the releases (default: the map file name"
+                              " followed by .lock)")
+    parser_check.add_argument("--update-lock",
+                              help="Write the lockfile instead of checking"
+                              " the released releases against it",
+                              action='store_true')
     parser_check.add_argument("file", help="The map file to be checked")
     parser_check.set_defaults(func=check)
 
+    # Merge subcommand parser
+    parser_merge = subparsers.add_parser("merge",
+                                         help="Merge map fragments into a"
+                                         " single map",
+                                         parents=[verb_args],
+                                         epilog="Releases with the same name"
+                                         " are merged by the union of their"
+                                         " scopes.")
+    parser_merge.add_argument('-o', '--out',
+                              help='Output file (defaults to stdout)')
+    parser_merge.add_argument('-d', '--dry',
+                              help='Do everything, but do not write the'
+                              ' output', action='store_true')
+    parser_merge.add_argument("-j", "--jobs",
+                              help="The number of processes used to parse"
+                              " the fragments (defaults to the number of"
+                              " CPUs)", type=int)
+    parser_merge.add_argument("--strict",
+                              help="Fail if a symbol is found in more than"
+                              " one fragment", action="store_true")
+    parser_merge.add_argument("fragments", help="The map fragments",
+                              nargs="+", metavar="fragment")
+    parser_merge.set_defaults(func=merge)
+
+    # History subcommand parser
+    parser_history = subparsers.add_parser("history",
+                                           help="Keep a database of the"
+                                           " history of a map",
+                                           parents=[verb_args],
+                                           epilog="The revisions given are"
+                                           " added to the database before"
+                                           " running the queries. Revisions"
+                                           " already in the database are"
+                                           " skipped.")
+    parser_history.add_argument("--git",
+                                help="Add the revisions of the map from the"
+                                " history of this git repository",
+                                metavar="REPOSITORY")
+    parser_history.add_argument("--path",
+                                help="The path of the map file in the git"
+                                " repository")
+    parser_history.add_argument("--rev",
+                                help="The git revision or range whose history"
+                                " is added (default: HEAD)", default="HEAD")
+    parser_history.add_argument("--symbol",
+                                help="Print the history of the symbols"
+                                " matching this name or glob pattern",
+                                metavar="PATTERN")
+    parser_history.add_argument("--releases",
+                                help="Print the history of the releases",
+                                action="store_true")
+    parser_history.add_argument("--bumps",
+                                help="Print the releases which changed the"
+                                " major version", action="store_true")
+    parser_history.add_argument("--list-revisions",
+                                help="Print the revisions in the database",
+                                action="store_true")
+    parser_history.add_argument("database",
+                                help="The path to the history database")
+    parser_history.add_argument("revisions",
+                                help="Map files or directories of map files"
+                                " to be added, in order", nargs="*",
+                                metavar="revision")
+    parser_history.set_defaults(func=history)
+
+    # Scan subcommand parser
+    parser_scan = subparsers.add_parser("scan",
+                                        help="Index the versions and symbols"
+                                        " of the shared objects found in"
+                                        " directories",
+                                        parents=[verb_args],
+                                        epilog="The shared objects are found"
+                                        " by the content of the files. With"
+                                        " an index, the files which did not"
+                                        " change are not read again.")
+    parser_scan.add_argument('-o', '--out',
+                             help='Output file (defaults to stdout)')
+    parser_scan.add_argument("-j", "--jobs",
+                             help="The number of processes reading the files"
+                             " (defaults to the number of CPUs)", type=int)
+    parser_scan.add_argument("--index",
+                             help="The path to the SQLite index, created if"
+                             " it does not exist. If not given, the index is"
+                             " not kept")
+    parser_scan.add_argument("--map",
+                             help="Print the map reconstructed for this"
+                             " library, given by its path or soname, instead"
+                             " of the list of libraries", metavar="LIBRARY")
+    parser_scan.add_argument("directories",
+                             help="The directories to be scanned", nargs="+",
+                             metavar="directory")
+    parser_scan.set_defaults(func=scan)
+
+    # Consumers subcommand parser
+    parser_consumers = subparsers.add_parser("consumers",
+                                             help="Find the files which would"
+                                             " break if symbols were removed"
+                                             " from a library",
+                                             parents=[verb_args],
+                                             epilog="The files are scanned as"
+                                             " with the 'scan' subcommand."
+                                             " By default, the consumers of"
+                                             " all the global symbols are"
+                                             " found.")
+    parser_consumers.add_argument('-o', '--out',
+                                  help='Output file (defaults to stdout)')
+    parser_consumers.add_argument('-i', '--in',
+                                  help="Read the symbols to be removed from"
+                                  " this file", dest='input')
+    parser_consumers.add_argument("--symbols",
+                                  help="Comma-separated symbols to be"
+                                  " removed")
+    parser_consumers.add_argument("--soname",
+                                  help="The soname of the library. The files"
+                                  " which need it and import the symbols"
+                                  " without a version are consumers too")
+    parser_consumers.add_argument("-j", "--jobs",
+                                  help="The number of processes reading the"
+                                  " files (defaults to the number of CPUs)",
+                                  type=int)
+    parser_consumers.add_argument("--index",
+                                  help="The path to the SQLite index, created"
+                                  " if it does not exist. If no directory is"
+                                  " given, the index is queried without"
+                                  " scanning the files again")
+    parser_consumers.add_argument("--strict",
+                                  help="Fail if a consumer would break",
+                                  action="store_true")
+    parser_consumers.add_argument("file", help="The map of the library")
+    parser_consumers.add_argument("directories",
+                                  help="The directories to be scanned",
+                                  nargs="*", metavar="directory")
+    parser_consumers.set_defaults(func=consumers)
+
+    # Watch subcommand parser
+    parser_watch = subparsers.add_parser("watch",
+                                         help="Check the map files again"
+                                         " whenever they are modified",
+                                         parents=[verb_args],
+                                         epilog="Only the diagnostics which"
+                                         " appeared (+) or were resolved (-)"
+                                         " since the last check are printed.")
+    parser_watch.add_argument("--poll",
+                              help="Poll the files instead of using inotify",
+                              action="store_true")
+    parser_watch.add_argument("--interval",
+                              help="Time in seconds between polls"
+                              " (default: 0.5)", type=float, default=0.5)
+    parser_watch.add_argument("--debounce",
+                              help="Wait until the files are not modified for"
+                              " this time in seconds before checking"
+                              " (default: 0.1)", type=float, default=0.1)
+    parser_watch.add_argument("files", help="The map files to be watched",
+                              nargs="+", metavar="file")
+    parser_watch.set_defaults(func=watch)
+
+    # Serve subcommand parser
+    parser_serve = subparsers.add_parser("serve",
+                                         help="Run a server which keeps the"
+                                         " parsed maps in memory",
+                                         parents=[verb_args],
+                                         epilog="The server answers requests"
+                                         " sent with the \'client\'"
+                                         " subcommand.")
+    parser_serve.add_argument("-s", "--socket",
+                              help="The path to the Unix socket (defaults to"
+                              " $ABIMAP_SOCKET or a socket in"
+                              " $XDG_RUNTIME_DIR)")
+    parser_serve.set_defaults(func=serve)
+
+    # Client subcommand parser
+    parser_client = subparsers.add_parser("client",
+                                          help="Send a subcommand to the"
+                                          " server",
+                                          epilog="The subcommands check,"
+                                          " update, and new can be sent. If"
+                                          " the server is not running, the"
+                                          " subcommand is executed locally.")
+    parser_client.add_argument("-s", "--socket",
+                               help="The path to the Unix socket (defaults to"
+                               " $ABIMAP_SOCKET or a socket in"
+                               " $XDG_RUNTIME_DIR)")
+    parser_client.add_argument("--no-fallback",
+                               help="Fail if the server is not running",
+                               action="store_true")
+    parser_client.add_argument("command", nargs=argparse.REMAINDER,
+                               help="The subcommand and its arguments")
+    parser_client.set_defaults(func=client)
+
     # Version subcommand parser
     parser_version = subparsers.add_parser("version", help="Print version")
     parser_version.set_defaults(func=version)
@@ -0,0 +1,300 @@
+"""Measure the time and memory used by the phases of a command
+
+The phases are marked in the code with the ``phase()`` context manager, which
+does nothing unless a ``Timings`` instance is collecting:
+::
+
+    with Timings() as timings:
+        with phase("parse"):
+            m.parse(lines)
+            with phase("check"):
+                m.check()
+    timings.report(sys.stderr)
+
+The time is measured with a monotonic high-resolution clock. The memory
+high-water mark of each phase is measured with ``tracemalloc``, when available.
+"""
+
+from __future__ import print_function
+
+import functools
+import json
+import sys
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 does not have tracemalloc
+    tracemalloc = None
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    # Python 2 does not have a high-resolution monotonic clock
+    from time import time as clock
+
+# The Timings instance collecting, if any
+_active = None
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Phase(object):
+    """
+    The measurements of a phase
+
+    Attributes:
+        name:       The name of the phase
+        depth:      The number of phases enclosing this phase
+        seconds:    The time spent in the phase
+        peak:       The maximum memory traced during the phase, in bytes;
+                    None if the memory is not traced
+    """
+
+    __slots__ = ("name", "depth", "seconds", "peak")
+
+    def __init__(self, name, depth):
+        """
+        The constructor
+
+        :param name:    The name of the phase
+        :param depth:   The number of phases enclosing this phase
+        """
+
+        self.name = name
+        self.depth = depth
+        self.seconds = None
+        self.peak = None
+
+    def to_dict(self):
+        """
+        Get the measurements as a dictionary
+
+        :returns: A dictionary with the attributes of the phase
+        """
+
+        return {"name": self.name,
+                "depth": self.depth,
+                "seconds": self.seconds,
+                "peak": self.peak}
+
+
+class Timings(object):
+    """
+    Collect the time and memory used by the phases of a command
+
+    While used as a context manager, the phases marked by ``phase()`` are
+    measured by this instance. The memory is traced only while collecting,
+    as tracing makes the program slower.
+
+    Attributes:
+        phases:     The list of the measured phases (instances of ``Phase``),
+                    in the order they started
+        memory:     Indicates if the memory is traced
+    """
+
+    def __init__(self, memory=True):
+        """
+        The constructor
+
+        :param memory:  If True, the memory is traced, when tracemalloc is
+                        available
+        """
+
+        self.phases = []
+        self.memory = memory and tracemalloc is not None
+        self._stack = []
+        self._previous = None
+        self._tracing = False
+
+    def __enter__(self):
+        global _active
+
+        self._previous = _active
+        _active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        global _active
+
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        _active = self._previous
+        self._previous = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure a phase
+
+        The phases can be nested. The peak memory of a phase includes the
+        peaks of the phases it encloses.
+
+        :param name:    The name of the phase
+        """
+
+        record = Phase(name, len(self._stack))
+        self.phases.append(record)
+
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak = max(parent.peak, peak)
+            record.peak = 0
+            # Python < 3.9 cannot reset the peak, so it includes the memory
+            # used before the phase
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+        self._stack.append(record)
+        start = clock()
+        try:
+            yield record
+        finally:
+            record.seconds = clock() - start
+            self._stack.pop()
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record.peak = max(record.peak, peak)
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent.peak = max(parent.peak, record.peak)
+
+    def record(self, name, seconds):
+        """
+        Record a phase measured by the caller
+
+        The phase is recorded as enclosed by the current phase. Its memory is
+        not measured.
+
+        :param name:    The name of the phase
+        :param seconds: The time spent in the phase
+        """
+
+        record = Phase(name, len(self._stack))
+        record.seconds = seconds
+        self.phases.append(record)
+        return record
+
+    def report(self, out=None, fmt="table"):
+        """
+        Print the measurements
+
+        :param out: The stream where the report is printed (defaults to
+                    stderr)
+        :param fmt: The format of the report, "table" or "json"
+        """
+
+        if out is None:
+            out = sys.stderr
+
+        if fmt == "json":
+            print(json.dumps({"phases": [record.to_dict() for record in
+                                         self.phases]},
+                             sort_keys=True), file=out)
+            return
+
+        print("{0:<40}{1:>12}{2:>14}".format("phase", "time (ms)",
+                                             "peak (KiB)"), file=out)
+        for record in self.phases:
+            if record.peak is None:
+                peak = "-"
+            else:
+                peak = str(record.peak // 1024)
+            name = "  " * record.depth + record.name
+            print("{0:<40}{1:>12.3f}{2:>14}".format(name,
+                                                    record.seconds * 1e3,
+                                                    peak), file=out)
+
+
+class _Null_Phase(object):
+    """
+    A context manager which does nothing, used when not collecting
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, etype, value, traceback):
+        return None
+
+
+_NULL_PHASE = _Null_Phase()
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def phase(name):
+    """
+    Measure a phase, if a ``Timings`` instance is collecting
+
+    :param name:    The name of the phase
+    :returns:       A context manager
+    """
+
+    if _active is None:
+        return _NULL_PHASE
+    return _active.phase(name)
+
+
+def collecting():
+    """
+    Check if a ``Timings`` instance is collecting
+
+    :returns:   True if the phases are being measured
+    """
+
+    return _active is not None
+
+
+def record(name, seconds):
+    """
+    Record a phase measured by the caller, if a ``Timings`` instance is
+    collecting
+
+    :param name:    The name of the phase
+    :param seconds: The time spent in the phase
+    """
+
+    if _active is not None:
+        _active.record(name, seconds)
+
+
+def timed(func):
+    """
+    Decorate a subcommand to measure it if timings were requested
+
+    The timings are requested by setting ``args.timings`` to the format of the
+    report (see ``Timings.report()``). The whole subcommand is measured as a
+    phase named after it, and the report is printed to stderr, even if the
+    subcommand fails.
+
+    :param func:    The subcommand function, which receives the arguments
+    :returns:       The decorated function
+    """
+
+    @functools.wraps(func)
+    def wrapper(args):
+        fmt = getattr(args, "timings", None)
+        if not fmt:
+            return func(args)
+
+        timings = Timings()
+        try:
+            with timings:
+                with timings.phase(func.__name__):
+                    return func(args)
+        finally:
+            timings.report(sys.stderr, fmt)
+
+    return wrapper
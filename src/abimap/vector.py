@@ -0,0 +1,129 @@
+"""Set operations on large lists of symbols using NumPy
+
+Comparing the symbols of a map with millions of given symbols in Python sets
+spends most of the time hashing and looking up strings one at a time. Here the
+symbols are hashed once into arrays of 64-bit integers, which are sorted and
+compared in bulk with binary searches.
+
+Two different symbols can have the same hash. Every pair of symbols matched by
+their hashes is compared, so a collision is always detected; in that case the
+result is not computed and the caller uses Python sets instead. Symbols whose
+hashes do not match are always different.
+
+NumPy is optional: if it is not installed, ``numpy`` is None and the functions
+of this module cannot be used.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def hash_symbols(symbols):
+    """
+    Hash the symbols into a sorted array
+
+    :param symbols: A list of symbols
+    :returns:       A tuple (hashes, order), where hashes is the sorted array
+                    of the 64-bit hashes of the symbols, and order is the
+                    array of the indexes of the symbols in that order
+    """
+
+    hashes = numpy.fromiter(map(hash, symbols), numpy.int64, len(symbols))
+    order = numpy.argsort(hashes)
+    return hashes[order], order
+
+
+def find_hashes(hashes, keys):
+    """
+    Find sorted keys in a sorted array of hashes
+
+    :param hashes:  A sorted array of hashes
+    :param keys:    A sorted array of the hashes to be found
+    :returns:       A tuple (positions, found), where found is a boolean array
+                    telling if each key is in hashes, and positions are the
+                    indexes of the first matching hashes (meaningful only
+                    where found)
+    """
+
+    if not len(hashes):
+        return (numpy.zeros(len(keys), numpy.intp),
+                numpy.zeros(len(keys), bool))
+    positions = numpy.searchsorted(hashes, keys)
+    positions[positions == len(hashes)] = 0
+    return positions, hashes[positions] == keys
+
+
+def unique_hashes(hashes, order, symbols):
+    """
+    Get the hashes which are not repeated
+
+    :param hashes:  A sorted array of hashes (see ``hash_symbols()``)
+    :param order:   The indexes of the symbols in the order of the hashes
+    :param symbols: The array of the symbols
+    :returns:       A tuple (hashes, order) with the first of each run of
+                    repeated hashes, or None if a hash is repeated for
+                    different symbols
+    """
+
+    first = numpy.ones(len(hashes), bool)
+    first[1:] = hashes[1:] != hashes[:-1]
+    repeated = numpy.flatnonzero(~first)
+    if not numpy.all(symbols[order[repeated]] ==
+                     symbols[order[repeated - 1]]):
+        return None
+    return hashes[first], order[first]
+
+
+def symbol_changes(cur_symbols, new_symbols, add=False, remove=False):
+    """
+    Compare the global symbols of a map with the given symbols
+
+    See ``symver.get_symbol_changes()``, which returns the same symbols.
+
+    :param cur_symbols: The list of the global symbols of the map
+    :param new_symbols: The list of the given symbols
+    :param add:         If True, the symbols are being added
+    :param remove:      If True, the symbols are being removed
+    :returns:           A tuple of lists (added, removed, present, missing),
+                        or None if two different symbols have the same hash
+    """
+
+    cur = numpy.array(cur_symbols, dtype=object)
+    new = numpy.array(new_symbols, dtype=object)
+
+    # Once the repeated hashes are checked, each hash is a single symbol in
+    # each list
+    cur_unique = unique_hashes(*hash_symbols(cur_symbols), symbols=cur)
+    new_unique = unique_hashes(*hash_symbols(new_symbols), symbols=new)
+    if cur_unique is None or new_unique is None:
+        return None
+    cur_hashes, cur_order = cur_unique
+    new_hashes, new_order = new_unique
+
+    # The symbols matched by their hashes must be the same
+    positions, in_cur = find_hashes(cur_hashes, new_hashes)
+    matched = new[new_order[in_cur]]
+    if not numpy.all(matched == cur[cur_order[positions[in_cur]]]):
+        return None
+
+    added = []
+    removed = []
+    present = []
+    missing = []
+    if add:
+        added = new[new_order].tolist()
+        present = matched.tolist()
+    elif remove:
+        removed = matched.tolist()
+        missing = new[new_order[~in_cur]].tolist()
+    else:
+        added = new[new_order[~in_cur]].tolist()
+        _, in_new = find_hashes(new_hashes, cur_hashes)
+        removed = cur[cur_order[~in_new]].tolist()
+    return added, removed, present, missing
@@ -0,0 +1,391 @@
+"""Watch map files and check them again when they change"""
+
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from .symver import Log_Collector
+from .symver import Map
+from .symver import ParserError
+from .symver import Single_Logger
+
+# Events from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# The events which indicate a file in a watched directory was modified. The
+# directories are watched instead of the files because editors usually save
+# files by replacing them.
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event {int wd; uint32_t mask, cookie, len; char name[];}
+EVENT_HEADER = struct.Struct("iIII")
+
+
+###############################################################################
+# Classes
+###############################################################################
+
+class Inotify_Watcher(object):
+    """
+    Wait for modifications in files using the Linux inotify API
+
+    The inotify functions are called through ``ctypes``. Creating an instance
+    raises ``OSError`` if inotify is not available.
+
+    Attributes:
+        paths:      The absolute paths of the files watched
+        debounce:   Time in seconds without events to consider a burst over
+    """
+
+    def __init__(self, paths, debounce=0.1):
+        """
+        The constructor
+
+        :param paths:       The paths of the files to watch
+        :param debounce:    Time in seconds without events to consider a burst
+                            of modifications over
+        """
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            init = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.debounce = debounce
+
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+        # Map each watch descriptor to the watched files in the directory
+        self.watches = {}
+        dirs = {}
+        for path in self.paths:
+            dirs.setdefault(os.path.dirname(path), set()).add(
+                os.path.basename(path))
+        for directory, names in dirs.items():
+            wd = add_watch(self.fd, directory.encode(sys.getfilesystemencoding()),
+                           WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(code, os.strerror(code), directory)
+            self.watches[wd] = (directory, names)
+
+    def close(self):
+        """
+        Release the inotify file descriptor
+        """
+
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _read_events(self):
+        """
+        Read the pending events, returning the paths of the watched files
+        modified
+        """
+
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not buf:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, _, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if wd not in self.watches:
+                    continue
+                directory, names = self.watches[wd]
+                name = name.decode(sys.getfilesystemencoding())
+                if name in names:
+                    changed.add(os.path.join(directory, name))
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Wait until watched files are modified
+
+        After the first modification, keep collecting events until no events
+        arrive for ``debounce`` seconds.
+
+        :param timeout: Maximum time to wait for the first modification, in
+                        seconds. If None, wait forever.
+        :returns:       A set of the paths of the modified files; empty if the
+                        timeout expired
+        """
+
+        changed = set()
+        wait_for = timeout
+        while True:
+            readable, _, _ = select.select([self.fd], [], [], wait_for)
+            if not readable:
+                # Either the timeout expired or the burst is over
+                return changed
+            changed.update(self._read_events())
+            if changed:
+                wait_for = self.debounce
+
+
+class Polling_Watcher(object):
+    """
+    Wait for modifications in files by polling their status
+
+    Used when inotify is not available.
+
+    Attributes:
+        paths:      The absolute paths of the files watched
+        debounce:   Time in seconds without changes to consider a burst over
+        interval:   Time in seconds between polls
+    """
+
+    def __init__(self, paths, debounce=0.1, interval=0.5):
+        """
+        The constructor
+
+        :param paths:       The paths of the files to watch
+        :param debounce:    Time in seconds without changes to consider a burst
+                            of modifications over
+        :param interval:    Time in seconds between polls
+        """
+
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.debounce = debounce
+        self.interval = interval
+        self.status = self._stat_all()
+
+    def close(self):
+        pass
+
+    def _stat_all(self):
+        status = {}
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                status[path] = (st.st_ino, st.st_size, st.st_mtime)
+            except OSError:
+                status[path] = None
+        return status
+
+    def _poll(self):
+        status = self._stat_all()
+        changed = set(path for path in self.paths if
+                      status[path] != self.status[path])
+        self.status = status
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Wait until watched files are modified
+
+        After the first modification, keep polling until the files are not
+        modified for ``debounce`` seconds.
+
+        :param timeout: Maximum time to wait for the first modification, in
+                        seconds. If None, wait forever.
+        :returns:       A set of the paths of the modified files; empty if the
+                        timeout expired
+        """
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        changed = self._poll()
+        while not changed:
+            if deadline is not None and time.time() >= deadline:
+                return changed
+            time.sleep(self.interval)
+            changed = self._poll()
+
+        while True:
+            time.sleep(self.debounce)
+            more = self._poll()
+            if not more:
+                return changed
+            changed.update(more)
+
+
+class Map_Watcher(object):
+    """
+    Check map files and report only the diagnostics which changed
+
+    Keeps a parsed ``Map`` for each file, so that modified files are parsed
+    incrementally with ``Map.reparse()``.
+
+    Attributes:
+        paths:          The absolute paths of the files watched
+        diagnostics:    A dictionary mapping each path to the list of
+                        diagnostics of the last check
+    """
+
+    def __init__(self, paths, logger=None, out=None):
+        """
+        The constructor
+
+        :param paths:   The paths of the map files
+        :param logger:  The logger used by the checks
+        :param out:     The stream where the diagnostics are printed (defaults
+                        to stdout)
+        """
+
+        if logger is None:
+            logger = Single_Logger.getLogger(__name__)
+        self.logger = logger
+        self.out = out
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.names = dict(zip(self.paths, paths))
+        self.maps = {}
+        self.diagnostics = dict((path, []) for path in self.paths)
+
+    def _run_check(self, path):
+        """
+        Read, parse and check the given file, collecting the diagnostics
+
+        :param path:    The path of the map file
+        :returns:       The list of diagnostics
+        """
+
+        with Log_Collector(self.logger) as collector:
+            try:
+                with open(path, "r") as f:
+                    lines = f.readlines()
+
+                m = self.maps.get(path)
+                if m is None:
+                    m = Map(logger=self.logger)
+                    m.filename = self.names[path]
+                    self.maps[path] = m
+                    m.parse(lines)
+                else:
+                    m.reparse(lines)
+
+                m.check()
+            except ParserError:
+                # Already logged by the parser
+                pass
+            except Exception as e:
+                message = "[ERROR] {0}".format(e)
+                if message not in collector.messages:
+                    collector.messages.append(message)
+
+        # Keep the order, but remove repeated messages
+        diagnostics = []
+        for message in collector.messages:
+            if message not in diagnostics:
+                diagnostics.append(message)
+        return diagnostics
+
+    def check(self, path):
+        """
+        Check a file and print the new and the resolved diagnostics
+
+        :param path:    The path of the map file
+        :returns:       A tuple of lists (new, resolved)
+        """
+
+        path = os.path.abspath(path)
+        current = self._run_check(path)
+        previous = self.diagnostics.get(path, [])
+
+        new = [message for message in current if message not in previous]
+        resolved = [message for message in previous if message not in current]
+        self.diagnostics[path] = current
+
+        name = self.names.get(path, path)
+        for message in new:
+            print("{0}: + {1}".format(name, message), file=self.out)
+        for message in resolved:
+            print("{0}: - {1}".format(name, message), file=self.out)
+        if (new or resolved) and not current:
+            print("{0}: OK".format(name), file=self.out)
+        if self.out is not None:
+            self.out.flush()
+
+        return new, resolved
+
+    def check_all(self):
+        """
+        Check all the files
+        """
+
+        for path in self.paths:
+            self.check(path)
+
+    def run(self, watcher, rounds=None, timeout=None):
+        """
+        Check all the files and check them again when modified
+
+        :param watcher: The watcher used to wait for modifications
+        :param rounds:  The number of modification bursts to process. If None,
+                        run until interrupted.
+        :param timeout: Stop after waiting this many seconds without
+                        modifications. If None, wait forever.
+        """
+
+        self.check_all()
+        done = 0
+        while rounds is None or done < rounds:
+            changed = watcher.wait(timeout)
+            if not changed:
+                return
+            for path in self.paths:
+                if path in changed:
+                    self.check(path)
+            done += 1
+
+
+###############################################################################
+# Utility functions
+###############################################################################
+
+def get_watcher(paths, debounce=0.1, interval=0.5, poll=False):
+    """
+    Get the best watcher available for the given paths
+
+    Uses inotify, if available. Otherwise falls back to polling.
+
+    :param paths:       The paths of the files to watch
+    :param debounce:    Time in seconds without modifications to consider a
+                        burst of modifications over
+    :param interval:    Time in seconds between polls, if polling
+    :param poll:        If True, use polling even if inotify is available
+    :returns:           An instance of Inotify_Watcher or Polling_Watcher
+    """
+
+    logger = Single_Logger.getLogger(__name__)
+
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return Inotify_Watcher(paths, debounce)
+        except OSError as e:
+            logger.debug("Could not use inotify (%s), polling instead", e)
+    return Polling_Watcher(paths, debounce, interval)
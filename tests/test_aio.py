@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the asyncio API"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+if sys.version_info < (3, 7):
+    pytest.skip("The asyncio API requires python 3.7", allow_module_level=True)
+
+import asyncio  # noqa: E402
+
+from abimap import aio  # noqa: E402
+from abimap import symver  # noqa: E402
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+BASE = """\
+LIB{0}_1_0_0
+{{
+    global:
+        symbol_{0};
+    local:
+        *;
+}} ;
+"""
+
+
+def write_maps(tmpdir, count):
+    names = []
+    for i in range(count):
+        name = os.path.join(str(tmpdir), "lib{0}.map".format(i))
+        with open(name, "w") as f:
+            f.write(BASE.format(i))
+        names.append(name)
+    return names
+
+
+def test_read_many_maps(tmpdir):
+    names = write_maps(tmpdir, 20)
+
+    async def read_all():
+        return await aio.gather_bounded((aio.read_map(name) for name in
+                                         names), limit=4)
+
+    maps = asyncio.run(read_all())
+
+    assert [str(m) for m in maps] == [str(symver.Map(filename=name)) for
+                                      name in names]
+    assert all(m.init for m in maps)
+
+
+def test_read_in_process_pool(tmpdir):
+    names = write_maps(tmpdir, 4)
+
+    async def read_all(executor):
+        return await asyncio.gather(*(aio.read_map(name, executor=executor)
+                                      for name in names))
+
+    with ProcessPoolExecutor(2) as executor:
+        maps = asyncio.run(read_all(executor))
+
+    assert [m.releases[0].name for m in maps] == ["LIB0_1_0_0", "LIB1_1_0_0",
+                                                  "LIB2_1_0_0", "LIB3_1_0_0"]
+
+
+def test_update_same_as_sync(tmpdir):
+    name = write_maps(tmpdir, 1)[0]
+    out_name = os.path.join(str(tmpdir), "out.map")
+    symbols = ["symbol_0", "added"]
+
+    async def update():
+        m = await aio.read_map(name)
+        out = StringIO()
+        new_map, release = await aio.update_map(m, symbols, out=out)
+        await aio.write_map(new_map, out_name)
+        return m, new_map, release, out.getvalue()
+
+    m, new_map, release, printed = asyncio.run(update())
+
+    # The given map is not modified
+    assert str(m) == str(symver.Map(filename=name))
+    assert release.symbols["global"] == ["added"]
+    assert printed == "Added:\n    added\n\n"
+
+    expected = StringIO()
+    sync_map, _ = symver.update_map(symver.Map(filename=name), symbols,
+                                    out=StringIO())
+    symver.write_map(sync_map, "updated", out=expected)
+    with open(out_name) as f:
+        assert f.read() == expected.getvalue()
+
+
+def test_create_map():
+    info = symver.get_info_from_release_string("LIBY_1_0_0")
+
+    async def create():
+        return await aio.create_map(info, ["b", "a"], final=True)
+
+    m = asyncio.run(create())
+    assert m.releases[0].released
+    assert sorted(m.releases[0].symbols["global"]) == ["a", "b"]
+
+
+def test_errors_are_raised(tmpdir):
+    name = os.path.join(str(tmpdir), "broken.map")
+    with open(name, "w") as f:
+        f.write("{\n")
+
+    async def read():
+        return await aio.read_map(name)
+
+    with pytest.raises(symver.ParserError) as e:
+        asyncio.run(read())
+    assert "Invalid Release identifier" in str(e.value)
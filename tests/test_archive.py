@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for reading the symbols of static archives"""
+
+import os
+import subprocess
+
+import pytest
+
+from abimap import archive
+from abimap import symver
+from abimap.elf import ELF_File
+
+SOURCE = """\
+int exported_data = 1;
+__thread int exported_tls;
+static int local_fn(void) { return 0; }
+int exported_fn(void) { return local_fn(); }
+__attribute__((weak)) int weak_fn(void) { return 1; }
+__attribute__((visibility("hidden"))) int hidden_fn(void) { return 2; }
+__attribute__((visibility("protected"))) int protected_fn(void) { return 3; }
+extern int undefined_fn(void);
+int caller(void) { return undefined_fn(); }
+"""
+
+LONG_NAME_SOURCE = """\
+int long_name_fn(void) { return 4; }
+"""
+
+LONG_NAME = "a_member_with_a_long_name.o"
+
+ALL = ["exported_data", "exported_tls", "exported_fn", "weak_fn",
+       "protected_fn", "caller"]
+
+
+def run(directory, *command):
+    try:
+        subprocess.check_call(command, cwd=directory)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("{0} is not available".format(command[0]))
+
+
+@pytest.fixture
+def objects(tmpdir):
+    directory = str(tmpdir)
+    for name, source in (("a", SOURCE),
+                         (LONG_NAME[:-2], LONG_NAME_SOURCE)):
+        with open(os.path.join(directory, name + ".c"), "w") as f:
+            f.write(source)
+        run(directory, "gcc", "-c", "-fPIC", name + ".c")
+    with open(os.path.join(directory, "notes.txt"), "w") as f:
+        f.write("not an object\n")
+    return directory
+
+
+def test_gnu_archive(objects, caplog):
+    run(objects, "ar", "rcs", "libx.a", "a.o", LONG_NAME, "notes.txt")
+    filename = os.path.join(objects, "libx.a")
+
+    with archive.Archive(filename) as a:
+        assert not a.thin
+        members = a.members()
+    assert [member.name for member in members] == \
+        ["a.o", LONG_NAME, "notes.txt"]
+
+    assert list(archive.iter_archive_symbols(filename, jobs=1)) == \
+        [("a.o", name) for name in ALL] + [(LONG_NAME, "long_name_fn")]
+    assert "Skipping member \'notes.txt\'" in caplog.text
+
+    assert archive.read_archive_symbols(filename, ["tls"], jobs=1) == \
+        ["exported_tls"]
+
+
+def test_thin_archive(objects):
+    run(objects, "ar", "rcsT", "libthin.a", "a.o", LONG_NAME)
+    filename = os.path.join(objects, "libthin.a")
+
+    with archive.Archive(filename) as a:
+        assert a.thin
+        members = a.members()
+    assert [member.path for member in members] == \
+        [os.path.join(objects, "a.o"), os.path.join(objects, LONG_NAME)]
+
+    assert archive.read_archive_symbols(filename, jobs=1) == \
+        ALL + ["long_name_fn"]
+
+
+def test_bsd_archive(objects):
+    with open(os.path.join(objects, "a.o"), "rb") as f:
+        data = f.read()
+
+    # A BSD member with its long name stored before the data
+    name = LONG_NAME.encode("utf-8")
+    size = len(name) + len(data)
+    header = "#1/{0:<13}{1:<12}{2:<6}{3:<6}{4:<8}{5:<10}`\n".format(
+        len(name), 0, 0, 0, 644, size)
+    content = archive.AR_MAGIC + header.encode("utf-8") + name + data
+    if size & 1:
+        content += b"\n"
+    filename = os.path.join(objects, "libbsd.a")
+    with open(filename, "wb") as f:
+        f.write(content)
+
+    assert list(archive.iter_archive_symbols(filename, jobs=1)) == \
+        [(LONG_NAME, name) for name in ALL]
+
+
+def test_parallel(objects, monkeypatch):
+    names = []
+    for i in range(20):
+        name = "member_{0}.o".format(i)
+        source = "int member_fn_{0}(void) {{ return {0}; }}\n".format(i)
+        with open(os.path.join(objects, name[:-2] + ".c"), "w") as f:
+            f.write(source)
+        names.append(name)
+    run(objects, "gcc", "-c", *(name[:-2] + ".c" for name in names))
+    run(objects, "ar", "rcs", "libmany.a", *names)
+    filename = os.path.join(objects, "libmany.a")
+
+    monkeypatch.setattr(archive, "ARCHIVE_PARALLEL_MIN_MEMBERS", 1)
+    expected = ["member_fn_{0}".format(i) for i in range(20)]
+    assert archive.read_archive_symbols(filename, jobs=3) == expected
+    assert archive.read_archive_symbols(filename, jobs=1) == expected
+
+
+def test_elf_file(objects):
+    with open(os.path.join(objects, "a.o"), "rb") as f:
+        elf = ELF_File(f.read())
+    symbols = dict((symbol.name, symbol) for symbol in elf.symbols())
+    assert "local_fn" in symbols
+    assert "undefined_fn" in symbols
+    assert elf.exported_symbols(set(["func"])) == \
+        ["exported_fn", "weak_fn", "protected_fn", "caller"]
+
+
+def test_errors(tmpdir):
+    filename = os.path.join(str(tmpdir), "libx.a")
+    with open(filename, "wb") as f:
+        f.write(b"not an archive\n")
+    with pytest.raises(Exception) as e:
+        archive.read_archive_symbols(filename)
+    assert "is not an archive" in str(e.value)
+
+    with open(filename, "wb") as f:
+        f.write(archive.AR_MAGIC + b"a.o/" + b" " * 56)
+    with pytest.raises(Exception) as e:
+        archive.read_archive_symbols(filename)
+    assert "invalid member header at offset 8" in str(e.value)
+
+    with pytest.raises(Exception) as e:
+        symver.read_symbols(None, "archive")
+    assert "must be given in a file" in str(e.value)
+
+
+def test_new_command(objects):
+    run(objects, "ar", "rcs", "libx.a", "a.o", LONG_NAME)
+    out = os.path.join(objects, "new.map")
+
+    args = symver.get_arg_parser().parse_args([
+        "new", "--input-format", "archive", "-j", "1", "-r", "LIBX_1_0_0",
+        "-i", os.path.join(objects, "libx.a"), "-o", out])
+    args.program = "abimap"
+    args.func(args)
+
+    m = symver.Map(filename=out)
+    assert sorted(m.releases[0].symbols["global"]) == \
+        sorted(ALL + ["long_name_fn"])
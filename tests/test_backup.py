@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the backups of the files overwritten by the subcommands"""
+
+import errno
+import os
+
+import pytest
+
+from abimap import backup
+from abimap import symver
+
+CONTENT = b"LIBX_1_0\n{\n    global:\n        fn;\n} ;\n" * 100
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    filename = str(tmpdir.join("libx.map"))
+    with open(filename, "wb") as f:
+        f.write(CONTENT)
+    os.chmod(filename, 0o640)
+    return filename
+
+
+def read(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("strategy", ["copy_file_range", "copy"])
+def test_strategies(map_file, strategy):
+    if strategy == "copy_file_range" and \
+            not hasattr(os, "copy_file_range"):
+        pytest.skip("copy_file_range is not available")
+
+    name, used = backup.backup_file(map_file, strategies=(strategy,))
+    assert (name, used) == (map_file + ".old", strategy)
+    assert read(name) == CONTENT
+    assert not os.path.samefile(name, map_file)
+
+    # The mode and the times are kept
+    st = os.stat(map_file)
+    st_backup = os.stat(name)
+    assert st_backup.st_mode == st.st_mode
+    assert int(st_backup.st_mtime) == int(st.st_mtime)
+
+
+def test_hardlink(map_file):
+    # A link is made only if the file is going to be replaced
+    with pytest.raises(ValueError):
+        backup.backup_file(map_file, strategies=("hardlink",))
+
+    name, used = backup.backup_file(map_file, replaced=True,
+                                    strategies=("hardlink",))
+    assert used == "hardlink"
+    assert os.path.samefile(name, map_file)
+    assert sorted(os.listdir(os.path.dirname(map_file))) == [
+        "libx.map", "libx.map.old"]
+
+    # A copy does not write to the file through the link
+    backup.backup_file(map_file, strategies=("copy",))
+    assert read(map_file) == read(name) == CONTENT
+    assert not os.path.samefile(name, map_file)
+
+    # Replacing the file keeps the backup
+    backup.backup_file(map_file, replaced=True, strategies=("hardlink",))
+    symver.atomic_write(map_file, b"new content")
+    assert read(name) == CONTENT
+
+
+def test_fallback(map_file, monkeypatch):
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(os, "link", unsupported)
+
+    # The reflink is not supported by the file systems used by the tests
+    # either, but if it is, nothing falls back
+    name, used = backup.backup_file(map_file, replaced=True)
+    assert used in ("reflink", "copy")
+    assert read(name) == CONTENT
+
+    with pytest.raises(ValueError):
+        backup.backup_file(map_file, strategies=("unknown",))
+
+
+def test_rotation(map_file):
+    names = []
+    for i in range(5):
+        with open(map_file, "wb") as f:
+            f.write(str(i).encode("ascii"))
+        name, _ = backup.backup_file(map_file, keep=3)
+        names.append(name)
+
+    assert set(names) == set([map_file + ".old.1"])
+    assert [read(map_file + ".old.{0}".format(i)) for i in (1, 2, 3)] == \
+        [b"4", b"3", b"2"]
+    assert sorted(os.listdir(os.path.dirname(map_file))) == [
+        "libx.map", "libx.map.old.1", "libx.map.old.2", "libx.map.old.3"]
+
+
+def test_check_files(map_file):
+    symver.check_files("--out", map_file, "file", map_file, False, 0)
+    assert not os.path.exists(map_file + ".old")
+
+    symver.check_files("--out", map_file, "file", map_file, False, 2)
+    symver.check_files("--out", map_file, "file", map_file, False, 2)
+    assert read(map_file + ".old.1") == read(map_file + ".old.2") == CONTENT
+
+
+def test_update_backups(tmpdir):
+    filename = str(tmpdir.join("libx.map"))
+    symbols = str(tmpdir.join("symbols"))
+    with open(filename, "w") as f:
+        f.write("LIBX_1_0\n{\n    global:\n        base_fn;\n    local:\n"
+                "        *;\n} ;\n")
+
+    parser = symver.get_arg_parser()
+    for i in range(3):
+        with open(symbols, "w") as f:
+            f.write("fn_{0}\n".format(i))
+        args = parser.parse_args(["update", "--quiet", "-a", "--backups", "2",
+                                  "-i", symbols, "-o", filename, filename])
+        args.program = "abimap"
+        args.func(args)
+
+    newest = symver.Map(filename=filename + ".old.1")
+    oldest = symver.Map(filename=filename + ".old.2")
+    assert "fn_1" in newest.all_global_symbols()
+    assert "fn_1" not in oldest.all_global_symbols()
+    assert "fn_2" in symver.Map(filename=filename).all_global_symbols()
+
+
+def test_backup_not_linked(tmpdir, monkeypatch):
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    # Make the strategies tried before the hard link fail
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+
+    filename = str(tmpdir.join("libx.map"))
+    symbols = str(tmpdir.join("symbols"))
+    content = ("LIBX_1_0\n{\n    global:\n        base_fn;\n    local:\n"
+               "        *;\n} ;\n")
+    with open(filename, "w") as f:
+        f.write(content)
+    with open(symbols, "w") as f:
+        f.write("base_fn\n")
+
+    # Nothing done: the map is not replaced
+    parser = symver.get_arg_parser()
+    args = parser.parse_args(["update", "--quiet", "-i", symbols, "-o",
+                              filename, filename])
+    args.program = "abimap"
+    args.func(args)
+
+    # Editing the map in place does not change the backup
+    with open(filename, "a") as f:
+        f.write("# edited\n")
+    assert read(filename + ".old") == content.encode("ascii")
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the builder methods of Map"""
+
+import pytest
+
+from abimap import symver
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_a;
+        symbol_b;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0
+{
+    global:
+        symbol_c;
+} LIBX_1_0_0;
+"""
+
+
+@pytest.fixture
+def m():
+    m = symver.Map()
+    base = m.add_release("LIBX_1_0_0")
+    m.bulk_add_symbols(base, ["symbol_b", "symbol_a"])
+    m.bulk_add_symbols("LIBX_1_0_0", ["*"], "local")
+    r = m.add_release("LIBX_1_1_0", previous=base)
+    m.bulk_add_symbols(r, iter(["symbol_c"]))
+    return m
+
+
+def parsed(content):
+    m = symver.Map()
+    m.parse(content.splitlines(True))
+    return m
+
+
+def test_build(m):
+    assert str(m) == str(parsed(BASE))
+    m.check()
+    assert m.dependencies() == [["LIBX_1_1_0", "LIBX_1_0_0"]]
+    assert m.guess_latest_release()[0] == "LIBX_1_1_0"
+
+
+def test_add_release_checks(m):
+    for name, previous, error in (
+            ("LIBX_1_1_0", "", "Duplicated Release identifier"),
+            ("LIBX 2", "", "Invalid Release identifier"),
+            ("", "", "Invalid Release identifier"),
+            ("LIBX_1_2_0", "LIBX_0_0_0", "not found")):
+        with pytest.raises(Exception) as e:
+            m.add_release(name, previous)
+        assert error in str(e.value)
+    assert len(m.releases) == 2
+
+
+def test_bulk_add_checks(m):
+    r = m.add_release("LIBX_1_2_0", "LIBX_1_1_0")
+    for symbols, scope, error in (
+            (["new", "symbol_a"], "global", "already global in LIBX_1_0_0"),
+            (["new", "new"], "global", "Duplicated symbol"),
+            (["new", "bad symbol"], "global", "Invalid symbol"),
+            (["new"], "bad scope", "Invalid visibility scope")):
+        with pytest.raises(Exception) as e:
+            m.bulk_add_symbols(r, symbols, scope)
+        assert error in str(e.value)
+    # Nothing was added
+    assert r.symbols.get("global", []) == []
+
+    m.bulk_add_symbols(r, ["new"])
+    with pytest.raises(Exception) as e:
+        m.bulk_add_symbols(r, ["new"])
+    assert "Duplicated symbol \'new\' in LIBX_1_2_0: global" in str(e.value)
+
+    # Local symbols can repeat between releases
+    m.bulk_add_symbols(r, ["symbol_a"], "local")
+
+
+def test_released(m):
+    m.mark_released("LIBX_1_1_0")
+    assert m.releases[1].released
+    with pytest.raises(Exception) as e:
+        m.bulk_add_symbols("LIBX_1_1_0", ["other"])
+    assert "Released releases cannot be modified" in str(e.value)
+    with pytest.raises(Exception):
+        m.remove_symbols(["symbol_a", "symbol_c"])
+    assert str(m).count("symbol_") == 3
+
+
+def test_remove(m):
+    with pytest.raises(Exception) as e:
+        m.remove_symbols(["symbol_a", "missing"])
+    assert "Symbol \'missing\' not found" in str(e.value)
+    assert str(m) == str(parsed(BASE))
+
+    m.remove_symbols(["symbol_a", "symbol_c", "symbol_a"])
+    assert m.releases[0].symbols["global"] == ["symbol_b"]
+    assert m.releases[1].symbols["global"] == []
+
+    # The removed symbols can be added again
+    m.bulk_add_symbols("LIBX_1_1_0", ["symbol_a"])
+    assert m.releases[1].symbols["global"] == ["symbol_a"]
+
+    m.remove_symbols(["*"], release="LIBX_1_0_0", scope="local")
+    assert m.releases[0].symbols["local"] == []
+    with pytest.raises(Exception):
+        m.remove_symbols(["*"], scope="local")
+
+
+def test_parsed_map():
+    m = parsed(BASE)
+    m.check()
+    with pytest.raises(Exception):
+        m.bulk_add_symbols("LIBX_1_1_0", ["symbol_b"])
+    r = m.add_release("LIBX_1_2_0", "LIBX_1_1_0")
+    m.bulk_add_symbols(r, ["symbol_d"])
+    m.remove_symbols(["symbol_c"])
+    assert m.releases[1].symbols["global"] == []
+
+    # The compact lists are replaced when modified
+    m = parsed(BASE)
+    m.compact()
+    m.bulk_add_symbols("LIBX_1_1_0", ["symbol_d"])
+    assert sorted(m.releases[1].symbols["global"]) == ["symbol_c", "symbol_d"]
+
+
+def test_releases_changed_directly(m):
+    r = symver.Release()
+    r.name = "LIBX_2_0_0"
+    r.symbols["global"] = ["symbol_z"]
+    m.releases.append(r)
+    with pytest.raises(Exception) as e:
+        m.bulk_add_symbols("LIBX_1_1_0", ["symbol_z"])
+    assert "already global in LIBX_2_0_0" in str(e.value)
+
+    m.releases = [m.releases[0]]
+    with pytest.raises(Exception):
+        m.add_release("LIBX_1_2_0", "LIBX_1_1_0")
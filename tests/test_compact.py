@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the compact memory representation"""
+
+import os
+
+import pytest
+
+from abimap import symver
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_b;
+        symbol_a;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0
+{
+    global:
+        symbol_c;
+} LIBX_1_0_0;
+"""
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    name = os.path.join(str(tmpdir), "lib.map")
+    with open(name, "w") as f:
+        f.write(BASE)
+    return name
+
+
+def test_lines_dropped_unless_requested(map_file):
+    assert symver.Map(filename=map_file).lines == []
+
+    m = symver.Map(filename=map_file, keep_lines=True)
+    assert "".join(m.lines) == BASE
+
+
+def test_no_instance_dict(map_file):
+    m = symver.Map(filename=map_file)
+    assert not hasattr(m, "__dict__")
+    assert not hasattr(m.releases[0], "__dict__")
+
+
+def test_compact_output_unchanged(map_file):
+    expected = str(symver.Map(filename=map_file))
+
+    m = symver.Map(filename=map_file, compact=True)
+    assert str(m) == expected
+    assert m.releases[0].symbols["global"] == ("symbol_a", "symbol_b")
+
+    m = symver.Map(filename=map_file)
+    m.compact()
+    assert str(m) == expected
+
+
+def test_symbols_shared_between_maps(map_file):
+    a = symver.Map(filename=map_file, compact=True)
+    b = symver.Map(filename=map_file, compact=True)
+
+    assert a.releases[1].symbols["global"][0] is \
+        b.releases[1].symbols["global"][0]
+    assert a.releases[1].previous is b.releases[0].name
+
+
+def test_update_compact_map(map_file):
+    m = symver.Map(filename=map_file, compact=True)
+
+    new_map, release = symver.update_map(m, ["symbol_a", "symbol_b",
+                                             "symbol_c", "symbol_d"],
+                                         out=open(os.devnull, "w"))
+    assert release.symbols["global"] == ["symbol_d"]
+
+    # Adding to an existing, compact, release
+    info = symver.get_info_from_release_string("LIBX_1_1_0")
+    m = symver.Map(filename=map_file, compact=True)
+    new_map, release = symver.update_map(m, ["symbol_e"], info, add=True,
+                                         out=open(os.devnull, "w"))
+    assert sorted(release.symbols["global"]) == ["symbol_c", "symbol_e"]
+
+
+def test_reparse_compact_map():
+    lines = BASE.splitlines(True)
+    m = symver.Map(compact=True)
+    m.parse(lines)
+
+    lines.insert(lines.index("        symbol_c;\n"), "        symbol_0;\n")
+    m.reparse(lines)
+    assert m.releases[1].symbols["global"] == ("symbol_0", "symbol_c")
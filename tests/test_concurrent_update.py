@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for concurrent in-place updates of a map"""
+
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+import pytest
+
+from abimap import symver
+
+MAP = """\
+LIBX_1_0
+{
+    global:
+        base_fn;
+    local:
+        *;
+} ;
+"""
+
+# The number of processes updating the map at the same time
+UPDATERS = 12
+
+# The number of symbols added by each process
+SYMBOLS = 3
+
+
+def run(*arguments):
+    parser = symver.get_arg_parser()
+    args = parser.parse_args(list(arguments[:1]) + ["--quiet"] +
+                             list(arguments[1:]))
+    args.program = "abimap"
+    args.func(args)
+
+
+def get_symbols(filename):
+    m = symver.Map(filename=filename)
+    return set(m.all_global_symbols())
+
+
+def updater(start, filename, symbols, retry_merge):
+    start.wait()
+    arguments = ["update", "-a", "-i", symbols, "-o", filename, filename]
+    if retry_merge:
+        arguments.insert(1, "--retry-merge")
+    run(*arguments)
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    filename = str(tmpdir.join("libx.map"))
+    with open(filename, "w") as f:
+        f.write(MAP)
+    return filename
+
+
+@pytest.mark.skipif(symver.fcntl is None,
+                    reason="advisory locks not supported")
+@pytest.mark.parametrize("retry_merge", [False, True])
+def test_concurrent_updates(map_file, tmpdir, retry_merge):
+    start = multiprocessing.Event()
+    expected = set(["base_fn"])
+    processes = []
+    for i in range(UPDATERS):
+        names = ["fn_{0}_{1}".format(i, k) for k in range(SYMBOLS)]
+        expected.update(names)
+        symbols = str(tmpdir.join("symbols_{0}".format(i)))
+        with open(symbols, "w") as f:
+            f.write(" ".join(names) + "\n")
+        process = multiprocessing.Process(
+            target=updater, args=(start, map_file, symbols, retry_merge))
+        process.start()
+        processes.append(process)
+
+    start.set()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * UPDATERS
+
+    # No addition was lost
+    assert get_symbols(map_file) == expected
+    assert get_symbols(map_file + ".old") < expected
+
+
+def test_retry_merge(map_file, tmpdir, monkeypatch, capsys):
+    symbols = str(tmpdir.join("symbols"))
+    with open(symbols, "w") as f:
+        f.write("new_fn\n")
+
+    lock_map_file = symver.lock_map_file
+
+    # Another update is written while this one is being computed
+    @contextmanager
+    def concurrent_update(filename):
+        with open(filename, "a") as f:
+            f.write("\nLIBX_1_1\n{\n    global:\n        other_fn;\n}"
+                    " LIBX_1_0;\n")
+        with lock_map_file(filename):
+            yield
+
+    monkeypatch.setattr(symver, "lock_map_file", concurrent_update)
+    run("update", "--retry-merge", "-a", "-i", symbols, "-o", map_file,
+        map_file)
+    assert get_symbols(map_file) == set(["base_fn", "new_fn", "other_fn"])
+
+    # The report of the update applied is printed once
+    out = capsys.readouterr().out
+    assert out.count("Added:\n    new_fn\n") == 1
+
+
+def test_lock_map_file(map_file, tmpdir):
+    # The lock is taken again on the file replacing the locked one
+    with symver.lock_map_file(map_file):
+        symver.atomic_write(map_file, MAP)
+    with symver.lock_map_file(map_file):
+        pass
+
+    with pytest.raises(Exception):
+        with symver.lock_map_file(str(tmpdir.join("missing.map"))):
+            pass
+
+
+def test_write_map_symlink(map_file, tmpdir):
+    link = str(tmpdir.join("link.map"))
+    os.symlink(map_file, link)
+    m = symver.Map(filename=link)
+    symver.write_map(m, "updated", link)
+    # The link is kept, and the file it points to is replaced
+    assert os.path.islink(link)
+    assert get_symbols(map_file) == set(["base_fn"])
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lossless representation of map files"""
+
+import difflib
+import os
+
+import pytest
+
+from abimap import symver
+from abimap.cst import Document
+
+NEWEST_FIRST = """\
+# The library map
+# Keep the comments
+
+LIBX_1_1_0
+{
+  global:
+    # Added in 1.1
+    symbol_c;
+} LIBX_1_0_0;
+# Blank lines and comments between the releases are kept
+
+
+LIBX_1_0_0
+{
+    global:
+        symbol_a;
+        symbol_b;
+    local:
+        *;
+} ;
+# The end
+"""
+
+OLDEST_FIRST = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_a;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0
+{
+    global:
+        symbol_b;
+} LIBX_1_0_0;
+"""
+
+
+def read(content, tmpdir):
+    filename = os.path.join(str(tmpdir), "lib.map")
+    with open(filename, "w") as f:
+        f.write(content)
+    m = symver.Map(filename=filename, keep_lines=True)
+    return m, Document(m)
+
+
+def changes(before, after):
+    return [line for line in difflib.ndiff(before.splitlines(True),
+                                           after.splitlines(True))
+            if line[0] in "+-"]
+
+
+def run(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    args.func(args)
+
+
+def test_unchanged(tmpdir):
+    for content in (NEWEST_FIRST, OLDEST_FIRST, OLDEST_FIRST.rstrip("\n")):
+        m, document = read(content, tmpdir)
+        assert document.render(m) == content
+
+
+def test_append_symbols(tmpdir):
+    m, document = read(NEWEST_FIRST, tmpdir)
+    m.bulk_add_symbols("LIBX_1_1_0", ["symbol_e", "symbol_d"])
+    m.bulk_add_symbols("LIBX_1_0_0", ["hidden"], "local")
+    rendered = document.render(m)
+    assert changes(NEWEST_FIRST, rendered) == [
+        "+     symbol_e;\n", "+     symbol_d;\n", "+         hidden;\n"]
+    assert "    symbol_c;\n    symbol_e;\n    symbol_d;\n} LIBX_1_0_0;" \
+        in rendered
+    assert "        *;\n        hidden;\n} ;" in rendered
+
+
+def test_new_scope_and_released(tmpdir):
+    m, document = read(OLDEST_FIRST, tmpdir)
+    m.bulk_add_symbols("LIBX_1_1_0", ["hidden"], "local")
+    m.mark_released("LIBX_1_1_0")
+    rendered = document.render(m)
+    assert changes(OLDEST_FIRST, rendered) == [
+        "- LIBX_1_1_0\n", "+ LIBX_1_1_0    # Released\n",
+        "+     local:\n", "+         hidden;\n"]
+
+    # The marker is removed
+    m, document = read(rendered, tmpdir)
+    m.releases[1].released = False
+    assert changes(rendered, document.render(m)) == [
+        "- LIBX_1_1_0    # Released\n", "+ LIBX_1_1_0\n"]
+
+
+def test_new_release(tmpdir):
+    m, document = read(NEWEST_FIRST, tmpdir)
+    r = m.add_release("LIBX_1_2_0", "LIBX_1_1_0")
+    m.bulk_add_symbols(r, ["symbol_d"])
+    rendered = document.render(m)
+    assert rendered.startswith(
+        "# The library map\n# Keep the comments\n\nLIBX_1_2_0\n")
+    assert rendered.endswith(NEWEST_FIRST[NEWEST_FIRST.index("LIBX_1_1_0"):])
+
+    m, document = read(OLDEST_FIRST, tmpdir)
+    r = m.add_release("LIBX_1_2_0", "LIBX_1_1_0")
+    m.bulk_add_symbols(r, ["symbol_c"])
+    rendered = document.render(m)
+    assert rendered == OLDEST_FIRST + "\n" + str(r)
+
+    # The releases are checked as usual
+    m = symver.Map()
+    m.parse(rendered.splitlines(True))
+    m.check()
+    assert m.releases[2].name == "LIBX_1_2_0"
+
+
+def test_regenerated(tmpdir):
+    m, document = read(NEWEST_FIRST, tmpdir)
+    m.remove_symbols(["symbol_a"])
+    rendered = document.render(m)
+    assert NEWEST_FIRST[:NEWEST_FIRST.index("LIBX_1_0_0\n")] in rendered
+    assert rendered.endswith(str(m.releases[1]) + "# The end\n")
+
+    m, document = read(NEWEST_FIRST, tmpdir)
+    del m.releases[0]
+    rendered = document.render(m)
+    assert "LIBX_1_1_0" not in rendered
+    assert "# The library map" in rendered
+
+
+def test_errors(tmpdir):
+    m, document = read(OLDEST_FIRST, tmpdir)
+    m.lines = []
+    with pytest.raises(Exception) as e:
+        Document(m)
+    assert "keep_lines" in str(e.value)
+
+    m, document = read(OLDEST_FIRST, tmpdir)
+    m.releases[1].span = (4, 10)
+    with pytest.raises(Exception) as e:
+        Document(m)
+    assert "shares a line" in str(e.value)
+
+
+def test_update_command(tmpdir, capsys):
+    directory = str(tmpdir)
+    map_file = os.path.join(directory, "lib.map")
+    with open(map_file, "w") as f:
+        f.write(NEWEST_FIRST)
+    symbols = os.path.join(directory, "symbols")
+    with open(symbols, "w") as f:
+        f.write("symbol_new\n")
+    out = os.path.join(directory, "out.map")
+
+    run("update", "--preserve-layout", "--add", "-i", symbols, "-o", out,
+        map_file)
+    with open(out) as f:
+        content = f.read()
+    index = NEWEST_FIRST.index("LIBX_1_1_0")
+    assert content == "".join([
+        NEWEST_FIRST[:index], "LIBX_1_2_0\n{\n    global:\n",
+        "        symbol_new;\n} LIBX_1_1_0;\n\n", NEWEST_FIRST[index:]])
+
+    # Merging the releases does not preserve the layout
+    with open(symbols, "w") as f:
+        f.write("symbol_a\n")
+    run("update", "--preserve-layout", "--allow-abi-break", "-i", symbols,
+        "-o", out, map_file)
+    with open(out) as f:
+        content = f.read()
+    assert content.startswith("# This map file was updated with")
+    assert "# Keep the comments" not in content
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the depfile and stamp options"""
+
+import os
+
+import pytest
+
+from abimap import symver
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+    local:
+        *;
+} ;
+"""
+
+
+@pytest.fixture
+def files(tmpdir):
+    directory = str(tmpdir)
+    map_file = os.path.join(directory, "lib x.map")
+    with open(map_file, "w") as f:
+        f.write(BASE)
+    symbols = os.path.join(directory, "symbols")
+    with open(symbols, "w") as f:
+        f.write("symbol\nother\n")
+    return directory, map_file, symbols
+
+
+def run(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    args.func(args)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_update(files):
+    directory, map_file, symbols = files
+    out = os.path.join(directory, "out.map")
+    depfile = os.path.join(directory, "out.d")
+    stamp = os.path.join(directory, "stamp")
+
+    run("update", "-i", symbols, "-o", out, "--depfile", depfile, "--stamp",
+        stamp, map_file)
+
+    assert os.path.isfile(stamp)
+    assert read(depfile) == "{0}: \\\n  {1} \\\n  {2}\n".format(
+        stamp, map_file.replace(" ", "\\ "), symbols)
+
+
+def test_new_target_is_output(files):
+    directory, _, symbols = files
+    out = os.path.join(directory, "new.map")
+    depfile = os.path.join(directory, "new.d")
+
+    run("new", "-r", "LIBY_1_0_0", "-i", symbols, "-o", out, "--depfile",
+        depfile)
+
+    assert read(depfile) == "{0}: \\\n  {1}\n".format(out, symbols)
+
+
+def test_check(files):
+    directory, map_file, _ = files
+    depfile = os.path.join(directory, "check.d")
+    stamp = os.path.join(directory, "check.stamp")
+
+    run("check", "--depfile", depfile, "--stamp", stamp, map_file)
+    assert os.path.isfile(stamp)
+    assert read(depfile) == "{0}: \\\n  {1}\n".format(
+        stamp, map_file.replace(" ", "\\ "))
+
+
+def test_depfile_without_target(files):
+    directory, map_file, _ = files
+    depfile = os.path.join(directory, "check.d")
+
+    with pytest.raises(Exception) as e:
+        run("check", "--depfile", depfile, map_file)
+    assert "--stamp" in str(e.value)
+    assert not os.path.exists(depfile)
+
+
+def test_stamp_not_touched_on_failure(files):
+    directory, map_file, symbols = files
+    stamp = os.path.join(directory, "stamp")
+    with open(map_file, "w") as f:
+        f.write("{\n")
+
+    with pytest.raises(Exception):
+        run("check", "--stamp", stamp, map_file)
+    assert not os.path.exists(stamp)
+
+    with pytest.raises(Exception):
+        run("update", "-i", symbols, "--stamp", stamp, map_file)
+    assert not os.path.exists(stamp)
+
+
+def test_dry_run(files):
+    directory, map_file, symbols = files
+    stamp = os.path.join(directory, "stamp")
+
+    run("update", "-d", "-i", symbols, "--stamp", stamp, map_file)
+    assert not os.path.exists(stamp)
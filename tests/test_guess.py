@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for guessing release names in large maps"""
+
+import pytest
+
+from abimap import symver
+
+
+def build(releases, newest_first):
+    m = symver.Map()
+    previous = ""
+    for i in range(releases):
+        r = symver.Release()
+        r.name = "LIBX_1_{0}_0".format(i)
+        r.previous = previous
+        m.releases.append(r)
+        previous = r.name
+    if newest_first:
+        m.releases.reverse()
+    m.init = True
+    return m
+
+
+@pytest.mark.parametrize("newest_first", [False, True])
+def test_long_chain(newest_first):
+    m = build(5000, newest_first)
+    deps = m.dependencies()
+    assert len(deps) == 1
+    assert deps[0] == ["LIBX_1_{0}_0".format(i) for i in
+                       reversed(range(5000))]
+    assert m.guess_name(None, guess=True) == "LIBX_1_5000_0"
+
+
+def test_branches():
+    m = symver.Map()
+    for name, previous in (("A_1_0", ""), ("B_1_0", "A_1_0"),
+                           ("C_1_0", "A_1_0"), ("D_1_0", "B_1_0"),
+                           ("E_1_0", "")):
+        r = symver.Release()
+        r.name = name
+        r.previous = previous
+        m.releases.append(r)
+
+    assert m.dependencies() == [["C_1_0", "A_1_0"],
+                                ["D_1_0", "B_1_0", "A_1_0"],
+                                ["E_1_0"]]
+
+    m.releases[0].previous = "D_1_0"
+    with pytest.raises(Exception) as e:
+        m.dependencies()
+    assert "Circular dependency detected" in str(e.value)
+
+
+def test_cached_results_not_shared():
+    info = symver.get_info_from_release_string("LIBX_1_2_3")
+    info[1] = "CHANGED"
+    info[3].append(4)
+    assert symver.get_info_from_release_string("LIBX_1_2_3") == \
+        ["LIBX_1_2_3", "LIBX", "_1_2_3", [1, 2, 3]]
+
+    version = symver.get_version_from_string("1.2")
+    version.append(3)
+    assert symver.get_version_from_string("1.2") == [1, 2]
+
+
+def test_warnings_repeated(caplog):
+    for _ in range(2):
+        caplog.clear()
+        assert symver.get_info_from_release_string("1.2") is None
+        assert "not well formed" in caplog.text
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for history command"""
+
+import os
+import subprocess
+
+import pytest
+
+from abimap import symver
+from abimap.history import History
+
+V1 = """\
+LIBX_1_0_0
+{
+    global:
+        a;
+        b;
+    local:
+        *;
+} ;
+"""
+
+V2 = V1 + """
+LIBX_1_1_0
+{
+    global:
+        c;
+} LIBX_1_0_0;
+"""
+
+# The symbol b is removed, breaking the ABI
+V3 = """\
+LIBX_2_0_0
+{
+    global:
+        a;
+        c;
+    local:
+        *;
+} LIBX_1_1_0;
+""" + V2.replace("        b;\n", "")
+
+# The symbol b is added back
+V4 = V3.replace("        c;\n    local:",
+                "        c;\n        b;\n    local:", 1)
+
+
+def write(directory, name, content):
+    path = os.path.join(str(directory), name)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+@pytest.fixture
+def revisions(tmpdir):
+    directory = tmpdir.mkdir("revisions")
+    for i, content in enumerate((V1, V2, V2, V3, V4)):
+        write(directory, "{0:02d}.map".format(i), content)
+    return str(directory)
+
+
+def name(revisions, i):
+    return os.path.join(revisions, "{0:02d}.map".format(i))
+
+
+def test_symbol_history(tmpdir, revisions):
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        assert h.ingest_files([revisions]) == 5
+
+        assert h.symbol_history("c") == [
+            ("c", "LIBX_1_1_0", "global", name(revisions, 1),
+             name(revisions, 4)),
+            ("c", "LIBX_2_0_0", "global", name(revisions, 3),
+             name(revisions, 4))]
+
+        # Removed and added back in another release
+        assert h.symbol_history("b") == [
+            ("b", "LIBX_1_0_0", "global", name(revisions, 0),
+             name(revisions, 2)),
+            ("b", "LIBX_2_0_0", "global", name(revisions, 4),
+             name(revisions, 4))]
+
+        # Including the local wildcards
+        assert len(h.symbol_history("*")) == 8
+
+
+def test_incremental(tmpdir, revisions):
+    db = os.path.join(str(tmpdir), "h.db")
+    files = sorted(os.listdir(revisions))
+
+    with History(db) as h:
+        assert h.ingest_files([os.path.join(revisions, f) for f in
+                               files[:2]]) == 2
+    with History(db) as h:
+        assert h.ingest_files([revisions]) == 3
+        assert h.ingest_files([revisions]) == 0
+        incremental = h.symbol_history("*")
+
+    with History(os.path.join(str(tmpdir), "full.db")) as h:
+        h.ingest_files([revisions])
+        assert h.symbol_history("*") == incremental
+
+
+def test_releases_and_bumps(tmpdir, revisions):
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        h.ingest_files([revisions])
+
+        assert [row[0] for row in h.release_history()] == [
+            "LIBX_1_0_0", "LIBX_1_1_0", "LIBX_2_0_0"]
+        assert h.bumps() == [(name(revisions, 3), "LIBX_1_1_0",
+                              "LIBX_2_0_0")]
+
+
+def test_bump_by_abi_break(tmpdir):
+    directory = tmpdir.mkdir("revisions")
+    paths = [os.path.join(str(directory), "r{0}.map".format(i)) for i in
+             range(1, 4)]
+    parser = symver.get_arg_parser()
+
+    def run(*argv):
+        args = parser.parse_args(list(argv))
+        args.program = "abimap"
+        args.func(args)
+
+    run("new", "--quiet", "-r", "LIBX_1_0_0", "-i",
+        write(tmpdir, "s1", "a\nb\n"), "-o", paths[0])
+    run("update", "--quiet", "-i", write(tmpdir, "s2", "a\nb\nc\n"), "-o",
+        paths[1], paths[0])
+    # The release created by the ABI break has no predecessor
+    run("update", "--quiet", "--allow-abi-break", "-i",
+        write(tmpdir, "s3", "a\nc\n"), "-o", paths[2], paths[1])
+
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        assert h.ingest_files(paths) == 3
+        assert h.bumps() == [(paths[2], "LIBX_1_1_0", "LIBX_2_0_0")]
+
+
+def test_bumps_unversioned_release(tmpdir):
+    directory = tmpdir.mkdir("revisions")
+    unversioned = "LIBX\n{\n    global:\n        x;\n} ;\n\n"
+    paths = [write(directory, "{0:02d}.map".format(i), content) for i, content
+             in enumerate((unversioned + V1, unversioned + V2,
+                           unversioned + V3))]
+
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        assert h.ingest_files([str(directory)]) == 3
+        assert h.bumps() == [(paths[2], "LIBX_1_1_0", "LIBX_2_0_0")]
+
+
+def test_invalid_revision_skipped(tmpdir, revisions):
+    write(revisions, "99.map", "{\n")
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        assert h.ingest_files([revisions]) == 5
+        assert name(revisions, 99) not in h.revisions()
+
+
+def git(repository, *args):
+    subprocess.check_call(["git", "-C", repository, "-c", "user.name=test",
+                           "-c", "user.email=test@example.com"] + list(args),
+                          stdout=subprocess.PIPE)
+
+
+def test_git_history(tmpdir):
+    repository = str(tmpdir.mkdir("repo"))
+    try:
+        git(repository, "init", "-q")
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("git is not available")
+
+    for content in (V1, V2, V3):
+        write(repository, "lib.map", content)
+        git(repository, "add", "lib.map")
+        git(repository, "commit", "-q", "-m", "update")
+
+    with History(os.path.join(str(tmpdir), "h.db")) as h:
+        assert h.ingest_git(repository, "lib.map") == 3
+        commits = h.revisions()
+        assert h.symbol_history("b")[0][3:] == (commits[0], commits[1])
+
+        write(repository, "lib.map", V4)
+        git(repository, "commit", "-q", "-a", "-m", "update")
+        assert h.ingest_git(repository, "lib.map") == 1
+
+
+def test_history_command(tmpdir, revisions, capsys):
+    db = os.path.join(str(tmpdir), "h.db")
+    args = symver.get_arg_parser().parse_args(["history", "--symbol", "c",
+                                               "--bumps", db, revisions])
+    args.func(args)
+
+    out, _ = capsys.readouterr()
+    assert out.splitlines() == [
+        "c LIBX_1_1_0 global first: {0} last: {1}".format(
+            name(revisions, 1), name(revisions, 4)),
+        "c LIBX_2_0_0 global first: {0} last: {1}".format(
+            name(revisions, 3), name(revisions, 4)),
+        "{0}: LIBX_1_1_0 -> LIBX_2_0_0".format(name(revisions, 3))]
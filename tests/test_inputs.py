@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for reading the symbols from the output of nm and readelf"""
+
+import os
+
+import pytest
+
+from abimap import inputs
+from abimap import symver
+
+NM = """\
+0000000000000000 A LIBX_1_0
+                 w _ITM_deregisterTMCloneTable
+                 w __cxa_finalize@GLIBC_2.2.5
+0000000000004010 D exported_data@@LIBX_1_0
+000000000000112a T exported_fn@@LIBX_1_0
+0000000000000000 B exported_tls@@LIBX_1_0
+0000000000001100 t local_fn
+                 U putchar@GLIBC_2.2.5
+000000000000111f W weak_fn@@LIBX_1_0
+"""
+
+NM_POSIX = """\
+libx.so:
+LIBX_1_0 A 0 \n\
+_ITM_deregisterTMCloneTable w         \n\
+__cxa_finalize@GLIBC_2.2.5 w         \n\
+exported_data@@LIBX_1_0 D 4010 4
+exported_fn@@LIBX_1_0 T 112a 27
+exported_tls@@LIBX_1_0 B 0 4
+putchar@GLIBC_2.2.5 U         \n\
+weak_fn@@LIBX_1_0 W 111f b
+"""
+
+READELF = """\
+
+Symbol table '.dynsym' contains 12 entries:
+   Num:    Value          Size Type    Bind   Vis      Ndx Name
+     0: 0000000000000000     0 NOTYPE  LOCAL  DEFAULT  UND \n\
+     1: 0000000000000000     0 FUNC    GLOBAL DEFAULT  UND putchar@GLIBC_2.2.5 (3)
+     2: 0000000000000000     0 NOTYPE  WEAK   DEFAULT  UND __gmon_start__
+     3: 0000000000004010     4 OBJECT  GLOBAL DEFAULT   23 exported_data@@LIBX_1_0
+     4: 0000000000000000     0 OBJECT  GLOBAL DEFAULT  ABS LIBX_1_0
+     5: 000000000000112a    39 FUNC    GLOBAL DEFAULT   13 exported_fn@@LIBX_1_0
+     6: 000000000000111f    11 FUNC    WEAK   DEFAULT   13 weak_fn@@LIBX_1_0
+     7: 0000000000000000     4 TLS     GLOBAL DEFAULT   17 exported_tls@@LIBX_1_0
+     8: 0000000000001130     8 FUNC    GLOBAL HIDDEN    13 hidden_fn
+     9: 0000000000001140     8 FUNC    GLOBAL DEFAULT [VARIANT_PCS]    13 vector_fn
+    10: 0000000000004014     0 NOTYPE  GLOBAL DEFAULT   23 _edata
+"""
+
+ALL = ["exported_data", "exported_fn", "exported_tls", "weak_fn"]
+
+
+def test_formats():
+    for fmt, content in (("nm", NM), ("nm-posix", NM_POSIX)):
+        lines = content.splitlines(True)
+        assert sorted(symver.get_symbols_from_lines(lines, fmt)) == ALL
+        assert sorted(symver.get_symbols_from_lines(lines, fmt,
+                                                    ["func"])) == \
+            ["exported_fn", "weak_fn"]
+        assert symver.get_symbols_from_lines(lines, fmt, ["other"]) == \
+            ["LIBX_1_0"]
+
+    lines = READELF.splitlines(True)
+    assert sorted(symver.get_symbols_from_lines(lines, "readelf")) == \
+        sorted(ALL + ["vector_fn"])
+    assert symver.get_symbols_from_lines(lines, "readelf", ["tls"]) == \
+        ["exported_tls"]
+    assert symver.get_symbols_from_lines(lines, "readelf", ["other"]) == \
+        ["LIBX_1_0", "_edata"]
+
+    # The version nodes named as their version are skipped
+    lines = ["0000000000000000 A LIBX_1_0@@LIBX_1_0\n"]
+    assert symver.get_symbols_from_lines(lines, "nm", ["other"]) == []
+
+
+def test_plain():
+    lines = ["symbol_a symbol_b\n", "\n", "symbol_c\n"]
+    assert symver.get_symbols_from_lines(lines) == \
+        ["symbol_a", "symbol_b", "symbol_c"]
+    assert symver.get_symbols_from_lines(iter(lines), "plain", ["func"]) == \
+        ["symbol_a", "symbol_b", "symbol_c"]
+
+
+def test_truncated(caplog):
+    line = "     1: 0000000000001139    11 FUNC    GLOBAL DEFAULT   13" \
+           " a_very_long_name_which_[...]\n"
+    assert symver.get_symbols_from_lines([line], "readelf") == []
+    assert "run it with -W" in caplog.text
+
+
+def test_errors():
+    with pytest.raises(Exception) as e:
+        list(inputs.iter_symbols(NM.splitlines(), "nm", ["function"]))
+    assert "Unknown symbol type \'function\'" in str(e.value)
+
+    with pytest.raises(Exception) as e:
+        inputs.iter_symbols(NM.splitlines(), "objdump")
+    assert "Unknown input format \'objdump\'" in str(e.value)
+
+
+def test_new_command(tmpdir, capsys):
+    directory = str(tmpdir)
+    symbols = os.path.join(directory, "symbols")
+    with open(symbols, "w") as f:
+        f.write(READELF)
+    out = os.path.join(directory, "new.map")
+
+    args = symver.get_arg_parser().parse_args([
+        "new", "--input-format", "readelf", "--symbol-types", "func,tls",
+        "-r", "LIBY_1_0_0", "-i", symbols, "-o", out])
+    args.program = "abimap"
+    args.func(args)
+
+    m = symver.Map(filename=out)
+    assert sorted(m.releases[0].symbols["global"]) == [
+        "exported_fn", "exported_tls", "vector_fn", "weak_fn"]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lazy parsing of the release bodies"""
+
+import glob
+import os
+
+import pytest
+
+from abimap import symver
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_b;
+        symbol_a;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0    # Released
+{
+    global:
+        symbol_c; # A comment
+} LIBX_1_0_0;
+
+LIBX_1_2_0 {
+    global:
+        symbol_d;
+}
+LIBX_1_1_0
+;
+"""
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    name = os.path.join(str(tmpdir), "lib.map")
+    with open(name, "w") as f:
+        f.write(BASE)
+    return name
+
+
+def parse(path, lazy):
+    m = symver.Map(lazy=lazy)
+    m.filename = path
+    with open(path) as f:
+        lines = f.readlines()
+    try:
+        m.parse(lines)
+        # Access the symbols to raise the errors of lazy maps
+        return ([(r.name, r.previous, r.released, r.span) for r in
+                 m.releases], [r.symbols for r in m.releases])
+    except symver.ParserError as e:
+        return str(e)
+
+
+def test_symbols_not_loaded(map_file):
+    m = symver.Map(filename=map_file, lazy=True)
+    assert m.init
+    assert not any(release.is_loaded() for release in m.releases)
+
+    assert m.guess_latest_release()[0] == "LIBX_1_2_0"
+    assert m.guess_name(None, guess=True) == "LIBX_1_3_0"
+    assert [(r.name, r.previous, r.released) for r in m.releases] == [
+        ("LIBX_1_0_0", "", False), ("LIBX_1_1_0", "LIBX_1_0_0", True),
+        ("LIBX_1_2_0", "LIBX_1_1_0", False)]
+    assert not any(release.is_loaded() for release in m.releases)
+
+    assert m.releases[1].symbols == {"global": ["symbol_c"]}
+    assert m.releases[1].is_loaded()
+    assert not m.releases[0].is_loaded()
+
+
+def test_same_as_eager(map_file):
+    expected = symver.Map(filename=map_file)
+    m = symver.Map(filename=map_file, lazy=True)
+    assert str(m) == str(expected)
+    assert [r.span for r in m.releases] == [r.span for r in
+                                            expected.releases]
+
+    m = symver.Map(filename=map_file, lazy=True, compact=True)
+    assert str(m) == str(expected)
+    assert m.releases[0].symbols["global"] == ("symbol_a", "symbol_b")
+
+
+def test_data_maps():
+    pattern = os.path.join(os.path.dirname(__file__), "data_template", "*",
+                           "*.map")
+    paths = glob.glob(pattern)
+    assert paths
+    for path in paths:
+        assert parse(path, True) == parse(path, False), path
+
+
+def test_errors_raised_on_access(map_file):
+    with open(map_file, "w") as f:
+        f.write(BASE.replace("symbol_d;", "symbol_d"))
+
+    m = symver.Map(filename=map_file, lazy=True)
+    assert m.guess_latest_release()[0] == "LIBX_1_2_0"
+    with pytest.raises(symver.ParserError) as e:
+        m.releases[2].symbols
+    assert e.value.line == 18
+    assert e.value.context == "}\n"
+    assert "Missing \';\' or \':\' after \'symbol_d\'" in str(e.value)
+
+
+def test_structure_errors_raised_on_read(map_file):
+    with open(map_file, "w") as f:
+        f.write(BASE.replace("LIBX_1_2_0 {", "LIBX_1_2_0"))
+
+    with pytest.raises(symver.ParserError) as e:
+        symver.Map(filename=map_file, lazy=True)
+    assert "Missing \'{\'" in str(e.value)
+
+
+def test_reparse(map_file):
+    m = symver.Map(lazy=True)
+    m.parse(BASE.splitlines(True))
+    modified = BASE.replace("symbol_c;", "symbol_c;\n        symbol_e;")
+    m.reparse(modified.splitlines(True))
+
+    expected = symver.Map()
+    expected.parse(modified.splitlines(True))
+    assert str(m) == str(expected)
+
+
+def test_copy(map_file):
+    m = symver.Map(filename=map_file, lazy=True, compact=True)
+    copy = m.copy()
+    assert not any(release.is_loaded() for release in copy.releases)
+
+    # The copy loads its own symbols, which can be modified
+    copy.releases[0].symbols["global"].append("symbol_e")
+    assert not m.releases[0].is_loaded()
+    assert m.releases[0].symbols["global"] == ("symbol_a", "symbol_b")
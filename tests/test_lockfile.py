@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lockfiles recording the digests of the releases"""
+
+import json
+
+import pytest
+
+from abimap import lockfile
+from abimap import symver
+from abimap.lockfile import Lock_Error
+
+MAP = """\
+LIBX_2_0
+{
+    global:
+        new_fn;
+} LIBX_1_0;
+
+LIBX_1_0    # Released
+{
+    global:
+        old_fn;
+        other_fn;
+    local:
+        *;
+} ;
+"""
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    filename = str(tmpdir.join("libx.map"))
+    with open(filename, "w") as f:
+        f.write(MAP)
+    return filename
+
+
+def get_release(content, name):
+    m = symver.Map()
+    m.parse(content.splitlines(True))
+    return [r for r in m.releases if r.name == name][0]
+
+
+def test_release_digest():
+    digest = lockfile.release_digest(get_release(MAP, "LIBX_1_0"))
+
+    # The layout and the order of the symbols do not change the digest
+    content = MAP.replace("        old_fn;\n        other_fn;\n",
+                          "        other_fn;\n\n        old_fn;\n")
+    assert lockfile.release_digest(get_release(content, "LIBX_1_0")) == \
+        digest
+
+    for content in (MAP.replace("other_fn", "another_fn"),
+                    MAP.replace("    # Released", ""),
+                    MAP.replace("    local:\n        *;\n", "")):
+        assert lockfile.release_digest(get_release(content, "LIBX_1_0")) != \
+            digest
+
+
+def test_get_lock(map_file):
+    lock = lockfile.get_lock(map_file)
+    assert sorted(lock) == ["content", "releases", "version"]
+    assert sorted(lock["releases"]) == ["LIBX_1_0", "LIBX_2_0"]
+    assert lock["releases"]["LIBX_1_0"]["released"]
+    assert not lock["releases"]["LIBX_2_0"]["released"]
+
+    # A change in a release changes only its own entry
+    with open(map_file, "w") as f:
+        f.write(MAP.replace("new_fn", "newer_fn"))
+    changed = lockfile.get_lock(map_file)
+    assert changed["releases"]["LIBX_1_0"] == lock["releases"]["LIBX_1_0"]
+    assert changed["releases"]["LIBX_2_0"] != lock["releases"]["LIBX_2_0"]
+
+
+def test_verify_digests(map_file):
+    lock = lockfile.get_lock(map_file)
+    entry = lock["releases"]["LIBX_1_0"]
+    text = entry["text"]
+    moved = MAP.replace("        old_fn;\n        other_fn;",
+                        "        other_fn;\n        old_fn;")
+
+    # The lines changed, but not the digest: the release is not altered
+    assert lockfile.verify(map_file, lock, moved) == ([], [])
+
+    # A release is altered only if both the lines and the digest changed
+    entry["digest"] = "0" * 64
+    assert lockfile.verify(map_file, lock, moved) == (["LIBX_1_0"], [])
+    entry["text"] = lockfile._span_digest(moved.splitlines(True),
+                                          get_release(moved, "LIBX_1_0"))
+    assert lockfile.verify(map_file, lock, moved) == ([], [])
+
+    # Lines which did not change are not parsed again
+    entry["text"] = text
+    assert lockfile.verify(map_file, lock, MAP + "\n") == ([], [])
+
+
+def test_verify(map_file):
+    lock = lockfile.write_lock(map_file)
+    with open(map_file + ".lock") as f:
+        assert json.load(f) == lock
+
+    assert lockfile.verify(map_file, lock) == ([], [])
+    assert lockfile.check_lock(map_file)
+
+    # The releases not released yet can be modified
+    with open(map_file, "w") as f:
+        f.write(MAP.replace("new_fn;", "new_fn;\n        added_fn;"))
+    assert lockfile.verify(map_file, lock) == ([], [])
+
+    # Only the layout of a released release changed
+    with open(map_file, "w") as f:
+        f.write(MAP.replace("LIBX_1_0    # Released\n{",
+                            "LIBX_1_0 # Released\n{ # A comment"))
+    assert lockfile.verify(map_file, lock) == ([], [])
+
+    with open(map_file, "w") as f:
+        f.write(MAP.replace("other_fn", "another_fn"))
+    assert lockfile.verify(map_file, lock) == (["LIBX_1_0"], [])
+    with pytest.raises(Lock_Error) as e:
+        lockfile.check_lock(map_file)
+    assert e.value.altered == ["LIBX_1_0"]
+    assert "modified: LIBX_1_0" in str(e.value)
+
+    with open(map_file, "w") as f:
+        f.write(MAP.split("\n\n")[0].replace(" LIBX_1_0;", " ;") + "\n")
+    assert lockfile.verify(map_file, lock) == ([], ["LIBX_1_0"])
+
+
+def test_verify_unchanged(map_file):
+    lock = lockfile.get_lock(map_file)
+    # An unchanged map is not parsed
+    lock["releases"]["LIBX_1_0"]["digest"] = "0" * 64
+    lock["releases"]["LIBX_1_0"]["text"] = "0" * 64
+    assert lockfile.verify(map_file, lock) == ([], [])
+
+    # Only the releases whose lines changed are compared
+    lock["content"] = "0" * 64
+    assert lockfile.verify(map_file, lock) == (["LIBX_1_0"], [])
+
+
+def test_read_lock(tmpdir, map_file):
+    assert not lockfile.check_lock(map_file)
+
+    filename = str(tmpdir.join("invalid.lock"))
+    with open(filename, "w") as f:
+        f.write("{")
+    with pytest.raises(Exception) as e:
+        lockfile.read_lock(filename)
+    assert "Invalid lockfile" in str(e.value)
+
+    with open(filename, "w") as f:
+        f.write('{"version": 0}')
+    with pytest.raises(Exception) as e:
+        lockfile.read_lock(filename)
+    assert "Unsupported lockfile" in str(e.value)
+
+
+def run(*arguments):
+    parser = symver.get_arg_parser()
+    args = parser.parse_args(list(arguments))
+    args.program = "abimap"
+    args.func(args)
+
+
+def test_check_command(map_file, tmpdir):
+    run("check", map_file)
+
+    other = str(tmpdir.join("other.lock"))
+    with pytest.raises(Exception) as e:
+        run("check", "--lock", other, map_file)
+    assert "not found" in str(e.value)
+
+    run("check", "--update-lock", "--lock", other, map_file)
+    run("check", "--lock", other, map_file)
+    run("check", "--update-lock", map_file)
+
+    with open(map_file, "w") as f:
+        f.write(MAP.replace("old_fn", "renamed_fn"))
+    with pytest.raises(Lock_Error):
+        run("check", map_file)
+    with pytest.raises(Lock_Error):
+        run("check", "--lock", other, map_file)
+
+
+def test_update_command(map_file, tmpdir):
+    symbols = str(tmpdir.join("symbols"))
+    with open(symbols, "w") as f:
+        f.write("old_fn other_fn new_fn added_fn\n")
+    lockfile.write_lock(map_file)
+
+    run("update", "-a", "-i", symbols, "-o", map_file, map_file)
+    with open(map_file) as f:
+        assert "added_fn;" in f.read()
+    # The lockfile was updated with the map
+    assert lockfile.verify(map_file, lockfile.read_lock(map_file + ".lock"))\
+        == ([], [])
+    lock = lockfile.read_lock(map_file + ".lock")
+    assert lock == lockfile.get_lock(map_file)
+
+    # A hand-edited released release is refused
+    with open(map_file) as f:
+        content = f.read()
+    with open(map_file, "w") as f:
+        f.write(content.replace("other_fn;", ""))
+    with pytest.raises(Lock_Error):
+        run("update", "-a", "-i", symbols, "-o", map_file, map_file)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the memoization of update results"""
+
+import os
+import time
+
+import pytest
+
+from abimap import memo
+from abimap import symver
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+    local:
+        *;
+} ;
+"""
+
+
+@pytest.fixture
+def files(tmpdir):
+    directory = str(tmpdir)
+    map_file = os.path.join(directory, "lib.map")
+    with open(map_file, "w") as f:
+        f.write(BASE)
+    symbols = os.path.join(directory, "symbols")
+    with open(symbols, "w") as f:
+        f.write("symbol\nother\n")
+    return directory, map_file, symbols
+
+
+def run(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    args.func(args)
+
+
+def test_store(tmpdir):
+    store = memo.Result_Store(str(tmpdir), max_size=250)
+    store.put("aa01", {"output": "x" * 100})
+    store.put("bb02", {"output": "y" * 100})
+    assert store.get("aa01") == {"output": "x" * 100}
+    assert store.get("cc03") is None
+
+    # Make bb02 the least recently used
+    old = time.time() - 100
+    os.utime(os.path.join(str(tmpdir), "bb", "bb02.json"), (old, old))
+    store.put("cc03", {"output": "z" * 100})
+    assert store.get("bb02") is None
+    assert store.get("aa01") is not None
+    assert store.get("cc03") is not None
+
+
+def test_cached_update(files, capsys, monkeypatch):
+    directory, map_file, symbols = files
+    cache = os.path.join(directory, "cache")
+
+    run("update", "--cache-dir", cache, "-i", symbols, map_file)
+    first = capsys.readouterr()
+    assert "Added:\n    other\n" in first.out
+
+    def fail(*args):
+        raise AssertionError("The map should not be parsed")
+
+    monkeypatch.setattr(symver.Map, "parse", fail)
+    run("update", "--cache-dir", cache, "-i", symbols, map_file)
+    second = capsys.readouterr()
+    assert second.out == first.out
+
+
+def test_cached_update_output(files):
+    directory, map_file, symbols = files
+    cache = os.path.join(directory, "cache")
+    out = os.path.join(directory, "out.map")
+    expected = os.path.join(directory, "expected.map")
+
+    run("update", "--no-cache", "-i", symbols, "-o", expected, map_file)
+    for _ in range(2):
+        run("update", "--cache-dir", cache, "-i", symbols, "-o", out,
+            map_file)
+        with open(out) as f, open(expected) as g:
+            assert f.read() == g.read()
+
+
+def test_cached_diagnostics_replayed(files, caplog, monkeypatch):
+    directory, map_file, symbols = files
+    cache = os.path.join(directory, "cache")
+    with open(map_file, "w") as f:
+        f.write(BASE.replace("    local:\n        *;\n", ""))
+
+    run("update", "--cache-dir", cache, "-i", symbols, map_file)
+    first = [(r.levelname, r.getMessage()) for r in caplog.records]
+    assert ("WARNING", "The \'*\' wildcard was not found") in first
+    caplog.clear()
+
+    monkeypatch.setattr(symver.Map, "parse", None)
+    run("update", "--cache-dir", cache, "-i", symbols, map_file)
+    assert [(r.levelname, r.getMessage()) for r in caplog.records] == first
+
+
+def test_key_depends_on_inputs(files):
+    _, map_file, symbols = files
+    parser = symver.get_arg_parser()
+
+    def key(*argv):
+        args = parser.parse_args(["update"] + list(argv) + [map_file])
+        args.program = "abimap"
+        release_info = symver.get_info_from_args(args)
+        return memo.get_update_key(BASE.encode("utf-8"), ["a", "b"],
+                                   release_info, args)
+
+    assert key() == key()
+    assert key() != key("--final")
+    assert key() != key("-r", "LIBX_1_1_0")
+
+    args = parser.parse_args(["update", map_file])
+    args.program = "abimap"
+    assert memo.get_update_key(b"", ["b", "a", "a"], None, args) == \
+        memo.get_update_key(b"", ["a", "b"], None, args)
+    assert memo.get_update_key(b"", ["a"], None, args) != \
+        memo.get_update_key(b" ", ["a"], None, args)
+
+
+def test_failures_not_cached(files):
+    directory, map_file, symbols = files
+    cache = os.path.join(directory, "cache")
+    with open(symbols, "w") as f:
+        f.write("other\n")
+
+    for _ in range(2):
+        with pytest.raises(Exception) as e:
+            run("update", "--cache-dir", cache, "-i", symbols, map_file)
+        assert "ABI break detected" in str(e.value)
+    assert not any(names for _, _, names in os.walk(cache))
+
+
+def test_map_modified_while_reading(files, monkeypatch):
+    directory, map_file, symbols = files
+    cache = os.path.join(directory, "cache")
+    out = os.path.join(directory, "out.map")
+    read_symbols = memo.read_symbols
+
+    # The map is modified after its content was hashed
+    def modify(*args):
+        with open(map_file, "w") as f:
+            f.write(BASE.replace("symbol;", "symbol;\n        modified;"))
+        return read_symbols(*args)
+
+    monkeypatch.setattr(memo, "read_symbols", modify)
+    run("update", "--cache-dir", cache, "-i", symbols, "-o", out, map_file)
+
+    # The result stored is the update of the content hashed
+    with open(out) as f:
+        assert "modified" not in f.read()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for merge command"""
+
+import os
+
+import pytest
+
+from abimap import merge
+from abimap import symver
+
+CORE = """\
+LIBX_1_0_0
+{
+    global:
+        core_b;
+        core_a;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0
+{
+    global:
+        core_c;
+} LIBX_1_0_0;
+"""
+
+NET = """\
+LIBX_1_0_0
+{
+    global:
+        net_a;
+    local:
+        *;
+} ;
+
+LIBX_2_0_0    # Released
+{
+    global:
+        net_b;
+        core_c;
+} LIBX_1_1_0;
+"""
+
+EXPECTED = """\
+LIBX_2_0_0    # Released
+{
+    global:
+        core_c;
+        net_b;
+} LIBX_1_1_0;
+
+LIBX_1_1_0
+{
+    global:
+        core_c;
+} LIBX_1_0_0;
+
+LIBX_1_0_0
+{
+    global:
+        core_a;
+        core_b;
+        net_a;
+    local:
+        *;
+} ;
+
+"""
+
+
+def write(tmpdir, name, content):
+    path = os.path.join(str(tmpdir), name)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+@pytest.fixture
+def fragments(tmpdir):
+    return [write(tmpdir, "core.map", CORE), write(tmpdir, "net.map", NET)]
+
+
+def test_merge(fragments):
+    m, duplicates = merge.merge_maps(fragments, jobs=1)
+    assert str(m) == EXPECTED
+    assert duplicates == [("core_c", [(fragments[0], "LIBX_1_1_0", "global"),
+                                      (fragments[1], "LIBX_2_0_0",
+                                       "global")])]
+
+
+def test_merge_order_independent(fragments):
+    m, _ = merge.merge_maps(list(reversed(fragments)), jobs=1)
+    assert str(m) == EXPECTED
+
+
+def test_merge_parallel(tmpdir):
+    fragments = []
+    for i in range(20):
+        fragments.append(write(tmpdir, "f{0}.map".format(i), """\
+LIBX_1_0_0
+{{
+    global:
+        symbol_{0};
+    local:
+        *;
+}} ;
+""".format(i)))
+
+    serial, _ = merge.merge_maps(fragments, jobs=1)
+    parallel, duplicates = merge.merge_maps(fragments, jobs=2)
+    assert str(parallel) == str(serial)
+    assert len(serial.releases[0].symbols["global"]) == 20
+    assert duplicates == []
+
+
+def test_conflicting_predecessors(tmpdir, fragments):
+    other = write(tmpdir, "other.map", """\
+LIBX_1_1_0
+{
+    global:
+        other;
+} LIBX_0_0_0;
+""")
+    with pytest.raises(Exception) as e:
+        merge.merge_maps(fragments + [other], jobs=1)
+    assert "different predecessors" in str(e.value)
+
+
+def test_missing_predecessor(tmpdir):
+    fragment = write(tmpdir, "lib.map", NET.replace("LIBX_1_1_0",
+                                                    "LIBX_1_5_0"))
+    with pytest.raises(Exception) as e:
+        merge.merge_maps([fragment], jobs=1)
+    assert "\'LIBX_1_5_0\' not found" in str(e.value)
+
+
+def test_invalid_fragment(tmpdir, fragments):
+    bad = write(tmpdir, "bad.map", "{\n")
+    with pytest.raises(Exception) as e:
+        merge.merge_maps(fragments + [bad], jobs=1)
+    assert "Could not parse 1 of 3 fragments" in str(e.value)
+
+
+def test_merge_command(tmpdir, fragments):
+    out = os.path.join(str(tmpdir), "merged.map")
+    args = symver.get_arg_parser().parse_args(["merge", "-j", "1", "-o", out]
+                                              + fragments)
+    args.program = "abimap"
+    args.func(args)
+    with open(out) as f:
+        content = f.read()
+    assert content.endswith(EXPECTED)
+    assert content.startswith("# This map file was merged with")
+
+    args = symver.get_arg_parser().parse_args(["merge", "--strict"] +
+                                              fragments)
+    args.program = "abimap"
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "1 symbols found in more than one fragment" in str(e.value)
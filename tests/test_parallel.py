@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the parallel parser"""
+
+import pytest
+
+from abimap import parallel
+from abimap import symver
+
+
+def generate(releases, symbols):
+    content = []
+    previous = ""
+    for i in range(releases):
+        name = "LIBX_{0}_0_0".format(i)
+        content.append("{0}\n{{\n    global:\n".format(name))
+        content.extend("        symbol_{0}_{1};\n".format(i, j) for j in
+                       range(symbols))
+        if not previous:
+            content.append("    local:\n        *;\n")
+        content.append("}} {0};\n\n".format(previous))
+        previous = name
+    return "".join(content)
+
+
+@pytest.fixture(autouse=True)
+def small_maps(monkeypatch):
+    monkeypatch.setattr(symver, "PARALLEL_MIN_LINES", 1)
+
+
+def parse(content, jobs):
+    m = symver.Map(jobs=jobs)
+    m.parse(content.splitlines(True))
+    return m
+
+
+def assert_same(content):
+    serial = parse(content, None)
+    parallel = parse(content, 2)
+    assert str(parallel) == str(serial)
+    assert [(r.name, r.previous, r.released, r.span) for r in
+            parallel.releases] == [(r.name, r.previous, r.released, r.span)
+                                   for r in serial.releases]
+
+
+def test_scan_boundaries():
+    lines = """\
+LIBX_1_0_0 # {
+{
+    global:
+        a; # }
+} ;
+LIBX_1_1_0 { global: b; } LIBX_1_0_0
+;
+LIBX_1_2_0 { c; } LIBX_1_1_0; LIBX_1_3_0
+{
+} LIBX_1_2_0;
+""".splitlines(True)
+    assert parallel.scan_boundaries(lines) == [5, 7, 10]
+
+
+def test_split_lines():
+    lines = generate(10, 10).splitlines(True)
+    chunks = parallel.split_lines(lines, 4)
+    assert len(chunks) == 4
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(lines)
+    for (_, end), (begin, _) in zip(chunks, chunks[1:]):
+        assert end == begin
+        assert lines[begin - 1].startswith("}")
+
+
+def test_same_as_serial():
+    assert_same(generate(20, 30))
+    assert_same(generate(20, 30).replace("} LIBX_3_0_0;\n",
+                                         "} LIBX_3_0_0;\n# Comment {\n"))
+    assert_same(generate(20, 30).replace("LIBX_5_0_0\n",
+                                         "LIBX_5_0_0    # Released\n"))
+    # An unclosed release at the end
+    assert_same(generate(20, 30) + "LIBX_END_0_0\n{\n    global:\n")
+
+
+def test_duplicates_across_chunks(caplog):
+    content = generate(20, 30).replace("LIBX_15_0_0", "LIBX_1_0_0")
+    assert_same(content)
+    assert any("Duplicated Release identifier \'LIBX_1_0_0\'" in
+               record.getMessage() for record in caplog.records)
+
+
+def test_same_errors_as_serial():
+    content = generate(20, 30).replace("symbol_12_3;", "symbol_12_3")
+    with pytest.raises(symver.ParserError) as serial:
+        parse(content, None)
+    with pytest.raises(symver.ParserError) as parallel:
+        parse(content, 2)
+    assert str(parallel.value) == str(serial.value)
+    assert parallel.value.line == serial.value.line
+
+
+def test_check_command(tmpdir):
+    path = tmpdir.join("lib.map")
+    path.write(generate(20, 30))
+
+    args = symver.get_arg_parser().parse_args(["check", "-j", "2",
+                                               str(path)])
+    args.func(args)
+
+
+def test_fallback_to_serial(monkeypatch):
+    content = generate(20, 30)
+    # Split in the middle of the releases
+    monkeypatch.setattr(parallel, "scan_boundaries",
+                        lambda lines: list(range(5, len(lines), 10)))
+    assert_same(content)
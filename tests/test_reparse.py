@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the incremental parser"""
+
+import random
+
+import pytest
+
+from abimap import symver
+
+
+def random_map(rng, releases):
+    """
+    Generate the lines of a random version script
+
+    :param rng: The random number generator
+    :param releases: The number of releases to generate
+    """
+
+    lines = ["# A random map\n", "\n"]
+    previous = None
+    for i in range(releases):
+        name = "LIBRANDOM_1_{0}_0".format(i)
+        if rng.random() < 0.2:
+            lines.append(name + "    # Released\n")
+        else:
+            lines.append(name + "\n")
+        lines.append("{\n")
+        lines.append("    global:\n")
+        for j in range(rng.randint(0, 6)):
+            lines.append("        symbol_{0}_{1};\n".format(i, j))
+        if previous is None:
+            lines.append("    local:\n")
+            lines.append("        *;\n")
+            lines.append("} ;\n")
+        else:
+            lines.append("} " + previous + ";\n")
+        if rng.random() < 0.3:
+            lines.append("# Between releases\n")
+        lines.append("\n")
+        previous = name
+    return lines
+
+
+def random_edit(rng, lines):
+    """
+    Apply a random edit to the given lines, returning the new lines
+
+    :param rng: The random number generator
+    :param lines: The lines to edit
+    """
+
+    new = list(lines)
+    fragments = ["        new_symbol;\n",
+                 "# comment\n",
+                 "\n",
+                 "    local:\n",
+                 "}\n",
+                 "} LIBRANDOM_1_0_0;\n",
+                 "LIBNEW_2_0_0\n{\n    global:\n        other;\n} ;\n",
+                 "LIBRANDOM_1_1_0\n{\n    global:\n        dup;\n} ;\n",
+                 "invalid-line\n",
+                 "LIBSHARED_1_0 {\n",
+                 "        a; }",
+                 "} ; LIBX_1_0\n"]
+
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.randint(0, 3)
+        position = rng.randint(0, len(new))
+        if kind == 0 or not new:
+            new.insert(position, rng.choice(fragments))
+        elif kind == 1:
+            del new[min(position, len(new) - 1)]
+        elif kind == 2:
+            index = min(position, len(new) - 1)
+            new[index] = new[index].replace("symbol", "changed")
+        else:
+            index = min(position, len(new) - 1)
+            new[index] = rng.choice(fragments)
+    return new
+
+
+def summary(m):
+    return [(r.name, r.previous, r.released, r.span, r.symbols)
+            for r in m.releases]
+
+
+def parse_or_error(m, method, lines):
+    try:
+        method(lines)
+    except symver.ParserError as e:
+        return str(e)
+    return summary(m)
+
+
+def test_reparse_unchanged():
+    lines = random_map(random.Random(0), 5)
+
+    m = symver.Map()
+    m.parse(lines)
+    before = summary(m)
+
+    assert m.reparse(list(lines)) == []
+    assert summary(m) == before
+
+
+def test_reparse_only_changed_release():
+    lines = random_map(random.Random(1), 10)
+
+    m = symver.Map()
+    m.parse(lines)
+    m.check()
+    deps = m.dependencies()
+    untouched = m.releases[0]
+
+    # Add a symbol to the last release
+    index = lines.index("LIBRANDOM_1_9_0\n")
+    lines.insert(index + 3, "        added;\n")
+    parsed = m.reparse(lines)
+
+    assert [r.name for r in parsed] == ["LIBRANDOM_1_9_0"]
+    assert "added" in m.releases[-1].symbols["global"]
+    assert m.releases[0] is untouched
+    assert m._deps_key is not None
+    assert m.dependencies() == deps
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_reparse_differential(seed):
+    rng = random.Random(seed)
+
+    lines = random_map(rng, rng.randint(1, 8))
+    m = symver.Map()
+    m.parse(lines)
+    m.check()
+
+    for _ in range(30):
+        new = random_edit(rng, lines)
+
+        full = symver.Map()
+        expected = parse_or_error(full, full.parse, new)
+        result = parse_or_error(m, m.reparse, new)
+
+        assert result == expected
+
+        if isinstance(expected, str):
+            # Start again from a valid map
+            m = symver.Map()
+            m.parse(lines)
+            continue
+
+        try:
+            assert m.dependencies() == full.dependencies()
+        except Exception as e:
+            with pytest.raises(Exception) as full_e:
+                full.dependencies()
+            assert str(full_e.value) == str(e)
+
+        lines = new
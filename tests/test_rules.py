@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the rules checked by Map.check()"""
+
+import json
+import logging
+import os
+
+import pytest
+
+from abimap import rules
+from abimap import symver
+from abimap import timings
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_a;
+        symbol_a;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0
+{
+    global:
+        symbol_a;
+    other:
+        symbol_b;
+} LIBX_1_0_0;
+"""
+
+
+def parsed(content=BASE, names=None):
+    m = symver.Map(rules=names)
+    m.parse(content.splitlines(True))
+    return m
+
+
+def run(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    args.func(args)
+
+
+class Counting_Rule(rules.Rule):
+    name = "counting"
+
+    def __init__(self):
+        super(Counting_Rule, self).__init__()
+        self.calls = []
+
+    def release(self, release):
+        self.calls.append(release.name)
+
+    def finish(self, m):
+        self.calls.append("finish")
+
+
+class Finish_Rule(rules.Rule):
+    name = "finish-only"
+
+    def __init__(self):
+        super(Finish_Rule, self).__init__()
+        self.finished = False
+
+    def finish(self, m):
+        self.finished = True
+
+
+def test_default_rules(caplog):
+    m = parsed()
+    m.check()
+    assert m.init
+    messages = caplog.text
+    assert "Duplicates found in release \'LIBX_1_0_0\':" in messages
+    assert "LIBX_1_1_0 contains unknown scope named other" in messages
+    assert "is global in" not in messages
+
+
+def test_message_order(caplog):
+    # The duplicates are reported first, as before the checks were rules
+    m = parsed(BASE.replace("LIBX_1_0_0;", "LIBX_1_0_0;\n"
+                            "LIBX_1_2_0\n{\n    global:\n"
+                            "        symbol_c;\n        symbol_c;\n"
+                            "} LIBX_1_1_0;"))
+    caplog.set_level(logging.INFO, logger=m.logger.name)
+    m.check()
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages[:6] == [
+        "Duplicates found in release \'LIBX_1_0_0\':",
+        "    global:",
+        " " * 8 + "symbol_a",
+        "Duplicates found in release \'LIBX_1_2_0\':",
+        "    global:",
+        " " * 8 + "symbol_c"]
+    assert messages[6:9] == [
+        "LIBX_1_0_0 contains the local \'*\' wildcard",
+        "LIBX_1_0_0 seems to be the base version",
+        "LIBX_1_1_0 contains unknown scope named other (different from"
+        " \'global\' and \'local\')"]
+
+
+def test_get_rules():
+    names = [rule.name for rule in rules.get_rules()]
+    assert names == ["duplicates", "wildcard", "base", "scopes",
+                     "dependencies"]
+
+    names = [rule.name for rule in
+             rules.get_rules(["exported-twice", "scopes"], ["scopes"])]
+    assert names == ["exported-twice"]
+
+    names = [rule.name for rule in rules.get_rules(ignore=["duplicates"])]
+    assert "duplicates" not in names
+    assert "wildcard" in names
+
+    with pytest.raises(Exception) as e:
+        rules.get_rules(["missing"])
+    assert "Unknown rule \'missing\'" in str(e.value)
+
+
+def test_selected_rules(caplog):
+    m = parsed(names=["exported-twice"])
+    m.check()
+    messages = caplog.text
+    assert "symbol_a is global in LIBX_1_0_0 and LIBX_1_1_0" in messages
+    assert "Duplicates found" not in messages
+    assert "unknown scope" not in messages
+
+
+def test_single_traversal():
+    m = parsed()
+    counting = Counting_Rule()
+    finish = Finish_Rule()
+    rules.run_rules(m, [counting, finish])
+    assert counting.calls == ["LIBX_1_0_0", "LIBX_1_1_0", "finish"]
+    assert finish.finished
+    assert not rules._overrides(finish, "release")
+    assert not rules._overrides(finish, "scope")
+
+
+def test_register_rule():
+    with pytest.raises(ValueError):
+        rules.register_rule(type("Other", (rules.Rule,),
+                                 {"name": "duplicates"}))
+
+
+def test_rule_timings():
+    m = parsed()
+    t = timings.Timings(memory=False)
+    with t:
+        with timings.phase("check"):
+            m.check()
+    assert [(p.depth, p.name) for p in t.phases] == [
+        (0, "check"), (1, "rule duplicates"), (1, "rule wildcard"),
+        (1, "rule base"), (1, "rule scopes"), (1, "rule dependencies")]
+    assert all(p.seconds >= 0 for p in t.phases)
+
+
+def test_check_command(tmpdir, caplog, capsys):
+    map_file = os.path.join(str(tmpdir), "lib.map")
+    with open(map_file, "w") as f:
+        f.write(BASE)
+
+    run("check", "--ignore", "duplicates,scopes", map_file)
+    assert "Duplicates found" not in caplog.text
+    assert "unknown scope" not in caplog.text
+    caplog.clear()
+
+    run("check", "--select", "exported-twice", "--timings-json", map_file)
+    assert "is global in LIBX_1_0_0" in caplog.text
+    report = json.loads(capsys.readouterr().err.strip().splitlines()[-1])
+    names = [p["name"] for p in report["phases"]]
+    # The lazy map is only checked once
+    assert names.count("rule exported-twice") == 1
+    assert "rule duplicates" not in names
+
+    with pytest.raises(Exception) as e:
+        run("check", "--select", "duplicates,missing", map_file)
+    assert "Unknown rule \'missing\'" in str(e.value)
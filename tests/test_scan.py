@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for indexing the shared objects of directories"""
+
+import os
+import subprocess
+
+import pytest
+
+from abimap import symver
+from abimap.scan import Scan_Index
+from abimap.scan import get_removed_versions
+
+SOURCE = """\
+int old_fn(void) { return 1; }
+int new_fn(void) { return 2; }
+int data = 3;
+int unversioned_fn(void) { return 4; }
+int compat_fn_1(void) { return 5; }
+int compat_fn_2(void) { return 6; }
+__asm__(".symver compat_fn_1, compat_fn@LIBX_1_0");
+__asm__(".symver compat_fn_2, compat_fn@@LIBX_2_0");
+"""
+
+VERSION_SCRIPT = """\
+LIBX_1_0
+{
+    global:
+        old_fn;
+        data;
+        compat_fn;
+    local:
+        *;
+};
+
+LIBX_2_0
+{
+    global:
+        new_fn;
+} LIBX_1_0;
+"""
+
+EXPECTED = """\
+LIBX_2_0    # Released
+{
+    global:
+        compat_fn;
+        new_fn;
+} LIBX_1_0;
+
+LIBX_1_0    # Released
+{
+    global:
+        compat_fn;
+        data;
+        old_fn;
+    local:
+        *;
+} ;
+
+"""
+
+
+def run(directory, *command):
+    try:
+        subprocess.check_call(command, cwd=directory)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("{0} is not available".format(command[0]))
+
+
+def build(directory, name="libx.so.1", source=SOURCE):
+    with open(os.path.join(directory, "x.c"), "w") as f:
+        f.write(source)
+    with open(os.path.join(directory, "x.map"), "w") as f:
+        f.write(VERSION_SCRIPT)
+    run(directory, "gcc", "-shared", "-fPIC", "-o", name, "x.c",
+        "-Wl,--build-id", "-Wl,--version-script=x.map",
+        "-Wl,-soname," + name)
+
+
+@pytest.fixture
+def sysroot(tmpdir):
+    directory = str(tmpdir.mkdir("sysroot"))
+    lib = os.path.join(directory, "lib")
+    os.mkdir(lib)
+    build(lib)
+    os.symlink("libx.so.1", os.path.join(lib, "libx.so"))
+
+    # A position independent executable is not a shared object
+    with open(os.path.join(directory, "main.c"), "w") as f:
+        f.write("int main(void) { return 0; }\n")
+    run(directory, "gcc", "-fPIE", "-pie", "-o", "main", "main.c")
+    return directory
+
+
+def test_scan(sysroot):
+    with Scan_Index() as index:
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.files, stats.libraries, stats.read, stats.unchanged,
+                stats.removed) == (5, 1, 5, 0, 0)
+
+        libraries = index.libraries()
+        assert [(path, soname, versions) for path, soname, _, versions, _ in
+                libraries] == [(os.path.join(sysroot, "lib", "libx.so.1"),
+                                "libx.so.1", 2)]
+        assert libraries[0][2]
+
+        library = index.get_library(index.find("libx.so.1"))
+        assert library.versions == [("LIBX_1_0", ""),
+                                    ("LIBX_2_0", "LIBX_1_0")]
+        assert sorted(library.symbols) == [
+            ("compat_fn", "LIBX_1_0", True),
+            ("compat_fn", "LIBX_2_0", False),
+            ("data", "LIBX_1_0", False),
+            ("new_fn", "LIBX_2_0", False),
+            ("old_fn", "LIBX_1_0", False)]
+
+        m = index.get_map(os.path.join(sysroot, "lib", "libx.so.1"))
+        assert str(m) == EXPECTED
+
+        with pytest.raises(Exception) as e:
+            index.get_map("libmissing.so.1")
+        assert "not found in the index" in str(e.value)
+
+
+def test_rescan(sysroot, tmpdir):
+    path = str(tmpdir.join("index.db"))
+    lib = os.path.join(sysroot, "lib")
+    filename = os.path.join(lib, "libx.so.1")
+
+    with Scan_Index(path) as index:
+        index.scan([sysroot], jobs=1)
+        build_id = index.get_library(index.find(filename)).build_id
+
+    # The index is kept, and the files which did not change are not read
+    with Scan_Index(path) as index:
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.libraries, stats.read, stats.unchanged) == (1, 0, 5)
+
+        # The same build-id: the library is kept
+        st = os.stat(filename)
+        os.utime(filename, (st.st_atime, st.st_mtime + 10))
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.libraries, stats.read, stats.unchanged) == (1, 0, 5)
+
+        # A new content is read again (with the sources written again), and
+        # the old library is removed
+        build(lib, source=SOURCE + "int added_fn(void) { return 7; }\n")
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.libraries, stats.read) == (1, 3)
+        assert index.db.execute("SELECT count(*) FROM libraries")\
+            .fetchone()[0] == 1
+        assert index.get_library(index.find(filename)).build_id != build_id
+
+        # A copy of a known library is not added again
+        copy = os.path.join(sysroot, "libx-copy.so.1")
+        with open(filename, "rb") as f, open(copy, "wb") as g:
+            g.write(f.read())
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.libraries, stats.read) == (2, 1)
+        assert index.find(copy) == index.find(filename)
+
+        os.unlink(copy)
+        os.unlink(filename)
+        stats = index.scan([sysroot], jobs=1)
+        assert (stats.libraries, stats.removed) == (0, 2)
+        assert index.db.execute("SELECT count(*) FROM symbols")\
+            .fetchone()[0] == 0
+
+
+def test_parallel(sysroot):
+    for i in range(4):
+        build(os.path.join(sysroot, "lib"), "libx{0}.so.1".format(i),
+              SOURCE + "int fn_{0}(void) {{ return 0; }}\n".format(i))
+
+    with Scan_Index() as serial, Scan_Index() as parallel:
+        serial.scan([sysroot], jobs=1)
+        parallel.scan([sysroot], jobs=2)
+        assert serial.libraries() == parallel.libraries()
+        assert len(parallel.libraries()) == 5
+
+
+def test_scan_command(sysroot, tmpdir, capsys):
+    parser = symver.get_arg_parser()
+    index = str(tmpdir.join("index.db"))
+
+    args = parser.parse_args(["scan", "-j", "1", "--index", index, sysroot])
+    args.program = "abimap"
+    args.func(args)
+    out, _ = capsys.readouterr()
+    assert out == "{0}: libx.so.1 (2 versions, 5 symbols)\n".format(
+        os.path.join(sysroot, "lib", "libx.so.1"))
+
+    args = parser.parse_args(["scan", "--index", index, "--map",
+                              "libx.so.1", sysroot])
+    args.program = "abimap"
+    args.func(args)
+    out, _ = capsys.readouterr()
+    assert out.endswith(EXPECTED)
+
+    args = parser.parse_args(["scan", os.path.join(sysroot, "main")])
+    args.program = "abimap"
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "is not a directory" in str(e.value)
+
+
+CONSUMER = """\
+extern int old_fn(void);
+extern int data;
+extern int plain_fn(void);
+int main(void) { return old_fn() + data + plain_fn(); }
+"""
+
+
+@pytest.fixture
+def consumers(sysroot):
+    lib = os.path.join(sysroot, "lib")
+    with open(os.path.join(lib, "u.c"), "w") as f:
+        f.write("int plain_fn(void) { return 0; }\n")
+    run(lib, "gcc", "-shared", "-fPIC", "-o", "libu.so.1", "u.c",
+        "-Wl,-soname,libu.so.1")
+
+    bin_dir = os.path.join(sysroot, "bin")
+    os.mkdir(bin_dir)
+    with open(os.path.join(bin_dir, "app.c"), "w") as f:
+        f.write(CONSUMER)
+    run(bin_dir, "gcc", "-o", "app", "app.c", "-L" + lib, "-l:libx.so.1",
+        "-l:libu.so.1")
+    return sysroot
+
+
+def test_consumers(consumers):
+    app = os.path.join(consumers, "bin", "app")
+    m = symver.Map()
+    m.parse(VERSION_SCRIPT.splitlines(True))
+
+    with Scan_Index() as index:
+        index.scan([consumers], jobs=1)
+
+        # The copied object is imported too
+        removed, missing = get_removed_versions(m, ["data", "new_fn",
+                                                    "missing_fn"])
+        assert removed == [("data", "LIBX_1_0"), ("new_fn", "LIBX_2_0")]
+        assert missing == ["missing_fn"]
+        assert index.consumers(removed) == [(app, "data", "LIBX_1_0")]
+        assert index.consumers(removed, "libother.so.1") == []
+        assert index.consumers(removed, directories=[
+            os.path.join(consumers, "lib")]) == []
+
+        removed, _ = get_removed_versions(m)
+        assert index.consumers(removed, "libx.so.1") == [
+            (app, "data", "LIBX_1_0"), (app, "old_fn", "LIBX_1_0")]
+
+        # The unversioned imports are found from the shared objects needed
+        assert index.consumers([("plain_fn", "LIBU_1_0")]) == []
+        assert index.consumers([("plain_fn", "LIBU_1_0")], "libu.so.1") == \
+            [(app, "plain_fn", None)]
+
+
+def test_consumers_command(consumers, tmpdir, capsys):
+    parser = symver.get_arg_parser()
+    index = str(tmpdir.join("index.db"))
+    lib_map = str(tmpdir.join("libx.map"))
+    with open(lib_map, "w") as f:
+        f.write(VERSION_SCRIPT)
+    app = os.path.join(consumers, "bin", "app")
+
+    args = parser.parse_args(["consumers", "-j", "1", "--index", index,
+                              "--symbols", "old_fn,new_fn", lib_map,
+                              consumers])
+    args.func(args)
+    out, _ = capsys.readouterr()
+    assert out == "{0}: old_fn@LIBX_1_0\n".format(app)
+
+    # The index is queried without scanning the files again
+    args = parser.parse_args(["consumers", "--index", index, "--strict",
+                              lib_map])
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "1 consumers would break" in str(e.value)
+    out, _ = capsys.readouterr()
+    assert out == "{0}: data@LIBX_1_0, old_fn@LIBX_1_0\n".format(app)
+
+    args = parser.parse_args(["consumers", "--strict", "--symbols",
+                              "new_fn", lib_map, consumers])
+    args.func(args)
+    out, _ = capsys.readouterr()
+    assert out == ""
+
+    args = parser.parse_args(["consumers", lib_map])
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "Please provide the directories" in str(e.value)
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the server and the client"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+if sys.version_info < (3, 7):
+    pytest.skip("The server requires python 3.7", allow_module_level=True)
+
+from abimap import server  # noqa: E402
+from abimap import symver  # noqa: E402
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+    local:
+        *;
+} ;
+"""
+
+
+@pytest.fixture
+def socket_path():
+    # Socket paths are limited in length, so tmpdir is not used
+    directory = tempfile.mkdtemp(prefix="abimap")
+    yield os.path.join(directory, "abimap.sock")
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def running_server(socket_path):
+    s = server.Server(socket_path)
+    thread = threading.Thread(target=s.run)
+    thread.start()
+
+    # Wait for the socket to be created
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+
+    yield s
+
+    server.Client(socket_path).request({"op": "shutdown"})
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_update_same_as_command(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    cache = server.Map_Cache()
+    request = {"op": "update", "file": map_path, "stdin": ["symbol\n",
+                                                           "new_symbol\n"]}
+    response = server.handle_request(request, cache)
+
+    assert response["ok"]
+    assert "Added:\n    new_symbol\n" in response["stdout"]
+
+    # Compare with the map written by the command
+    symbols_path = os.path.join(str(tmpdir), "symbols")
+    out_path = os.path.join(str(tmpdir), "out.map")
+    write(symbols_path, "symbol\nnew_symbol\n")
+    parser = symver.get_arg_parser()
+    args = parser.parse_args(["update", "-i", symbols_path, "-o", out_path,
+                              map_path])
+    args.program = "abimap"
+    args.func(args)
+
+    with open(out_path) as f:
+        assert response["stdout"].endswith(f.read())
+
+    # The cached map was not modified by the update
+    assert "new_symbol" not in str(cache.get(map_path))
+
+
+def test_cache_invalidated_by_modification(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    cache = server.Map_Cache()
+    m = cache.get(map_path)
+    assert cache.get(map_path) is m
+
+    write(map_path, BASE.replace("symbol;", "symbol;\n        other;"))
+    m = cache.get(map_path)
+    assert m.releases[0].symbols["global"] == ["symbol", "other"]
+
+
+def test_errors_and_diagnostics(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE.replace("local:\n        *;\n", ""))
+
+    cache = server.Map_Cache()
+    response = server.handle_request({"op": "check", "file": map_path},
+                                     cache)
+    assert response["ok"]
+    assert any("wildcard was not found" in message for message in
+               response["diagnostics"])
+
+    response = server.handle_request({"op": "update", "file": map_path,
+                                      "stdin": []}, cache)
+    assert not response["ok"]
+    assert "ABI break detected" in response["error"]
+
+    response = server.handle_request({"op": "unknown"}, cache)
+    assert not response["ok"]
+
+
+def test_depfile_and_stamp(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+    depfile = os.path.join(str(tmpdir), "check.d")
+    stamp = os.path.join(str(tmpdir), "check.stamp")
+
+    response = server.handle_request({"op": "check", "file": map_path,
+                                      "depfile": depfile, "stamp": stamp},
+                                     server.Map_Cache())
+    assert response["ok"]
+    assert os.path.isfile(stamp)
+    with open(depfile) as f:
+        assert f.read() == "{0}: \\\n  {1}\n".format(stamp, map_path)
+
+
+def test_query_and_verify(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    cache = server.Map_Cache()
+    response = server.handle_request({"op": "query", "file": map_path,
+                                      "symbols": ["symbol", "missing"]},
+                                     cache)
+    assert response["ok"]
+    result = response["result"]
+    assert result["latest"] == "LIBX_1_0_0"
+    assert result["symbols"] == {"symbol": ["LIBX_1_0_0"], "missing": []}
+
+    response = server.handle_request({"op": "verify", "file": map_path,
+                                      "stdin": ["symbol"]}, cache)
+    assert response["ok"]
+
+    response = server.handle_request({"op": "verify", "file": map_path,
+                                      "stdin": ["other"]}, cache)
+    assert not response["ok"]
+    assert response["result"] is None
+    assert "Added:\n    other\n" in response["stdout"]
+    assert "Removed:\n    symbol\n" in response["stdout"]
+
+
+def test_client_server(tmpdir, running_server):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    out_path = os.path.join(str(tmpdir), "new.map")
+    write(map_path, BASE)
+
+    client = server.Client(running_server.path)
+
+    response = client.request({"op": "check", "file": map_path})
+    assert response["ok"]
+
+    response = client.request({"op": "new", "release": "LIBY_1_0_0",
+                               "out": out_path, "stdin": ["a b c"]})
+    assert response["ok"]
+    m = symver.Map(filename=out_path)
+    assert sorted(m.releases[0].symbols["global"]) == ["a", "b", "c"]
+
+    # Many concurrent clients
+    results = []
+
+    def query():
+        results.append(client.request({"op": "query", "file": map_path}))
+
+    threads = [threading.Thread(target=query) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 10
+    assert all(response["ok"] for response in results)
+
+
+def test_fallback_without_server(tmpdir, socket_path):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    request = {"op": "check", "file": map_path}
+    response = server.send_request(request, socket_path)
+    assert response["ok"]
+
+    with pytest.raises(OSError):
+        server.send_request(request, socket_path, fallback=False)
+
+
+def test_concurrent_requests(running_server, monkeypatch):
+    event = threading.Event()
+
+    def wait(request, cache, logger, out):
+        logger.warning("waiting")
+        return event.wait(5)
+
+    def notify(request, cache, logger, out):
+        logger.warning("notifying")
+        event.set()
+        return True
+
+    monkeypatch.setitem(server.HANDLERS, "wait", wait)
+    monkeypatch.setitem(server.HANDLERS, "notify", notify)
+
+    # The waiting request does not block the request which ends the wait
+    client = server.Client(running_server.path)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        client.request({"op": "wait"})))
+    thread.start()
+    time.sleep(0.2)
+    response = client.request({"op": "notify"})
+    thread.join()
+
+    assert response["result"]
+    assert response["diagnostics"] == ["[WARNING] notifying"]
+    assert results[0]["result"]
+    assert results[0]["diagnostics"] == ["[WARNING] waiting"]
+
+
+def test_no_fallback_after_sending(socket_path, monkeypatch):
+    import socket
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+
+    def reset():
+        conn, _ = listener.accept()
+        conn.recv(65536)
+        conn.close()
+
+    thread = threading.Thread(target=reset)
+    thread.start()
+
+    executed = []
+    monkeypatch.setattr(server, "handle_request",
+                        lambda *args: executed.append(args))
+    try:
+        # The server received the request: it is not executed again
+        with pytest.raises(OSError):
+            server.send_request({"op": "check"}, socket_path)
+    finally:
+        thread.join()
+        listener.close()
+    assert not executed
+
+
+def test_check_rules(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE.replace("local:\n        *;\n", ""))
+
+    cache = server.Map_Cache()
+    parser = symver.get_arg_parser()
+    for options, warned in (([], True),
+                            (["--ignore", "wildcard"], False),
+                            (["--select", "duplicates"], False),
+                            (["--select", "wildcard"], True)):
+        args = parser.parse_args(["check"] + options + [map_path])
+        response = server.handle_request(server.get_request_from_args(args),
+                                         cache)
+        assert response["ok"]
+        assert any("wildcard was not found" in message for message in
+                   response["diagnostics"]) == warned
+
+    response = server.handle_request({"op": "check", "file": map_path,
+                                      "select": "unknown"}, cache)
+    assert not response["ok"]
+
+
+def test_update_preserve_layout(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    symbols_path = os.path.join(str(tmpdir), "symbols")
+    write(map_path, "# comment kept\n" + BASE)
+    write(symbols_path, "new_symbol\n")
+
+    parser = symver.get_arg_parser()
+    args = parser.parse_args(["update", "--add", "--preserve-layout", "-i",
+                              symbols_path, "-o", map_path, map_path])
+    args.program = "abimap"
+    response = server.handle_request(server.get_request_from_args(args),
+                                     server.Map_Cache())
+    assert response["ok"]
+
+    with open(map_path) as f:
+        content = f.read()
+    assert content.startswith("# comment kept\n")
+    assert content.endswith(BASE)
+    assert "new_symbol;" in content
+
+
+def test_update_in_place_locked(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    request = {"op": "update", "file": map_path, "out": map_path,
+               "add": True, "stdin": ["new_symbol\n"]}
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        server.handle_request(request, server.Map_Cache())))
+
+    # The server waits for the lock taken by the update subcommand
+    with symver.lock_map_file(map_path):
+        thread.start()
+        thread.join(0.5)
+        assert thread.is_alive()
+        symver.atomic_write(map_path, BASE.replace(
+            "symbol;", "symbol;\n        other;"))
+    thread.join()
+
+    assert results[0]["ok"]
+    m = symver.Map(filename=map_path)
+    assert m.all_global_symbols() == set(["symbol", "other", "new_symbol"])
+
+
+def request_from_command(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    return server.get_request_from_args(args)
+
+
+def test_check_lock(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    lock_path = os.path.join(str(tmpdir), "lib.lock")
+    released = BASE.replace("LIBX_1_0_0", "LIBX_1_0_0    # Released")
+    write(map_path, released)
+
+    cache = server.Map_Cache()
+    request = request_from_command("check", "--lock", lock_path, map_path)
+    response = server.handle_request(request, cache)
+    assert not response["ok"]
+    assert "not found" in response["error"]
+
+    request = request_from_command("check", "--update-lock", "--lock",
+                                   lock_path, map_path)
+    assert server.handle_request(request, cache)["ok"]
+    assert os.path.isfile(lock_path)
+
+    write(map_path, released.replace("symbol;", "changed;"))
+    request = request_from_command("check", "--lock", lock_path, map_path)
+    assert not server.handle_request(request, cache)["ok"]
+
+
+def test_update_options(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    symbols_path = os.path.join(str(tmpdir), "symbols")
+    cache_dir = os.path.join(str(tmpdir), "cache")
+    write(symbols_path, "symbol\nnew_symbol\n")
+
+    cache = server.Map_Cache()
+    for options in (["--cache-dir", cache_dir], ["--cache-dir", cache_dir],
+                    ["--retry-merge"]):
+        write(map_path, BASE)
+        request = request_from_command("update", "-i", symbols_path, "-o",
+                                       map_path, *(options + [map_path]))
+        response = server.handle_request(request, cache)
+        assert response["ok"]
+        assert "Added:\n    new_symbol\n" in response["stdout"]
+        m = symver.Map(filename=map_path)
+        assert m.all_global_symbols() == set(["symbol", "new_symbol"])
+
+    # The result of the update was stored
+    assert os.listdir(cache_dir)
+
+
+def test_client_timings(tmpdir, socket_path):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    args = symver.get_arg_parser().parse_args(["client", "-s", socket_path,
+                                               "check", "--timings",
+                                               map_path])
+    args.program = "abimap"
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "timings" in str(e.value)
+
+
+def test_default_socket_path(tmpdir, monkeypatch):
+    monkeypatch.delenv("ABIMAP_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+    path = server.get_socket_path()
+    directory = os.path.dirname(path)
+    assert os.path.dirname(directory) == str(tmpdir)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert server.get_socket_path() == path
+
+    # A directory which others can access is refused
+    os.chmod(directory, 0o777)
+    with pytest.raises(Exception):
+        server.get_socket_path()
+
+
+def test_concurrent_checks(tmpdir, monkeypatch):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE)
+
+    cache = server.Map_Cache()
+    checking = []
+    check = symver.Map.check
+
+    def exclusive_check(m):
+        # The shared map is never checked by two threads at the same time
+        assert m not in checking
+        checking.append(m)
+        time.sleep(0.05)
+        check(m)
+        checking.remove(m)
+
+    monkeypatch.setattr(symver.Map, "check", exclusive_check)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        server.handle_request({"op": "verify", "file": map_path,
+                               "stdin": ["symbol"]}, cache)))
+        for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert all(response["ok"] for response in results)
+
+
+def test_copy_keeps_options():
+    m = symver.Map(jobs=4, lazy=True, compact=True, rules=["wildcard"])
+    m.parse(BASE.splitlines(True))
+    copy = m.copy()
+    assert (copy.jobs, copy.lazy, copy.rules, copy.logger) == \
+        (4, True, ["wildcard"], m.logger)
+    assert copy._compact
+
+
+def test_query_lazy(tmpdir):
+    map_path = os.path.join(str(tmpdir), "lib.map")
+    write(map_path, BASE + BASE.replace("LIBX_1_0_0", "LIBX_1_1_0")
+          .replace("} ;", "} LIBX_1_0_0;").replace("symbol;", "other;"))
+
+    # Without symbols, the bodies of the releases are not parsed
+    cache = server.Map_Cache()
+    response = server.handle_request({"op": "query", "file": map_path},
+                                     cache)
+    assert response["ok"]
+    assert response["result"]["latest"] == "LIBX_1_1_0"
+    m = cache.get(map_path)
+    assert not any(release.is_loaded() for release in m.releases)
+
+    response = server.handle_request({"op": "query", "file": map_path,
+                                      "symbols": ["other"]}, cache)
+    assert response["result"]["symbols"] == {"other": ["LIBX_1_1_0"]}
+    assert all(release.is_loaded() for release in m.releases)
+
+
+@pytest.mark.parametrize("subcommand", [["serve"], ["client", "check", "x"]])
+def test_python_version(subcommand, monkeypatch):
+    monkeypatch.setattr(symver, "SERVER_MIN_PYTHON", (99, 0))
+    args = symver.get_arg_parser().parse_args(subcommand)
+    args.program = "abimap"
+    with pytest.raises(Exception) as e:
+        args.func(args)
+    assert "subcommand requires Python 99.0 or later" in str(e.value)
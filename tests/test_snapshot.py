@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the binary snapshots of maps"""
+
+import os
+import pickle
+
+import pytest
+
+from abimap import symver
+from abimap.snapshot import Snapshot
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol_b;
+        symbol_a;
+        shared;
+    local:
+        *;
+} ;
+
+LIBX_1_1_0    # Released
+{
+    global:
+        symbol_c;
+        shared;
+} LIBX_1_0_0;
+
+LIBX_2_0_0
+{
+} LIBX_1_1_0;
+"""
+
+
+@pytest.fixture
+def map_file(tmpdir):
+    name = os.path.join(str(tmpdir), "lib.map")
+    with open(name, "w") as f:
+        f.write(BASE)
+    return name
+
+
+@pytest.fixture
+def snapshot_file(map_file):
+    name = map_file + ".snap"
+    symver.Map(filename=map_file).save_snapshot(name)
+    return name
+
+
+def test_round_trip(map_file, snapshot_file):
+    expected = symver.Map(filename=map_file)
+
+    m = symver.Map()
+    m.load_snapshot(snapshot_file)
+    assert m.init
+    assert str(m) == str(expected)
+    assert [r.span for r in m.releases] == [r.span for r in
+                                            expected.releases]
+    assert m.dependencies() == expected.dependencies()
+
+
+def test_symbols_loaded_on_access(snapshot_file):
+    m = symver.Map()
+    m.load_snapshot(snapshot_file)
+    assert not any(r.is_loaded() for r in m.releases)
+
+    assert m.releases[1].symbols == {"global": ["symbol_c", "shared"]}
+    assert m.releases[1].released
+    assert [r.is_loaded() for r in m.releases] == [False, True, False]
+
+
+def test_load_compact(map_file, snapshot_file):
+    m = symver.Map(compact=True)
+    m.load_snapshot(snapshot_file)
+    assert not m.releases[0].is_loaded()
+    assert m.releases[0].symbols["global"] == ("shared", "symbol_a",
+                                               "symbol_b")
+    assert str(m) == str(symver.Map(filename=map_file))
+
+
+def test_pickle_loaded_map(snapshot_file):
+    m = symver.Map()
+    m.load_snapshot(snapshot_file)
+    copy = pickle.loads(pickle.dumps(m))
+    assert str(copy) == str(m)
+
+
+def test_find_symbol(snapshot_file):
+    snapshot = Snapshot(snapshot_file)
+    assert snapshot.find_symbol("symbol_a") == [("LIBX_1_0_0", "global")]
+    assert sorted(snapshot.find_symbol("shared")) == [
+        ("LIBX_1_0_0", "global"), ("LIBX_1_1_0", "global")]
+    assert snapshot.find_symbol("missing") == []
+
+
+def test_empty_map(tmpdir):
+    name = os.path.join(str(tmpdir), "empty.snap")
+    symver.Map().save_snapshot(name)
+
+    m = symver.Map()
+    m.load_snapshot(name)
+    assert m.releases == []
+    assert Snapshot(name).find_symbol("symbol") == []
+
+
+def test_invalid_snapshot(map_file):
+    with pytest.raises(Exception) as e:
+        symver.Map().load_snapshot(map_file)
+    assert "is not a snapshot" in str(e.value)
+
+
+def test_find_all_symbols(tmpdir):
+    m = symver.Map()
+    m.parse("""\
+LIBY_1_0_0
+{
+    global:
+        a0;
+        a1;
+    local:
+        *;
+} ;
+
+LIBY_1_1_0
+{
+} LIBY_1_0_0;
+
+LIBY_1_2_0
+{
+    global:
+    local:
+        b0;
+} LIBY_1_1_0;
+
+LIBY_1_3_0
+{
+    global:
+        c0;
+        c1;
+        c2;
+} LIBY_1_2_0;
+""".splitlines(True))
+    name = os.path.join(str(tmpdir), "map.snap")
+    m.save_snapshot(name)
+
+    snapshot = Snapshot(name)
+    for release in m.releases:
+        for scope, symbols in release.symbols.items():
+            for symbol in symbols:
+                assert (release.name, scope) in snapshot.find_symbol(symbol)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the measurement of the phases of the subcommands"""
+
+import io
+import json
+import os
+
+import pytest
+
+from abimap import symver
+from abimap import timings
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+    local:
+        *;
+} ;
+"""
+
+
+@pytest.fixture
+def files(tmpdir):
+    directory = str(tmpdir)
+    map_file = os.path.join(directory, "lib.map")
+    with open(map_file, "w") as f:
+        f.write(BASE)
+    symbols = os.path.join(directory, "symbols")
+    with open(symbols, "w") as f:
+        f.write("symbol\nother\n")
+    return directory, map_file, symbols
+
+
+def rule_phases(depth):
+    return [(depth, "rule " + name) for name in
+            ("duplicates", "wildcard", "base", "scopes", "dependencies")]
+
+
+def run(*argv):
+    args = symver.get_arg_parser().parse_args(list(argv))
+    args.program = "abimap"
+    args.func(args)
+
+
+def get_phases(err):
+    report = json.loads(err.strip().splitlines()[-1])
+    return [(p["depth"], p["name"]) for p in report["phases"]]
+
+
+def test_phases_nested():
+    with timings.Timings() as t:
+        with timings.phase("outer"):
+            with timings.phase("inner"):
+                data = [0] * 100000
+            del data
+        with timings.phase("other"):
+            pass
+
+    assert [(p.depth, p.name) for p in t.phases] == [
+        (0, "outer"), (1, "inner"), (0, "other")]
+    assert all(p.seconds >= 0 for p in t.phases)
+    outer, inner, _ = t.phases
+    assert outer.seconds >= inner.seconds
+    if t.memory:
+        assert inner.peak >= 100000 * 8
+        assert outer.peak >= inner.peak
+
+
+def test_not_collecting():
+    with timings.phase("nothing") as record:
+        assert record is None
+
+    t = timings.Timings(memory=False)
+    with t:
+        with timings.phase("x"):
+            pass
+    with timings.phase("y"):
+        pass
+    assert [p.name for p in t.phases] == ["x"]
+    assert t.phases[0].peak is None
+
+
+def test_report():
+    t = timings.Timings(memory=False)
+    with t:
+        with timings.phase("outer"):
+            with timings.phase("inner"):
+                pass
+
+    out = io.StringIO()
+    t.report(out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].split() == ["phase", "time", "(ms)", "peak", "(KiB)"]
+    assert lines[1].startswith("outer ")
+    assert lines[2].startswith("  inner ")
+    assert lines[2].endswith(" -")
+
+    out = io.StringIO()
+    t.report(out, "json")
+    report = json.loads(out.getvalue())
+    assert [p["name"] for p in report["phases"]] == ["outer", "inner"]
+
+
+def test_update(files, capsys):
+    directory, map_file, symbols = files
+    out = os.path.join(directory, "out.map")
+
+    run("update", "--timings-json", "-i", symbols, "-o", out, map_file)
+    assert get_phases(capsys.readouterr().err) == [
+        (0, "update"), (1, "read"), (2, "parse"), (2, "check")] + \
+        rule_phases(3) + [
+        (1, "read_symbols"), (2, "clean_symbols"), (1, "update_map"),
+        (2, "guess_latest_release"), (2, "check")] + rule_phases(3) + [
+        (2, "sort_releases_nice"), (1, "write_map")]
+
+
+def test_new(files, capsys):
+    directory, _, symbols = files
+    out = os.path.join(directory, "new.map")
+
+    run("new", "--timings-json", "-r", "LIBY_1_0_0", "-i", symbols, "-o",
+        out)
+    assert get_phases(capsys.readouterr().err) == [
+        (0, "new"), (1, "read_symbols"), (2, "clean_symbols"),
+        (1, "create_map")] + rule_phases(2) + [(1, "write_map")]
+
+
+def test_check_table(files, capsys):
+    _, map_file, _ = files
+
+    run("check", "--timings", map_file)
+    err = capsys.readouterr().err
+    assert "phase" in err
+    assert "\n  read " in err
+    assert "\n    parse " in err
+
+
+def test_report_on_failure(files, capsys):
+    _, map_file, _ = files
+    with open(map_file, "w") as f:
+        f.write("{\n")
+
+    with pytest.raises(Exception):
+        run("check", "--timings-json", map_file)
+    assert get_phases(capsys.readouterr().err) == [
+        (0, "check"), (1, "read"), (2, "parse")]
+
+
+def test_no_timings(files, capsys):
+    _, map_file, _ = files
+
+    run("check", map_file)
+    assert "phase" not in capsys.readouterr().err
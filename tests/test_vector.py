@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the set operations on large lists of symbols"""
+
+import random
+
+import pytest
+
+from abimap import symver
+from abimap import vector
+
+numpy = pytest.importorskip("numpy")
+
+MODES = [(False, False), (True, False), (False, True)]
+
+
+def get_symbols():
+    rng = random.Random(0)
+    cur = ["symbol_{0}".format(k) for k in range(2000)]
+    # The same symbol can be global in more than one release
+    cur += cur[:10]
+    new = cur[100:] + ["new_{0}".format(k) for k in range(100)]
+    new += new[:5]
+    rng.shuffle(new)
+    return cur, new
+
+
+def normalize(changes):
+    return tuple(sorted(symbols) for symbols in changes)
+
+
+@pytest.mark.parametrize("add, remove", MODES)
+def test_symbol_changes(add, remove, monkeypatch):
+    cur, new = get_symbols()
+    result = vector.symbol_changes(cur, new, add, remove)
+    for symbols in result:
+        assert len(set(symbols)) == len(symbols)
+
+    monkeypatch.setattr(symver, "VECTOR_MIN_SYMBOLS", float("inf"))
+    assert normalize(result) == \
+        normalize(symver.get_symbol_changes(cur, new, add, remove))
+
+
+def test_empty():
+    assert vector.symbol_changes([], []) == ([], [], [], [])
+    assert normalize(vector.symbol_changes(["a"], [])) == \
+        ([], ["a"], [], [])
+    assert normalize(vector.symbol_changes([], ["a"], remove=True)) == \
+        ([], [], [], ["a"])
+
+
+@pytest.mark.parametrize("add, remove", MODES)
+def test_collisions(add, remove, monkeypatch):
+    cur, new = get_symbols()
+    expected = vector.symbol_changes(cur, new, add, remove)
+
+    # Different symbols with the same hash are detected
+    monkeypatch.setattr(vector, "hash", len, raising=False)
+    assert vector.symbol_changes(cur, new, add, remove) is None
+    assert vector.symbol_changes(["ab"], ["cd"], add, remove) is None
+
+    # And the symbols are compared in Python sets
+    monkeypatch.setattr(symver, "VECTOR_MIN_SYMBOLS", 1)
+    assert normalize(symver.get_symbol_changes(cur, new, add, remove)) == \
+        normalize(expected)
+
+
+def test_update_map(monkeypatch):
+    cur, new = get_symbols()
+    m = symver.Map()
+    m.parse(["LIBX_1_0\n", "{\n", "    global:\n"] +
+            ["        {0};\n".format(symbol) for symbol in set(cur)] +
+            ["    local:\n", "        *;\n", "} ;\n"])
+    m.check()
+
+    maps = []
+    for min_symbols in (1, float("inf")):
+        monkeypatch.setattr(symver, "VECTOR_MIN_SYMBOLS", min_symbols)
+        new_map, _ = symver.update_map(m.copy(), new, allow_abi_break=True)
+        maps.append(str(new_map))
+    assert maps[0] == maps[1]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for watch command"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+from abimap import watch
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+BASE = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+    local:
+        *;
+} ;
+"""
+
+WILDCARD = """\
+LIBX_1_0_0
+{
+    global:
+        symbol;
+        *;
+    local:
+        *;
+} ;
+"""
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_map_watcher_reports_changes(tmpdir):
+    path = os.path.join(str(tmpdir), "lib.map")
+    write(path, BASE)
+
+    out = StringIO()
+    watcher = watch.Map_Watcher([path], out=out)
+
+    new, resolved = watcher.check(path)
+    assert not new and not resolved
+
+    write(path, WILDCARD)
+    new, resolved = watcher.check(path)
+    assert any("wildcard in global scope" in message for message in new)
+    assert not resolved
+
+    # Checking again without changes reports nothing
+    assert watcher.check(path) == ([], [])
+
+    write(path, BASE)
+    new, resolved = watcher.check(path)
+    assert not new
+    assert any("wildcard in global scope" in message for message in resolved)
+
+    output = out.getvalue()
+    assert "+ [WARNING]" in output
+    assert "- [WARNING]" in output
+    assert output.endswith("OK\n")
+
+
+def test_map_watcher_reports_errors(tmpdir):
+    path = os.path.join(str(tmpdir), "lib.map")
+    write(path, BASE)
+
+    watcher = watch.Map_Watcher([path], out=StringIO())
+    watcher.check(path)
+
+    write(path, BASE.replace("{", ""))
+    new, _ = watcher.check(path)
+    assert any("Missing '{'" in message for message in new)
+
+    write(path, BASE)
+    _, resolved = watcher.check(path)
+    assert any("Missing '{'" in message for message in resolved)
+
+
+def modify_later(path, content):
+    timer = threading.Timer(0.2, write, (path, content))
+    timer.start()
+    return timer
+
+
+def test_polling_watcher(tmpdir):
+    path = os.path.join(str(tmpdir), "lib.map")
+    write(path, BASE)
+
+    watcher = watch.Polling_Watcher([path], debounce=0.05, interval=0.05)
+    assert watcher.wait(0.1) == set()
+
+    timer = modify_later(path, WILDCARD)
+    changed = watcher.wait(5)
+    timer.join()
+    assert changed == set([os.path.abspath(path)])
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="inotify is only available on Linux")
+def test_inotify_watcher(tmpdir):
+    path = os.path.join(str(tmpdir), "lib.map")
+    other = os.path.join(str(tmpdir), "other.map")
+    write(path, BASE)
+
+    watcher = watch.Inotify_Watcher([path], debounce=0.05)
+    try:
+        # Modifications to other files in the directory are ignored
+        write(other, BASE)
+        assert watcher.wait(0.1) == set()
+
+        timer = modify_later(path, WILDCARD)
+        changed = watcher.wait(5)
+        timer.join()
+        assert changed == set([os.path.abspath(path)])
+    finally:
+        watcher.close()
+
+
+def test_run_stops_after_rounds(tmpdir):
+    path = os.path.join(str(tmpdir), "lib.map")
+    write(path, BASE)
+
+    out = StringIO()
+    map_watcher = watch.Map_Watcher([path], out=out)
+    watcher = watch.get_watcher([path], debounce=0.05, interval=0.05)
+    try:
+        timer = modify_later(path, WILDCARD)
+        map_watcher.run(watcher, rounds=1, timeout=5)
+        timer.join()
+    finally:
+        watcher.close()
+
+    assert "wildcard in global scope" in out.getvalue()